@@ -0,0 +1,429 @@
+#!/usr/bin/env python3
+"""
+Batch modes for the prescription reader CLI.
+
+Re-parsing streams archived QR payloads from JSONL or CSV through
+parse_prescription_data and validate_prescription_data on a process pool and
+writes one JSONL result per input record, in input order. Only a bounded
+window of batches is in flight at a time, so memory stays flat however large
+the archive is, and results are flushed as each batch completes.
+
+Image batches stream label photos through the same kind of pipeline: files
+are read ahead on I/O threads, decoded on worker processes, and written as
+JSONL with per-file timings.
+"""
+
+import contextlib
+import csv
+import glob
+import io
+import json
+import os
+import sys
+import time
+from collections import Counter, deque
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, TextIO
+
+import cv2
+
+from image_ingest import load_image_bytes
+from scan_memory import ScanMemory, input_pixel_limit
+
+# Keys tried, in order, when a JSONL record is an object
+PAYLOAD_FIELDS = ('raw_qr_data', 'raw_data', 'qr_data', 'payload')
+
+DEFAULT_CHUNK_SIZE = 500
+
+# Batches queued per worker; bounds memory while keeping workers busy
+BATCHES_PER_WORKER = 2
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.tif', '.tiff', '.webp')
+
+# Files read ahead of the decoders
+DEFAULT_PREFETCH = 16
+IO_THREADS = 4
+
+# Summary buckets for detection_method values
+SCAN_METHODS = {'QR_CODE': 'qr', 'BARCODE': 'barcode', 'TEXT_OCR': 'ocr'}
+
+# Reader owned by each worker process (or by the caller when running inline)
+_worker_reader = None
+
+
+def detect_format(path: str) -> str:
+    return 'csv' if path.lower().endswith('.csv') else 'jsonl'
+
+
+def is_valid_utf8(text: str) -> bool:
+    """False when text holds bytes that weren't UTF-8 (read with errors='surrogateescape')"""
+    try:
+        text.encode('utf-8')
+    except UnicodeEncodeError:
+        return False
+    return True
+
+
+@contextlib.contextmanager
+def open_records(path: str) -> Iterator[TextIO]:
+    """
+    Open a JSONL or CSV input ('-' for stdin). Bytes that aren't UTF-8 are
+    kept as surrogates, so only the records holding them fail.
+    """
+    if path != '-':
+        with open(path, newline='', encoding='utf-8', errors='surrogateescape') as f:
+            yield f
+        return
+    stream = io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8',
+                              errors='surrogateescape', newline='')
+    try:
+        yield stream
+    finally:
+        # Leave stdin open
+        stream.detach()
+
+
+def _rows(rows: Iterator) -> Iterator:
+    """Rows of a csv reader, with a csv.Error (e.g. an oversized field) in place of a bad row"""
+    rows = iter(rows)
+    while True:
+        try:
+            yield next(rows)
+        except StopIteration:
+            return
+        except csv.Error as e:
+            yield e
+
+
+def iter_payload_records(stream: TextIO, fmt: str = 'jsonl',
+                         field: Optional[str] = None, id_field: str = 'id',
+                         start: int = 0) -> Iterator[Dict]:
+    """
+    Yield {'offset', 'id', 'payload'} for each input record, skipping the
+    first `start` records. JSONL lines may be objects or bare JSON strings;
+    payloads that aren't strings are passed on as JSON. Records that can't
+    be read (invalid JSON or CSV, bytes that aren't UTF-8) carry an 'error'
+    instead of a payload.
+    """
+    if fmt == 'csv':
+        rows = _rows(csv.DictReader(stream))
+    else:
+        rows = (line for line in stream if line.strip())
+
+    for offset, row in enumerate(rows):
+        if offset < start:
+            continue
+        record = {'offset': offset, 'id': None, 'payload': None}
+        if isinstance(row, csv.Error):
+            record['error'] = f"Invalid CSV: {row}"
+            yield record
+            continue
+        if fmt == 'csv':
+            if not all(is_valid_utf8(value) for value in row.values()
+                       if isinstance(value, str)):
+                record['error'] = "Not valid UTF-8"
+                yield record
+                continue
+        else:
+            if not is_valid_utf8(row):
+                record['error'] = "Not valid UTF-8"
+                yield record
+                continue
+            try:
+                row = json.loads(row)
+            except ValueError as e:
+                record['error'] = f"Invalid JSON: {e}"
+                yield record
+                continue
+
+        if isinstance(row, str):
+            record['payload'] = row
+        elif isinstance(row, dict):
+            record['id'] = row.get(id_field)
+            keys = [field] if field else PAYLOAD_FIELDS
+            payload = next((row[key] for key in keys if row.get(key)), None)
+            if payload is None:
+                record['error'] = f"No payload field ({', '.join(keys)})"
+            elif isinstance(payload, str):
+                record['payload'] = payload
+            else:
+                # A JSON object payload reaches the parsers as JSON, not a Python repr
+                record['payload'] = json.dumps(payload)
+        else:
+            record['error'] = f"Unsupported record type {type(row).__name__}"
+        yield record
+
+
+def _init_worker(reader_factory: Callable) -> None:
+    global _worker_reader
+    _worker_reader = reader_factory()
+
+
+def reparse_batch(records: List[Dict]) -> List[Dict]:
+    """
+    Parse and validate a batch of records with this process's reader. A
+    record that fails gets an 'error' instead of parsed fields.
+    """
+    results = []
+    # Parser diagnostics must not end up in JSONL written to stdout
+    with contextlib.redirect_stdout(sys.stderr):
+        for record in records:
+            result = {'offset': record['offset'], 'id': record['id']}
+            if record.get('error'):
+                result['error'] = record['error']
+            else:
+                # One malformed archived payload must not lose the rest of the batch
+                try:
+                    parsed = _worker_reader.parse_prescription_data(record['payload'])
+                    is_valid, issues = _worker_reader.validate_prescription_data(parsed)
+                except Exception as e:
+                    result['error'] = f"{type(e).__name__}: {e}"
+                else:
+                    result.update({'parsed': parsed, 'valid': is_valid, 'issues': issues})
+            results.append(result)
+    return results
+
+
+def _batches(records: Iterator[Dict], size: int) -> Iterator[List[Dict]]:
+    batch = []
+    for record in records:
+        batch.append(record)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def run_reparse(reader_factory: Callable, input_path: str = '-',
+                output_path: str = '-', fmt: Optional[str] = None,
+                field: Optional[str] = None, workers: Optional[int] = None,
+                chunk_size: int = DEFAULT_CHUNK_SIZE, resume_from: int = 0,
+                progress: Optional[TextIO] = sys.stderr) -> Dict:
+    """
+    Re-parse archived payloads from input_path ('-' for stdin) into JSONL at
+    output_path ('-' for stdout). With resume_from, the first records are
+    skipped and an existing output file is appended to. Returns counts and
+    throughput.
+    """
+    fmt = fmt or ('jsonl' if input_path == '-' else detect_format(input_path))
+    workers = workers or os.cpu_count() or 1
+
+    stats = {'records': 0, 'valid': 0, 'invalid': 0, 'errors': 0}
+    start_time = time.perf_counter()
+
+    def write(results, out):
+        for result in results:
+            out.write(json.dumps(result, default=str) + '\n')
+            stats['records'] += 1
+            if 'error' in result:
+                stats['errors'] += 1
+            elif result['valid']:
+                stats['valid'] += 1
+            else:
+                stats['invalid'] += 1
+        out.flush()
+        if progress:
+            elapsed = time.perf_counter() - start_time
+            progress.write(f"\r{stats['records']} records, "
+                           f"{stats['records'] / elapsed:,.0f}/s")
+            progress.flush()
+
+    with contextlib.ExitStack() as stack:
+        source = stack.enter_context(open_records(input_path))
+        if output_path == '-':
+            out = sys.stdout
+        else:
+            mode = 'a' if resume_from else 'w'
+            out = stack.enter_context(open(output_path, mode, encoding='utf-8'))
+
+        batches = _batches(iter_payload_records(source, fmt, field, start=resume_from),
+                           chunk_size)
+
+        if workers == 1:
+            _init_worker(reader_factory)
+            for batch in batches:
+                write(reparse_batch(batch), out)
+        else:
+            pool = stack.enter_context(ProcessPoolExecutor(
+                max_workers=workers, initializer=_init_worker, initargs=(reader_factory,)))
+            pending = deque()
+            for batch in batches:
+                pending.append(pool.submit(reparse_batch, batch))
+                if len(pending) >= workers * BATCHES_PER_WORKER:
+                    write(pending.popleft().result(), out)
+            while pending:
+                write(pending.popleft().result(), out)
+
+    elapsed = time.perf_counter() - start_time
+    if progress:
+        progress.write('\n')
+    stats['seconds'] = elapsed
+    stats['records_per_second'] = stats['records'] / elapsed if elapsed else 0.0
+    stats['next_offset'] = resume_from + stats['records']
+    return stats
+
+
+def iter_image_paths(input_dir: Optional[str] = None, pattern: Optional[str] = None,
+                     from_list: Optional[str] = None) -> Iterator[str]:
+    """
+    Image paths from a directory (recursively, sorted), a glob pattern and/or
+    a file listing one path per line ('-' for stdin)
+    """
+    if input_dir:
+        for root, dirs, files in os.walk(input_dir):
+            dirs.sort()
+            for name in sorted(files):
+                if name.lower().endswith(IMAGE_EXTENSIONS):
+                    yield os.path.join(root, name)
+    if pattern:
+        yield from sorted(glob.iglob(pattern, recursive=True))
+    if from_list:
+        with contextlib.ExitStack() as stack:
+            source = sys.stdin if from_list == '-' else stack.enter_context(open(from_list))
+            for line in source:
+                if line.strip():
+                    yield line.strip()
+
+
+def _read_file(path: str):
+    start = time.perf_counter()
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+    except OSError as e:
+        return None, str(e), 1000 * (time.perf_counter() - start)
+    return data, None, 1000 * (time.perf_counter() - start)
+
+
+def _init_image_worker(reader_factory: Callable) -> None:
+    # One process per core already; OpenCV's own threads would oversubscribe
+    cv2.setNumThreads(1)
+    _init_worker(reader_factory)
+    # Racing decode attempts on threads would oversubscribe too
+    _worker_reader.race_workers = 1
+
+
+def scan_image_bytes(path: str, data: Optional[bytes], read_error: Optional[str],
+                     read_ms: float) -> Dict:
+    """
+    Decode one encoded image with this process's reader: quality gate,
+    QR/barcode, then OCR. Frames the gate rejects are reported as 'rejected'.
+    peak_mb is the scan's estimated peak of image buffers, and
+    memory_degraded lists what the memory budget cut (see scan_memory.py).
+    """
+    result = {'path': path, 'method': 'miss', 'payload': None, 'parsed': None,
+              'read_ms': round(read_ms, 2), 'decode_ms': 0.0}
+    if read_error:
+        result.update({'method': 'error', 'error': read_error})
+        return result
+
+    start = time.perf_counter()
+    loaded = load_image_bytes(data, input_pixel_limit())
+    if loaded is None:
+        result.update({'method': 'error', 'error': 'Not a readable image'})
+        return result
+    image, metadata = loaded
+    memory = ScanMemory()
+    if metadata['decode_scale'] < 1.0:
+        memory.degrade('reduced_decode')
+
+    quality = _worker_reader.assess_quality(image)
+    if quality and not quality['ok']:
+        result.update({'method': 'rejected', 'quality': quality['issues']})
+        result['decode_ms'] = round(1000 * (time.perf_counter() - start), 2)
+        return result
+
+    with contextlib.redirect_stdout(sys.stderr):
+        payload, _ = _worker_reader.scan_payload(image, quality, metadata['orientation_known'],
+                                                 memory=memory)
+        if payload:
+            parsed = _worker_reader.parse_prescription_data(payload)
+            result.update({'method': SCAN_METHODS.get(parsed['detection_method'], 'qr'),
+                           'payload': payload, 'parsed': parsed})
+    result['decode_ms'] = round(1000 * (time.perf_counter() - start), 2)
+    usage = memory.summary()
+    result['peak_mb'] = usage['peak_mb']
+    if 'traced_peak_mb' in usage:
+        result['traced_peak_mb'] = usage['traced_peak_mb']
+    if usage['degraded']:
+        result['memory_degraded'] = usage['degraded']
+    return result
+
+
+def run_image_batch(reader_factory: Callable, paths: Iterable[str],
+                    output_path: str = '-', workers: Optional[int] = None,
+                    prefetch: int = DEFAULT_PREFETCH,
+                    progress: Optional[TextIO] = sys.stderr) -> Dict:
+    """
+    Scan every image in paths and write one JSONL result per image, in
+    input order, to output_path ('-' for stdout). Returns hits per method,
+    throughput, the largest per-scan memory peak and the scans the memory
+    budget degraded.
+    """
+    workers = workers or os.cpu_count() or 1
+    methods = Counter()
+    memory = {'peak_mb_max': 0.0, 'memory_degraded': 0}
+    start_time = time.perf_counter()
+
+    def write(result, out):
+        out.write(json.dumps(result, default=str) + '\n')
+        out.flush()
+        methods[result['method']] += 1
+        memory['peak_mb_max'] = max(memory['peak_mb_max'], result.get('peak_mb', 0.0))
+        memory['memory_degraded'] += bool(result.get('memory_degraded'))
+        if progress:
+            count = sum(methods.values())
+            progress.write(f"\r{count} images, "
+                           f"{count / (time.perf_counter() - start_time):.1f}/s")
+            progress.flush()
+
+    with contextlib.ExitStack() as stack:
+        out = sys.stdout if output_path == '-' else stack.enter_context(
+            open(output_path, 'w', encoding='utf-8'))
+        io_pool = stack.enter_context(ThreadPoolExecutor(max_workers=IO_THREADS))
+
+        if workers == 1:
+            _init_worker(reader_factory)
+
+            def submit_decode(*args):
+                future = Future()
+                future.set_result(scan_image_bytes(*args))
+                return future
+        else:
+            pool = stack.enter_context(ProcessPoolExecutor(
+                max_workers=workers, initializer=_init_image_worker,
+                initargs=(reader_factory,)))
+
+            def submit_decode(*args):
+                return pool.submit(scan_image_bytes, *args)
+
+        reads = deque()
+        decodes = deque()
+
+        def start_next_decode():
+            path, read = reads.popleft()
+            decodes.append(submit_decode(path, *read.result()))
+
+        for path in paths:
+            reads.append((path, io_pool.submit(_read_file, path)))
+            if len(reads) >= prefetch:
+                start_next_decode()
+            if len(decodes) >= workers * BATCHES_PER_WORKER:
+                write(decodes.popleft().result(), out)
+        while reads:
+            start_next_decode()
+        while decodes:
+            write(decodes.popleft().result(), out)
+
+    elapsed = time.perf_counter() - start_time
+    if progress:
+        progress.write('\n')
+    images = sum(methods.values())
+    return {
+        'images': images,
+        'methods': dict(methods),
+        'seconds': elapsed,
+        'images_per_second': images / elapsed if elapsed else 0.0,
+        **memory,
+    }
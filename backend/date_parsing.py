@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Date parsing for prescription fields.
+
+One compiled regex finds the separator and which end holds the year; ranges
+are checked directly instead of trying strptime formats until one stops
+raising. Numeric dates like 03/04/2025 are ambiguous between day-first and
+month-first. Each source (pharmacy, payload format) is remembered with the
+order its unambiguous dates used, and later ambiguous dates from it are
+resolved with that order. Otherwise they are flagged, not guessed silently.
+"""
+
+import re
+import threading
+from typing import Dict, Hashable, Optional
+
+YEAR_FIRST_RE = re.compile(r'^(\d{4})([-/.])(\d{1,2})\2(\d{1,2})$')
+YEAR_LAST_RE = re.compile(r'^(\d{1,2})([-/.])(\d{1,2})\2(\d{4})$')
+
+ORDER_YMD = 'YMD'
+ORDER_DMY = 'DMY'
+ORDER_MDY = 'MDY'
+
+# Reading assumed for an ambiguous date from an unknown source, by separator
+DEFAULT_ORDER = {'/': ORDER_MDY, '-': ORDER_DMY, '.': ORDER_DMY}
+
+# Sources whose order is known, kept bounded for long-running workers
+MAX_SOURCES = 10000
+
+DAYS_IN_MONTH = (31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31)
+
+
+def valid_ymd(year: int, month: int, day: int) -> bool:
+    if year < 1 or not 1 <= month <= 12 or day < 1:
+        return False
+    if month == 2 and year % 4 == 0 and (year % 100 != 0 or year % 400 == 0):
+        return day <= 29
+    return day <= DAYS_IN_MONTH[month - 1]
+
+
+def _iso(year: int, month: int, day: int) -> str:
+    return f"{year:04d}-{month:02d}-{day:02d}"
+
+
+class DateParser:
+    """Parses numeric dates and remembers the day/month order of each source"""
+
+    def __init__(self):
+        self._orders: Dict[Hashable, Optional[str]] = {}
+        self._lock = threading.Lock()
+
+    def source_order(self, source: Hashable) -> Optional[str]:
+        return self._orders.get(source)
+
+    def _learn(self, source: Hashable, order: str) -> None:
+        with self._lock:
+            if source not in self._orders:
+                if len(self._orders) >= MAX_SOURCES:
+                    self._orders.clear()
+                self._orders[source] = order
+            elif self._orders[source] not in (order, None):
+                # The source has used both orders; stop resolving its dates
+                self._orders[source] = None
+
+    def parse(self, value: str, source: Optional[Hashable] = None,
+              learn: bool = True) -> Optional[Dict]:
+        """
+        Parse a numeric date; with learn=False an unambiguous date doesn't
+        teach the source its order. Returns None if the value is not a valid date,
+        otherwise a dict with:
+          iso          - normalized YYYY-MM-DD
+          order        - 'YMD', 'DMY' or 'MDY', as read
+          ambiguous    - True when day and month could be swapped and the
+                         source does not settle it
+          alternative  - the other reading's ISO date when ambiguous
+        """
+        value = value.strip()
+        match = YEAR_FIRST_RE.match(value)
+        if match:
+            year, _, month, day = match.groups()
+            year, month, day = int(year), int(month), int(day)
+            if not valid_ymd(year, month, day):
+                return None
+            return {'iso': _iso(year, month, day), 'order': ORDER_YMD,
+                    'ambiguous': False, 'alternative': None}
+
+        match = YEAR_LAST_RE.match(value)
+        if not match:
+            return None
+        first, separator, second, year = match.groups()
+        first, second, year = int(first), int(second), int(year)
+
+        dmy = _iso(year, second, first) if valid_ymd(year, second, first) else None
+        mdy = _iso(year, first, second) if valid_ymd(year, first, second) else None
+        if dmy is None and mdy is None:
+            return None
+
+        if dmy is None or mdy is None or dmy == mdy:
+            order = ORDER_DMY if mdy is None else ORDER_MDY
+            if dmy != mdy and source is not None and learn:
+                self._learn(source, order)
+            return {'iso': dmy or mdy, 'order': order,
+                    'ambiguous': False, 'alternative': None}
+
+        known = self._orders.get(source) if source is not None else None
+        order = known or DEFAULT_ORDER[separator]
+        iso, alternative = (dmy, mdy) if order == ORDER_DMY else (mdy, dmy)
+        return {'iso': iso, 'order': order, 'ambiguous': known is None,
+                'alternative': None if known else alternative}
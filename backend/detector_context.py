@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+"""
+Long-lived detector context shared across QR scans.
+
+Holds the objects that used to be rebuilt on every scan: gamma lookup tables,
+morphology structuring elements, OpenCV detectors and the image buffers
+used by the preprocessing chain. OpenCV detector objects are not safe to
+share between threads, so detectors, scratch buffers and buffer arenas are
+kept per thread, while the read-only tables are shared.
+"""
+
+import os
+import threading
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+def build_gamma_lut(gamma: float) -> np.ndarray:
+    """Build a 256-entry uint8 gamma correction table in one vectorized pass"""
+    inv_gamma = 1.0 / gamma
+    values = np.arange(256, dtype=np.float64) / 255.0
+    return (np.power(values, inv_gamma) * 255).astype(np.uint8)
+
+
+# Free buffers a thread's arena may keep between scans
+DEFAULT_ARENA_RETAINED_BYTES = int(
+    os.environ.get('QR_ARENA_MAX_MB', '128')) * 1024 * 1024
+
+
+class BufferArena:
+    """
+    Pool of reusable image buffers keyed by (shape, dtype).
+
+    Buffers handed out inside a scan() block stay reserved until the
+    outermost block exits, then return to the pool for the next scan.
+    Outside a scan() block acquire() simply allocates a fresh array.
+    While a meter (a scan_memory.ScanMemory) is attached, reserved buffers
+    are charged to it.
+    """
+
+    def __init__(self, max_retained_bytes: int = DEFAULT_ARENA_RETAINED_BYTES):
+        self.max_retained_bytes = max_retained_bytes
+        self._free: Dict[Tuple, List[np.ndarray]] = {}
+        self._in_use: List[Tuple[Tuple, np.ndarray]] = []
+        self._depth = 0
+        self.allocations = 0
+        self.reuses = 0
+        self.meter = None
+
+    @contextmanager
+    def scan(self):
+        self._depth += 1
+        try:
+            yield self
+        finally:
+            self._depth -= 1
+            if self._depth == 0:
+                self._release()
+
+    @contextmanager
+    def metered(self, meter):
+        """Charge buffers reserved inside the block to meter"""
+        previous, self.meter = self.meter, meter
+        try:
+            yield meter
+        finally:
+            self.meter = previous
+
+    def acquire(self, shape: Tuple[int, ...], dtype=np.uint8) -> np.ndarray:
+        shape = tuple(int(dim) for dim in shape)
+        if self._depth == 0:
+            return np.empty(shape, dtype=dtype)
+
+        key = (shape, np.dtype(dtype).str)
+        pool = self._free.get(key)
+        if pool:
+            buffer = pool.pop()
+            self.reuses += 1
+        else:
+            buffer = np.empty(shape, dtype=dtype)
+            self.allocations += 1
+        self._in_use.append((key, buffer))
+        if self.meter is not None:
+            self.meter.charge(buffer.nbytes)
+        return buffer
+
+    @property
+    def retained_bytes(self) -> int:
+        return sum(buffer.nbytes for pool in self._free.values() for buffer in pool)
+
+    def _release(self):
+        if self.meter is not None:
+            self.meter.release(sum(buffer.nbytes for _, buffer in self._in_use))
+        used_keys = []
+        for key, buffer in self._in_use:
+            self._free.setdefault(key, []).append(buffer)
+            if key not in used_keys:
+                used_keys.append(key)
+        self._in_use = []
+
+        # Trim the pool, dropping shapes the last scan did not use first
+        retained = self.retained_bytes
+        if retained <= self.max_retained_bytes:
+            return
+        stale_keys = [key for key in self._free if key not in used_keys]
+        for key in stale_keys + list(reversed(used_keys)):
+            pool = self._free.get(key, [])
+            while pool and retained > self.max_retained_bytes:
+                retained -= pool.pop().nbytes
+            if not pool:
+                self._free.pop(key, None)
+            if retained <= self.max_retained_bytes:
+                break
+
+    def clear(self):
+        self._free = {}
+
+
+class DetectorContext:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        # Built on first use; the scan ladder no longer applies gamma curves
+        self._gamma_luts: Dict[float, np.ndarray] = {}
+        self._kernels: Dict[Tuple[int, Tuple[int, int]], np.ndarray] = {}
+
+    def gamma_lut(self, gamma: float) -> np.ndarray:
+        lut = self._gamma_luts.get(gamma)
+        if lut is None:
+            lut = build_gamma_lut(gamma)
+            with self._lock:
+                self._gamma_luts.setdefault(gamma, lut)
+        return lut
+
+    def structuring_element(self, shape: int, ksize: Tuple[int, int]) -> np.ndarray:
+        key = (shape, ksize)
+        kernel = self._kernels.get(key)
+        if kernel is None:
+            kernel = cv2.getStructuringElement(shape, ksize)
+            with self._lock:
+                self._kernels.setdefault(key, kernel)
+        return kernel
+
+    def per_thread(self, name: str, factory: Callable[[], Any]) -> Any:
+        """
+        Return this thread's instance of a stateful object (such as an
+        OpenCV detector), creating it with factory() on first use.
+        """
+        objects = getattr(self._local, 'objects', None)
+        if objects is None:
+            objects = {}
+            self._local.objects = objects
+
+        obj = objects.get(name)
+        if obj is None:
+            obj = factory()
+            objects[name] = obj
+        return obj
+
+    def qr_detector(self):
+        """Return this thread's cv2.QRCodeDetector"""
+        return self.per_thread('qr_detector', cv2.QRCodeDetector)
+
+    def arena(self) -> BufferArena:
+        """Return this thread's buffer arena, creating it on first use"""
+        arena = getattr(self._local, 'arena', None)
+        if arena is None:
+            arena = BufferArena()
+            self._local.arena = arena
+        return arena
+
+    def scratch(self, name: str, shape: Tuple[int, ...],
+                dtype=np.uint8) -> np.ndarray:
+        """
+        Return a per-thread scratch buffer for the given name, reallocating
+        only when the requested shape or dtype changes.
+        The contents are overwritten by the next caller using the same name.
+        """
+        buffers = getattr(self._local, 'scratch', None)
+        if buffers is None:
+            buffers = {}
+            self._local.scratch = buffers
+
+        buffer = buffers.get(name)
+        if buffer is None or buffer.shape != tuple(shape) or buffer.dtype != dtype:
+            buffer = np.empty(shape, dtype=dtype)
+            buffers[name] = buffer
+        return buffer
+
+
+_default_context: Optional[DetectorContext] = None
+_default_context_lock = threading.Lock()
+
+
+def get_default_context() -> DetectorContext:
+    """Return the process-wide detector context, creating it on first use"""
+    global _default_context
+    if _default_context is None:
+        with _default_context_lock:
+            if _default_context is None:
+                _default_context = DetectorContext()
+    return _default_context
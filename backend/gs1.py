@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""
+GS1 barcode parsing for drug packaging.
+
+Stock bottles carry the NDC either as a linear UPC-A/EAN-13 barcode
+("3" + 10-digit NDC + check digit) or as a GS1 DataMatrix / GS1-128 element
+string holding the GTIN-14 ("003" + NDC + check digit) together with lot,
+expiry and serial number application identifiers (AIs).
+"""
+
+import calendar
+import re
+from typing import Dict, Optional
+
+GROUP_SEPARATOR = '\x1d'
+
+# Prefix used to hand barcode results to parse_prescription_data
+BARCODE_PAYLOAD_PREFIX = 'BARCODE '
+
+# AI -> (field name, fixed data length or None when variable, max length)
+APPLICATION_IDENTIFIERS = {
+    '00': ('sscc', 18, 18),
+    '01': ('gtin', 14, 14),
+    '02': ('content_gtin', 14, 14),
+    '10': ('lot_number', None, 20),
+    '11': ('production_date', 6, 6),
+    '13': ('packaging_date', 6, 6),
+    '15': ('best_before_date', 6, 6),
+    '17': ('expiration_date', 6, 6),
+    '21': ('serial_number', None, 20),
+    '30': ('count', None, 8),
+    '37': ('count', None, 8),
+    '240': ('additional_id', None, 30),
+    '241': ('customer_part_number', None, 30),
+    '400': ('order_number', None, 30),
+    '710': ('nhrn_de', None, 20),
+    '711': ('nhrn_fr', None, 20),
+    '712': ('nhrn_es', None, 20),
+    '713': ('nhrn_br', None, 20),
+    '714': ('nhrn_pt', None, 20),
+}
+
+DATE_FIELDS = {'production_date', 'packaging_date', 'best_before_date', 'expiration_date'}
+
+# Symbology identifiers that may prefix the decoded text, e.g. "]d2" for GS1 DataMatrix
+SYMBOLOGY_IDENTIFIER_RE = re.compile(r'^\][A-Za-z]\d')
+HRI_RE = re.compile(r'\((\d{2,4})\)([^(]*)')
+
+
+def gtin_check_digit_valid(digits: str) -> bool:
+    """Validate the GS1 mod-10 check digit of a GTIN-8/12/13/14"""
+    if not digits.isdigit() or len(digits) not in (8, 12, 13, 14):
+        return False
+    body, check = digits[:-1], int(digits[-1])
+    total = 0
+    for index, digit in enumerate(reversed(body)):
+        total += int(digit) * (3 if index % 2 == 0 else 1)
+    return (10 - total % 10) % 10 == check
+
+
+def to_gtin14(digits: str) -> Optional[str]:
+    """Pad a UPC-A/EAN-13/GTIN-14 to 14 digits, if its check digit is valid"""
+    if not gtin_check_digit_valid(digits):
+        return None
+    return digits.zfill(14)
+
+
+def ndc_from_gtin(gtin: str) -> Optional[str]:
+    """
+    Extract the 10-digit NDC from a drug GTIN. US drug GTIN-14s are
+    indicator digit + "03" + NDC10 + check digit. The hyphen layout of the
+    NDC cannot be recovered from the barcode alone.
+    """
+    gtin14 = to_gtin14(gtin)
+    if gtin14 is None or gtin14[1:3] != '03':
+        return None
+    return gtin14[3:13]
+
+
+def gs1_date_to_iso(value: str) -> Optional[str]:
+    """YYMMDD to YYYY-MM-DD; day 00 means the last day of the month"""
+    if len(value) != 6 or not value.isdigit():
+        return None
+    year, month, day = 2000 + int(value[:2]), int(value[2:4]), int(value[4:])
+    if not 1 <= month <= 12:
+        return None
+    last_day = calendar.monthrange(year, month)[1]
+    if day == 0:
+        day = last_day
+    if day > last_day:
+        return None
+    return f"{year:04d}-{month:02d}-{day:02d}"
+
+
+def parse_element_string(data: str) -> Dict[str, str]:
+    """
+    Parse a GS1 element string into {field_name: value}.
+    Accepts human-readable "(01)...(17)..." text and raw strings using
+    FNC1/<GS> separators, with or without a symbology identifier.
+    Raises ValueError for data that is not a GS1 element string.
+    """
+    data = data.strip()
+    fields = {}
+
+    if data.startswith('('):
+        for ai, value in HRI_RE.findall(data):
+            if ai not in APPLICATION_IDENTIFIERS:
+                raise ValueError(f"Unknown GS1 application identifier ({ai})")
+            fields[APPLICATION_IDENTIFIERS[ai][0]] = value.strip()
+        if not fields:
+            raise ValueError("No GS1 application identifiers found")
+        return fields
+
+    data = SYMBOLOGY_IDENTIFIER_RE.sub('', data).replace('<GS>', GROUP_SEPARATOR)
+    position = 0
+    while position < len(data):
+        if data[position] == GROUP_SEPARATOR:
+            position += 1
+            continue
+        for ai_length in (2, 3):
+            ai = data[position:position + ai_length]
+            if ai in APPLICATION_IDENTIFIERS:
+                break
+        else:
+            raise ValueError(f"Unknown GS1 application identifier at offset {position}")
+
+        name, fixed_length, max_length = APPLICATION_IDENTIFIERS[ai]
+        start = position + len(ai)
+        if fixed_length:
+            end = start + fixed_length
+        else:
+            separator = data.find(GROUP_SEPARATOR, start)
+            end = len(data) if separator < 0 else separator
+            end = min(end, start + max_length)
+        value = data[start:end]
+        if not value or (fixed_length and len(value) != fixed_length):
+            raise ValueError(f"Truncated GS1 element ({ai})")
+        fields[name] = value
+        position = end
+    return fields
+
+
+def parse_barcode(symbology: str, data: str) -> Dict[str, Optional[str]]:
+    """
+    Extract drug identifiers from a decoded barcode.
+    Returns a dict with gtin, ndc (10 digits), lot_number, expiration_date
+    (ISO), serial_number and symbology; missing values are None.
+    """
+    result = {
+        'symbology': symbology,
+        'gtin': None,
+        'ndc': None,
+        'lot_number': None,
+        'expiration_date': None,
+        'serial_number': None,
+    }
+    data = data.strip()
+
+    if data.isdigit() and len(data) in (12, 13):
+        # Linear UPC-A / EAN-13 retail barcode
+        gtin = to_gtin14(data)
+    else:
+        try:
+            fields = parse_element_string(data)
+        except ValueError:
+            return result
+        gtin = fields.get('gtin')
+        if gtin and not gtin_check_digit_valid(gtin):
+            gtin = None
+        result['lot_number'] = fields.get('lot_number')
+        result['serial_number'] = fields.get('serial_number')
+        if fields.get('expiration_date'):
+            result['expiration_date'] = gs1_date_to_iso(fields['expiration_date'])
+
+    if gtin:
+        result['gtin'] = gtin
+        result['ndc'] = ndc_from_gtin(gtin)
+    return result
+
+
+def barcode_payload(symbology: str, data: str) -> str:
+    """Payload string handed to parse_prescription_data for a barcode result"""
+    return f"{BARCODE_PAYLOAD_PREFIX}{symbology}: {data}"
+
+
+def is_barcode_payload(payload: str) -> bool:
+    return payload.startswith(BARCODE_PAYLOAD_PREFIX) and ': ' in payload
+
+
+def split_barcode_payload(payload: str):
+    """Inverse of barcode_payload: returns (symbology, data)"""
+    header, data = payload[len(BARCODE_PAYLOAD_PREFIX):].split(': ', 1)
+    return header, data
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Illumination normalization for uneven lighting.
+
+Shadows, flash hot spots and dim corners are the main reason a label fails
+to decode. Instead of trying several gamma curves and global thresholds on
+the whole image, the lighting itself is estimated and divided out:
+
+1. Background: the gray image is shrunk, dark marks (text, QR modules) are
+   closed away with a kernel larger than a few modules, and the result is
+   blurred and scaled back up. This is the paper's brightness at each pixel.
+2. Division: gray / background * 255 flattens the lighting, so the paper is
+   near white everywhere and ink is dark wherever it is.
+3. CLAHE restores local contrast that dim regions lost.
+4. Otsu on the flattened image gives one binarization candidate.
+"""
+
+from typing import Optional, Tuple
+
+import cv2
+import numpy as np
+
+from detector_context import BufferArena, DetectorContext
+
+# The background is estimated at this fraction of the input size
+BACKGROUND_SCALE = 0.125
+
+# Closing kernel in QR modules; larger than the 3x3 finder centres and most
+# blobs of dark data modules
+BACKGROUND_KERNEL_MODULES = 8
+# Used when the module size is unknown, as a fraction of the shorter side
+BACKGROUND_KERNEL_FRACTION = 0.06
+
+CLAHE_CLIP_LIMIT = 2.0
+CLAHE_TILE_GRID = (8, 8)
+
+
+def background_kernel_size(shape: Tuple[int, ...], module_size: Optional[float]) -> int:
+    """Odd closing kernel size, in pixels of the shrunken image"""
+    if module_size:
+        size = module_size * BACKGROUND_KERNEL_MODULES * BACKGROUND_SCALE
+    else:
+        size = min(shape[:2]) * BACKGROUND_SCALE * BACKGROUND_KERNEL_FRACTION
+    return max(3, int(size) | 1)
+
+
+def estimate_background(gray: np.ndarray, context: DetectorContext,
+                        module_size: Optional[float] = None,
+                        dst: Optional[np.ndarray] = None) -> np.ndarray:
+    """Smooth estimate of the paper brightness at every pixel"""
+    height, width = gray.shape[:2]
+    small = cv2.resize(gray, (max(1, int(width * BACKGROUND_SCALE)),
+                              max(1, int(height * BACKGROUND_SCALE))),
+                       interpolation=cv2.INTER_AREA)
+    ksize = background_kernel_size(gray.shape, module_size)
+    kernel = context.structuring_element(cv2.MORPH_ELLIPSE, (ksize, ksize))
+    small = cv2.morphologyEx(small, cv2.MORPH_CLOSE, kernel)
+    small = cv2.GaussianBlur(small, (0, 0), ksize / 2)
+    return cv2.resize(small, (width, height), dst=dst,
+                      interpolation=cv2.INTER_LINEAR)
+
+
+def clahe(context: DetectorContext):
+    """This thread's CLAHE operator (cv2.CLAHE objects are not thread-safe)"""
+    return context.per_thread('clahe', lambda: cv2.createCLAHE(
+        clipLimit=CLAHE_CLIP_LIMIT, tileGridSize=CLAHE_TILE_GRID))
+
+
+def normalize_illumination(gray: np.ndarray, context: DetectorContext,
+                           arena: Optional[BufferArena] = None,
+                           module_size: Optional[float] = None
+                           ) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Return (normalized, binary): the gray image with the lighting divided
+    out and contrast equalized, and its Otsu binarization. With an arena
+    the results live in its buffers; the background is per-thread scratch.
+    """
+    def buffer():
+        return arena.acquire(gray.shape) if arena is not None else None
+
+    background = estimate_background(
+        gray, context, module_size,
+        dst=context.scratch('illumination_background', gray.shape))
+    # Paper maps to ~255 and ink to its fraction of the local paper brightness
+    normalized = cv2.divide(gray, background, dst=buffer(), scale=255)
+    normalized = clahe(context).apply(normalized, dst=normalized)
+    _, binary = cv2.threshold(normalized, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU,
+                              dst=buffer())
+    return normalized, binary
@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""
+Image ingestion: decoding uploads and files with their EXIF orientation.
+
+Phone cameras store pixels in sensor order and record how the photo should
+be turned in the EXIF Orientation tag. cv2.imread/imdecode apply the tag
+for JPEGs but PIL does not, so the same photo reached the decoders upright
+as a file and sideways as base64, and the OCR fallback spent extra
+tesseract passes on 90/270 degree copies guessing which way was up.
+
+Every path now goes through load_image_bytes():
+
+1. The EXIF header is read with PIL, which parses the metadata without
+   decoding the pixels, for the orientation and the capture size.
+2. The pixels are decoded once with the orientation ignored (OpenCV, or
+   PIL for formats OpenCV can't read).
+3. The orientation is applied with cv2.rotate/cv2.flip, which move pixels
+   without resampling.
+
+The metadata says whether the orientation was known, so later stages can
+skip work that only guesses it. Given a pixel limit (see scan_memory.py),
+larger images are decoded at 1/2, 1/4 or 1/8 size; libjpeg scales while
+decoding, so the full-size array is never allocated.
+"""
+
+import io
+from typing import Dict, Optional, Tuple
+
+import cv2
+import numpy as np
+from PIL import Image
+
+EXIF_ORIENTATION = 0x0112
+EXIF_IFD = 0x8769
+EXIF_PIXEL_WIDTH = 0xA002
+EXIF_PIXEL_HEIGHT = 0xA003
+
+# EXIF orientation -> (flip code or None, rotation or None), applied in that
+# order to turn the stored pixels upright
+ORIENTATION_TRANSFORMS = {
+    1: (None, None),
+    2: (1, None),
+    3: (None, cv2.ROTATE_180),
+    4: (0, None),
+    5: (1, cv2.ROTATE_90_COUNTERCLOCKWISE),
+    6: (None, cv2.ROTATE_90_CLOCKWISE),
+    7: (1, cv2.ROTATE_90_CLOCKWISE),
+    8: (None, cv2.ROTATE_90_COUNTERCLOCKWISE),
+}
+
+# Orientations that swap width and height
+TRANSPOSED_ORIENTATIONS = (5, 6, 7, 8)
+
+# Reduced decode factor -> cv2.imread flag
+REDUCED_DECODES = {
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+}
+
+
+def read_image_metadata(data: bytes) -> Dict:
+    """
+    Orientation and size from the image header, without decoding pixels.
+    Returns {'orientation', 'orientation_known', 'width', 'height'}, where
+    the size is the upright capture size (EXIF pixel dimensions when present,
+    else the stored size). Unreadable headers give orientation 1, unknown.
+    """
+    metadata = {'orientation': 1, 'orientation_known': False, 'width': None, 'height': None}
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            width, height = image.size
+            exif = image.getexif()
+            orientation = exif.get(EXIF_ORIENTATION)
+            details = exif.get_ifd(EXIF_IFD)
+    except Exception:
+        return metadata
+
+    width = details.get(EXIF_PIXEL_WIDTH) or width
+    height = details.get(EXIF_PIXEL_HEIGHT) or height
+    if orientation in ORIENTATION_TRANSFORMS:
+        metadata.update(orientation=int(orientation), orientation_known=True)
+        if orientation in TRANSPOSED_ORIENTATIONS:
+            width, height = height, width
+    metadata.update(width=int(width), height=int(height))
+    return metadata
+
+
+def apply_orientation(image: np.ndarray, orientation: int) -> np.ndarray:
+    """Turn stored pixels upright for an EXIF orientation (lossless)"""
+    flip, rotation = ORIENTATION_TRANSFORMS.get(orientation, (None, None))
+    if flip is not None:
+        image = cv2.flip(image, flip)
+    if rotation is not None:
+        image = cv2.rotate(image, rotation)
+    return image
+
+
+def reduction_factor(metadata: Dict, max_pixels: Optional[int]) -> int:
+    """Smallest reduced decode (1, 2, 4 or 8) that brings the image within max_pixels"""
+    if not max_pixels or not metadata['width'] or not metadata['height']:
+        return 1
+    pixels = metadata['width'] * metadata['height']
+    for factor in (1,) + tuple(REDUCED_DECODES):
+        if pixels / (factor * factor) <= max_pixels:
+            return factor
+    return max(REDUCED_DECODES)
+
+
+def _decode_pixels(data: bytes, factor: int = 1) -> Optional[np.ndarray]:
+    """BGR pixels in stored order; PIL covers formats OpenCV can't read"""
+    flags = REDUCED_DECODES.get(factor, cv2.IMREAD_COLOR)
+    image = cv2.imdecode(np.frombuffer(data, np.uint8),
+                         flags | cv2.IMREAD_IGNORE_ORIENTATION)
+    if image is not None:
+        return image
+    try:
+        with Image.open(io.BytesIO(data)) as pil_image:
+            rgb = np.array(pil_image.convert('RGB'))
+    except Exception:
+        return None
+    if factor > 1:
+        height, width = rgb.shape[:2]
+        rgb = cv2.resize(rgb, (max(1, width // factor), max(1, height // factor)),
+                         interpolation=cv2.INTER_AREA)
+    return cv2.cvtColor(rgb, cv2.COLOR_RGB2BGR)
+
+
+def load_image_bytes(data: bytes,
+                     max_pixels: Optional[int] = None) -> Optional[Tuple[np.ndarray, Dict]]:
+    """
+    Decode an encoded image upright; returns (BGR image, metadata) or None.
+    Images over max_pixels are decoded reduced and then resized to fit;
+    metadata['decode_scale'] is the factor applied.
+    """
+    metadata = read_image_metadata(data)
+    factor = reduction_factor(metadata, max_pixels)
+    image = _decode_pixels(data, factor)
+    if image is None:
+        return None
+    decode_scale = 1.0 / factor
+    height, width = image.shape[:2]
+    if max_pixels and height * width > max_pixels:
+        # Formats without reduced decoding, or more than 1/8 was needed
+        scale = (max_pixels / (height * width)) ** 0.5
+        image = cv2.resize(image, (max(1, int(width * scale)), max(1, int(height * scale))),
+                           interpolation=cv2.INTER_AREA)
+        decode_scale *= scale
+    metadata['decode_scale'] = round(decode_scale, 4)
+    return apply_orientation(image, metadata['orientation']), metadata
+
+
+def load_image_file(path: str,
+                    max_pixels: Optional[int] = None) -> Optional[Tuple[np.ndarray, Dict]]:
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+    except OSError:
+        return None
+    return load_image_bytes(data, max_pixels)
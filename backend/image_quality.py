@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Image quality gate run before decoding.
+
+A few milliseconds on a small thumbnail are enough to tell a black, blank or
+badly blurred frame from one worth sending through the decoder ladder.
+Hopeless frames are rejected with feedback the user can act on.
+"""
+
+import os
+from typing import Dict, Optional
+
+import cv2
+import numpy as np
+
+from qr_geometry import find_finder_patterns
+
+# Set QR_QUALITY_GATE=0 to send every frame to the decoders
+QUALITY_GATE_ENABLED = os.environ.get('QR_QUALITY_GATE', '1') != '0'
+
+# Longest side of the thumbnail all measurements are taken on
+THUMBNAIL_DIMENSION = 640
+
+# Rejection thresholds on 0-255 gray levels. Sharpness is the variance of
+# the second derivative along the blurrier axis, divided by the image
+# variance so it doesn't depend on exposure: motion blur only flattens one
+# axis, and a QR code needs both. Deliberately loose: the synthetic corpus
+# goes down to ~0.08 and photos of labels sit above 0.5, while 15 px blurs
+# in any direction score under 0.05.
+MIN_CONTRAST = 24          # p99 - p1
+MAX_DARK_P99 = 40          # nearly everything black
+MIN_BRIGHT_P1 = 235        # nearly everything white
+MIN_SHARPNESS = 0.05
+
+# Below these the frame is decoded but the user is warned
+SOFT_SHARPNESS = 0.25
+DARK_MEAN = 80
+BRIGHT_MEAN = 225
+
+FEEDBACK = {
+    'too_dark': "Image is too dark. Turn on more light or use the flash.",
+    'overexposed': "Image is washed out. Avoid glare and direct light on the label.",
+    'no_contrast': "Image looks blank. Make sure the label fills the frame.",
+    'too_blurry': "Image is too blurry. Hold the camera steady and let it focus.",
+    'dark': "Image is dark; a brighter photo will scan more reliably.",
+    'bright': "Image is very bright; glare may hide part of the code.",
+    'blurry': "Image is slightly blurry; a sharper photo will scan more reliably.",
+}
+REJECTIONS = ('too_dark', 'overexposed', 'no_contrast', 'too_blurry')
+
+
+def make_thumbnail(image: np.ndarray) -> np.ndarray:
+    """Grayscale copy with its longest side at most THUMBNAIL_DIMENSION"""
+    height, width = image.shape[:2]
+    step = max(height, width) // (2 * THUMBNAIL_DIMENSION)
+    if step > 1:
+        # Cheap decimation first; INTER_AREA then only averages a few pixels
+        image = image[::step, ::step]
+        height, width = image.shape[:2]
+    scale = min(1.0, THUMBNAIL_DIMENSION / max(height, width))
+    if scale < 1.0:
+        image = cv2.resize(image, (max(1, int(width * scale)), max(1, int(height * scale))),
+                           interpolation=cv2.INTER_AREA)
+    if image.ndim == 3:
+        image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    return image
+
+
+def directional_sharpness(gray: np.ndarray) -> float:
+    """Second-derivative variance of the blurrier axis over the image variance"""
+    horizontal = cv2.Sobel(gray, cv2.CV_32F, 2, 0).var()
+    vertical = cv2.Sobel(gray, cv2.CV_32F, 0, 2).var()
+    return float(min(horizontal, vertical)) / max(float(gray.var()), 1.0)
+
+
+def assess_image_quality(image: np.ndarray) -> Dict:
+    """
+    Measure exposure, contrast, sharpness and finder-pattern structure.
+    Returns {'ok', 'issues', 'feedback', 'metrics'}; ok is False
+    only for frames without finder patterns that no decoder or OCR pass
+    could read.
+    """
+    thumbnail = make_thumbnail(image)
+    histogram = cv2.calcHist([thumbnail], [0], None, [256], [0, 256]).ravel()
+    cumulative = np.cumsum(histogram) / max(histogram.sum(), 1)
+    p1 = int(np.searchsorted(cumulative, 0.01))
+    p99 = int(np.searchsorted(cumulative, 0.99))
+    mean = float(thumbnail.mean())
+    sharpness = directional_sharpness(thumbnail)
+    finders = len(find_finder_patterns(thumbnail))
+
+    issues = []
+    # Visible finder patterns mean a decoder can lock on whatever the exposure
+    if not finders:
+        if p99 < MAX_DARK_P99:
+            issues.append('too_dark')
+        elif p1 > MIN_BRIGHT_P1:
+            issues.append('overexposed')
+        elif p99 - p1 < MIN_CONTRAST:
+            issues.append('no_contrast')
+        elif sharpness < MIN_SHARPNESS:
+            issues.append('too_blurry')
+    if not issues:
+        if mean < DARK_MEAN:
+            issues.append('dark')
+        elif mean > BRIGHT_MEAN:
+            issues.append('bright')
+        if sharpness < SOFT_SHARPNESS:
+            issues.append('blurry')
+
+    return {
+        'ok': not any(issue in REJECTIONS for issue in issues),
+        'issues': issues,
+        'feedback': [FEEDBACK[issue] for issue in issues],
+        'metrics': {
+            'mean': round(mean, 1),
+            'p1': p1,
+            'p99': p99,
+            'contrast': p99 - p1,
+            'sharpness': round(sharpness, 3),
+            'finder_patterns': finders,
+        },
+    }
+
+
+def passes_quality_gate(quality: Optional[Dict]) -> bool:
+    return not QUALITY_GATE_ENABLED or quality is None or quality['ok']
@@ -0,0 +1,494 @@
+#!/usr/bin/env python3
+"""
+Open-loop load testing for the scan API.
+
+tests/test_api.py sends one request at a time, which says nothing about
+how the API behaves when requests overlap. This harness starts the API
+locally (or targets --url), then offers requests at a series of arrival
+rates. Arrivals are scheduled in advance (Poisson by default) and sent
+whether or not earlier requests have finished, and each latency is measured
+from the scheduled send time, so a slow server can't slow the load down
+and hide its own queueing.
+
+Requests are drawn from a mix of:
+
+- easy_qr: the QR PNGs in sample_images/ and clean synthetic labels
+- hard_qr: the sample phone photos and distorted synthetic labels
+- ocr_only: synthetic labels with the code blanked out, which fall
+  through to the OCR fallback
+- health: GET /health
+
+Scans alternate between multipart uploads and base64 JSON. Each image gets
+a unique trailer so identical concurrent scans aren't coalesced into one.
+The report gives, per rate, throughput, p50/p95/p99 latency and the error
+rate, per request kind as well, plus the saturation point: the first rate
+where throughput falls behind the offered load or the latency or error
+SLO is missed.
+
+    python load_test.py --rates 1,2,4,8 --duration 20 --report load_report
+    python load_test.py --url http://localhost:3002 --corpus corpus/ --mix easy_qr=1
+"""
+
+import argparse
+import base64
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from synthetic_corpus import iter_samples
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+SAMPLE_IMAGES = os.path.join(BACKEND_DIR, 'sample_images')
+EASY_SAMPLES = ['test_prescription_json.png', 'test_prescription_kv.png', 'nexium.png']
+HARD_SAMPLES = ['prescription_photo_dark.jpg', 'prescription_photo_blurry.jpg',
+                'prescription_photo_rotated.jpg', 'realistic_prescription_photo.jpg']
+
+KINDS = ('easy_qr', 'hard_qr', 'ocr_only', 'health')
+DEFAULT_MIX = {'easy_qr': 0.5, 'hard_qr': 0.3, 'ocr_only': 0.1, 'health': 0.1}
+DEFAULT_RATES = [1.0, 2.0, 4.0, 8.0]
+
+# Throughput below this fraction of the offered rate means the server is saturated
+SATURATION_THROUGHPUT = 0.9
+
+
+def _synthetic_label(sample) -> Tuple[str, bytes]:
+    return sample['truth']['file'], sample['jpeg']
+
+
+def ocr_only_label(sample) -> bytes:
+    """A synthetic label with its code painted over, leaving only the printed text"""
+    image = sample['image'].copy()
+    corners = np.array(sample['truth']['qr_corners'], dtype=np.float32)
+    center = corners.mean(axis=0)
+    # Grow the quad so no finder pattern edge survives
+    quad = np.round(center + (corners - center) * 1.2).astype(np.int32)
+    cv2.fillConvexPoly(image, quad, (255, 255, 255))
+    ok, jpeg = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, 90])
+    if not ok:
+        raise ValueError("Could not encode the label as JPEG")
+    return jpeg.tobytes()
+
+
+def build_workload(corpus_dir: Optional[str] = None, seed: int = 7,
+                   synthetic_count: int = 8) -> Dict[str, List[Tuple[str, bytes]]]:
+    """
+    Images for each request kind as (name, encoded bytes). With corpus_dir
+    (from `synthetic_corpus.py generate`), its clean-profile samples are
+    easy and the rest hard; otherwise sample_images/ and a small generated set.
+    """
+    workload = {kind: [] for kind in KINDS if kind != 'health'}
+    if corpus_dir:
+        with open(os.path.join(corpus_dir, 'manifest.jsonl'), encoding='utf-8') as f:
+            for truth in map(json.loads, f):
+                with open(os.path.join(corpus_dir, truth['file']), 'rb') as image:
+                    kind = 'easy_qr' if truth['profile'] == 'clean' else 'hard_qr'
+                    workload[kind].append((truth['file'], image.read()))
+    else:
+        for kind, names in (('easy_qr', EASY_SAMPLES), ('hard_qr', HARD_SAMPLES)):
+            for name in names:
+                path = os.path.join(SAMPLE_IMAGES, name)
+                if os.path.exists(path):
+                    with open(path, 'rb') as f:
+                        workload[kind].append((name, f.read()))
+        workload['easy_qr'] += [_synthetic_label(sample)
+                                for sample in iter_samples(seed, synthetic_count, 'clean')]
+        workload['hard_qr'] += [_synthetic_label(sample)
+                                for sample in iter_samples(seed, synthetic_count, 'mixed')]
+
+    workload['ocr_only'] = [(f"ocr_only_{sample['truth']['index']:06d}.jpg", ocr_only_label(sample))
+                            for sample in iter_samples(seed + 1, synthetic_count, 'clean')]
+    return workload
+
+
+def parse_mix(text: str) -> Dict[str, float]:
+    """'easy_qr=0.6,hard_qr=0.4' -> weights normalized to sum to 1"""
+    weights = {}
+    for part in filter(None, (item.strip() for item in text.split(','))):
+        kind, _, weight = part.partition('=')
+        if kind not in KINDS:
+            raise ValueError(f"Unknown request kind {kind}; expected one of {', '.join(KINDS)}")
+        try:
+            weights[kind] = float(weight)
+        except ValueError:
+            raise ValueError(f"Invalid weight for {kind}: {weight!r}")
+        if weights[kind] < 0:
+            raise ValueError(f"Weight for {kind} must not be negative")
+    total = sum(weights.values())
+    if total <= 0:
+        raise ValueError("The mix needs at least one positive weight")
+    return {kind: weight / total for kind, weight in weights.items() if weight > 0}
+
+
+def unique_image(data: bytes) -> bytes:
+    """Trailing bytes after the image end marker: still decodes, but a new single-flight key"""
+    return data + b'\0load-test ' + uuid.uuid4().hex.encode('ascii')
+
+
+def _multipart(name: str, data: bytes) -> Tuple[bytes, str]:
+    boundary = uuid.uuid4().hex
+    body = (f'--{boundary}\r\nContent-Disposition: form-data; name="image"; '
+            f'filename="{name}"\r\nContent-Type: application/octet-stream\r\n\r\n'
+            ).encode('ascii') + data + f'\r\n--{boundary}--\r\n'.encode('ascii')
+    return body, f'multipart/form-data; boundary={boundary}'
+
+
+def build_request(base_url: str, kind: str, name: str = '', data: bytes = b'',
+                  encoding: str = 'multipart') -> urllib.request.Request:
+    if kind == 'health':
+        return urllib.request.Request(f'{base_url}/health')
+    if encoding == 'base64':
+        body = json.dumps({'image': 'data:image/jpeg;base64,'
+                           + base64.b64encode(data).decode('ascii')}).encode('ascii')
+        content_type = 'application/json'
+    else:
+        body, content_type = _multipart(name, data)
+    return urllib.request.Request(f'{base_url}/api/scan-qr', data=body, method='POST',
+                                  headers={'Content-Type': content_type})
+
+
+def send(request: urllib.request.Request, timeout: float) -> Dict:
+    """{'status', 'error', 'decoded'}; status is None when no response arrived"""
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            status, raw = response.status, response.read()
+    except urllib.error.HTTPError as e:
+        return {'status': e.code, 'error': f'HTTP {e.code}', 'decoded': False}
+    except (urllib.error.URLError, OSError) as e:
+        reason = getattr(e, 'reason', e)
+        return {'status': None, 'error': type(reason).__name__, 'decoded': False}
+    try:
+        body = json.loads(raw)
+    except ValueError:
+        return {'status': status, 'error': 'Invalid JSON', 'decoded': False}
+    return {'status': status, 'error': None, 'decoded': bool(body.get('success'))}
+
+
+def arrival_times(rate: float, duration: float, rng: np.random.Generator,
+                  poisson: bool = True) -> List[float]:
+    """Send offsets in seconds: exponential gaps (Poisson arrivals) or an even spacing"""
+    if poisson:
+        gaps = rng.exponential(1.0 / rate, int(rate * duration * 2) + 16)
+        times = np.cumsum(gaps)
+        return [float(t) for t in times[times < duration]]
+    return [index / rate for index in range(int(rate * duration))]
+
+
+def _summary(latencies: List[float]) -> Dict:
+    if not latencies:
+        return {'p50_ms': None, 'p95_ms': None, 'p99_ms': None, 'max_ms': None}
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+    return {'p50_ms': round(float(p50), 1), 'p95_ms': round(float(p95), 1),
+            'p99_ms': round(float(p99), 1), 'max_ms': round(float(max(latencies)), 1)}
+
+
+def run_stage(base_url: str, workload: Dict, mix: Dict[str, float], rate: float,
+              duration: float, rng: np.random.Generator, base64_fraction: float = 0.5,
+              timeout: float = 30.0, max_in_flight: int = 64, poisson: bool = True) -> Dict:
+    """Offer requests at rate per second for duration seconds; returns the stage's results"""
+    kinds = [kind for kind in mix if kind == 'health' or workload.get(kind)]
+    weights = np.array([mix[kind] for kind in kinds])
+    offsets = arrival_times(rate, duration, rng, poisson)
+
+    # Draw every request up front so sending does no work but the request itself
+    planned = []
+    for offset in offsets:
+        kind = kinds[rng.choice(len(kinds), p=weights / weights.sum())]
+        if kind == 'health':
+            planned.append((offset, kind, build_request(base_url, kind)))
+            continue
+        name, data = workload[kind][rng.integers(len(workload[kind]))]
+        encoding = 'base64' if rng.random() < base64_fraction else 'multipart'
+        planned.append((offset, kind, build_request(base_url, kind, name, unique_image(data),
+                                                    encoding)))
+
+    results = []
+    lock = threading.Lock()
+
+    def issue(scheduled, kind, request):
+        outcome = send(request, timeout)
+        outcome.update(kind=kind, latency_ms=(time.perf_counter() - scheduled) * 1000)
+        with lock:
+            results.append(outcome)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max_in_flight) as pool:
+        for offset, kind, request in planned:
+            delay = start + offset - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            # Latency counts from the scheduled time, including any wait for a free sender
+            pool.submit(issue, start + offset, kind, request)
+    elapsed = max(time.perf_counter() - start, duration)
+
+    by_kind = defaultdict(list)
+    for outcome in results:
+        by_kind[outcome['kind']].append(outcome)
+    completed = [outcome for outcome in results if outcome['error'] is None]
+    errors = len(results) - len(completed)
+    stage = {
+        'offered_rps': rate,
+        'requests': len(results),
+        'completed': len(completed),
+        'errors': errors,
+        'error_rate': round(errors / len(results), 4) if results else 0.0,
+        'throughput_rps': round(len(completed) / elapsed, 2),
+        'elapsed_seconds': round(elapsed, 2),
+        **_summary([outcome['latency_ms'] for outcome in completed]),
+        'by_kind': {},
+    }
+    for kind, outcomes in sorted(by_kind.items()):
+        ok = [outcome for outcome in outcomes if outcome['error'] is None]
+        stage['by_kind'][kind] = {
+            'requests': len(outcomes),
+            'errors': len(outcomes) - len(ok),
+            'decoded': sum(outcome['decoded'] for outcome in ok) if kind != 'health' else None,
+            **_summary([outcome['latency_ms'] for outcome in ok]),
+        }
+    error_kinds = defaultdict(int)
+    for outcome in results:
+        if outcome['error']:
+            error_kinds[outcome['error']] += 1
+    stage['error_kinds'] = dict(error_kinds)
+    return stage
+
+
+def stage_violations(stage: Dict, slo_p99_ms: float, max_error_rate: float) -> List[str]:
+    """Why a stage counts as saturated; empty when it kept up within the SLO"""
+    reasons = []
+    if stage['throughput_rps'] < SATURATION_THROUGHPUT * stage['offered_rps']:
+        reasons.append(f"throughput {stage['throughput_rps']}/s of {stage['offered_rps']}/s offered")
+    if stage['p99_ms'] is not None and stage['p99_ms'] > slo_p99_ms:
+        reasons.append(f"p99 {stage['p99_ms']} ms over the {slo_p99_ms:g} ms SLO")
+    if stage['error_rate'] > max_error_rate:
+        reasons.append(f"error rate {stage['error_rate']:.2%} over {max_error_rate:.2%}")
+    return reasons
+
+
+def saturation_point(stages: List[Dict], slo_p99_ms: float, max_error_rate: float) -> Dict:
+    """The highest rate that met the SLO and the first one that didn't, with why"""
+    saturation = {'max_sustained_rps': None, 'saturated_at_rps': None, 'reasons': []}
+    for stage in sorted(stages, key=lambda s: s['offered_rps']):
+        reasons = stage_violations(stage, slo_p99_ms, max_error_rate)
+        if reasons:
+            saturation.update(saturated_at_rps=stage['offered_rps'], reasons=reasons)
+            break
+        saturation['max_sustained_rps'] = stage['offered_rps']
+    return saturation
+
+
+def wait_for_health(base_url: str, timeout: float = 60.0) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if send(build_request(base_url, 'health'), timeout=2.0)['error'] is None:
+            return True
+        time.sleep(0.2)
+    return False
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(work_dir: str) -> Tuple[subprocess.Popen, str, str]:
+    """Run prescription_api.py on a free port; returns (process, base URL, log path)"""
+    port = _free_port()
+    log_path = os.path.join(work_dir, 'server.log')
+    env = dict(os.environ, PORT=str(port), DEBUG='False',
+               QR_SCAN_JOBS_DB=os.path.join(work_dir, 'scan_jobs.sqlite3'))
+    with open(log_path, 'wb') as log:
+        process = subprocess.Popen([sys.executable, os.path.join(BACKEND_DIR, 'prescription_api.py')],
+                                   cwd=BACKEND_DIR, env=env, stdout=log, stderr=subprocess.STDOUT)
+    return process, f'http://127.0.0.1:{port}', log_path
+
+
+def run_load_test(base_url: str, workload: Dict, mix: Dict[str, float], rates: List[float],
+                  duration: float, slo_p99_ms: float = 2000.0, max_error_rate: float = 0.01,
+                  seed: int = 0, **stage_options) -> Dict:
+    rng = np.random.default_rng(seed)
+    # One untimed scan so imports and detector setup aren't billed to the first stage
+    warm_kind = next((kind for kind in ('easy_qr', 'hard_qr', 'ocr_only') if workload.get(kind)), None)
+    if warm_kind:
+        name, data = workload[warm_kind][0]
+        send(build_request(base_url, warm_kind, name, data), stage_options.get('timeout', 30.0))
+
+    stages = []
+    for rate in rates:
+        stage = run_stage(base_url, workload, mix, rate, duration, rng, **stage_options)
+        stages.append(stage)
+        print(f"{rate:8.1f}/s offered {stage['throughput_rps']:8.2f}/s done  "
+              f"p50 {stage['p50_ms'] or 0:8.1f}  p95 {stage['p95_ms'] or 0:8.1f}  "
+              f"p99 {stage['p99_ms'] or 0:8.1f} ms  errors {stage['error_rate']:.1%}")
+    return {
+        'target': base_url,
+        'duration_seconds': duration,
+        'mix': mix,
+        'images': {kind: len(images) for kind, images in workload.items()},
+        'slo': {'p99_ms': slo_p99_ms, 'max_error_rate': max_error_rate},
+        'cpus': os.cpu_count(),
+        'stages': stages,
+        'saturation': saturation_point(stages, slo_p99_ms, max_error_rate),
+    }
+
+
+def _bar_chart(stages: List[Dict], slo_p99_ms: float) -> str:
+    """Inline SVG of p50/p95/p99 latency per offered rate, with the SLO line"""
+    width, height, pad = 640, 260, 40
+    peak = max([slo_p99_ms] + [stage['p99_ms'] or 0 for stage in stages]) * 1.1
+    slot = (width - 2 * pad) / max(len(stages), 1)
+    colors = {'p50_ms': '#4c9be8', 'p95_ms': '#f0a33a', 'p99_ms': '#d9534f'}
+    parts = [f'<svg width="{width}" height="{height}" xmlns="http://www.w3.org/2000/svg">']
+    for index, stage in enumerate(stages):
+        for offset, (key, color) in enumerate(colors.items()):
+            value = stage[key] or 0
+            bar = (height - 2 * pad) * value / peak
+            x = pad + index * slot + 8 + offset * (slot - 16) / 3
+            parts.append(f'<rect x="{x:.1f}" y="{height - pad - bar:.1f}" width="{(slot - 16) / 3:.1f}" '
+                         f'height="{bar:.1f}" fill="{color}"><title>{key[:3]} {value} ms</title></rect>')
+        parts.append(f'<text x="{pad + (index + 0.5) * slot:.1f}" y="{height - pad + 16}" '
+                     f'text-anchor="middle" font-size="12">{stage["offered_rps"]:g}/s</text>')
+    slo_y = height - pad - (height - 2 * pad) * slo_p99_ms / peak
+    parts.append(f'<line x1="{pad}" x2="{width - pad}" y1="{slo_y:.1f}" y2="{slo_y:.1f}" '
+                 f'stroke="#333" stroke-dasharray="4 3"/>')
+    parts.append(f'<text x="{width - pad}" y="{slo_y - 4:.1f}" text-anchor="end" '
+                 f'font-size="11">p99 SLO {slo_p99_ms:g} ms</text></svg>')
+    return ''.join(parts)
+
+
+def render_html(report: Dict) -> str:
+    saturation = report['saturation']
+    if saturation['saturated_at_rps'] is None:
+        verdict = f"Kept up with every rate up to {saturation['max_sustained_rps']:g}/s."
+    else:
+        verdict = (f"Saturated at {saturation['saturated_at_rps']:g}/s: "
+                   f"{'; '.join(saturation['reasons'])}.")
+    rows = []
+    for stage in report['stages']:
+        violated = stage_violations(stage, report['slo']['p99_ms'], report['slo']['max_error_rate'])
+        row_class = ' class="bad"' if violated else ''
+        rows.append(
+            f"<tr{row_class}><td>{stage['offered_rps']:g}</td>"
+            f"<td>{stage['throughput_rps']}</td><td>{stage['requests']}</td>"
+            f"<td>{stage['p50_ms']}</td><td>{stage['p95_ms']}</td><td>{stage['p99_ms']}</td>"
+            f"<td>{stage['error_rate']:.1%}</td></tr>")
+        for kind, row in stage['by_kind'].items():
+            decoded = '' if row['decoded'] is None else f" ({row['decoded']} decoded)"
+            rows.append(
+                f"<tr class=\"kind\"><td>{kind}</td><td></td><td>{row['requests']}{decoded}</td>"
+                f"<td>{row['p50_ms']}</td><td>{row['p95_ms']}</td><td>{row['p99_ms']}</td>"
+                f"<td>{row['errors']}</td></tr>")
+    return f"""<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>Scan API load test</title>
+<style>
+body {{ font-family: sans-serif; margin: 2em; }}
+table {{ border-collapse: collapse; }}
+td, th {{ border: 1px solid #ccc; padding: 4px 10px; text-align: right; }}
+tr.bad td {{ background: #fbe3e3; }}
+tr.kind td {{ color: #666; font-size: 0.9em; }}
+</style></head><body>
+<h1>Scan API load test</h1>
+<p>{report['target']} &middot; {report['duration_seconds']:g} s per rate &middot; {report['cpus']} CPUs
+&middot; mix {', '.join(f'{kind} {weight:.0%}' for kind, weight in report['mix'].items())}</p>
+<p><strong>{verdict}</strong></p>
+{_bar_chart(report['stages'], report['slo']['p99_ms'])}
+<table>
+<tr><th>offered /s</th><th>throughput /s</th><th>requests</th><th>p50 ms</th><th>p95 ms</th>
+<th>p99 ms</th><th>errors</th></tr>
+{''.join(rows)}
+</table>
+</body></html>
+"""
+
+
+def write_report(report: Dict, prefix: str) -> Tuple[str, str]:
+    """Write prefix.json and prefix.html; returns both paths"""
+    json_path, html_path = f'{prefix}.json', f'{prefix}.html'
+    with open(json_path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    with open(html_path, 'w', encoding='utf-8') as f:
+        f.write(render_html(report))
+    return json_path, html_path
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description='Open-loop load test for the scan API')
+    parser.add_argument('--url', help='Target a running server instead of starting one')
+    parser.add_argument('--rates', default=','.join(f'{rate:g}' for rate in DEFAULT_RATES),
+                        help='Comma-separated arrival rates in requests per second')
+    parser.add_argument('--duration', type=float, default=20.0, help='Seconds per rate')
+    parser.add_argument('--mix', default=','.join(f'{k}={v}' for k, v in DEFAULT_MIX.items()),
+                        help=f"Request kind weights, e.g. easy_qr=0.6,hard_qr=0.4 ({', '.join(KINDS)})")
+    parser.add_argument('--base64-fraction', type=float, default=0.5,
+                        help='Share of scans sent as base64 JSON rather than multipart')
+    parser.add_argument('--corpus', help='Use a synthetic_corpus.py output directory for the QR images')
+    parser.add_argument('--uniform', action='store_true',
+                        help='Evenly spaced arrivals instead of Poisson')
+    parser.add_argument('--slo-p99-ms', type=float, default=2000.0)
+    parser.add_argument('--max-error-rate', type=float, default=0.01)
+    parser.add_argument('--timeout', type=float, default=30.0, help='Per-request timeout in seconds')
+    parser.add_argument('--max-in-flight', type=int, default=64,
+                        help='Sender threads; requests beyond this wait, and the wait counts')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--report', default='load_report',
+                        help='Report path prefix; writes <prefix>.json and <prefix>.html')
+    args = parser.parse_args(argv)
+
+    try:
+        mix = parse_mix(args.mix)
+        rates = [float(rate) for rate in args.rates.split(',') if rate.strip()]
+    except ValueError as e:
+        parser.error(str(e))
+    if not rates or min(rates) <= 0:
+        parser.error('--rates must be positive numbers')
+
+    workload = build_workload(args.corpus)
+    print(f"Images: {', '.join(f'{len(images)} {kind}' for kind, images in workload.items())}")
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        process = None
+        base_url = args.url.rstrip('/') if args.url else None
+        if base_url is None:
+            process, base_url, log_path = start_server(work_dir)
+        try:
+            if not wait_for_health(base_url):
+                if process is not None:
+                    with open(log_path, encoding='utf-8', errors='replace') as log:
+                        print(log.read()[-2000:], file=sys.stderr)
+                sys.exit(f"✗ Server at {base_url} did not become healthy")
+            print(f"Target: {base_url}, {args.duration:g} s per rate")
+            report = run_load_test(base_url, workload, mix, rates, args.duration,
+                                   slo_p99_ms=args.slo_p99_ms, max_error_rate=args.max_error_rate,
+                                   seed=args.seed, base64_fraction=args.base64_fraction,
+                                   timeout=args.timeout, max_in_flight=args.max_in_flight,
+                                   poisson=not args.uniform)
+        finally:
+            if process is not None:
+                process.terminate()
+                process.wait(timeout=10)
+
+    json_path, html_path = write_report(report, args.report)
+    saturation = report['saturation']
+    if saturation['saturated_at_rps'] is None:
+        print(f"✓ No saturation up to {saturation['max_sustained_rps']:g}/s")
+    else:
+        print(f"Saturated at {saturation['saturated_at_rps']:g}/s: {'; '.join(saturation['reasons'])}")
+    print(f"Report: {json_path}, {html_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+National Drug Code (NDC) normalization.
+
+Labels print 10-digit NDCs in one of three segment layouts (4-4-2, 5-3-2,
+5-4-1); billing systems use the 11-digit 5-4-2 form, which pads the short
+segment with a leading zero. Normalizing to 5-4-2 gives downstream services
+a single key to cache and query on, whatever layout was scanned.
+"""
+
+import re
+from typing import Dict, List, Optional
+
+# Layouts of the 10-digit NDC and which segment gets padded to reach 5-4-2
+TEN_DIGIT_LAYOUTS = ('4-4-2', '5-3-2', '5-4-1')
+CANONICAL_LAYOUT = '5-4-2'
+
+HYPHENATED_NDC_RE = re.compile(r'^(\d{4,5})-(\d{3,4})-(\d{1,2})$')
+SEPARATORS_RE = re.compile(r'[\s-]')
+
+
+def _canonical_parts(labeler: str, product: str, package: str) -> Dict[str, str]:
+    labeler, product, package = labeler.zfill(5), product.zfill(4), package.zfill(2)
+    return {
+        'canonical': f"{labeler}-{product}-{package}",
+        'digits': f"{labeler}{product}{package}",
+        'labeler': labeler,
+        'product': product,
+        'package': package,
+    }
+
+
+def canonical_candidates(ndc10: str) -> List[str]:
+    """
+    The three 11-digit forms a bare 10-digit NDC could stand for, in
+    4-4-2, 5-3-2, 5-4-1 order. Without the FDA directory the right one
+    cannot be told apart, so barcode NDCs report all three.
+    """
+    return [
+        _canonical_parts(ndc10[:4], ndc10[4:8], ndc10[8:])['canonical'],
+        _canonical_parts(ndc10[:5], ndc10[5:8], ndc10[8:])['canonical'],
+        _canonical_parts(ndc10[:5], ndc10[5:9], ndc10[9:])['canonical'],
+    ]
+
+
+def normalize_ndc(raw: Optional[str]) -> Optional[Dict]:
+    """
+    Normalize an NDC as found in a payload, on a label or in a barcode.
+
+    Returns None for empty input, otherwise a dict with:
+      raw        - the string as found
+      canonical  - 11-digit 5-4-2 form with hyphens, or None if unknown
+      digits     - canonical without hyphens
+      layout     - segment layout of the input ('4-4-2', '5-3-2', '5-4-1',
+                   '5-4-2'), or None when it can't be determined
+      labeler, product, package - the canonical segments
+      candidates - possible canonical forms when the layout is unknown
+    """
+    if raw is None:
+        return None
+    raw = str(raw).strip()
+    if not raw:
+        return None
+
+    result = {
+        'raw': raw,
+        'canonical': None,
+        'digits': None,
+        'layout': None,
+        'labeler': None,
+        'product': None,
+        'package': None,
+        'candidates': [],
+    }
+
+    match = HYPHENATED_NDC_RE.match(raw)
+    if match:
+        labeler, product, package = match.groups()
+        layout = f"{len(labeler)}-{len(product)}-{len(package)}"
+        if layout in TEN_DIGIT_LAYOUTS or layout == CANONICAL_LAYOUT:
+            result.update(_canonical_parts(labeler, product, package))
+            result['layout'] = layout
+        return result
+
+    digits = SEPARATORS_RE.sub('', raw)
+    if digits.isdigit() and len(digits) == 11:
+        result.update(_canonical_parts(digits[:5], digits[5:9], digits[9:]))
+        result['layout'] = CANONICAL_LAYOUT
+    elif digits.isdigit() and len(digits) == 10:
+        result['candidates'] = canonical_candidates(digits)
+    return result
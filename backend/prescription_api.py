@@ -1,15 +1,21 @@
 #!/usr/bin/env python3
 
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, request, jsonify
 from werkzeug.utils import secure_filename
 import os
-import tempfile
 import base64
-import io
-from PIL import Image
+import json
+import time
 import cv2
-import numpy as np
-from prescription_qr_reader import PrescriptionQRReader, PYZBAR_AVAILABLE, TESSERACT_AVAILABLE
+from image_ingest import load_image_bytes
+from image_quality import passes_quality_gate
+from prescription_qr_reader import PrescriptionQRReader, TESSERACT_AVAILABLE
+from scan_capture import CaptureStore
+from scan_hints import parse_scan_hints
+from scan_jobs import JobQueue
+from scan_memory import ScanMemory, input_pixel_limit
+from scan_profiler import ScanProfiler
+from single_flight import SingleFlight, flight_key
 import logging
 
 app = Flask(__name__)
@@ -20,44 +26,59 @@ logger = logging.getLogger(__name__)
 
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'bmp', 'tiff', 'webp'}
 
+# One reader per worker; its detector context is thread-safe and reused across requests
+reader = PrescriptionQRReader()
+# Coalesces identical scans running at the same time, across workers on this host
+scan_flights = SingleFlight()
+# Asynchronous scans, drained by `python scan_jobs.py worker`
+scan_jobs = JobQueue()
+# Profiles the next requests of this worker when armed through /debug/profile
+profiler = ScanProfiler()
+# Keeps missed and slow scans in QR_CAPTURE_DIR for `python scan_capture.py replay`
+captures = CaptureStore()
+
 
 def allowed_file(filename):
     """Check if uploaded file has allowed extension"""
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
 
-def decode_base64_image(base64_string):
-    try:
-        if base64_string.startswith('data:image'):
-            base64_string = base64_string.split(',')[1]
+def base64_image_bytes(base64_string):
+    """Encoded image bytes from base64 data, with or without a data: URL prefix"""
+    if base64_string.startswith('data:image'):
+        base64_string = base64_string.split(',')[1]
+    return base64.b64decode(base64_string)
 
-        image_data = base64.b64decode(base64_string)
-        image = Image.open(io.BytesIO(image_data))
 
-        image_cv = cv2.cvtColor(np.array(image), cv2.COLOR_RGB2BGR)
-        return image_cv
-    except Exception as e:
+def decode_base64_image(base64_string):
+    """Upright image and its metadata from base64 data, or None"""
+    try:
+        return decode_image_bytes(base64_image_bytes(base64_string))
+    except (ValueError, IndexError) as e:
         logger.error(f"Error decoding base64 image: {e}")
         return None
 
 
-def read_qr_from_image_array(image_array):
-    try:
-        reader = PrescriptionQRReader()
-        # First try QR detection
-        qr_data = reader.enhanced_qr_detection(image_array)
-        if qr_data:
-            return qr_data
+def decode_image_bytes(data):
+    """
+    Decode an uploaded image in memory, turned upright by its EXIF
+    orientation. Returns (image, metadata) or None.
+    """
+    loaded = load_image_bytes(data, input_pixel_limit())
+    if loaded is None:
+        logger.error("Error decoding uploaded image: unreadable image data")
+    return loaded
 
-        # Fallback to NDC detection if no QR code found
-        ndc_number = reader.detect_ndc_from_text(image_array)
-        if ndc_number:
-            return f"NDC: {ndc_number}"
 
-        return None
+def read_qr_from_image_array(image_array, quality=None, orientation_known=False, hints=None,
+                             memory=None, decode_scale=1.0):
+    """QR/barcode payload, else the label text payload; returns (payload or None, hint report)"""
+    try:
+        return reader.scan_payload(image_array, quality, orientation_known, hints, memory,
+                                   decode_scale)
     except Exception as e:
         logger.error(f"Error reading QR code: {e}")
-        return None
+        return None, None
 
 
 @app.route('/health', methods=['GET'])
@@ -68,7 +89,11 @@ def health_check():
         'version': '1.0.0',
         'capabilities': {
             'qr_detection': True,
-            'qr_detection_method': 'pyzbar + opencv' if PYZBAR_AVAILABLE else 'opencv',
+            'qr_detection_method': ' + '.join(backend.name for backend in reader.router.backends),
+            'qr_decoders': [
+                {'name': backend.name, 'cost': backend.cost, 'strengths': list(backend.strengths)}
+                for backend in reader.router.backends
+            ],
             'text_detection': TESSERACT_AVAILABLE,
             'text_detection_method': 'tesseract_ocr' if TESSERACT_AVAILABLE else 'unavailable',
             'image_processing': True,
@@ -83,81 +108,178 @@ def health_check():
     }), 200
 
 
+def scan_image(decode, image_source, hints=None, encoded=None):
+    """
+    Decode, gate, scan and parse one image; returns (response body, status).
+    With hints (see scan_hints.py) the body reports how they were used.
+    encoded() returns the uploaded image bytes, read only when the scan is
+    captured (see scan_capture.py).
+    """
+    start = time.perf_counter()
+    decoded = decode()
+    if decoded is None:
+        if image_source == 'file_upload':
+            return {'error': 'Invalid image',
+                    'message': 'Could not decode the uploaded image'}, 400
+        return {'error': 'Invalid base64 image',
+                'message': 'Could not decode base64 image data'}, 400
+    image_array, metadata = decoded
+    decode_ms = 1000 * (time.perf_counter() - start)
+
+    body = scan_decoded_image(image_array, metadata, image_source, hints)
+    total_ms = 1000 * (time.perf_counter() - start)
+    reason = captures.reason(body, total_ms)
+    if reason and encoded is not None:
+        timings = {'decode_ms': round(decode_ms, 2), 'scan_ms': round(total_ms - decode_ms, 2),
+                   'total_ms': round(total_ms, 2)}
+        captures.submit(reason, encoded(), image_array, metadata, body, timings,
+                        image_source, hints)
+    return body, 200
+
+
+def scan_decoded_image(image_array, metadata, image_source, hints=None):
+    """Response body for a decoded upload: quality gate, scan and parse"""
+    # Black, blank and badly blurred frames are answered in milliseconds
+    quality = reader.assess_quality(image_array)
+    if not passes_quality_gate(quality):
+        return {
+            'success': False,
+            'qr_detected': False,
+            'image_source': image_source,
+            'message': 'Image quality too low to scan',
+            'quality': quality
+        }
+
+    # Estimated peak of the scan's image buffers, against QR_SCAN_MEMORY_BUDGET_MB
+    memory = ScanMemory()
+    if metadata['decode_scale'] < 1.0:
+        memory.degrade('reduced_decode')
+    qr_data, hint_report = read_qr_from_image_array(
+        image_array, quality, metadata['orientation_known'], hints, memory,
+        metadata['decode_scale'])
+    payload_format = hints['payload_format'] if hints else None
+
+    if qr_data:
+        parsed_data = reader.parse_prescription_data(qr_data, payload_format, hint_report)
+        is_valid, issues = reader.validate_prescription_data(parsed_data)
+
+        # Remove raw_data from response to keep it clean
+        response_data = {k: v for k,
+                         v in parsed_data.items() if k != 'raw_data'}
+
+        body = {
+            'success': True,
+            'qr_detected': True,
+            'image_source': image_source,
+            'prescription_data': response_data,
+            'validation': {
+                'is_valid': is_valid,
+                'issues': issues
+            },
+            'raw_qr_data': qr_data
+        }
+    else:
+        body = {
+            'success': False,
+            'qr_detected': False,
+            'image_source': image_source,
+            'message': 'No QR code detected in the provided image',
+            'quality': quality
+        }
+    if hints and hint_report is not None:
+        body['hints'] = hint_report
+    body['memory'] = memory.summary()
+    return body
+
+
+def image_request():
+    """
+    The image in a scan request: (image_data, image_source, idempotency_key,
+    error). image_data is the uploaded file's bytes or the base64 string;
+    error is a (body, status) response when the request has no usable image.
+    """
+    idempotency_key = request.headers.get('Idempotency-Key')
+
+    if 'image' in request.files:
+        file = request.files['image']
+        if file and file.filename and allowed_file(file.filename):
+            return file.read(), "file_upload", idempotency_key, None
+        return None, None, None, ({
+            'error': 'Invalid file type',
+            'message': 'Please upload a valid image file (PNG, JPG, JPEG, GIF, BMP, TIFF, WEBP)'
+        }, 400)
+
+    if request.is_json:
+        data = request.get_json()
+        if 'image' in data:
+            idempotency_key = idempotency_key or data.get('idempotency_key')
+            return data['image'], "base64", idempotency_key, None
+        return None, None, None, ({
+            'error': 'Missing image data',
+            'message': 'Please provide image data in base64 format'
+        }, 400)
+
+    return None, None, None, ({
+        'error': 'No image provided',
+        'message': 'Please provide an image file or base64 image data'
+    }, 400)
+
+
+def request_hints():
+    """
+    Scan hints from the JSON body's 'hints' object or a 'hints' form field
+    holding JSON; None when the request has none. Raises ValueError.
+    """
+    if request.is_json:
+        raw = (request.get_json() or {}).get('hints')
+    else:
+        raw = request.form.get('hints')
+    if raw is None or raw == '':
+        return None
+    return parse_scan_hints(raw)
+
+
 @app.route('/api/scan-qr', methods=['POST'])
 def scan_qr_code():
     # Note: QR detection will use OpenCV's built-in detector if pyzbar is not available
     try:
-        qr_data = None
-        image_source = None
-
-        if 'image' in request.files:
-            file = request.files['image']
-            if file and file.filename and allowed_file(file.filename):
-                # Save uploaded file temporarily
-                with tempfile.NamedTemporaryFile(delete=False, suffix='.png') as tmp_file:
-                    file.save(tmp_file.name)
-
-                    reader = PrescriptionQRReader()
-                    qr_data = reader.read_from_image(tmp_file.name)
-                    image_source = "file_upload"
-
-                    os.unlink(tmp_file.name)
-            else:
-                return jsonify({
-                    'error': 'Invalid file type',
-                    'message': 'Please upload a valid image file (PNG, JPG, JPEG, GIF, BMP, TIFF, WEBP)'
-                }), 400
-
-        elif request.is_json:
-            data = request.get_json()
-            if 'image' in data:
-                image_array = decode_base64_image(data['image'])
-                if image_array is not None:
-                    qr_data = read_qr_from_image_array(image_array)
-                    image_source = "base64"
-                else:
-                    return jsonify({
-                        'error': 'Invalid base64 image',
-                        'message': 'Could not decode base64 image data'
-                    }), 400
-            else:
-                return jsonify({
-                    'error': 'Missing image data',
-                    'message': 'Please provide image data in base64 format'
-                }), 400
-        else:
+        image_data, image_source, idempotency_key, error = image_request()
+        if error:
+            body, status = error
+            return jsonify(body), status
+        try:
+            hints = request_hints()
+        except ValueError as e:
             return jsonify({
-                'error': 'No image provided',
-                'message': 'Please provide an image file or base64 image data'
+                'error': 'Invalid hints',
+                'message': str(e)
             }), 400
 
-        if qr_data:
-            reader = PrescriptionQRReader()
-            parsed_data = reader.parse_prescription_data(qr_data)
-            is_valid, issues = reader.validate_prescription_data(parsed_data)
-
-            # Remove raw_data from response to keep it clean
-            response_data = {k: v for k,
-                             v in parsed_data.items() if k != 'raw_data'}
+        if image_source == "file_upload":
+            def decode():
+                return decode_image_bytes(image_data)
 
-            return jsonify({
-                'success': True,
-                'qr_detected': True,
-                'image_source': image_source,
-                'prescription_data': response_data,
-                'validation': {
-                    'is_valid': is_valid,
-                    'issues': issues
-                },
-                'raw_qr_data': qr_data
-            }), 200
+            def encoded():
+                return image_data
         else:
-            return jsonify({
-                'success': False,
-                'qr_detected': False,
-                'image_source': image_source,
-                'message': 'No QR code detected in the provided image'
-            }), 200
+            def decode():
+                return decode_base64_image(image_data)
+
+            def encoded():
+                return base64_image_bytes(image_data)
+
+        # A retry of a scan that is still running waits for it instead of
+        # decoding the same image again, in this worker or another one. An
+        # Idempotency-Key only matches together with the same image, so a
+        # reused or guessed key can't return another upload's result.
+        hints_key = json.dumps(hints, sort_keys=True)
+        if idempotency_key:
+            key = flight_key('idempotency', idempotency_key, image_source, image_data, hints_key)
+        else:
+            key = flight_key(image_source, image_data, hints_key)
+        (body, status), shared = scan_flights.run(
+            key, lambda: scan_image(decode, image_source, hints, encoded))
+        return jsonify(dict(body, shared_result=shared)), status
 
     except Exception as e:
         logger.error(f"Error processing QR code: {e}")
@@ -167,6 +289,130 @@ def scan_qr_code():
         }), 500
 
 
+@app.route('/api/scan-jobs', methods=['POST'])
+def submit_scan_job():
+    """Queue a scan and answer at once; poll GET /api/scan-jobs/<job_id> for the result"""
+    try:
+        image_data, image_source, idempotency_key, error = image_request()
+        if error:
+            body, status = error
+            return jsonify(body), status
+
+        if image_source == "base64":
+            try:
+                image_data = base64_image_bytes(image_data)
+            except (ValueError, IndexError):
+                return jsonify({
+                    'error': 'Invalid base64 image',
+                    'message': 'Could not decode base64 image data'
+                }), 400
+
+        # Resubmitting the same image with the same Idempotency-Key returns the
+        # same job; the id depends on the image too, so a key alone can't be
+        # used to poll another client's result
+        job_id = (flight_key('scan_job', idempotency_key, image_data)
+                  if idempotency_key else None)
+        job_id, created = scan_jobs.submit(image_data, image_source, job_id)
+        job = scan_jobs.get(job_id)
+        status_url = f'/api/scan-jobs/{job_id}'
+        response = jsonify({
+            'job_id': job_id,
+            'status': job['status'] if job else 'queued',
+            'created': created,
+            'status_url': status_url
+        })
+        response.headers['Location'] = status_url
+        return response, 202
+
+    except Exception as e:
+        logger.error(f"Error queueing scan job: {e}")
+        return jsonify({
+            'error': 'Processing error',
+            'message': f'An error occurred while queueing the image: {str(e)}'
+        }), 500
+
+
+@app.route('/api/scan-jobs/metrics', methods=['GET'])
+def scan_job_metrics():
+    return jsonify(scan_jobs.metrics()), 200
+
+
+@app.route('/api/scan-jobs/<job_id>', methods=['GET'])
+def get_scan_job(job_id):
+    job = scan_jobs.get(job_id)
+    if job is None:
+        return jsonify({
+            'error': 'Job not found',
+            'message': 'No scan job with this id, or its result has expired'
+        }), 404
+    # Done jobs carry the /api/scan-qr response body and status
+    result = job.pop('result', None)
+    if result is not None:
+        job['result'] = result['body']
+        job['result_status'] = result['status']
+    return jsonify(job), 200
+
+
+@app.before_request
+def start_request_profile():
+    # One attribute check unless a profiling session is armed
+    if profiler.armed and not request.path.startswith('/debug/'):
+        g.profile = profiler.begin()
+
+
+@app.teardown_request
+def end_request_profile(exc):
+    profiler.end(g.pop('profile', None))
+
+
+def profile_request_authorized():
+    """Bearer token from QR_PROFILE_TOKEN; without a token the endpoint doesn't exist"""
+    header = request.headers.get('Authorization', '')
+    supplied = header[len('Bearer '):] if header.startswith('Bearer ') else None
+    return profiler.authorized(supplied)
+
+
+@app.route('/debug/profile', methods=['POST', 'GET', 'DELETE'])
+def debug_profile():
+    """
+    POST {"requests": N, "seconds": T, "mode": "sample"|"cprofile",
+    "interval_ms": 5} arms profiling of this worker's next requests.
+    GET returns the status, top functions and collapsed stacks so far
+    (?format=collapsed for the stacks as text); DELETE stops the session.
+    """
+    if not profiler.token:
+        return not_found(None)
+    if not profile_request_authorized():
+        return jsonify({
+            'error': 'Unauthorized',
+            'message': 'A valid profiling token is required'
+        }), 401
+
+    if request.method == 'POST':
+        options = request.get_json(silent=True) or {}
+        unknown = sorted(set(options) - {'requests', 'seconds', 'mode', 'interval_ms'})
+        try:
+            if unknown:
+                raise ValueError(f"Unknown options: {', '.join(unknown)}")
+            status = profiler.arm(**options)
+        except (TypeError, ValueError) as e:
+            return jsonify({
+                'error': 'Invalid profiling options',
+                'message': str(e)
+            }), 400
+        return jsonify(dict(status, pid=os.getpid())), 202
+
+    if request.method == 'DELETE':
+        profiler.disarm()
+        return jsonify(dict(profiler.status(), pid=os.getpid())), 200
+
+    if request.args.get('format') == 'collapsed':
+        return Response(profiler.collapsed(), mimetype='text/plain')
+    limit = request.args.get('top', type=int) or None
+    report = profiler.report(limit) if limit else profiler.report()
+    return jsonify(dict(report, pid=os.getpid())), 200
+
+
 @app.errorhandler(413)
 def too_large(e):
     return jsonify({
@@ -199,5 +445,11 @@ if __name__ == '__main__':
     print("Available endpoints:")
     print("  GET  /health - Health check")
     print("  POST /api/scan-qr - Scan QR code from image")
+    print("  POST /api/scan-jobs - Queue a scan; poll GET /api/scan-jobs/<job_id>")
+    print("  GET  /api/scan-jobs/metrics - Scan job queue depth and age")
+    if captures.enabled:
+        print(f"Capturing missed and slow scans in {captures.directory}")
+    if profiler.token:
+        print("  POST /debug/profile - Profile the next requests (QR_PROFILE_TOKEN)")
 
     app.run(host='0.0.0.0', port=port, debug=debug)
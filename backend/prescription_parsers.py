@@ -0,0 +1,411 @@
+#!/usr/bin/env python3
+"""
+Payload parsers for decoded prescription data.
+
+A payload is sniffed once and handed to the parser for its format. Package
+barcodes and OCR text hand-offs are handled in code; the XML, JSON and
+KEY: value formats come from a declarative mapping schema
+(payload_mappings.json) that names each format, its syntax and its field
+aliases. The schema is compiled into flat alias tables and compiled regexes
+when loaded, and reloaded when the file changes, so a new pharmacy layout
+needs no code change and no worker restart.
+"""
+
+import ast
+import html
+import json
+import os
+import re
+import sys
+import threading
+import time
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from gs1 import is_barcode_payload, parse_barcode, split_barcode_payload
+
+TEXT_INFO_PREFIX = 'TEXT_INFO: '
+
+DEFAULT_MAPPINGS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                     'payload_mappings.json')
+MAPPINGS_PATH = os.environ.get('QR_PAYLOAD_MAPPINGS', DEFAULT_MAPPINGS_PATH)
+
+# How often workers look at the mapping file's modification time
+RELOAD_INTERVAL_SECONDS = float(os.environ.get('QR_MAPPINGS_RELOAD_SECONDS', '2'))
+
+# Fields a mapping may fill in; see PrescriptionQRReader.parse_prescription_data
+MAPPABLE_FIELDS = (
+    'patient_name', 'patient_dob', 'medication_name', 'medication_strength',
+    'ndc_number', 'prescriber_name', 'pharmacy_name', 'rx_number', 'date_filled',
+    'directions', 'quantity', 'refills',
+)
+
+
+def build_alias_table(mappings: Dict[str, List[str]],
+                      case_sensitive: bool = False) -> Dict[str, tuple]:
+    """{field: [aliases]} -> {alias: (field, priority)}, aliases lowercased unless case_sensitive"""
+    table = {}
+    for field, aliases in mappings.items():
+        for priority, alias in enumerate(aliases):
+            table.setdefault(alias if case_sensitive else alias.lower(), (field, priority))
+    return table
+
+
+def apply_aliases(items, aliases: Dict[str, tuple], parsed_data: Dict,
+                  case_sensitive: bool = False) -> None:
+    """
+    Copy (key, value, depth) items into parsed_data. Per field the
+    shallowest key wins, then the best-ranked alias.
+    """
+    ranks = {}
+    for key, value, depth in items:
+        entry = aliases.get(key if case_sensitive else key.lower())
+        if entry is None:
+            continue
+        field, priority = entry
+        rank = (depth, priority)
+        if field not in ranks or rank < ranks[field]:
+            ranks[field] = rank
+            parsed_data[field] = value
+
+
+# An opening or closing tag (name with its '/'), its attributes and the
+# text after it, up to the next '<'
+TAG_RE = re.compile(r'<(/?[A-Za-z_][\w.:-]*)([^<>]*)>([^<]*)')
+
+# HTML elements that never have a closing tag
+VOID_TAGS = frozenset(['br', 'hr', 'img', 'input', 'link', 'meta', 'wbr'])
+
+
+def iter_tag_values(payload: str) -> Iterator[Tuple[str, str, int]]:
+    """
+    Yield (tag, text, depth) for each opening tag followed by text, in one
+    pass; depth is the number of elements still open around the tag, so
+    the root's children are at depth 1. A closing tag also closes anything
+    left unclosed inside its element (<dg>Aspirin<in>..</p>), and stray
+    closing tags are ignored, so broken and HTML-ish markup needs no
+    special handling. Namespace prefixes are dropped and entities decoded.
+    """
+    open_tags = []
+    for tag, attributes, text in TAG_RE.findall(payload):
+        closing = tag[0] == '/'
+        if closing:
+            tag = tag[1:]
+        if ':' in tag:
+            tag = tag.rsplit(':', 1)[1]
+        if closing:
+            if open_tags and open_tags[-1] == tag:
+                open_tags.pop()
+                continue
+            # Mismatched case, or elements left unclosed inside this one
+            name = tag.lower()
+            for index in range(len(open_tags) - 1, -1, -1):
+                if open_tags[index].lower() == name:
+                    del open_tags[index:]
+                    break
+            continue
+        if attributes.endswith('/') or tag.lower() in VOID_TAGS:
+            continue
+        depth = len(open_tags)
+        open_tags.append(tag)
+        text = text.strip()
+        if text:
+            if '&' in text:
+                text = html.unescape(text)
+            yield tag, text, depth
+
+
+def extract_patterns(payload: str, patterns: Dict, parsed_data: Dict,
+                     only_missing: bool = False) -> None:
+    """Fill fields from compiled regexes; group 1 if the pattern has one"""
+    for field, pattern in patterns.items():
+        if only_missing and parsed_data.get(field):
+            continue
+        match = pattern.search(payload)
+        if match:
+            parsed_data[field] = match.group(1 if pattern.groups else 0).strip()
+
+
+class PayloadParser:
+    """A payload format: sniff() recognizes it, parse() fills in parsed_data"""
+
+    name = 'base'
+    # Set on parsers compiled from the mapping schema, which reloads replace
+    from_schema = False
+
+    def sniff(self, payload: str) -> bool:
+        raise NotImplementedError
+
+    def parse(self, payload: str, parsed_data: Dict) -> Dict:
+        raise NotImplementedError
+
+
+class BarcodeParser(PayloadParser):
+    """Drug barcode (UPC/EAN or GS1 element string) found on packaging"""
+
+    name = 'barcode'
+
+    def sniff(self, payload):
+        return is_barcode_payload(payload)
+
+    def parse(self, payload, parsed_data):
+        symbology, data = split_barcode_payload(payload)
+        barcode = parse_barcode(symbology, data)
+        parsed_data['ndc_number'] = barcode['ndc']
+        for field in ['gtin', 'lot_number', 'expiration_date', 'serial_number']:
+            parsed_data[field] = barcode[field]
+        parsed_data['detection_method'] = 'BARCODE'
+        return parsed_data
+
+
+def legacy_text_info(body: str) -> Optional[Dict]:
+    """
+    OCR hand-offs archived before they were JSON are Python dict reprs,
+    e.g. {'ndc': '0378-1805-1'}. literal_eval evaluates literals only, and
+    anything but a dict of strings is refused.
+    """
+    try:
+        info = ast.literal_eval(body.strip())
+    except (ValueError, SyntaxError, MemoryError, RecursionError):
+        return None
+    if not isinstance(info, dict) or not all(
+            isinstance(key, str) and (value is None or isinstance(value, str))
+            for key, value in info.items()):
+        return None
+    return info
+
+
+class TextInfoParser(PayloadParser):
+    """NDC / Rx number found by OCR, handed over as a JSON object (or a legacy dict repr)"""
+
+    name = 'text_info'
+
+    def sniff(self, payload):
+        return payload.startswith(TEXT_INFO_PREFIX)
+
+    def parse(self, payload, parsed_data):
+        body = payload[len(TEXT_INFO_PREFIX):]
+        try:
+            info = json.loads(body)
+        except ValueError:
+            info = legacy_text_info(body)
+        if not isinstance(info, dict):
+            # Not a hand-off we produced; salvage what the text contains
+            return PARSERS[-1].parse(payload, parsed_data)
+
+        if info.get('ndc'):
+            parsed_data['ndc_number'] = info['ndc']
+        if info.get('rx_number'):
+            parsed_data['rx_number'] = info['rx_number']
+        parsed_data['detection_method'] = 'TEXT_OCR'
+        return parsed_data
+
+
+class SchemaParser(PayloadParser):
+    """A format compiled from the mapping schema"""
+
+    from_schema = True
+
+    def __init__(self, name: str, aliases: Dict[str, tuple], match=None,
+                 patterns: Optional[Dict] = None, case_sensitive: bool = False):
+        self.name = name
+        self.aliases = aliases
+        self.case_sensitive = case_sensitive
+        self.match = match
+        self.patterns = patterns or {}
+
+    def sniff(self, payload):
+        if self.match is not None:
+            return self.match.search(payload) is not None
+        return self.sniff_syntax(payload)
+
+    def sniff_syntax(self, payload):
+        raise NotImplementedError
+
+
+class XMLParser(SchemaParser):
+    """
+    Short-tag XML such as <p><n>..</n><dg>..</dg></p>, well-formed or not.
+    A field is read from its shallowest tag, so <name> inside <prescriber>
+    doesn't become the patient's name.
+    """
+
+    def sniff_syntax(self, payload):
+        stripped = payload.strip()
+        return stripped.startswith('<') and stripped.endswith('>')
+
+    def parse(self, payload, parsed_data):
+        apply_aliases(iter_tag_values(payload), self.aliases, parsed_data,
+                      self.case_sensitive)
+        extract_patterns(payload, self.patterns, parsed_data, only_missing=True)
+        return parsed_data
+
+
+class JSONParser(SchemaParser):
+    def sniff_syntax(self, payload):
+        return payload.startswith('{') and payload.endswith('}')
+
+    def parse(self, payload, parsed_data):
+        apply_aliases(((key, value, 0) for key, value in json.loads(payload).items()),
+                      self.aliases, parsed_data, self.case_sensitive)
+        extract_patterns(payload, self.patterns, parsed_data, only_missing=True)
+        return parsed_data
+
+
+class KeyValueParser(SchemaParser):
+    """Key: value lines, any case, spaces in keys read as underscores; the last line for a field wins"""
+
+    KEY_VALUE_LINE_RE = re.compile(r'^[A-Za-z][\w ]*:')
+
+    def sniff_syntax(self, payload):
+        return True
+
+    def parse(self, payload, parsed_data):
+        for line in payload.split('\n'):
+            line = line.strip()
+            if not self.KEY_VALUE_LINE_RE.match(line):
+                continue
+            key, value = line.split(':', 1)
+            key = '_'.join(key.split())
+            entry = self.aliases.get(key if self.case_sensitive else key.lower())
+            if entry:
+                parsed_data[entry[0]] = value.strip()
+
+        extract_patterns(payload, self.patterns, parsed_data, only_missing=True)
+        return parsed_data
+
+
+SYNTAXES = {'xml': XMLParser, 'json': JSONParser, 'key_value': KeyValueParser}
+
+
+def _compile_patterns(patterns: Dict[str, str], where: str) -> Dict:
+    compiled = {}
+    for field, pattern in patterns.items():
+        if field not in MAPPABLE_FIELDS:
+            raise ValueError(f"{where}: unknown field '{field}'")
+        try:
+            compiled[field] = re.compile(pattern)
+        except re.error as e:
+            raise ValueError(f"{where}: bad pattern for '{field}': {e}")
+    return compiled
+
+
+def compile_schema(schema: Dict) -> List[SchemaParser]:
+    """
+    Compile a mapping schema into parsers. Each format's own aliases rank
+    ahead of the shared 'fields' aliases, which a format can opt out of
+    with "shared_fields": false. Raises ValueError for unknown syntaxes or
+    fields and for invalid regexes.
+    """
+    shared = schema.get('fields', {})
+    parsers = []
+    for index, spec in enumerate(schema.get('formats', [])):
+        name = spec.get('name') or f"format_{index}"
+        where = f"format '{name}'"
+        syntax = SYNTAXES.get(spec.get('syntax'))
+        if syntax is None:
+            raise ValueError(f"{where}: unknown syntax '{spec.get('syntax')}'")
+
+        own = spec.get('fields', {})
+        for field in list(shared) + list(own):
+            if field not in MAPPABLE_FIELDS:
+                raise ValueError(f"{where}: unknown field '{field}'")
+        inherited = shared if spec.get('shared_fields', True) else {}
+        mappings = {field: list(own.get(field, [])) + list(inherited.get(field, []))
+                    for field in MAPPABLE_FIELDS}
+        case_sensitive = bool(spec.get('case_sensitive', False))
+
+        match = None
+        if spec.get('match'):
+            try:
+                match = re.compile(spec['match'])
+            except re.error as e:
+                raise ValueError(f"{where}: bad match pattern: {e}")
+        parsers.append(syntax(
+            name, build_alias_table(mappings, case_sensitive), match=match,
+            patterns=_compile_patterns(spec.get('patterns', {}), where),
+            case_sensitive=case_sensitive))
+
+    if not parsers or parsers[-1].match is not None or not isinstance(parsers[-1], KeyValueParser):
+        raise ValueError("The last format must be a key_value format without 'match'")
+    return parsers
+
+
+# Sniffed in order; the schema's last (key-value) format accepts anything
+PARSERS: List[PayloadParser] = []
+
+_schema_lock = threading.Lock()
+_schema_state = {'path': None, 'mtime': None, 'checked': 0.0}
+
+
+def register_parser(parser: PayloadParser) -> PayloadParser:
+    """Add a parser in code; it is tried ahead of the schema formats"""
+    with _schema_lock:
+        position = next((index for index, existing in enumerate(PARSERS)
+                         if existing.from_schema), len(PARSERS))
+        PARSERS.insert(position, parser)
+    return parser
+
+
+def load_mappings(path: Optional[str] = None) -> List[SchemaParser]:
+    """Load, compile and install a mapping schema, replacing the current one"""
+    path = path or MAPPINGS_PATH
+    with open(path, encoding='utf-8') as f:
+        parsers = compile_schema(json.load(f))
+    mtime = os.stat(path).st_mtime
+    with _schema_lock:
+        PARSERS[:] = [parser for parser in PARSERS if not parser.from_schema] + parsers
+        _schema_state.update(path=path, mtime=mtime, checked=time.monotonic())
+    return parsers
+
+
+def reload_mappings_if_changed() -> bool:
+    """
+    Reload the schema if its file changed, checking at most every
+    RELOAD_INTERVAL_SECONDS. A schema that fails to compile is reported and
+    the previous one stays in use.
+    """
+    now = time.monotonic()
+    if now - _schema_state['checked'] < RELOAD_INTERVAL_SECONDS:
+        return False
+    _schema_state['checked'] = now
+    path = _schema_state['path']
+    try:
+        mtime = os.stat(path).st_mtime
+        if mtime == _schema_state['mtime']:
+            return False
+        # Don't retry (and warn about) the same broken file on every check
+        _schema_state['mtime'] = mtime
+        load_mappings(path)
+    except (OSError, ValueError) as e:
+        print(f"Warning: keeping previous payload mappings, {path} not loaded: {e}",
+              file=sys.stderr)
+        return False
+    return True
+
+
+for _parser in (BarcodeParser(), TextInfoParser()):
+    register_parser(_parser)
+load_mappings()
+
+
+def sniff_format(payload: str) -> PayloadParser:
+    """The parser responsible for a payload"""
+    reload_mappings_if_changed()
+    for parser in PARSERS:
+        if parser.sniff(payload):
+            return parser
+    return PARSERS[-1]
+
+
+def parser_named(name: str) -> Optional[PayloadParser]:
+    """The installed parser with this format name, if any"""
+    reload_mappings_if_changed()
+    for parser in PARSERS:
+        if parser.name == name:
+            return parser
+    return None
+
+
+def text_info_payload(info: Dict) -> str:
+    """Payload string handed to parse_prescription_data for OCR results"""
+    return TEXT_INFO_PREFIX + json.dumps(info)
@@ -5,21 +5,35 @@ import numpy as np
 import json
 import re
 from datetime import datetime
-from typing import Dict, List, Optional, Tuple
+from typing import Dict, Iterator, List, Optional, Tuple
 import argparse
+import os
 import sys
-import xml.etree.ElementTree as ET
-from xml.etree.ElementTree import ParseError
-
-# Make pyzbar optional since it requires zbar system library
-try:
-    from pyzbar import pyzbar
-    from pyzbar.pyzbar import ZBarSymbol
-    PYZBAR_AVAILABLE = True
-except (ImportError, OSError) as e:
-    PYZBAR_AVAILABLE = False
-    print(
-        f"Warning: pyzbar not available ({e}). QR code detection will be limited.")
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from itertools import islice
+
+from batch_processing import (DEFAULT_CHUNK_SIZE, DEFAULT_PREFETCH, iter_image_paths,
+                              run_image_batch, run_reparse)
+from date_parsing import DateParser
+from detector_context import DetectorContext, get_default_context
+from qr_decoders import (BARCODE_SYMBOLOGIES, PYZBAR_AVAILABLE, QR_SYMBOLOGIES,
+                         QRCODE, DecoderBackend, DecoderRouter, bench_backends,
+                         geometry_traits, get_default_router)
+from gs1 import barcode_payload, parse_barcode
+from illumination import normalize_illumination
+from image_ingest import load_image_file
+from image_quality import (QUALITY_GATE_ENABLED, assess_image_quality,
+                           passes_quality_gate)
+from ndc import normalize_ndc
+from prescription_parsers import parser_named, sniff_format, text_info_payload
+from qr_geometry import (TYPICAL_QR_MODULES, analyze_geometry, initial_scale,
+                         plan_decode_scales, scale_geometry)
+from rectification import rectify_code
+from scan_hints import (MODE_OCR_ONLY, MODE_QR_ONLY, new_hint_report, note_hint,
+                        parse_scan_hints, roi_box, rotate_upright, scale_roi,
+                        skip_stage)
+from scan_memory import MIN_MODULE_PX, ScanMemory, input_pixel_limit, traced
 
 try:
     import pytesseract
@@ -29,67 +43,212 @@ try:
         TESSERACT_AVAILABLE = True
     except (OSError, RuntimeError):
         TESSERACT_AVAILABLE = False
-        print("Warning: pytesseract installed but tesseract binary not found. Text detection will be disabled.")
+        print("Warning: pytesseract installed but tesseract binary not found. Text detection will be disabled.", file=sys.stderr)
 except ImportError:
     TESSERACT_AVAILABLE = False
-    print("Warning: pytesseract not installed. Text detection will be disabled.")
+    print("Warning: pytesseract not installed. Text detection will be disabled.", file=sys.stderr)
 
+# Decode attempts run at once per scan; 1 runs the ladder sequentially.
+# OpenCV, zbar and zxing release the GIL, so idle cores shorten single scans.
+RACE_WORKERS = max(1, int(os.environ.get('QR_RACE_WORKERS', '1')))
 
-class PrescriptionQRReader:
-    def __init__(self):
-        self.cap = None
+# Preprocessed variants each backend tries after the direct attempt
+# (see preprocess_image_for_qr)
+LADDER_VARIANTS = 5
 
-    def preprocess_image_for_qr(self, image: np.ndarray) -> List[np.ndarray]:
-        processed_images = []
+# OCR works on images up to this size, upscaling narrower ones by 1.5x;
+# gray, Otsu, adaptive and morph-close variants are always read
+OCR_MAX_DIMENSION = 2000
+OCR_UPSCALE_BELOW_WIDTH = 2500
+OCR_BASE_PASSES = 4
 
-        # Original image
-        processed_images.append(image.copy())
+# Hyphenated as printed, or the plain 10/11 digits read from a barcode
+NDC_FORMAT_RE = re.compile(r'^(\d{4,5}-\d{3,4}-\d{1,2}|\d{10,11})$')
 
-        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-        processed_images.append(cv2.cvtColor(gray, cv2.COLOR_GRAY2BGR))
 
-        blurred = cv2.GaussianBlur(gray, (5, 5), 0)
-        processed_images.append(cv2.cvtColor(blurred, cv2.COLOR_GRAY2BGR))
+class PrescriptionQRReader:
+    def __init__(self, context: Optional[DetectorContext] = None,
+                 router: Optional[DecoderRouter] = None,
+                 race_workers: Optional[int] = None):
+        self.cap = None
+        # Shared detectors, lookup tables and scratch buffers reused across scans
+        self.context = context or get_default_context()
+        # Chooses which decoder backends run, cheapest likely-to-succeed first
+        self.router = router or get_default_router()
+        # Concurrent decode attempts per scan, and their thread pool
+        self.race_workers = race_workers or RACE_WORKERS
+        self._race_pool: Optional[ThreadPoolExecutor] = None
+        self._race_pool_lock = threading.Lock()
+        # Remembers the day/month order each pharmacy's dates use
+        self.date_parser = DateParser()
+
+    def preprocess_image_for_qr(self, image: np.ndarray,
+                                module_size: Optional[float] = None) -> List[np.ndarray]:
+        """
+        Build the preprocessing variants tried by the decoders.
+        Uneven lighting is handled by one illumination-normalization pass
+        (see illumination.py) rather than a fan-out of gamma curves and
+        global thresholds; module_size, when known, sizes its background
+        kernel. Variants after the original are single-channel: pyzbar and
+        OpenCV both decode grayscale directly, so expanding them back to BGR
+        only tripled the memory. Inside a scan the buffers come from the
+        thread's arena and are only valid until that scan finishes; variants
+        that don't fit the scan's memory budget (see scan_memory.py) are left out.
+        """
+        arena = self.context.arena()
+        shape = image.shape[:2]
+        processed_images = []
 
+        # Original image (decoders never modify their input, so no copy)
+        processed_images.append(image)
+
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY,
+                            dst=arena.acquire(shape))
+        processed_images.append(gray)
+
+        def fits(buffers):
+            if arena.meter is None or arena.meter.fits(buffers * gray.nbytes):
+                return True
+            arena.meter.degrade('skipped_variants')
+            return False
+
+        # Lighting divided out, and its binarization
+        if not fits(2):
+            return processed_images
+        normalized, binary = normalize_illumination(
+            gray, self.context, arena, module_size)
+        processed_images.append(normalized)
+        processed_images.append(binary)
+
+        # Sensor noise and JPEG artifacts on small modules
+        if not fits(1):
+            return processed_images
+        blurred = cv2.GaussianBlur(gray, (5, 5), 0, dst=arena.acquire(shape))
+        processed_images.append(blurred)
+
+        if not fits(1):
+            return processed_images
+
+        # Local threshold; still wins on small, noisy codes
         adaptive_thresh = cv2.adaptiveThreshold(
-            gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 11, 2
+            gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 11, 2,
+            dst=arena.acquire(shape)
         )
-        processed_images.append(cv2.cvtColor(
-            adaptive_thresh, cv2.COLOR_GRAY2BGR))
+        processed_images.append(adaptive_thresh)
 
-        _, otsu_thresh = cv2.threshold(
-            gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
-        processed_images.append(cv2.cvtColor(otsu_thresh, cv2.COLOR_GRAY2BGR))
-
-        equalized = cv2.equalizeHist(gray)
-        processed_images.append(cv2.cvtColor(equalized, cv2.COLOR_GRAY2BGR))
-
-        kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (3, 3))
-        morph = cv2.morphologyEx(gray, cv2.MORPH_CLOSE, kernel)
-        processed_images.append(cv2.cvtColor(morph, cv2.COLOR_GRAY2BGR))
+        return processed_images
 
-        edges = cv2.Canny(gray, 50, 150)
-        processed_images.append(cv2.cvtColor(edges, cv2.COLOR_GRAY2BGR))
+    def adjust_gamma(self, image: np.ndarray, gamma: float = 1.0,
+                     dst: Optional[np.ndarray] = None) -> np.ndarray:
+        return cv2.LUT(image, self.context.gamma_lut(gamma), dst=dst)
 
-        for gamma in [0.5, 1.5, 2.0]:
-            gamma_corrected = self.adjust_gamma(gray, gamma)
-            processed_images.append(cv2.cvtColor(
-                gamma_corrected, cv2.COLOR_GRAY2BGR))
+    def resize_image(self, image: np.ndarray, width: int, height: int,
+                     interpolation: int = cv2.INTER_CUBIC) -> np.ndarray:
+        """Resize into an arena buffer so repeated scans reuse the allocation"""
+        buffer = self.context.arena().acquire(
+            (height, width) + image.shape[2:], image.dtype)
+        return cv2.resize(image, (width, height), dst=buffer,
+                          interpolation=interpolation)
 
-        return processed_images
+    def prepare_decode_image(self, image: np.ndarray) -> Tuple[np.ndarray, Dict]:
+        """
+        Estimate the QR geometry (module size, code region) once per scan and
+        downscale inputs that are larger than decoding needs.
+        Returns the image to decode and its geometry; geometry['input_scale']
+        is the factor applied to the input. geometry['native'] keeps the
+        input when only the module estimate (not the memory budget) asked
+        for the downscale, so a wrong estimate can't lose a readable code.
+        """
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY,
+                            dst=self.context.scratch('geometry_gray', image.shape[:2]))
+        geometry = analyze_geometry(gray)
+
+        wanted = initial_scale(image.shape, geometry['module_size'])
+        scale = self.budget_scale(image.shape, geometry['module_size'], wanted)
+        native = None
+        if scale < 1.0:
+            if scale == wanted:
+                native = image
+            height, width = image.shape[:2]
+            image = self.resize_image(image, max(1, int(width * scale)),
+                                      max(1, int(height * scale)),
+                                      interpolation=cv2.INTER_AREA)
+            geometry = scale_geometry(geometry, scale)
+        else:
+            scale = 1.0
+        geometry['input_scale'] = scale
+        geometry['native'] = native
+        return image, geometry
 
-    def adjust_gamma(self, image: np.ndarray, gamma: float = 1.0) -> np.ndarray:
-        inv_gamma = 1.0 / gamma
-        table = np.array([((i / 255.0) ** inv_gamma) *
-                         255 for i in np.arange(0, 256)]).astype("uint8")
-        return cv2.LUT(image, table)
+    def budget_scale(self, shape: Tuple[int, ...], module_size: Optional[float],
+                     scale: float) -> float:
+        """
+        The decode scale, lowered when the downscaled copy and its
+        preprocessed variants would not fit the scan's memory budget, but
+        not below MIN_MODULE_PX wide modules.
+        """
+        memory = self.context.arena().meter
+        headroom = memory.headroom() if memory is not None else None
+        if headroom is None:
+            return scale
+        pixels = shape[0] * shape[1]
+        channels = shape[2] if len(shape) > 2 else 1
+        copy = channels if scale < 1.0 else 0
+        if pixels * scale * scale * (LADDER_VARIANTS + copy) <= headroom:
+            return scale
+
+        fitted = (headroom / (pixels * (LADDER_VARIANTS + channels))) ** 0.5
+        if module_size:
+            fitted = max(fitted, MIN_MODULE_PX / module_size)
+        if fitted >= scale:
+            return scale
+        memory.degrade('downscaled')
+        return fitted
+
+    def scaled_variants(self, image: np.ndarray, geometry: Dict):
+        """
+        Yield (resized, (offset_x, offset_y, scale)) pairs that bring the QR
+        modules towards the target size; a point p in the resized copy is at
+        p / scale + offset in the image. Upscales are cropped to the code
+        region when it is known.
+        """
+        region = geometry.get('region')
+        memory = self.context.arena().meter
+        for scale in plan_decode_scales(image.shape, geometry.get('module_size')):
+            source = image
+            x, y = 0, 0
+            if scale > 1.0 and region is not None:
+                x, y, w, h = region
+                source = image[y:y+h, x:x+w]
+            height, width = source.shape[:2]
+            if memory is not None and not memory.fits(
+                    int(width * scale) * int(height * scale) * source.itemsize
+                    * (source.shape[2] if source.ndim > 2 else 1)):
+                memory.degrade('skipped_rescales')
+                continue
+            interpolation = cv2.INTER_AREA if scale < 1.0 else cv2.INTER_CUBIC
+            resized = self.resize_image(source, max(1, int(width * scale)),
+                                        max(1, int(height * scale)), interpolation)
+            yield resized, (x, y, scale)
 
     def detect_qr_with_contours(self, image: np.ndarray) -> Optional[np.ndarray]:
-        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        rect = self.detect_qr_region_with_contours(image)
+        if rect is None:
+            return None
+        x, y, w, h = rect
+        return image[y:y+h, x:x+w]
+
+    def detect_qr_region_with_contours(self, image: np.ndarray) -> Optional[Tuple[int, int, int, int]]:
+        """Bounding box (x, y, w, h) of the first square-ish contour that may be a QR code"""
+        shape = image.shape[:2]
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY,
+                            dst=self.context.scratch('contour_gray', shape))
 
-        blurred = cv2.GaussianBlur(gray, (5, 5), 0)
+        blurred = cv2.GaussianBlur(
+            gray, (5, 5), 0, dst=self.context.scratch('contour_blur', shape))
         _, thresh = cv2.threshold(
-            blurred, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+            blurred, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU,
+            dst=self.context.scratch('contour_thresh', shape))
 
         contours, _ = cv2.findContours(
             thresh, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
@@ -107,10 +266,8 @@ class PrescriptionQRReader:
 
                 aspect_ratio = float(w) / h
                 if 0.7 <= aspect_ratio <= 1.3:
-                    # Extract the region
-                    roi = image[y:y+h, x:x+w]
-                    if roi.size > 0:
-                        return roi
+                    if w > 0 and h > 0:
+                        return x, y, w, h
 
         return None
 
@@ -119,297 +276,631 @@ class PrescriptionQRReader:
         Fallback QR detection using OpenCV's built-in QRCodeDetector
         This doesn't require pyzbar/zbar and works on all platforms
         """
-        detector = cv2.QRCodeDetector()
+        backend = self.router.get('opencv')
+        if backend is None:
+            return None
+        result = self.decode_with_backends(image, backends=[backend])
+        return result['data'] if result else None
+
+    def _decode_attempt(self, backend: DecoderBackend, image: np.ndarray,
+                        transform, symbologies=QR_SYMBOLOGIES) -> Optional[Dict]:
+        """
+        One decode attempt. transform = (offset_x, offset_y, scale), or a 3x3
+        homography for rectified patches, maps the attempted image back onto
+        the caller's image so returned polygons are in input coordinates.
+        """
+        results = backend.decode(image, self.context, symbologies)
+        self.router.record(backend, bool(results))
+        if not results:
+            return None
 
-        # Try direct detection
-        data, bbox, straight_qrcode = detector.detectAndDecode(image)
-        if data:
-            return data
+        result = results[0]
+        if result.get('polygon'):
+            if isinstance(transform, np.ndarray):
+                points = np.float32(result['polygon']).reshape(-1, 1, 2)
+                result['polygon'] = [tuple(point) for point in cv2.perspectiveTransform(
+                    points, transform).reshape(-1, 2).tolist()]
+            else:
+                offset_x, offset_y, scale = transform
+                result['polygon'] = [(x / scale + offset_x, y / scale + offset_y)
+                                     for x, y in result['polygon']]
+        return result
 
-        # Try with preprocessed images
-        processed_images = self.preprocess_image_for_qr(image)
-        for processed_img in processed_images:
-            data, bbox, straight_qrcode = detector.detectAndDecode(
-                processed_img)
-            if data:
-                return data
+    def rectified_patch(self, image: np.ndarray, geometry: Dict) -> Optional[Tuple]:
+        """
+        The located code warped fronto-parallel (see rectification.py), with
+        the homography from the patch to the input image, or None.
+        """
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY,
+                            dst=self.context.scratch('rectify_gray', image.shape[:2]))
+        rectified = rectify_code(gray, self.context, geometry['finder_patterns'])
+        if rectified is None:
+            return None
+        patch, homography = rectified
+        # The patch maps into the decode image; undo the initial downscale too
+        input_scale = geometry['input_scale']
+        to_input = np.diag([1.0 / input_scale, 1.0 / input_scale, 1.0])
+        return patch, to_input @ homography
+
+    def ladder_attempts(self, image: np.ndarray, geometry: Dict,
+                        backends: List[DecoderBackend],
+                        barcodes: bool = False,
+                        barcode_symbologies: Tuple[str, ...] = BARCODE_SYMBOLOGIES
+                        ) -> Iterator[Tuple]:
+        """
+        Yield decode attempts (backend, image, transform, symbologies) in
+        ladder order. Variants are built the first time they are needed and
+        shared by every backend.
+        """
+        input_scale = geometry['input_scale']
+        full_frame = (0, 0, input_scale)
+
+        processed_images = None
+        processed_regions = None
+        region_frame = full_frame
+        rectified = False
+        barcode_backends = (self.router.plan(symbologies=barcode_symbologies)
+                            if barcodes else [])
+        barcodes_direct = False
+
+        for backend in backends:
+            # Quick direct attempt
+            yield backend, image, full_frame, QR_SYMBOLOGIES
+
+            # A barcode-only package decodes here in milliseconds instead of
+            # after every QR backend's full ladder
+            if not barcodes_direct:
+                barcodes_direct = True
+                for barcode_backend in barcode_backends:
+                    yield barcode_backend, image, full_frame, barcode_symbologies
+
+            # One attempt on the code warped to a fronto-parallel patch
+            if rectified is False:
+                rectified = self.rectified_patch(image, geometry)
+            if rectified is not None:
+                patch, homography = rectified
+                yield backend, patch, homography, QR_SYMBOLOGIES
+
+            # The input as uploaded, in case the module estimate that
+            # downscaled it was wrong
+            if geometry.get('native') is not None:
+                yield backend, geometry['native'], (0, 0, 1.0), QR_SYMBOLOGIES
 
-        # Try with different scales
-        for scale in [0.5, 1.5, 2.0]:
-            height, width = image.shape[:2]
-            new_width = int(width * scale)
-            new_height = int(height * scale)
+            # Try with preprocessing
+            if processed_images is None:
+                processed_images = self.preprocess_image_for_qr(
+                    image, geometry['module_size'])[1:]
+            for processed_img in processed_images:
+                yield backend, processed_img, full_frame, QR_SYMBOLOGIES
+
+            # Try to detect QR region using contours; a rectified patch
+            # already covers the code the finder patterns located
+            if processed_regions is None and rectified is not None:
+                processed_regions = []
+            if processed_regions is None:
+                processed_regions = []
+                rect = self.detect_qr_region_with_contours(image)
+                if rect is not None:
+                    x, y, w, h = rect
+                    region_frame = (x / input_scale, y / input_scale, input_scale)
+                    processed_regions = self.preprocess_image_for_qr(
+                        image[y:y+h, x:x+w], geometry['module_size'])
+                    if geometry['module_size'] is None:
+                        # No finder patterns found: size the modules from the region
+                        geometry = dict(
+                            geometry, module_size=min(w, h) / TYPICAL_QR_MODULES)
+            for processed_region in processed_regions:
+                yield backend, processed_region, region_frame, QR_SYMBOLOGIES
+
+            # Try scales that bring the modules to a decodable size
+            for resized, (x, y, scale) in self.scaled_variants(image, geometry):
+                yield (backend, resized,
+                       (x / input_scale, y / input_scale, scale * input_scale),
+                       QR_SYMBOLOGIES)
+
+        if barcodes:
+            if not barcodes_direct:
+                # No QR backends: the original comes first here
+                for barcode_backend in barcode_backends:
+                    yield barcode_backend, image, full_frame, barcode_symbologies
+            if processed_images is None:
+                processed_images = self.preprocess_image_for_qr(
+                    image, geometry['module_size'])[1:]
+            # Every single-channel variant
+            for backend in barcode_backends:
+                for barcode_image in processed_images:
+                    yield backend, barcode_image, full_frame, barcode_symbologies
+
+    def _shared_race_pool(self) -> ThreadPoolExecutor:
+        """The racing thread pool, started by the first racing scan"""
+        with self._race_pool_lock:
+            if self._race_pool is None:
+                self._race_pool = ThreadPoolExecutor(max_workers=self.race_workers,
+                                                     thread_name_prefix='qr-race')
+            return self._race_pool
+
+    def close(self):
+        """
+        Shut down the racing thread pool. Call it once no scans are running;
+        a racing scan after close() starts a new pool.
+        """
+        with self._race_pool_lock:
+            pool, self._race_pool = self._race_pool, None
+        if pool is not None:
+            pool.shutdown(wait=True)
 
-            if new_width > 50 and new_height > 50:
-                resized = cv2.resize(
-                    image, (new_width, new_height), interpolation=cv2.INTER_CUBIC)
-                data, bbox, straight_qrcode = detector.detectAndDecode(resized)
-                if data:
-                    return data
+    def race_attempts(self, attempts: Iterator[Tuple]) -> Optional[Dict]:
+        """
+        Keep up to race_workers attempts decoding at once on the race pool
+        and return the first success. Attempts that have not started are
+        cancelled; ones already running can't be interrupted and are waited
+        for, because they read buffers from this scan's arena.
+        """
+        pool = self._shared_race_pool()
+        stop = threading.Event()
 
-        return None
+        def run(attempt):
+            if stop.is_set():
+                return None
+            return self._decode_attempt(*attempt)
 
-    def enhanced_qr_detection(self, image: np.ndarray) -> Optional[str]:
+        in_flight = set()
+        try:
+            while True:
+                # Top the window up, still in ladder order
+                for attempt in islice(attempts, self.race_workers - len(in_flight)):
+                    in_flight.add(pool.submit(run, attempt))
+                if not in_flight:
+                    return None
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    result = future.result()
+                    if result:
+                        return result
+        finally:
+            stop.set()
+            for future in in_flight:
+                future.cancel()
+            wait(in_flight)
+
+    def decode_with_backends(self, image: np.ndarray,
+                             backends: Optional[List[DecoderBackend]] = None,
+                             barcodes: bool = False,
+                             barcode_symbologies: Tuple[str, ...] = BARCODE_SYMBOLOGIES,
+                             stats: Optional[Dict] = None) -> Optional[Dict]:
         """
-        Enhanced QR detection with fallback strategies:
-        1. If pyzbar available: Try pyzbar first (more robust for challenging images)
-        2. If pyzbar unavailable OR pyzbar fails: Use OpenCV with extensive preprocessing
+        Run the variant ladder with each decoder backend in turn, in the
+        order chosen by the router, until one decodes:
+        direct -> rectified patch -> native resolution (if the input was
+        downscaled) -> preprocessed variants -> contour region -> rescaled
+        copies.
+        With barcodes=True, linear barcodes and GS1 DataMatrix are tried on
+        the original right after the first direct QR attempt, and on the
+        same preprocessed buffers after the QR ladder before giving up.
+        With race_workers > 1 the attempts run concurrently in ladder order
+        and the first success wins (see race_attempts).
+        Pass backends=[] to try barcodes only, and a stats dict to have the
+        attempts started added to stats['attempts'].
+        Returns the decode result (data, symbology, backend, polygon) or None.
         """
+        with self.context.arena().scan():
+            image, geometry = self.prepare_decode_image(image)
+            if backends is None:
+                backends = self.router.plan(geometry_traits(geometry))
+            attempts = self.ladder_attempts(image, geometry, backends, barcodes,
+                                            barcode_symbologies)
+            if stats is not None:
+                attempts = self._counted(attempts, stats)
+
+            if self.race_workers > 1:
+                return self.race_attempts(attempts)
+            for attempt in attempts:
+                result = self._decode_attempt(*attempt)
+                if result:
+                    return result
+            return None
 
-        # Strategy 1: If pyzbar is available, try it first with various techniques
-        if PYZBAR_AVAILABLE:
-            # Quick direct attempt
-            decoded_objects = pyzbar.decode(image, symbols=[ZBarSymbol.QRCODE])
-            if decoded_objects:
-                return decoded_objects[0].data.decode('utf-8')
+    @staticmethod
+    def _counted(attempts: Iterator[Tuple], stats: Dict) -> Iterator[Tuple]:
+        for attempt in attempts:
+            stats['attempts'] = stats.get('attempts', 0) + 1
+            yield attempt
 
-            # Try with preprocessing
-            processed_images = self.preprocess_image_for_qr(image)
-            for processed_img in processed_images:
-                decoded_objects = pyzbar.decode(
-                    processed_img, symbols=[ZBarSymbol.QRCODE])
-                if decoded_objects:
-                    return decoded_objects[0].data.decode('utf-8')
-
-            # Try to detect QR region using contours first
-            qr_region = self.detect_qr_with_contours(image)
-            if qr_region is not None:
-                decoded_objects = pyzbar.decode(
-                    qr_region, symbols=[ZBarSymbol.QRCODE])
-                if decoded_objects:
-                    return decoded_objects[0].data.decode('utf-8')
-
-                # Try preprocessed regions
-                processed_regions = self.preprocess_image_for_qr(qr_region)
-                for processed_region in processed_regions:
-                    decoded_objects = pyzbar.decode(
-                        processed_region, symbols=[ZBarSymbol.QRCODE])
-                    if decoded_objects:
-                        return decoded_objects[0].data.decode('utf-8')
-
-            # Try different scales
-            for scale in [0.5, 1.5, 2.0]:
-                height, width = image.shape[:2]
-                new_width = int(width * scale)
-                new_height = int(height * scale)
-
-                if new_width > 50 and new_height > 50:
-                    resized = cv2.resize(
-                        image, (new_width, new_height), interpolation=cv2.INTER_CUBIC)
-                    decoded_objects = pyzbar.decode(
-                        resized, symbols=[ZBarSymbol.QRCODE])
-                    if decoded_objects:
-                        return decoded_objects[0].data.decode('utf-8')
-
-        # Strategy 2: Fallback to OpenCV (or primary if pyzbar unavailable)
-        # OpenCV's detector handles preprocessing internally
-        qr_data = self.opencv_qr_detection(image)
-        if qr_data:
-            return qr_data
+    def planned_ladder_attempts(self, image: np.ndarray, qr: bool = True,
+                                barcode_symbologies: Tuple[str, ...] = ()) -> int:
+        """
+        Attempts the ladder plans for an image without running it: each QR
+        backend's direct attempt, variants and rescales, then each barcode
+        backend's attempts. The rectified patch and contour region depend
+        on what is found and aren't counted.
+        """
+        count = 0
+        if qr:
+            per_backend = 1 + LADDER_VARIANTS + len(plan_decode_scales(image.shape, None))
+            count += per_backend * len(self.router.plan())
+        if barcode_symbologies:
+            count += (1 + LADDER_VARIANTS) * len(self.router.plan(symbologies=barcode_symbologies))
+        return count
+
+    def planned_ocr_passes(self, image: np.ndarray, orientation_known: bool = False) -> int:
+        """Preprocessed images the OCR fallback reads (see detect_prescription_info_from_text)"""
+        height, width = image.shape[:2]
+        width = int(width * min(1.0, OCR_MAX_DIMENSION / max(height, width)))
+        upscaled = 1 if width < OCR_UPSCALE_BELOW_WIDTH else 0
+        return OCR_BASE_PASSES + upscaled + len(self.text_rotations(orientation_known))
+
+    def assess_quality(self, image: np.ndarray) -> Optional[Dict]:
+        """Quality gate result for an image, or None when QR_QUALITY_GATE=0"""
+        return assess_image_quality(image) if QUALITY_GATE_ENABLED else None
+
+    def enhanced_qr_detection(self, image: np.ndarray,
+                              quality: Optional[Dict] = None,
+                              hints: Optional[Dict] = None,
+                              report: Optional[Dict] = None) -> Optional[str]:
+        """
+        Enhanced QR detection with fallback strategies:
+        the decoder router orders the available backends (pyzbar, OpenCV,
+        OpenCV Aruco, WeChat, zxing-cpp) by cost and fit for this image, and
+        each runs the full preprocessing ladder before escalating to the next.
+        If no QR code is found, drug barcodes (UPC/EAN, GS1-128, GS1
+        DataMatrix) carrying an NDC are returned as a BARCODE payload.
+        Frames the quality gate rejects are not decoded at all; pass the
+        assess_quality() result if the caller already has it.
+        hints (see scan_hints.parse_scan_hints) narrow the search to a
+        region, a symbology or skip it ('ocr_only'); what they saved is
+        added to report.
+        """
+        hints = hints or parse_scan_hints(None)
+        symbologies = hints['symbologies'] or ()
+        qr = not symbologies or QRCODE in symbologies
+        barcode_symbologies = tuple(name for name in symbologies if name != QRCODE) \
+            if symbologies else BARCODE_SYMBOLOGIES
+        if hints['mode'] == MODE_QR_ONLY:
+            barcode_symbologies = ()
+            note_hint(report, 'mode')
+        if symbologies:
+            note_hint(report, 'symbology')
+
+        if hints['mode'] == MODE_OCR_ONLY:
+            note_hint(report, 'mode')
+            skip_stage(report, 'decode', self.planned_ladder_attempts(
+                image, barcode_symbologies=BARCODE_SYMBOLOGIES))
+            return None
+        if not qr:
+            skip_stage(report, 'qr', self.planned_ladder_attempts(image, barcode_symbologies=()))
+            if not barcode_symbologies:
+                return None
+
+        if hints['roi'] is not None:
+            box = roi_box(hints['roi'], image.shape)
+            note_hint(report, 'roi', used=box is not None)
+            if box is not None:
+                x0, y0, x1, y1 = box
+                image = image[y0:y1, x0:x1]
+                # Measured on the region the decoders will see
+                quality = None
+
+        if quality is None:
+            quality = self.assess_quality(image)
+        if not passes_quality_gate(quality):
+            return None
+        stats = {} if report is not None else None
+        result = self.decode_with_backends(
+            image, backends=None if qr else [], barcodes=bool(barcode_symbologies),
+            barcode_symbologies=barcode_symbologies, stats=stats)
+        if report is not None:
+            report['attempts'] += stats.get('attempts', 0)
+            if not result and barcode_symbologies != BARCODE_SYMBOLOGIES:
+                # The full barcode stage would have run next
+                saved = (self.planned_ladder_attempts(
+                    image, qr=False, barcode_symbologies=BARCODE_SYMBOLOGIES)
+                    - self.planned_ladder_attempts(
+                        image, qr=False, barcode_symbologies=barcode_symbologies))
+                if barcode_symbologies:
+                    report['attempts_saved'] += saved
+                else:
+                    skip_stage(report, 'barcode', saved)
+        if not result:
+            return None
+        if result['symbology'] == QRCODE:
+            return result['data']
 
+        # Only barcodes that identify a drug are worth more than the OCR fallback
+        barcode = parse_barcode(result['symbology'], result['data'])
+        if barcode['ndc'] or barcode['gtin']:
+            return barcode_payload(result['symbology'], result['data'])
         return None
 
-    def detect_prescription_info_from_text(self, image: np.ndarray) -> Optional[Dict]:
+    def scan_payload(self, image: np.ndarray, quality: Optional[Dict] = None,
+                     orientation_known: bool = False,
+                     hints: Optional[Dict] = None,
+                     memory: Optional[ScanMemory] = None,
+                     decode_scale: float = 1.0) -> Tuple[Optional[str], Dict]:
+        """
+        QR/barcode decoding, then the OCR fallback, as the API and batch
+        scans run them. Returns (payload or None, hint report); see
+        scan_hints.py for the hints and the report.
+        Image buffers are charged to memory (a ScanMemory with the default
+        budget if not given), which keeps the scan's estimated peak and any
+        variants the budget skipped; see scan_memory.py.
+        decode_scale is the ingestion metadata's: how far the upload was
+        reduced, which an roi hint in upload pixels is scaled by.
+        """
+        if hints and hints['roi'] is not None and decode_scale != 1.0:
+            hints = dict(hints, roi=scale_roi(hints['roi'], decode_scale))
+        memory = memory if memory is not None else ScanMemory()
+        with self.context.arena().metered(memory), traced(memory):
+            # The caller's image is held for the whole scan
+            memory.charge(image.nbytes)
+            try:
+                return self._scan_payload(image, quality, orientation_known, hints)
+            finally:
+                memory.release(image.nbytes)
+
+    def _scan_payload(self, image: np.ndarray, quality: Optional[Dict],
+                      orientation_known: bool, hints: Optional[Dict]) -> Tuple[Optional[str], Dict]:
+        hints = hints or parse_scan_hints(None)
+        report = new_hint_report()
+        payload = self.enhanced_qr_detection(image, quality, hints, report)
+        if payload:
+            return payload, report
+
+        if hints['mode'] == MODE_QR_ONLY:
+            skip_stage(report, 'ocr', self.planned_ocr_passes(image, orientation_known))
+            return None, report
+        rotated_bytes = 0
+        if hints['rotation'] is not None:
+            note_hint(report, 'rotation')
+            upright = rotate_upright(image, hints['rotation'])
+            if upright is not image:
+                rotated_bytes = upright.nbytes
+                self.context.arena().meter.charge(rotated_bytes)
+            image = upright
+            if not orientation_known:
+                report['attempts_saved'] += (self.planned_ocr_passes(image)
+                                             - self.planned_ocr_passes(image, True))
+            orientation_known = True
+        try:
+            info = self.detect_prescription_info_from_text(image, orientation_known, report)
+        finally:
+            # The rotated copy is freed with this scan
+            self.context.arena().meter.release(rotated_bytes)
+        return (text_info_payload(info) if info else None), report
+
+    def text_rotations(self, orientation_known: bool = False) -> List[int]:
+        """
+        Extra angles OCR tries when the label may be sideways. Images whose
+        EXIF orientation was applied on ingestion are already upright.
+        """
+        # Skip 180 since it's usually less common
+        return [] if orientation_known else [90, 270]
+
+    def detect_prescription_info_from_text(self, image: np.ndarray,
+                                           orientation_known: bool = False,
+                                           report: Optional[Dict] = None) -> Optional[Dict]:
         """
         Use OCR to detect NDC numbers and RX numbers from prescription label text as fallback
         NDC format: XXXXX-XXXX-XX or XXXX-XXXX-XX
         RX format: Various patterns like "Rx #123456", "Prescription: 123456", etc.
+        With orientation_known (see image_ingest.py) the rotated passes are skipped.
+        Each preprocessed image read is counted in report['attempts'].
         Returns dict with 'ndc' and 'rx_number' keys, or None if nothing found
         """
         if not TESSERACT_AVAILABLE:
             return None
 
-        try:
-            # Resize large images for faster processing, but not too aggressively
-            height, width = image.shape[:2]
-            max_dimension = 2000  # Less aggressive resize - keep more detail for text
-
-            if max(height, width) > max_dimension:
-                # Calculate scaling factor to keep aspect ratio
-                scale_factor = max_dimension / max(height, width)
-                new_width = int(width * scale_factor)
-                new_height = int(height * scale_factor)
-
-                print(
-                    f"Resizing from {width}x{height} to {new_width}x{new_height} for faster processing...")
-                # Use INTER_AREA for downscaling to preserve text quality
-                image = cv2.resize(
-                    image, (new_width, new_height), interpolation=cv2.INTER_AREA)
-            else:
-                print(
-                    f"Image size {width}x{height} is reasonable for OCR, keeping original size")
-
-            # Preprocess image for better OCR
-            processed_images = []
-
-            # Convert to grayscale
-            gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-            processed_images.append(gray)
-
-            # Apply different preprocessing techniques
-            # 1. Gaussian blur + threshold
-            blurred = cv2.GaussianBlur(gray, (5, 5), 0)
-            _, thresh1 = cv2.threshold(
-                blurred, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
-            processed_images.append(thresh1)
-
-            # 2. Adaptive threshold
-            adaptive = cv2.adaptiveThreshold(
-                gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 11, 2)
-            processed_images.append(adaptive)
-
-            # 3. Morphological operations to clean up text
-            kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (2, 2))
-            morph = cv2.morphologyEx(thresh1, cv2.MORPH_CLOSE, kernel)
-            processed_images.append(morph)
-
-            # 4. Add one upscaling option to help with small text
-            # Only upscale if the image is reasonably sized after initial resize
-            current_height, current_width = gray.shape
-            if current_width < 2500:  # Only upscale if not already very large
-                upscaled = cv2.resize(gray, (int(
-                    current_width * 1.5), int(current_height * 1.5)), interpolation=cv2.INTER_CUBIC)
-                processed_images.append(upscaled)
-
-            # 5. Rotation handling for rotated images (like 12.jpg)
-            # Only try common rotations to balance speed vs accuracy
-            for angle in [90, 270]:  # Skip 180 since it's usually less common
-                height, width = gray.shape
-                center = (width // 2, height // 2)
-                rotation_matrix = cv2.getRotationMatrix2D(center, angle, 1.0)
-                rotated = cv2.warpAffine(
-                    gray, rotation_matrix, (width, height))
-                processed_images.append(rotated)
-
-            # Try OCR on each processed image
-            for processed_img in processed_images:
-                try:
-                    # Use fewer PSM modes for faster processing
-                    # Reduced from 4 to 2 most effective modes
-                    psm_modes = [6, 8]
-                    found_info = {}
-
-                    for psm in psm_modes:
-                        # Configure tesseract for better number detection (NDC focused)
-                        config = f'--oem 3 --psm {psm} -c tessedit_char_whitelist=0123456789-'
-                        text_numbers = pytesseract.image_to_string(
-                            processed_img, config=config)
-
-                        # Also get full text for RX number detection
-                        config_full = f'--oem 3 --psm {psm}'
-                        text_full = pytesseract.image_to_string(
-                            processed_img, config=config_full)
-
-                        if 'ndc' not in found_info:
-                            ndc_patterns = [
-                                # XXXXX-XXXX-XX (removed word boundaries)
-                                r'(\d{5}-\d{4}-\d{1,2})',
-                                r'(\d{4}-\d{4}-\d{1,2})',  # XXXX-XXXX-XX
-                                # XXXXX-XXX-XX (alternative format)
-                                r'(\d{5}-\d{3}-\d{1,2})',
-                                # XXXX-XXX-XX (alternative format)
-                                r'(\d{4}-\d{3}-\d{1,2})'
-                            ]
-
-                            for pattern in ndc_patterns:
-                                matches = re.findall(pattern, text_numbers)
-                                if matches:
-                                    found_info['ndc'] = matches[0]
-                                    break
+        arena = self.context.arena()
+        with arena.scan():
+            try:
+                # Resize large images for faster processing, but not too aggressively
+                height, width = image.shape[:2]
+                max_dimension = OCR_MAX_DIMENSION  # Less aggressive resize - keep more detail for text
+
+                if max(height, width) > max_dimension:
+                    # Calculate scaling factor to keep aspect ratio
+                    scale_factor = max_dimension / max(height, width)
+                    new_width = int(width * scale_factor)
+                    new_height = int(height * scale_factor)
+
+                    print(
+                        f"Resizing from {width}x{height} to {new_width}x{new_height} for faster processing...")
+                    # Use INTER_AREA for downscaling to preserve text quality
+                    image = self.resize_image(
+                        image, new_width, new_height, interpolation=cv2.INTER_AREA)
+                else:
+                    print(
+                        f"Image size {width}x{height} is reasonable for OCR, keeping original size")
+
+                # Preprocess image for better OCR
+                processed_images = []
+
+                # Convert to grayscale
+                shape = image.shape[:2]
+                gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY,
+                                    dst=arena.acquire(shape))
+                processed_images.append(gray)
+
+                # Apply different preprocessing techniques
+                # 1. Gaussian blur + threshold
+                blurred = cv2.GaussianBlur(
+                    gray, (5, 5), 0, dst=arena.acquire(shape))
+                _, thresh1 = cv2.threshold(
+                    blurred, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU,
+                    dst=arena.acquire(shape))
+                processed_images.append(thresh1)
+
+                # 2. Adaptive threshold
+                adaptive = cv2.adaptiveThreshold(
+                    gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 11, 2,
+                    dst=arena.acquire(shape))
+                processed_images.append(adaptive)
+
+                # 3. Morphological operations to clean up text
+                kernel = self.context.structuring_element(cv2.MORPH_RECT, (2, 2))
+                morph = cv2.morphologyEx(thresh1, cv2.MORPH_CLOSE, kernel,
+                                         dst=arena.acquire(shape))
+                processed_images.append(morph)
+
+                # 4. Add one upscaling option to help with small text
+                # Only upscale if the image is reasonably sized after initial resize
+                current_height, current_width = gray.shape
+                memory = arena.meter
+                if current_width < OCR_UPSCALE_BELOW_WIDTH:  # Only upscale if not already very large
+                    upscaled_size = (int(current_width * 1.5), int(current_height * 1.5))
+                    if memory is None or memory.fits(upscaled_size[0] * upscaled_size[1]):
+                        upscaled = self.resize_image(gray, *upscaled_size)
+                        processed_images.append(upscaled)
+                    else:
+                        memory.degrade('skipped_ocr_upscale')
+
+                # 5. Rotation handling for rotated images (like 12.jpg)
+                # Only try common rotations to balance speed vs accuracy
+                for angle in self.text_rotations(orientation_known):
+                    if memory is not None and not memory.fits(gray.nbytes):
+                        memory.degrade('skipped_ocr_rotations')
+                        break
+                    height, width = gray.shape
+                    center = (width // 2, height // 2)
+                    rotation_matrix = cv2.getRotationMatrix2D(center, angle, 1.0)
+                    rotated = cv2.warpAffine(
+                        gray, rotation_matrix, (width, height),
+                        dst=arena.acquire((height, width)))
+                    processed_images.append(rotated)
+
+                # Try OCR on each processed image
+                for processed_img in processed_images:
+                    if report is not None:
+                        report['attempts'] += 1
+                    try:
+                        # Use fewer PSM modes for faster processing
+                        # Reduced from 4 to 2 most effective modes
+                        psm_modes = [6, 8]
+                        found_info = {}
+
+                        for psm in psm_modes:
+                            # Configure tesseract for better number detection (NDC focused)
+                            config = f'--oem 3 --psm {psm} -c tessedit_char_whitelist=0123456789-'
+                            text_numbers = pytesseract.image_to_string(
+                                processed_img, config=config)
+
+                            # Also get full text for RX number detection
+                            config_full = f'--oem 3 --psm {psm}'
+                            text_full = pytesseract.image_to_string(
+                                processed_img, config=config_full)
 
                             if 'ndc' not in found_info:
-                                loose_patterns = [
-                                    r'(\d{5})\s*-\s*(\d{4})\s*-\s*(\d{2})',
-                                    r'(\d{4})\s*-\s*(\d{4})\s*-\s*(\d{2})',
-                                    r'(\d{5})\s*-\s*(\d{3})\s*-\s*(\d{2})',
-                                    r'(\d{4})\s*-\s*(\d{3})\s*-\s*(\d{2})'
+                                ndc_patterns = [
+                                    # XXXXX-XXXX-XX (removed word boundaries)
+                                    r'(\d{5}-\d{4}-\d{1,2})',
+                                    r'(\d{4}-\d{4}-\d{1,2})',  # XXXX-XXXX-XX
+                                    # XXXXX-XXX-XX (alternative format)
+                                    r'(\d{5}-\d{3}-\d{1,2})',
+                                    # XXXX-XXX-XX (alternative format)
+                                    r'(\d{4}-\d{3}-\d{1,2})'
                                 ]
 
-                                for pattern in loose_patterns:
+                                for pattern in ndc_patterns:
                                     matches = re.findall(pattern, text_numbers)
                                     if matches:
-                                        # Reconstruct NDC by joining the groups
-                                        found_info['ndc'] = '-'.join(
-                                            matches[0])
+                                        found_info['ndc'] = matches[0]
+                                        break
+
+                                if 'ndc' not in found_info:
+                                    loose_patterns = [
+                                        r'(\d{5})\s*-\s*(\d{4})\s*-\s*(\d{2})',
+                                        r'(\d{4})\s*-\s*(\d{4})\s*-\s*(\d{2})',
+                                        r'(\d{5})\s*-\s*(\d{3})\s*-\s*(\d{2})',
+                                        r'(\d{4})\s*-\s*(\d{3})\s*-\s*(\d{2})'
+                                    ]
+
+                                    for pattern in loose_patterns:
+                                        matches = re.findall(pattern, text_numbers)
+                                        if matches:
+                                            # Reconstruct NDC by joining the groups
+                                            found_info['ndc'] = '-'.join(
+                                                matches[0])
+                                            break
+
+                            # Look for RX number patterns in the full text
+                            if 'rx_number' not in found_info:
+                                rx_patterns = [
+                                    # Rx #123456 or RX 123456
+                                    r'(?:Rx|RX)\s*#?\s*(\d+)',
+                                    # Prescription Number: 123456
+                                    r'(?:Prescription|PRESCRIPTION)\s*(?:Number|#)?\s*:?\s*(\d+)',
+                                    # Script ID: 123456
+                                    r'(?:Script|SCRIPT)\s*(?:ID|Number)\s*:?\s*(\d+)',
+                                    # Rx Number: 123456
+                                    r'(?:Rx|RX)\s*(?:Number|No|NUM)\s*:?\s*(\d+)',
+                                    # Prescription: 123456
+                                    r'(?:Prescription|PRESCRIPTION)\s*:?\s*(\d+)',
+                                    # RX 123456 (6+ digits, space optional)
+                                    r'(?:RX|Rx)\s*(\d{6,})',
+                                    # RX123456 (no space, 6+ digits)
+                                    r'(?:RX|Rx)(\d{6,})',
+                                    # #123456 (standalone with 6+ digits)
+                                    r'#\s*(\d{6,})'
+                                ]
+
+                                for pattern in rx_patterns:
+                                    matches = re.findall(
+                                        pattern, text_full, re.IGNORECASE)
+                                    if matches:
+                                        found_info['rx_number'] = matches[0]
                                         break
 
-                        # Look for RX number patterns in the full text
-                        if 'rx_number' not in found_info:
-                            rx_patterns = [
-                                # Rx #123456 or RX 123456
-                                r'(?:Rx|RX)\s*#?\s*(\d+)',
-                                # Prescription Number: 123456
-                                r'(?:Prescription|PRESCRIPTION)\s*(?:Number|#)?\s*:?\s*(\d+)',
-                                # Script ID: 123456
-                                r'(?:Script|SCRIPT)\s*(?:ID|Number)\s*:?\s*(\d+)',
-                                # Rx Number: 123456
-                                r'(?:Rx|RX)\s*(?:Number|No|NUM)\s*:?\s*(\d+)',
-                                # Prescription: 123456
-                                r'(?:Prescription|PRESCRIPTION)\s*:?\s*(\d+)',
-                                # RX 123456 (6+ digits, space optional)
-                                r'(?:RX|Rx)\s*(\d{6,})',
-                                # RX123456 (no space, 6+ digits)
-                                r'(?:RX|Rx)(\d{6,})',
-                                # #123456 (standalone with 6+ digits)
-                                r'#\s*(\d{6,})'
-                            ]
-
-                            for pattern in rx_patterns:
-                                matches = re.findall(
-                                    pattern, text_full, re.IGNORECASE)
-                                if matches:
-                                    found_info['rx_number'] = matches[0]
+                            if found_info:
+                                # Found both or last attempt
+                                if len(found_info) == 2 or psm == psm_modes[-1]:
                                     break
 
                         if found_info:
-                            # Found both or last attempt
-                            if len(found_info) == 2 or psm == psm_modes[-1]:
-                                break
+                            return found_info
 
-                    if found_info:
-                        return found_info
+                    except Exception as e:
+                        continue
 
-                except Exception as e:
-                    continue
+                # If no strict patterns found, try a more lenient approach for NDC
+                # Look for any sequence that might be an NDC (only if we haven't found anything yet)
+                if not found_info:
+                    # Only try the 2 best preprocessed images
+                    for processed_img in processed_images[:2]:
+                        if report is not None:
+                            report['attempts'] += 1
+                        try:
+                            text = pytesseract.image_to_string(processed_img)
+                            # Look for number sequences that could be NDCs
+                            numbers = re.findall(r'\d+', text)
+
+                            # Try to find sequences that could form an NDC
+                            for i in range(len(numbers) - 2):
+                                part1, part2, part3 = numbers[i], numbers[i +
+                                                                          1], numbers[i+2]
+
+                                # Check if this could be a valid NDC format
+                                if ((len(part1) == 4 or len(part1) == 5) and
+                                    (len(part2) == 3 or len(part2) == 4) and
+                                        len(part3) == 2):
+                                    potential_ndc = f"{part1}-{part2}-{part3}"
+                                    found_info['ndc'] = potential_ndc
+                                    break
 
-            # If no strict patterns found, try a more lenient approach for NDC
-            # Look for any sequence that might be an NDC (only if we haven't found anything yet)
-            if not found_info:
-                # Only try the 2 best preprocessed images
-                for processed_img in processed_images[:2]:
-                    try:
-                        text = pytesseract.image_to_string(processed_img)
-                        # Look for number sequences that could be NDCs
-                        numbers = re.findall(r'\d+', text)
-
-                        # Try to find sequences that could form an NDC
-                        for i in range(len(numbers) - 2):
-                            part1, part2, part3 = numbers[i], numbers[i +
-                                                                      1], numbers[i+2]
-
-                            # Check if this could be a valid NDC format
-                            if ((len(part1) == 4 or len(part1) == 5) and
-                                (len(part2) == 3 or len(part2) == 4) and
-                                    len(part3) == 2):
-                                potential_ndc = f"{part1}-{part2}-{part3}"
-                                found_info['ndc'] = potential_ndc
-                                break
-
-                    except Exception:
-                        continue
+                        except Exception:
+                            continue
 
-                    if found_info.get('ndc'):
-                        break
+                        if found_info.get('ndc'):
+                            break
 
-            # Return whatever we found (could be NDC, RX, both, or empty dict)
-            return found_info if found_info else None
+                # Return whatever we found (could be NDC, RX, both, or empty dict)
+                return found_info if found_info else None
 
-        except Exception as e:
-            print(f"Error in prescription info text detection: {e}")
+            except Exception as e:
+                print(f"Error in prescription info text detection: {e}")
 
-        return None
+            return None
 
-    def parse_prescription_data(self, qr_data: str) -> Dict:
+    def parse_prescription_data(self, qr_data: str, payload_format: Optional[str] = None,
+                                report: Optional[Dict] = None) -> Dict:
         """
         Parse prescription QR code data and extract relevant information
         Common prescription data fields include:
@@ -419,9 +910,12 @@ class PrescriptionQRReader:
         - Pharmacy information
         - Prescription number, date filled
         - Directions for use
+        A payload_format hint (a parser name such as 'xml') skips sniffing
+        when the payload matches that format.
         """
         parsed_data = {
             'raw_data': qr_data,
+            'payload_format': None,  # Name of the parser that read raw_data
             'patient_name': None,
             'patient_dob': None,
             'medication_name': None,
@@ -431,147 +925,62 @@ class PrescriptionQRReader:
             'pharmacy_name': None,
             'rx_number': None,
             'date_filled': None,
+            'date_filled_iso': None,  # YYYY-MM-DD, unless day/month order is unknown
             'directions': None,
             'quantity': None,
             'refills': None,
+            'gtin': None,
+            'lot_number': None,
+            'expiration_date': None,
+            'serial_number': None,
+            'ndc': None,  # Canonical form of ndc_number, see ndc.normalize_ndc
             'detection_method': 'QR_CODE'  # Track detection method
         }
 
-        # Check if this is prescription info data from text detection
-        if qr_data.startswith('TEXT_INFO: '):
-            # Parse the dictionary from the text
-            import ast
-            try:
-                info_str = qr_data[11:]  # Remove 'TEXT_INFO: ' prefix
-                info_dict = ast.literal_eval(info_str)
-
-                if info_dict.get('ndc'):
-                    parsed_data['ndc_number'] = info_dict['ndc']
-                if info_dict.get('rx_number'):
-                    parsed_data['rx_number'] = info_dict['rx_number']
-
-                parsed_data['detection_method'] = 'TEXT_OCR'
-                return parsed_data
-            except (ValueError, SyntaxError):
-                # Fallback for old NDC-only format
-                if qr_data.startswith('NDC: '):
-                    ndc_value = qr_data[5:]  # Remove 'NDC: ' prefix
-                    parsed_data['ndc_number'] = ndc_value
-                    parsed_data['detection_method'] = 'TEXT_OCR'
-                    return parsed_data
-
+        parser = parser_named(payload_format) if payload_format else None
+        if parser is not None and not parser.sniff(qr_data):
+            parser = None
+        if payload_format:
+            note_hint(report, 'payload_format', used=parser is not None)
+        if parser is None:
+            parser = sniff_format(qr_data)
+        parsed_data['payload_format'] = parser.name
         try:
-            if qr_data.strip().startswith('<') and qr_data.strip().endswith('>'):
-                try:
-                    root = ET.fromstring(qr_data)
-
-                    xml_mappings = {
-                        'patient_name': ['n', 'name', 'patient'],
-                        'medication_name': ['dg', 'drug', 'medication', 'med'],
-                        'prescriber_name': ['pm', 'prescriber', 'doctor'],
-                        'date_filled': ['dt', 'date', 'dispensed'],
-                        'directions': ['in', 'instructions', 'directions', 'sig'],
-                        'rx_number': ['id', 'rx', 'prescription_id'],
-                        'pharmacy_name': ['pharmacy', 'pharm']
-                    }
-
-                    for field, xml_tags in xml_mappings.items():
-                        for tag in xml_tags:
-                            element = root.find(tag)
-                            if element is not None and element.text:
-                                parsed_data[field] = element.text.strip()
-                                break
-
-                except ParseError:
-                    # If XML parsing fails, try simple regex extraction
-                    xml_patterns = {
-                        'patient_name': r'<n[^>]*>([^<]+)</n>',
-                        'medication_name': r'<dg[^>]*>([^<]+)</dg>',
-                        'prescriber_name': r'<pm[^>]*>([^<]+)</pm>',
-                        'date_filled': r'<dt[^>]*>([^<]+)</dt>',
-                        'directions': r'<in[^>]*>([^<]+)</in>',
-                        'rx_number': r'<id[^>]*>([^<]+)</id>'
-                    }
-
-                    for field, pattern in xml_patterns.items():
-                        match = re.search(pattern, qr_data, re.IGNORECASE)
-                        if match:
-                            parsed_data[field] = match.group(1).strip()
-
-            # Check for JSON format
-            elif qr_data.startswith('{') and qr_data.endswith('}'):
-                json_data = json.loads(qr_data)
-
-                field_mappings = {
-                    'patient_name': ['patient_name', 'patientName', 'name', 'pt_name'],
-                    'patient_dob': ['patient_dob', 'patientDOB', 'dob', 'birth_date'],
-                    'medication_name': ['medication_name', 'medicationName', 'drug_name', 'med_name'],
-                    'medication_strength': ['medication_strength', 'strength', 'dose'],
-                    'ndc_number': ['ndc_number', 'ndc', 'NDC'],
-                    'prescriber_name': ['prescriber_name', 'prescriber', 'doctor', 'physician'],
-                    'pharmacy_name': ['pharmacy_name', 'pharmacy', 'pharm_name'],
-                    'rx_number': ['rx_number', 'prescription_number', 'rx_num', 'rx'],
-                    'date_filled': ['date_filled', 'fill_date', 'dispensed_date'],
-                    'directions': ['directions', 'sig', 'instructions'],
-                    'quantity': ['quantity', 'qty', 'amount'],
-                    'refills': ['refills', 'refills_remaining']
-                }
-
-                for field, possible_keys in field_mappings.items():
-                    for key in possible_keys:
-                        if key in json_data:
-                            parsed_data[field] = json_data[key]
-                            break
+            parser.parse(qr_data, parsed_data)
+        except (json.JSONDecodeError, ValueError, KeyError) as e:
+            print(f"Error parsing prescription data: {e}")
 
-            else:
-                lines = qr_data.split('\n')
-                for line in lines:
-                    line = line.strip()
-                    if not line:
-                        continue
+        self._attach_iso_date(parsed_data)
+        return self._attach_canonical_ndc(parsed_data)
 
-                    if re.match(r'^[A-Z]{2,}:', line):
-                        key, value = line.split(':', 1)
-                        key = key.strip().lower()
-                        value = value.strip()
-
-                        if key in ['patient', 'name', 'pt']:
-                            parsed_data['patient_name'] = value
-                        elif key in ['dob', 'birth']:
-                            parsed_data['patient_dob'] = value
-                        elif key in ['drug', 'medication', 'med']:
-                            parsed_data['medication_name'] = value
-                        elif key in ['strength', 'dose']:
-                            parsed_data['medication_strength'] = value
-                        elif key == 'ndc':
-                            parsed_data['ndc_number'] = value
-                        elif key in ['prescriber', 'doctor', 'physician']:
-                            parsed_data['prescriber_name'] = value
-                        elif key in ['pharmacy', 'pharm']:
-                            parsed_data['pharmacy_name'] = value
-                        elif key in ['rx', 'prescription']:
-                            parsed_data['rx_number'] = value
-                        elif key in ['filled', 'date']:
-                            parsed_data['date_filled'] = value
-                        elif key in ['directions', 'sig']:
-                            parsed_data['directions'] = value
-                        elif key in ['qty', 'quantity']:
-                            parsed_data['quantity'] = value
-                        elif key == 'refills':
-                            parsed_data['refills'] = value
-
-                ndc_match = re.search(r'\b\d{4,5}-\d{3,4}-\d{2}\b', qr_data)
-                if ndc_match and not parsed_data['ndc_number']:
-                    parsed_data['ndc_number'] = ndc_match.group()
-
-                rx_match = re.search(r'\bRx\s*#?\s*(\d+)\b',
-                                     qr_data, re.IGNORECASE)
-                if rx_match and not parsed_data['rx_number']:
-                    parsed_data['rx_number'] = rx_match.group(1)
+    @staticmethod
+    def _date_source(parsed_data: Dict) -> Optional[Tuple]:
+        """
+        Day/month order is remembered per pharmacy and payload format (as
+        recorded by parse_prescription_data, so payloads aren't sniffed
+        again). Payloads without a pharmacy have no source to learn from.
+        """
+        pharmacy = parsed_data.get('pharmacy_name')
+        if not pharmacy:
+            return None
+        return (pharmacy, parsed_data.get('payload_format'))
 
-        except (json.JSONDecodeError, ValueError, KeyError) as e:
-            print(f"Error parsing prescription data: {e}")
+    def _attach_iso_date(self, parsed_data: Dict) -> None:
+        """Normalize date_filled to date_filled_iso when its reading is certain"""
+        date_filled = parsed_data.get('date_filled')
+        if not date_filled:
+            return
+        date = self.date_parser.parse(str(date_filled), self._date_source(parsed_data))
+        if date is not None and not date['ambiguous']:
+            parsed_data['date_filled_iso'] = date['iso']
 
+    def _attach_canonical_ndc(self, parsed_data: Dict) -> Dict:
+        """
+        Add the normalized 'ndc' object next to the NDC as found, so
+        downstream lookups can key on the 5-4-2 form instead of trying
+        every layout
+        """
+        parsed_data['ndc'] = normalize_ndc(parsed_data.get('ndc_number'))
         return parsed_data
 
     def validate_prescription_data(self, parsed_data: Dict) -> Tuple[bool, List[str]]:
@@ -588,43 +997,41 @@ class PrescriptionQRReader:
             issues.append("Missing patient name")
 
         ndc = parsed_data.get('ndc_number')
-        if ndc and not re.match(r'^\d{4,5}-\d{3,4}-\d{1,2}$', ndc):
+        if ndc and not NDC_FORMAT_RE.match(str(ndc)):
             issues.append("Invalid NDC number format")
 
         rx_num = parsed_data.get('rx_number')
         if rx_num:
-            rx_clean = rx_num.strip()
+            # Archived payloads can carry numbers where strings are expected
+            rx_clean = str(rx_num).strip()
             if not rx_clean or rx_clean.lower() in ['test', 'sample', 'demo']:
                 issues.append(
                     "Invalid prescription number (appears to be test data)")
 
         date_filled = parsed_data.get('date_filled')
         if date_filled:
-            date_formats = [
-                '%Y-%m-%d',      # 2025-03-15
-                '%m/%d/%Y',      # 03/15/2025
-                '%d/%m/%Y',      # 15/03/2025 (common in many countries)
-                '%Y/%m/%d',      # 2025/03/15
-                '%d-%m-%Y',      # 15-03-2025
-                '%m-%d-%Y',      # 03-15-2025
-                '%d.%m.%Y',      # 15.03.2025
-                '%m.%d.%Y'       # 03.15.2025
-            ]
-
-            date_valid = False
-            for date_format in date_formats:
-                try:
-                    datetime.strptime(date_filled, date_format)
-                    date_valid = True
-                    break
-                except ValueError:
-                    continue
-
-            if not date_valid:
+            # Already learned from when the payload was parsed
+            date = self.date_parser.parse(str(date_filled), self._date_source(parsed_data),
+                                          learn=False)
+            if date is None:
                 issues.append("Invalid date format")
+            elif date['ambiguous']:
+                issues.append(f"Ambiguous date: {date['iso']} or {date['alternative']} "
+                              "(day/month order unknown)")
 
         return len(issues) == 0, issues
 
+    def _canonical_ndc_line(self, parsed_data: Dict) -> Optional[str]:
+        """The 5-4-2 form, when it differs from the NDC as printed"""
+        ndc = parsed_data.get('ndc')
+        if not ndc:
+            return None
+        if ndc['canonical'] and ndc['canonical'] != ndc['raw']:
+            return f"NDC (5-4-2): {ndc['canonical']} (from {ndc['layout']})"
+        if ndc['candidates']:
+            return f"NDC (5-4-2) candidates: {', '.join(ndc['candidates'])}"
+        return None
+
     def format_prescription_output(self, parsed_data: Dict) -> str:
         output = []
 
@@ -638,6 +1045,9 @@ class PrescriptionQRReader:
             found_items = []
             if parsed_data.get('ndc_number'):
                 output.append(f"NDC Number: {parsed_data['ndc_number']}")
+                canonical_line = self._canonical_ndc_line(parsed_data)
+                if canonical_line:
+                    output.append(canonical_line)
                 found_items.append("NDC")
             if parsed_data.get('rx_number'):
                 output.append(f"RX Number: {parsed_data['rx_number']}")
@@ -648,6 +1058,29 @@ class PrescriptionQRReader:
                 f"Note: {', '.join(found_items)} number(s) detected from text.")
             output.append("No additional prescription information available.")
             output.append("For complete prescription data, use a QR code.")
+        elif parsed_data.get('detection_method') == 'BARCODE':
+            output.append("=" * 50)
+            output.append("PRESCRIPTION INFORMATION (Barcode)")
+            output.append("=" * 50)
+            output.append("")
+
+            if parsed_data.get('ndc_number'):
+                output.append(f"NDC Number: {parsed_data['ndc_number']}")
+                canonical_line = self._canonical_ndc_line(parsed_data)
+                if canonical_line:
+                    output.append(canonical_line)
+            if parsed_data.get('gtin'):
+                output.append(f"GTIN: {parsed_data['gtin']}")
+            if parsed_data.get('lot_number'):
+                output.append(f"Lot: {parsed_data['lot_number']}")
+            if parsed_data.get('expiration_date'):
+                output.append(f"Expires: {parsed_data['expiration_date']}")
+            if parsed_data.get('serial_number'):
+                output.append(f"Serial: {parsed_data['serial_number']}")
+
+            output.append("")
+            output.append("Note: product identifiers read from the package barcode.")
+            output.append("For complete prescription data, use a QR code.")
         else:
             output.append("=" * 50)
             output.append("PRESCRIPTION INFORMATION")
@@ -667,6 +1100,9 @@ class PrescriptionQRReader:
                     f"Strength: {parsed_data['medication_strength']}")
             if parsed_data.get('ndc_number'):
                 output.append(f"NDC: {parsed_data['ndc_number']}")
+                canonical_line = self._canonical_ndc_line(parsed_data)
+                if canonical_line:
+                    output.append(canonical_line)
 
             output.append("")
 
@@ -694,10 +1130,6 @@ class PrescriptionQRReader:
         return "\n".join(output)
 
     def read_from_camera(self) -> Optional[str]:
-        if not PYZBAR_AVAILABLE:
-            print("Error: pyzbar not available. Camera QR detection requires pyzbar.")
-            return None
-
         try:
             self.cap = cv2.VideoCapture(0)
 
@@ -715,23 +1147,19 @@ class PrescriptionQRReader:
                     print("Error: Could not read frame")
                     break
 
-                qr_data = self.enhanced_qr_detection(frame)
-
-                if qr_data:
-                    decoded_objects = pyzbar.decode(
-                        frame, symbols=[ZBarSymbol.QRCODE])
-
-                    if decoded_objects:
-                        for obj in decoded_objects:
-                            x, y, w, h = obj.rect
-                            cv2.rectangle(
-                                frame, (x, y), (x + w, y + h), (0, 255, 0), 2)
-
-                            font = cv2.FONT_HERSHEY_SIMPLEX
-                            cv2.putText(frame, "QR Code Detected",
-                                        (x, y-10), font, 0.5, (0, 255, 0), 2)
+                result = self.decode_with_backends(frame)
+
+                if result:
+                    qr_data = result['data']
+                    font = cv2.FONT_HERSHEY_SIMPLEX
+                    if result.get('polygon'):
+                        points = np.array(result['polygon'], dtype=np.int32)
+                        x, y, w, h = cv2.boundingRect(points)
+                        cv2.rectangle(
+                            frame, (x, y), (x + w, y + h), (0, 255, 0), 2)
+                        cv2.putText(frame, "QR Code Detected",
+                                    (x, y-10), font, 0.5, (0, 255, 0), 2)
                     else:
-                        font = cv2.FONT_HERSHEY_SIMPLEX
                         cv2.putText(frame, "QR Code Found (Enhanced Detection)",
                                     (10, 30), font, 0.7, (0, 255, 0), 2)
 
@@ -764,7 +1192,7 @@ class PrescriptionQRReader:
 
                         self.cap.release()
                         cv2.destroyAllWindows()
-                        return f"TEXT_INFO: {prescription_info}"
+                        return text_info_payload(prescription_info)
 
                 # Show scanning status
                 font = cv2.FONT_HERSHEY_SIMPLEX
@@ -792,59 +1220,68 @@ class PrescriptionQRReader:
 
         return None
 
-    def read_from_image(self, image_path: str) -> Optional[str]:
+    def read_from_image(self, image_path: str, hints: Optional[Dict] = None) -> Optional[str]:
         try:
-            image = cv2.imread(image_path)
-            if image is None:
+            loaded = load_image_file(image_path, input_pixel_limit())
+            if loaded is None:
                 print(f"Error: Could not load image {image_path}")
                 return None
+            image, metadata = loaded
+            memory = ScanMemory()
 
             print(f"Analyzing image: {image_path}")
             print(
                 f"Image dimensions: {image.shape[1]}x{image.shape[0]} pixels")
-
-            # First try QR code detection
-            qr_data = self.enhanced_qr_detection(image)
-
-            if qr_data:
-                print("✓ QR code successfully detected and decoded")
-                return qr_data
-            else:
-                print("✗ No QR code found in image after trying all detection methods")
-
-                # Fallback to prescription info detection from text
-                print("Attempting prescription info detection from text as fallback...")
-                prescription_info = self.detect_prescription_info_from_text(
-                    image)
-
-                if prescription_info:
-                    found_items = []
-                    if prescription_info.get('ndc'):
-                        found_items.append(f"NDC: {prescription_info['ndc']}")
-                    if prescription_info.get('rx_number'):
-                        found_items.append(
-                            f"RX: {prescription_info['rx_number']}")
-
-                    print(
-                        f"✓ Prescription info detected: {', '.join(found_items)}")
-                    # Return a format that can be parsed
-                    return f"TEXT_INFO: {prescription_info}"
+            if metadata['orientation'] != 1:
+                print(f"Applied EXIF orientation {metadata['orientation']}")
+            if metadata['decode_scale'] < 1.0:
+                memory.degrade('reduced_decode')
+                print(f"Decoded at {metadata['decode_scale']:g}x to fit the memory budget")
+
+            quality = self.assess_quality(image)
+            if not passes_quality_gate(quality):
+                print("✗ Image rejected before decoding:")
+                for feedback in quality['feedback']:
+                    print(f"- {feedback}")
+                return None
+            if quality and quality['feedback']:
+                print(f"Image quality: {' '.join(quality['feedback'])}")
+
+            # QR code and barcode detection, then the label text as fallback
+            payload, report = self.scan_payload(
+                image, quality, metadata['orientation_known'], hints, memory,
+                metadata['decode_scale'])
+            usage = memory.summary()
+            print(f"Peak memory: {usage['peak_mb']} MB"
+                  + (f" of {usage['budget_mb']} MB budget" if usage['budget_mb'] else '')
+                  + (f"; budget forced: {', '.join(usage['degraded'])}" if usage['degraded'] else ''))
+            if report['used'] or report['ignored']:
+                print(f"Hints used: {', '.join(report['used']) or 'none'}"
+                      + (f"; ignored: {', '.join(report['ignored'])}" if report['ignored'] else '')
+                      + f"; {report['attempts_saved']} attempts saved")
+
+            if payload:
+                if sniff_format(payload).name == 'text_info':
+                    print("✓ Prescription info detected from label text")
                 else:
-                    print("✗ No prescription info found in image text")
-                    print("Tips:")
-                    print(
-                        "- Ensure the QR code or prescription label is clearly visible")
-                    print("- Try better lighting conditions")
-                    print("- Make sure the text isn't too small or blurry")
-                    print(
-                        "- Check if the image contains a valid QR code, NDC number, or RX number")
-                    return None
+                    print("✓ QR code successfully detected and decoded")
+                return payload
+
+            print("✗ No QR code or prescription info found in image")
+            print("Tips:")
+            print(
+                "- Ensure the QR code or prescription label is clearly visible")
+            print("- Try better lighting conditions")
+            print("- Make sure the text isn't too small or blurry")
+            print(
+                "- Check if the image contains a valid QR code, NDC number, or RX number")
+            return None
 
         except Exception as e:
             print(f"Error reading image: {e}")
             return None
 
-    def process_qr_data(self, qr_data: str) -> None:
+    def process_qr_data(self, qr_data: str, payload_format: Optional[str] = None) -> None:
         if not qr_data:
             print("No QR code data to process")
             return
@@ -854,7 +1291,7 @@ class PrescriptionQRReader:
         print(qr_data)
         print()
 
-        parsed_data = self.parse_prescription_data(qr_data)
+        parsed_data = self.parse_prescription_data(qr_data, payload_format)
         is_valid, issues = self.validate_prescription_data(parsed_data)
 
         print(self.format_prescription_output(parsed_data))
@@ -872,18 +1309,89 @@ def main():
     parser.add_argument('-i', '--image', help='Read QR code from image file')
     parser.add_argument('-c', '--camera', action='store_true',
                         help='Read QR code from camera (default)')
+    parser.add_argument('--bench-decoders', nargs='+', metavar='IMAGE',
+                        help='Compare speed and hit rate of each decoder backend on these images')
+    parser.add_argument('--race-workers', type=int, metavar='K',
+                        help='Decode attempts run at once per scan (default: QR_RACE_WORKERS or 1)')
+    parser.add_argument('--hints', metavar='JSON',
+                        help='Scan hints for --image, e.g. \'{"mode": "qr_only", "roi": [0, 0, 400, 400]}\'')
+
+    batch = parser.add_argument_group('batch modes')
+    batch.add_argument('--input-dir', metavar='DIR',
+                       help='Scan every image under this directory')
+    batch.add_argument('--glob', metavar='PATTERN',
+                       help="Scan images matching this pattern, e.g. 'labels/**/*.jpg'")
+    batch.add_argument('--from-list', metavar='FILE',
+                       help="Scan image paths listed one per line in this file ('-' for stdin)")
+    batch.add_argument('--prefetch', type=int, default=DEFAULT_PREFETCH,
+                       help='Images read ahead of the decoders')
+    batch.add_argument('--reparse', metavar='FILE',
+                       help="Re-parse and validate payloads from a JSONL/CSV file ('-' for stdin)")
+    batch.add_argument('--input-format', choices=['jsonl', 'csv'],
+                       help='Input format (default: from the file extension, jsonl for stdin)')
+    batch.add_argument('--payload-field',
+                       help='JSONL key or CSV column holding the payload (default: raw_qr_data, raw_data, ...)')
+    batch.add_argument('-o', '--output', default='-',
+                       help="JSONL results file (default: stdout)")
+    batch.add_argument('--workers', type=int,
+                       help='Worker processes (default: CPU count)')
+    batch.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE,
+                       help='Records per worker batch')
+    batch.add_argument('--resume-from', type=int, default=0, metavar='OFFSET',
+                       help='Skip records before this offset and append to the output')
 
     args = parser.parse_args()
 
-    reader = PrescriptionQRReader()
+    if args.reparse:
+        stats = run_reparse(PrescriptionQRReader, args.reparse, args.output,
+                            fmt=args.input_format, field=args.payload_field,
+                            workers=args.workers, chunk_size=args.chunk_size,
+                            resume_from=args.resume_from)
+        print(f"Re-parsed {stats['records']} records in {stats['seconds']:.1f}s "
+              f"({stats['records_per_second']:,.0f}/s): {stats['valid']} valid, "
+              f"{stats['invalid']} invalid, {stats['errors']} unreadable. "
+              f"Resume with --resume-from {stats['next_offset']}", file=sys.stderr)
+        return
+
+    if args.input_dir or args.glob or args.from_list:
+        paths = iter_image_paths(args.input_dir, args.glob, args.from_list)
+        stats = run_image_batch(PrescriptionQRReader, paths, args.output,
+                                workers=args.workers, prefetch=args.prefetch)
+        methods = stats['methods']
+        print(f"Scanned {stats['images']} images in {stats['seconds']:.1f}s "
+              f"({stats['images_per_second']:.1f} images/s): "
+              f"QR {methods.get('qr', 0)}, barcode {methods.get('barcode', 0)}, "
+              f"OCR {methods.get('ocr', 0)}, miss {methods.get('miss', 0)}, "
+              f"rejected {methods.get('rejected', 0)}, "
+              f"unreadable {methods.get('error', 0)}", file=sys.stderr)
+        print(f"Peak scan memory {stats['peak_mb_max']} MB; "
+              f"{stats['memory_degraded']} scans degraded to fit the budget", file=sys.stderr)
+        return
+
+    try:
+        hints = parse_scan_hints(args.hints)
+    except ValueError as e:
+        parser.error(f"--hints: {e}")
+    reader = PrescriptionQRReader(race_workers=args.race_workers)
+
+    if args.bench_decoders:
+        report = bench_backends(reader, args.bench_decoders)
+        print(f"{'backend':<14} {'cost':>5} {'hits':>9} {'hit rate':>9} "
+              f"{'mean ms':>9} {'p50 ms':>9} {'max ms':>9}")
+        for row in report:
+            print(f"{row['backend']:<14} {row['cost']:>5.1f} "
+                  f"{row['hits']:>4}/{row['images']:<4} {row['hit_rate']:>9.0%} "
+                  f"{row['mean_ms']:>9.1f} {row['p50_ms']:>9.1f} {row['max_ms']:>9.1f}")
+        return
 
     if args.image:
-        qr_data = reader.read_from_image(args.image)
+        qr_data = reader.read_from_image(args.image, hints)
     else:
         qr_data = reader.read_from_camera()
+    reader.close()
 
     if qr_data:
-        reader.process_qr_data(qr_data)
+        reader.process_qr_data(qr_data, hints['payload_format'])
     else:
         print("No QR code detected or read")
         sys.exit(1)
@@ -0,0 +1,370 @@
+#!/usr/bin/env python3
+"""
+Pluggable QR decoder backends and the router that chooses between them.
+
+Each backend wraps one decoding library, declares whether it is usable in
+this environment, its relative cost per attempt and the image traits it
+handles well. The router orders the available backends so the cheapest one
+likely to succeed runs first and the others are escalated to in turn.
+
+Optional backends are detected at import time, like pyzbar always was:
+  - pyzbar          (needs the zbar system library)
+  - opencv          (cv2.QRCodeDetector, always available)
+  - opencv_aruco    (cv2.QRCodeDetectorAruco, OpenCV >= 4.8)
+  - wechat          (cv2.wechat_qrcode_WeChatQRCode, opencv-contrib)
+  - zxing           (zxing-cpp Python bindings)
+"""
+
+import os
+import sys
+import threading
+import time
+from typing import Dict, Iterable, List, Optional
+
+import cv2
+import numpy as np
+
+from image_ingest import load_image_file
+from qr_geometry import MAX_MODULE_PX, MIN_MODULE_PX
+from scan_memory import input_pixel_limit
+
+# Make pyzbar optional since it requires zbar system library
+try:
+    from pyzbar import pyzbar
+    from pyzbar.pyzbar import ZBarSymbol
+    PYZBAR_AVAILABLE = True
+except (ImportError, OSError) as e:
+    PYZBAR_AVAILABLE = False
+    print(
+        f"Warning: pyzbar not available ({e}). QR code detection will be limited.",
+        file=sys.stderr)
+
+try:
+    import zxingcpp
+    ZXING_AVAILABLE = True
+except ImportError:
+    ZXING_AVAILABLE = False
+
+WECHAT_AVAILABLE = hasattr(cv2, 'wechat_qrcode_WeChatQRCode')
+ARUCO_AVAILABLE = hasattr(cv2, 'QRCodeDetectorAruco')
+
+# Directory holding the WeChat CNN model files (detect.prototxt,
+# detect.caffemodel, sr.prototxt, sr.caffemodel). Without them the WeChat
+# detector falls back to its traditional (non-CNN) detection.
+WECHAT_MODEL_DIR = os.environ.get('WECHAT_QR_MODEL_DIR')
+
+# Symbologies, named as pyzbar reports them
+QRCODE = 'QRCODE'
+EAN13 = 'EAN13'
+EAN8 = 'EAN8'
+UPCA = 'UPCA'
+UPCE = 'UPCE'
+CODE128 = 'CODE128'
+DATABAR = 'DATABAR'
+DATABAR_EXP = 'DATABAR_EXP'
+DATAMATRIX = 'DATAMATRIX'
+
+QR_SYMBOLOGIES = (QRCODE,)
+# Linear retail codes and GS1 carriers that may hold an NDC on packaging
+BARCODE_SYMBOLOGIES = (UPCA, EAN13, EAN8, UPCE, CODE128,
+                       DATABAR, DATABAR_EXP, DATAMATRIX)
+
+# Image traits the router matches against backend strengths
+TRAIT_SMALL_MODULES = 'small_modules'
+TRAIT_NO_FINDERS = 'no_finders'
+TRAIT_LARGE_MODULES = 'large_modules'
+
+
+def make_result(data: str, backend: str, symbology: str = QRCODE,
+                polygon: Optional[List] = None) -> Dict:
+    return {
+        'data': data,
+        'symbology': symbology,
+        'backend': backend,
+        'polygon': polygon,
+    }
+
+
+class DecoderBackend:
+    """Base class for decoder backends"""
+    name = ''
+    # Relative cost of one decode attempt (pyzbar on a typical frame = 1.0)
+    cost = 1.0
+    # Image traits this backend copes with better than its peers
+    strengths = ()
+    # Symbologies this backend can decode
+    symbologies = QR_SYMBOLOGIES
+
+    def is_available(self) -> bool:
+        return True
+
+    def supports(self, symbologies: Iterable[str]) -> bool:
+        return any(symbology in self.symbologies for symbology in symbologies)
+
+    def decode(self, image: np.ndarray, context,
+               symbologies: Iterable[str] = QR_SYMBOLOGIES) -> List[Dict]:
+        """Decode all codes in the image. Returns a list of result dicts."""
+        raise NotImplementedError
+
+
+class PyzbarBackend(DecoderBackend):
+    name = 'pyzbar'
+    cost = 1.0
+    strengths = (TRAIT_LARGE_MODULES,)
+    # zbar reads linear codes but not DataMatrix
+    symbologies = (QRCODE, UPCA, EAN13, EAN8, UPCE, CODE128, DATABAR, DATABAR_EXP)
+
+    def is_available(self) -> bool:
+        return PYZBAR_AVAILABLE
+
+    def decode(self, image: np.ndarray, context,
+               symbologies: Iterable[str] = QR_SYMBOLOGIES) -> List[Dict]:
+        symbols = [getattr(ZBarSymbol, symbology) for symbology in symbologies
+                   if symbology in self.symbologies and hasattr(ZBarSymbol, symbology)]
+        results = []
+        for obj in pyzbar.decode(image, symbols=symbols):
+            polygon = [(point.x, point.y) for point in obj.polygon]
+            results.append(make_result(
+                obj.data.decode('utf-8'), self.name, symbology=obj.type, polygon=polygon))
+        return results
+
+
+class OpenCVBackend(DecoderBackend):
+    name = 'opencv'
+    cost = 2.0
+    strengths = (TRAIT_LARGE_MODULES,)
+
+    def detector(self, context):
+        return context.qr_detector()
+
+    def decode(self, image: np.ndarray, context,
+               symbologies: Iterable[str] = QR_SYMBOLOGIES) -> List[Dict]:
+        data, points, _ = self.detector(context).detectAndDecode(image)
+        if not data:
+            return []
+        polygon = None
+        if points is not None:
+            polygon = [tuple(point) for point in points.reshape(-1, 2).tolist()]
+        return [make_result(data, self.name, polygon=polygon)]
+
+
+class OpenCVArucoBackend(OpenCVBackend):
+    name = 'opencv_aruco'
+    cost = 3.0
+    strengths = (TRAIT_NO_FINDERS, TRAIT_SMALL_MODULES)
+
+    def is_available(self) -> bool:
+        return ARUCO_AVAILABLE
+
+    def detector(self, context):
+        return context.per_thread('qr_detector_aruco', cv2.QRCodeDetectorAruco)
+
+
+class WeChatBackend(DecoderBackend):
+    name = 'wechat'
+    cost = 4.0
+    strengths = (TRAIT_SMALL_MODULES, TRAIT_NO_FINDERS)
+
+    def is_available(self) -> bool:
+        return WECHAT_AVAILABLE
+
+    @staticmethod
+    def _create():
+        if WECHAT_MODEL_DIR:
+            files = [os.path.join(WECHAT_MODEL_DIR, name) for name in
+                     ('detect.prototxt', 'detect.caffemodel', 'sr.prototxt', 'sr.caffemodel')]
+            if all(os.path.exists(path) for path in files):
+                return cv2.wechat_qrcode_WeChatQRCode(*files)
+        return cv2.wechat_qrcode_WeChatQRCode()
+
+    def decode(self, image: np.ndarray, context,
+               symbologies: Iterable[str] = QR_SYMBOLOGIES) -> List[Dict]:
+        detector = context.per_thread('wechat_detector', self._create)
+        texts, points = detector.detectAndDecode(image)
+        results = []
+        for index, text in enumerate(texts):
+            if not text:
+                continue
+            polygon = None
+            if points is not None and index < len(points):
+                polygon = [tuple(point) for point in
+                           np.asarray(points[index]).reshape(-1, 2).tolist()]
+            results.append(make_result(text, self.name, polygon=polygon))
+        return results
+
+
+class ZXingBackend(DecoderBackend):
+    name = 'zxing'
+    cost = 1.5
+    strengths = (TRAIT_SMALL_MODULES, TRAIT_NO_FINDERS)
+    symbologies = (QRCODE,) + BARCODE_SYMBOLOGIES
+
+    # Our symbology names -> zxing-cpp BarcodeFormat attribute names
+    FORMAT_NAMES = {
+        QRCODE: 'QRCode', UPCA: 'UPCA', EAN13: 'EAN13', EAN8: 'EAN8',
+        UPCE: 'UPCE', CODE128: 'Code128', DATABAR: 'DataBar',
+        DATABAR_EXP: 'DataBarExp', DATAMATRIX: 'DataMatrix',
+    }
+
+    def is_available(self) -> bool:
+        return ZXING_AVAILABLE
+
+    def _formats(self, symbologies: Iterable[str]):
+        formats = []
+        for symbology in symbologies:
+            barcode_format = getattr(zxingcpp.BarcodeFormat,
+                                     self.FORMAT_NAMES.get(symbology, ''), None)
+            if barcode_format is not None:
+                formats.append(barcode_format)
+        return tuple(formats)
+
+    def _symbology(self, barcode_format) -> str:
+        for symbology, format_name in self.FORMAT_NAMES.items():
+            if getattr(zxingcpp.BarcodeFormat, format_name, None) == barcode_format:
+                return symbology
+        return str(barcode_format)
+
+    def decode(self, image: np.ndarray, context,
+               symbologies: Iterable[str] = QR_SYMBOLOGIES) -> List[Dict]:
+        formats = self._formats(symbologies)
+        if not formats:
+            return []
+        results = []
+        for barcode in zxingcpp.read_barcodes(image, formats=formats):
+            if not barcode.valid or not barcode.text:
+                continue
+            position = barcode.position
+            polygon = [(point.x, point.y) for point in (
+                position.top_left, position.top_right,
+                position.bottom_right, position.bottom_left)]
+            results.append(make_result(
+                barcode.text, self.name, symbology=self._symbology(barcode.format),
+                polygon=polygon))
+        return results
+
+
+# Registry of every known backend, keyed by name
+BACKENDS: Dict[str, DecoderBackend] = {}
+
+
+def register_backend(backend: DecoderBackend) -> DecoderBackend:
+    BACKENDS[backend.name] = backend
+    return backend
+
+
+for _backend in (PyzbarBackend(), OpenCVBackend(), OpenCVArucoBackend(),
+                 WeChatBackend(), ZXingBackend()):
+    register_backend(_backend)
+
+
+def geometry_traits(geometry: Dict) -> List[str]:
+    """Translate the scan's QR geometry into traits the router matches on"""
+    traits = []
+    if not geometry.get('finder_patterns'):
+        traits.append(TRAIT_NO_FINDERS)
+    module_size = geometry.get('module_size')
+    if module_size and module_size < MIN_MODULE_PX:
+        traits.append(TRAIT_SMALL_MODULES)
+    elif module_size and module_size >= MAX_MODULE_PX / 2:
+        traits.append(TRAIT_LARGE_MODULES)
+    return traits
+
+
+class DecoderRouter:
+    """
+    Orders the available backends for a scan. Backends are ranked by cost,
+    discounted for each of the image's traits they list as a strength, so
+    the cheapest backend likely to succeed is tried first.
+
+    QR_DECODERS (comma separated names) restricts the backends used.
+    """
+
+    def __init__(self, names: Optional[Iterable[str]] = None):
+        if names is None:
+            configured = os.environ.get('QR_DECODERS', '')
+            names = [name.strip() for name in configured.split(',') if name.strip()]
+        names = list(names) or list(BACKENDS)
+        self.backends = [BACKENDS[name] for name in names
+                         if name in BACKENDS and BACKENDS[name].is_available()]
+
+        self._lock = threading.Lock()
+        self.stats = {backend.name: {'attempts': 0, 'hits': 0}
+                      for backend in self.backends}
+
+    def get(self, name: str) -> Optional[DecoderBackend]:
+        for backend in self.backends:
+            if backend.name == name:
+                return backend
+        return None
+
+    def plan(self, traits: Iterable[str] = (),
+             symbologies: Iterable[str] = QR_SYMBOLOGIES) -> List[DecoderBackend]:
+        traits = set(traits)
+        symbologies = tuple(symbologies)
+
+        def score(backend):
+            matches = len(traits.intersection(backend.strengths))
+            return backend.cost / (1 + matches)
+
+        candidates = [backend for backend in self.backends
+                      if backend.supports(symbologies)]
+        return sorted(candidates, key=score)
+
+    def record(self, backend: DecoderBackend, hit: bool):
+        with self._lock:
+            entry = self.stats.setdefault(
+                backend.name, {'attempts': 0, 'hits': 0})
+            entry['attempts'] += 1
+            if hit:
+                entry['hits'] += 1
+
+
+_default_router: Optional[DecoderRouter] = None
+_default_router_lock = threading.Lock()
+
+
+def get_default_router() -> DecoderRouter:
+    """Return the process-wide router, creating it on first use"""
+    global _default_router
+    if _default_router is None:
+        with _default_router_lock:
+            if _default_router is None:
+                _default_router = DecoderRouter()
+    return _default_router
+
+
+def bench_backends(reader, paths: List[str]) -> List[Dict]:
+    """
+    Run the full decode ladder with each available backend alone over the
+    same images and report hit rate and latency per backend. Images are
+    loaded as scans load them: EXIF-uprighted and reduced past the input
+    pixel limit.
+    """
+    images = []
+    for path in paths:
+        loaded = load_image_file(path, input_pixel_limit())
+        if loaded is not None:
+            images.append((path, loaded[0]))
+
+    report = []
+    for backend in reader.router.backends:
+        hits = 0
+        latencies = []
+        for _, image in images:
+            start = time.perf_counter()
+            result = reader.decode_with_backends(image, backends=[backend])
+            latencies.append(time.perf_counter() - start)
+            if result:
+                hits += 1
+        latencies.sort()
+        report.append({
+            'backend': backend.name,
+            'cost': backend.cost,
+            'images': len(images),
+            'hits': hits,
+            'hit_rate': hits / len(images) if images else 0.0,
+            'mean_ms': 1000 * sum(latencies) / len(latencies) if latencies else 0.0,
+            'p50_ms': 1000 * latencies[len(latencies) // 2] if latencies else 0.0,
+            'max_ms': 1000 * latencies[-1] if latencies else 0.0,
+        })
+    return report
@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""
+QR geometry helpers: finder-pattern detection, module size estimation and
+resolution-aware planning of the scales tried by the decoders.
+
+Decoders work best when each QR module covers a few pixels. Rather than
+trying fixed scales of the whole image, the pipeline estimates the module
+size once and resamples towards TARGET_MODULE_PX, never producing an image
+larger than decoding needs.
+"""
+
+import os
+from typing import Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+# Pixels per QR module the decoders handle reliably
+MIN_MODULE_PX = 2.5
+TARGET_MODULE_PX = 5.0
+MAX_MODULE_PX = 10.0
+
+# Longest side an image is ever decoded at when the module size is unknown
+MAX_DECODE_DIMENSION = int(os.environ.get('QR_MAX_DECODE_DIMENSION', '2000'))
+
+# Longest side of the thumbnail used to look for finder patterns
+FINDER_SEARCH_DIMENSION = 1200
+
+# Scales used when no module size estimate is available
+FALLBACK_SCALES = (0.5, 1.5, 2.0)
+
+# Modules across a finder pattern, and across a version 2 code (used for
+# contour ROIs, where the version is unknown)
+FINDER_MODULES = 7
+TYPICAL_QR_MODULES = 25
+
+
+def find_finder_patterns(gray: np.ndarray) -> List[Tuple[float, float, float]]:
+    """
+    Find QR finder patterns (the three nested squares in the corners).
+    Returns (center_x, center_y, side_length) tuples in the coordinates of
+    the given image, largest first.
+    """
+    height, width = gray.shape[:2]
+    scale = min(1.0, FINDER_SEARCH_DIMENSION / max(height, width))
+    if scale < 1.0:
+        gray = cv2.resize(gray, (int(width * scale), int(height * scale)),
+                          interpolation=cv2.INTER_AREA)
+
+    _, binary = cv2.threshold(
+        gray, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
+    contours, hierarchy = cv2.findContours(
+        binary, cv2.RETR_TREE, cv2.CHAIN_APPROX_SIMPLE)
+    if hierarchy is None:
+        return []
+    hierarchy = hierarchy[0]
+
+    patterns = []
+    for index, contour in enumerate(contours):
+        # A finder pattern is a dark ring holding a dark square: the outer
+        # contour has a child (the light gap) that has a child of its own
+        child = hierarchy[index][2]
+        if child < 0 or hierarchy[child][2] < 0:
+            continue
+        grandchild = hierarchy[child][2]
+
+        outer_area = cv2.contourArea(contour)
+        inner_area = cv2.contourArea(contours[grandchild])
+        if outer_area < 49 or inner_area <= 0:
+            continue
+
+        # Outer square is 7x7 modules, inner square 3x3: area ratio ~5.4
+        ratio = outer_area / inner_area
+        if not 2.5 <= ratio <= 12.0:
+            continue
+
+        x, y, w, h = cv2.boundingRect(contour)
+        if not 0.6 <= float(w) / h <= 1.6:
+            continue
+
+        side = np.sqrt(outer_area) / scale
+        patterns.append(((x + w / 2) / scale, (y + h / 2) / scale, side))
+
+    patterns.sort(key=lambda pattern: pattern[2], reverse=True)
+    return patterns
+
+
+def module_size_from_patterns(patterns: List[Tuple[float, float, float]]) -> Optional[float]:
+    if not patterns:
+        return None
+    # The three finder patterns of one code share a size; use the median
+    # of the largest few so stray text-like matches don't dominate
+    sides = [pattern[2] for pattern in patterns[:3]]
+    return float(np.median(sides)) / FINDER_MODULES
+
+
+def finder_region(patterns: List[Tuple[float, float, float]],
+                  shape: Tuple[int, ...]) -> Optional[Tuple[int, int, int, int]]:
+    """
+    Bounding box (x, y, w, h) of the code whose finder patterns were found,
+    padded by one finder width for the quiet zone. Only returned when the
+    three largest patterns have consistent sizes.
+    """
+    if len(patterns) < 3:
+        return None
+    corners = patterns[:3]
+    sides = [pattern[2] for pattern in corners]
+    if min(sides) < 0.7 * max(sides):
+        return None
+
+    height, width = shape[:2]
+    margin = max(sides)
+    x0 = int(max(0, min(p[0] for p in corners) - margin))
+    y0 = int(max(0, min(p[1] for p in corners) - margin))
+    x1 = int(min(width, max(p[0] for p in corners) + margin))
+    y1 = int(min(height, max(p[1] for p in corners) + margin))
+    if x1 - x0 <= 0 or y1 - y0 <= 0:
+        return None
+    return x0, y0, x1 - x0, y1 - y0
+
+
+def analyze_geometry(gray: np.ndarray) -> Dict:
+    """
+    Look for finder patterns once per scan and summarize what the decoders
+    need: the estimated module size and, if found, the code's region.
+    """
+    patterns = find_finder_patterns(gray)
+    return {
+        'module_size': module_size_from_patterns(patterns),
+        'region': finder_region(patterns, gray.shape),
+        'finder_patterns': patterns,
+    }
+
+
+def scale_geometry(geometry: Dict, scale: float) -> Dict:
+    """Geometry of the same image after resizing it by scale"""
+    region = geometry.get('region')
+    if region is not None:
+        region = tuple(int(value * scale) for value in region)
+    module_size = geometry.get('module_size')
+    return {
+        'module_size': module_size * scale if module_size else None,
+        'region': region,
+        'finder_patterns': [(x * scale, y * scale, side * scale)
+                            for x, y, side in geometry.get('finder_patterns', [])],
+    }
+
+
+def initial_scale(shape: Tuple[int, ...], module_size: Optional[float]) -> float:
+    """
+    Scale (<= 1.0) to apply before decoding so that no attempt processes
+    more pixels than decoding needs.
+    """
+    height, width = shape[:2]
+    if module_size:
+        if module_size <= MAX_MODULE_PX:
+            return 1.0
+        return TARGET_MODULE_PX / module_size
+    return min(1.0, MAX_DECODE_DIMENSION / max(height, width))
+
+
+def plan_decode_scales(shape: Tuple[int, ...], module_size: Optional[float]) -> List[float]:
+    """
+    Scales worth trying after the native-resolution attempts failed.
+    With a module size estimate the scales bring modules into the
+    MIN_MODULE_PX..MAX_MODULE_PX window; without one the old fixed scales are
+    used. Upscaling never takes the image past MAX_DECODE_DIMENSION (twice
+    that when the estimate says the modules really are that small).
+    """
+    height, width = shape[:2]
+    if module_size:
+        candidates = [TARGET_MODULE_PX / module_size,
+                      MIN_MODULE_PX / module_size,
+                      MAX_MODULE_PX / module_size]
+        limit = 2 * MAX_DECODE_DIMENSION
+    else:
+        candidates = list(FALLBACK_SCALES)
+        limit = MAX_DECODE_DIMENSION
+    max_scale = max(1.0, limit / max(height, width))
+
+    scales = []
+    for scale in candidates:
+        scale = round(min(scale, max_scale), 3)
+        # Native resolution was already tried
+        if abs(scale - 1.0) <= 0.1:
+            continue
+        if int(width * scale) <= 50 or int(height * scale) <= 50:
+            continue
+        if any(abs(scale - existing) < 0.05 for existing in scales):
+            continue
+        scales.append(scale)
+    return scales
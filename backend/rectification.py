@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+"""
+Perspective rectification of a located QR code.
+
+A code photographed at an angle, or on a curved bottle, has modules of
+varying size and shape, which is what makes the decoders fall through to
+more variants and scales. Once the code has been located its geometry is
+known, so it can be warped straight to a fronto-parallel patch where every
+module is TARGET_MODULE_PX wide, surrounded by a quiet zone, and decoded
+once:
+
+1. Finder patterns: the three found by qr_geometry (already computed for
+   every scan) give the code's orientation, its module count and, by
+   extrapolation, an estimate of its four corners.
+2. Quad: QRCodeDetector.detect() is run on that estimated area only, since
+   on a whole photo it costs as much as several decode attempts. It finds
+   the real corners even when decoding fails, and a perspective warp maps
+   them to the patch corners.
+3. When detect() finds nothing there, the finder centres give an affine
+   warp instead (rotation, scale and shear; no perspective).
+
+Without finder patterns there is nothing to rectify, and the ladder's
+other variants are left to find the code.
+"""
+
+from typing import List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from detector_context import DetectorContext
+from qr_geometry import FINDER_MODULES, TARGET_MODULE_PX
+
+# Light modules added around the code in the patch, as the QR spec requires
+QUIET_ZONE_MODULES = 4
+
+# Version 1 to 40 codes are 21 to 177 modules across, in steps of 4
+MIN_QR_MODULES = 21
+MAX_QR_VERSION = 40
+
+# The three finder patterns of one code are about the same size and sit at
+# the corners of a right angle
+FINDER_SIZE_TOLERANCE = 0.7
+MIN_CORNER_COSINE = 0.35
+
+# A detected quad is only trusted when its area is close to the finder estimate
+QUAD_AREA_RATIO = (0.6, 1.6)
+
+Point = Tuple[float, float]
+
+
+def qr_module_count(modules: float) -> int:
+    """Nearest valid QR width (21 + 4k modules) to an estimate"""
+    version = int(round((modules - MIN_QR_MODULES) / 4.0)) + 1
+    return MIN_QR_MODULES + 4 * (min(max(version, 1), MAX_QR_VERSION) - 1)
+
+
+def order_finder_patterns(patterns: List[Tuple[float, float, float]]
+                          ) -> Optional[Tuple[Point, Point, Point, float]]:
+    """
+    Return (top_left, top_right, bottom_left, module_size) in code
+    orientation from the three largest finder patterns, or None when they
+    don't look like the corners of one code.
+    """
+    if len(patterns) < 3:
+        return None
+    corners = patterns[:3]
+    sides = [pattern[2] for pattern in corners]
+    if min(sides) < FINDER_SIZE_TOLERANCE * max(sides):
+        return None
+    points = [np.float32(pattern[:2]) for pattern in corners]
+
+    # The top-left pattern is the one at the right angle
+    best = None
+    for index in range(3):
+        corner = points[index]
+        a, b = (points[(index + 1) % 3] - corner, points[(index + 2) % 3] - corner)
+        norms = float(np.linalg.norm(a) * np.linalg.norm(b))
+        if norms == 0:
+            return None
+        cosine = abs(float(np.dot(a, b))) / norms
+        if best is None or cosine < best[0]:
+            best = (cosine, index, a, b)
+    cosine, index, a, b = best
+    if cosine > MIN_CORNER_COSINE:
+        return None
+
+    top_left = points[index]
+    top_right, bottom_left = points[(index + 1) % 3], points[(index + 2) % 3]
+    # With y pointing down, top-right is clockwise from bottom-left
+    if a[0] * b[1] - a[1] * b[0] < 0:
+        top_right, bottom_left = bottom_left, top_right
+    module_size = float(np.median(sides)) / FINDER_MODULES
+    return (tuple(top_left), tuple(top_right), tuple(bottom_left), module_size)
+
+
+def module_count_from_finders(top_left: Point, top_right: Point,
+                              bottom_left: Point, module_size: float) -> int:
+    """Modules across the code: finder centres are 3.5 modules from its edges"""
+    spacing = (np.hypot(top_right[0] - top_left[0], top_right[1] - top_left[1])
+               + np.hypot(bottom_left[0] - top_left[0], bottom_left[1] - top_left[1])) / 2
+    return qr_module_count(spacing / module_size + FINDER_MODULES)
+
+
+def finder_quad(top_left: Point, top_right: Point, bottom_left: Point,
+                modules: int) -> np.ndarray:
+    """
+    The code's four corners (clockwise from top-left) extrapolated from the
+    finder centres, assuming no perspective
+    """
+    top_left, top_right, bottom_left = (np.float32(point) for point in
+                                        (top_left, top_right, bottom_left))
+    # Unit steps of one module along the code's rows and columns
+    spacing = modules - FINDER_MODULES
+    across = (top_right - top_left) / spacing
+    down = (bottom_left - top_left) / spacing
+    inset = FINDER_MODULES / 2.0
+    origin = top_left - inset * (across + down)
+    return np.float32([origin, origin + modules * across,
+                       origin + modules * (across + down), origin + modules * down])
+
+
+def detect_quad(gray: np.ndarray, context: DetectorContext) -> Optional[np.ndarray]:
+    """The code's four outer corners (4x2 float32) found by QRCodeDetector, or None"""
+    try:
+        found, points = context.qr_detector().detect(gray)
+    except cv2.error:
+        return None
+    if not found or points is None:
+        return None
+    quad = points.reshape(-1, 2).astype(np.float32)
+    if len(quad) != 4 or cv2.contourArea(quad) < MIN_QR_MODULES ** 2:
+        return None
+    return quad
+
+
+def detect_quad_near(gray: np.ndarray, context: DetectorContext,
+                     estimate: np.ndarray, module_size: float) -> Optional[np.ndarray]:
+    """
+    Run the quad detector on the estimated code area only (much cheaper
+    than the whole frame), padded by the quiet zone. The result must agree
+    with the estimate's size to be used.
+    """
+    height, width = gray.shape[:2]
+    pad = QUIET_ZONE_MODULES * module_size
+    x0, y0 = np.maximum(estimate.min(axis=0) - pad, 0).astype(int)
+    x1, y1 = np.minimum(estimate.max(axis=0) + pad, (width, height)).astype(int)
+    if x1 - x0 < MIN_QR_MODULES or y1 - y0 < MIN_QR_MODULES:
+        return None
+    quad = detect_quad(gray[y0:y1, x0:x1], context)
+    if quad is None:
+        return None
+    ratio = cv2.contourArea(quad) / max(cv2.contourArea(estimate), 1.0)
+    if not QUAD_AREA_RATIO[0] <= ratio <= QUAD_AREA_RATIO[1]:
+        return None
+    return quad + np.float32([x0, y0])
+
+
+def _patch_corners(modules: int) -> Tuple[np.ndarray, int]:
+    """Code corners in the patch and the patch side, both in pixels"""
+    start = QUIET_ZONE_MODULES * TARGET_MODULE_PX
+    end = start + modules * TARGET_MODULE_PX
+    corners = np.float32([[start, start], [end, start], [end, end], [start, end]])
+    return corners, int(round(end + start))
+
+
+def rectify_code(gray: np.ndarray, context: DetectorContext,
+                 finder_patterns: List[Tuple[float, float, float]]
+                 ) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+    """
+    Warp the code whose finder patterns were found in a gray image to a
+    fronto-parallel patch with TARGET_MODULE_PX modules and a quiet zone.
+    Returns (patch, homography), where the 3x3 homography maps patch points
+    back into gray, or None when the finder patterns don't form a code.
+    """
+    finders = order_finder_patterns(finder_patterns)
+    if finders is None:
+        return None
+    top_left, top_right, bottom_left, module_size = finders
+    modules = module_count_from_finders(top_left, top_right, bottom_left, module_size)
+    estimate = finder_quad(top_left, top_right, bottom_left, modules)
+
+    target, size = _patch_corners(modules)
+    quad = detect_quad_near(gray, context, estimate, module_size)
+    if quad is not None:
+        matrix = cv2.getPerspectiveTransform(quad, target)
+    else:
+        # Three corners fix an affine warp; perspective is left in
+        matrix = np.vstack([cv2.getAffineTransform(estimate[[0, 1, 3]], target[[0, 1, 3]]),
+                            [0.0, 0.0, 1.0]])
+
+    patch = cv2.warpPerspective(gray, matrix, (size, size), flags=cv2.INTER_LINEAR,
+                                borderMode=cv2.BORDER_CONSTANT, borderValue=255)
+    return patch, np.linalg.inv(matrix)
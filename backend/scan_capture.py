@@ -0,0 +1,421 @@
+#!/usr/bin/env python3
+"""
+Capture of failed and slow scans, and offline replay.
+
+When /api/scan-qr answered qr_detected: false the image was discarded, so
+real-world misses could not be reproduced or used to measure a fix. With
+QR_CAPTURE_DIR set, the API keeps the images of missed scans, and of scans
+slower than QR_CAPTURE_SLOW_MS, in that directory with a JSON record of
+their timings and result:
+
+- Writing happens on a background thread, off the request path. When the
+  queue is full (QUEUE_SIZE captures or QUEUE_BYTES) the capture is
+  dropped and counted.
+- The directory is bounded by QR_CAPTURE_MAX_FILES captures and
+  QR_CAPTURE_MAX_MB megabytes; the oldest captures are deleted first.
+- With QR_CAPTURE_REDACT=1 the upright pixels are stored as PNG instead of
+  the uploaded file, which drops EXIF metadata such as GPS position and
+  camera details, and decoded payloads are stored as SHA-256 digests.
+  The pixels still show the label, so keep the directory private.
+
+`python scan_capture.py replay` rescans every capture with the current
+pipeline, in parallel via batch_processing.run_image_batch, and reports
+the misses now recovered, the hits now lost and the latency change.
+"""
+
+import argparse
+import hashlib
+import io
+import json
+import os
+import queue
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from typing import Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from batch_processing import run_image_batch
+from image_ingest import EXIF_ORIENTATION
+from image_quality import passes_quality_gate
+from prescription_qr_reader import PrescriptionQRReader
+
+# Captures are kept only when a directory is configured
+CAPTURE_DIR = os.environ.get('QR_CAPTURE_DIR') or None
+# Scans slower than this (decode through parse) are captured too; 0 disables
+SLOW_MS = float(os.environ.get('QR_CAPTURE_SLOW_MS', '3000'))
+MAX_FILES = int(os.environ.get('QR_CAPTURE_MAX_FILES', '500'))
+MAX_MB = float(os.environ.get('QR_CAPTURE_MAX_MB', '500'))
+REDACT = os.environ.get('QR_CAPTURE_REDACT', '0') == '1'
+# Frames the quality gate rejects are usually black or blank; off by default
+CAPTURE_REJECTED = os.environ.get('QR_CAPTURE_REJECTED', '0') == '1'
+
+MB = 1024 * 1024
+QUEUE_SIZE = 16
+# Encoded uploads, and decoded pixels when redacting, waiting to be written
+QUEUE_BYTES = 64 * MB
+RECORD_SUFFIX = '.json'
+
+REASON_MISS = 'miss'
+REASON_REJECTED = 'rejected'
+REASON_SLOW = 'slow'
+
+# Leading bytes -> file extension of an uploaded image
+IMAGE_SIGNATURES = (
+    (b'\xff\xd8', '.jpg'),
+    (b'\x89PNG', '.png'),
+    (b'GIF8', '.gif'),
+    (b'BM', '.bmp'),
+    (b'II*\x00', '.tiff'),
+    (b'MM\x00*', '.tiff'),
+)
+
+
+def image_extension(data: bytes) -> str:
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        return '.webp'
+    for signature, extension in IMAGE_SIGNATURES:
+        if data.startswith(signature):
+            return extension
+    return '.img'
+
+
+def payload_digest(payload: str) -> str:
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def redacted_png(image: np.ndarray, orientation_known: bool) -> bytes:
+    """
+    Upright pixels as PNG without the upload's metadata. An EXIF
+    orientation of 1 is kept when the upload had one, so a replay skips the
+    same orientation guessing the original scan did.
+    """
+    buffer = io.BytesIO()
+    exif = Image.Exif()
+    if orientation_known:
+        exif[EXIF_ORIENTATION] = 1
+    Image.fromarray(cv2.cvtColor(image, cv2.COLOR_BGR2RGB)).save(
+        buffer, format='PNG', exif=exif.tobytes())
+    return buffer.getvalue()
+
+
+class CaptureStore:
+    """
+    A bounded directory of captured scans: <id><ext> holds the image and
+    <id>.json its record. Ids start with the capture time, so they sort
+    oldest first. Worker processes can share a directory.
+    """
+
+    def __init__(self, directory: Optional[str] = CAPTURE_DIR, slow_ms: float = SLOW_MS,
+                 max_files: int = MAX_FILES, max_bytes: int = int(MAX_MB * MB),
+                 redact: bool = REDACT, capture_rejected: bool = CAPTURE_REJECTED):
+        self.directory = directory
+        self.slow_ms = slow_ms
+        self.max_files = max_files
+        self.max_bytes = max_bytes
+        self.redact = redact
+        self.capture_rejected = capture_rejected
+        self.captured = 0
+        self.dropped = 0
+        self._queue: 'queue.Queue' = queue.Queue(maxsize=QUEUE_SIZE)
+        self._writer: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._queued_bytes = 0
+        self._sequence = 0
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.directory)
+
+    def reason(self, body: Dict, total_ms: float) -> Optional[str]:
+        """Why a scan's response should be captured, or None"""
+        if not self.enabled:
+            return None
+        if not body.get('qr_detected'):
+            if not passes_quality_gate(body.get('quality')):
+                return REASON_REJECTED if self.capture_rejected else None
+            return REASON_MISS
+        if self.slow_ms and total_ms > self.slow_ms:
+            return REASON_SLOW
+        return None
+
+    def submit(self, reason: str, encoded: bytes, image: np.ndarray, metadata: Dict,
+               body: Dict, timings: Dict, image_source: str,
+               hints: Optional[Dict] = None) -> bool:
+        """
+        Queue a capture for the writer thread; False when it was dropped.
+        Only redaction needs the decoded pixels; otherwise the queue holds
+        the encoded upload and the image's shape. Pending captures are
+        bounded by QUEUE_BYTES as well as QUEUE_SIZE, since the pixels are
+        outside the scan's memory budget once the response is sent.
+        """
+        pixels = image if self.redact else None
+        size = len(encoded) + (pixels.nbytes if pixels is not None else 0)
+        with self._lock:
+            if self._queued_bytes + size > QUEUE_BYTES and self._queued_bytes:
+                self.dropped += 1
+                return False
+            self._queued_bytes += size
+        try:
+            self._queue.put_nowait((size, (reason, encoded, pixels, image.shape, metadata,
+                                           body, timings, image_source, hints)))
+        except queue.Full:
+            with self._lock:
+                self._queued_bytes -= size
+                self.dropped += 1
+            return False
+        self._start_writer()
+        return True
+
+    def flush(self) -> None:
+        """Wait until every queued capture is written"""
+        self._queue.join()
+
+    def _start_writer(self) -> None:
+        with self._lock:
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._write_loop, name='scan-capture',
+                                                daemon=True)
+                self._writer.start()
+
+    def _write_loop(self) -> None:
+        while True:
+            size, item = self._queue.get()
+            try:
+                self._store(*item)
+            except Exception as e:
+                # A full disk or missing directory must not take the API down
+                print(f"Scan capture failed: {e}", file=sys.stderr)
+            finally:
+                # Don't keep the last capture's pixels alive while idle
+                item = None
+                with self._lock:
+                    self._queued_bytes -= size
+                self._queue.task_done()
+
+    def write(self, reason: str, encoded: bytes, image: np.ndarray, metadata: Dict,
+              body: Dict, timings: Dict, image_source: str,
+              hints: Optional[Dict] = None) -> Dict:
+        """Store one capture now, evict the oldest beyond the limits; returns its record"""
+        return self._store(reason, encoded, image, image.shape, metadata, body, timings,
+                           image_source, hints)
+
+    def _store(self, reason: str, encoded: bytes, pixels: Optional[np.ndarray],
+               shape: Tuple[int, ...], metadata: Dict, body: Dict, timings: Dict,
+               image_source: str, hints: Optional[Dict]) -> Dict:
+        os.makedirs(self.directory, exist_ok=True)
+        now = time.time()
+        with self._lock:
+            self._sequence += 1
+            sequence = self._sequence
+        # The sequence keeps captures from the same millisecond in order
+        capture_id = (f"{time.strftime('%Y%m%dT%H%M%S', time.gmtime(now))}"
+                      f"{int(now % 1 * 1000):03d}-{sequence % 1000000:06d}-{uuid.uuid4().hex[:6]}")
+        if self.redact:
+            data, extension = redacted_png(pixels, metadata['orientation_known']), '.png'
+        else:
+            data, extension = encoded, image_extension(encoded)
+
+        payload = body.get('raw_qr_data')
+        result = {'qr_detected': bool(body.get('qr_detected'))}
+        if payload:
+            result['detection_method'] = body['prescription_data'].get('detection_method')
+            if self.redact:
+                result['payload_sha256'] = payload_digest(payload)
+            else:
+                result['payload'] = payload
+        record = {
+            'id': capture_id,
+            'captured_at': now,
+            'reason': reason,
+            'image': capture_id + extension,
+            'image_source': image_source,
+            'redacted': self.redact,
+            'bytes': len(data),
+            'width': shape[1],
+            'height': shape[0],
+            'decode_scale': metadata['decode_scale'],
+            'orientation_known': metadata['orientation_known'],
+            'hints': hints,
+            'timings': timings,
+            'result': result,
+            'quality': body.get('quality'),
+            'memory': body.get('memory'),
+        }
+
+        with open(os.path.join(self.directory, record['image']), 'wb') as f:
+            f.write(data)
+        # Readers only see a record once its image is complete
+        record_path = os.path.join(self.directory, capture_id + RECORD_SUFFIX)
+        with open(record_path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(record, f)
+        os.replace(record_path + '.tmp', record_path)
+        with self._lock:
+            self.captured += 1
+        self.evict()
+        return record
+
+    def evict(self) -> int:
+        """Delete the oldest captures beyond max_files and max_bytes; returns how many"""
+        captures = []
+        for record in load_records(self.directory):
+            image_path = os.path.join(self.directory, record['image'])
+            try:
+                size = os.path.getsize(image_path)
+            except OSError:
+                size = 0
+            captures.append((record['id'], record['image'], size))
+
+        total = sum(size for _, _, size in captures)
+        evicted = 0
+        for capture_id, image_name, size in captures:
+            if len(captures) - evicted <= self.max_files and total <= self.max_bytes:
+                break
+            for name in (capture_id + RECORD_SUFFIX, image_name):
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except OSError:
+                    pass  # another worker evicted it first
+            total -= size
+            evicted += 1
+        return evicted
+
+    def status(self) -> Dict:
+        with self._lock:
+            return {'enabled': self.enabled, 'captured': self.captured,
+                    'dropped': self.dropped, 'queued': self._queue.qsize(),
+                    'queued_mb': round(self._queued_bytes / MB, 1)}
+
+
+def load_records(directory: str) -> List[Dict]:
+    """Capture records in a directory, oldest first"""
+    try:
+        names = sorted(name for name in os.listdir(directory) if name.endswith(RECORD_SUFFIX))
+    except OSError:
+        return []
+    records = []
+    for name in names:
+        try:
+            with open(os.path.join(directory, name), encoding='utf-8') as f:
+                records.append(json.load(f))
+        except (OSError, ValueError):
+            continue  # evicted meanwhile
+    return records
+
+
+def _percentile(values: List[float], fraction: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def replay_outcome(record: Dict, result: Dict) -> str:
+    """
+    recovered: a captured miss now decodes. still_missed: it still doesn't.
+    same / changed / lost: a captured hit decodes the same payload, a
+    different one, or nothing. error: the image could not be read.
+    """
+    if result['method'] == 'error':
+        return 'error'
+    payload = result.get('payload')
+    before = record['result']
+    if not before['qr_detected']:
+        return 'recovered' if payload else 'still_missed'
+    if not payload:
+        return 'lost'
+    expected = before.get('payload')
+    if expected is None:
+        return 'same' if payload_digest(payload) == before.get('payload_sha256') else 'changed'
+    return 'same' if payload == expected else 'changed'
+
+
+def replay(directory: str, reader_factory=PrescriptionQRReader, workers: Optional[int] = None,
+           results_path: Optional[str] = None, progress=sys.stderr) -> Dict:
+    """
+    Rescan every capture in directory and compare with its record. Latency
+    deltas are replay decode_ms minus the captured total_ms; batch workers
+    decode without racing, one process per core, so compare them across
+    replays of the same corpus on the same host rather than in absolute
+    terms. Scan hints are not replayed.
+    """
+    records = load_records(directory)
+    paths = [os.path.join(directory, record['image']) for record in records]
+    with tempfile.TemporaryDirectory() as work_dir:
+        output = results_path or os.path.join(work_dir, 'replay.jsonl')
+        stats = run_image_batch(reader_factory, paths, output, workers=workers,
+                                progress=progress)
+        with open(output, encoding='utf-8') as f:
+            results = {result['path']: result for result in map(json.loads, f)}
+
+    outcomes = {'recovered': 0, 'still_missed': 0, 'same': 0, 'changed': 0,
+                'lost': 0, 'error': 0}
+    rows = []
+    before_ms, after_ms, deltas = [], [], []
+    for record, path in zip(records, paths):
+        result = results[path]
+        outcome = replay_outcome(record, result)
+        outcomes[outcome] += 1
+        row = {'id': record['id'], 'reason': record['reason'], 'outcome': outcome,
+               'method': result['method']}
+        captured_ms = record['timings'].get('total_ms')
+        if outcome != 'error' and captured_ms is not None:
+            row.update(captured_ms=captured_ms, replay_ms=result['decode_ms'],
+                       delta_ms=round(result['decode_ms'] - captured_ms, 2))
+            before_ms.append(captured_ms)
+            after_ms.append(result['decode_ms'])
+            deltas.append(row['delta_ms'])
+        rows.append(row)
+
+    misses = sum(1 for record in records if not record['result']['qr_detected'])
+    return {
+        'captures': len(records),
+        'misses': misses,
+        **outcomes,
+        'recovery_rate': outcomes['recovered'] / misses if misses else 0.0,
+        'captured_p50_ms': _percentile(before_ms, 0.5),
+        'captured_p95_ms': _percentile(before_ms, 0.95),
+        'replay_p50_ms': _percentile(after_ms, 0.5),
+        'replay_p95_ms': _percentile(after_ms, 0.95),
+        'delta_p50_ms': _percentile(deltas, 0.5),
+        'seconds': stats['seconds'],
+        'captures_detail': rows,
+    }
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description='Replay captured scans through the current pipeline')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    rerun = commands.add_parser('replay', help='Rescan captures and report what changed')
+    rerun.add_argument('--dir', default=CAPTURE_DIR, help='Capture directory (QR_CAPTURE_DIR)')
+    rerun.add_argument('--workers', type=int, help='Worker processes (default: CPU count)')
+    rerun.add_argument('--results', help='Also keep the per-image batch results (JSONL)')
+    rerun.add_argument('--report', help='Write the report as JSON')
+
+    args = parser.parse_args(argv)
+    if not args.dir:
+        parser.error('--dir or QR_CAPTURE_DIR is required')
+
+    report = replay(args.dir, workers=args.workers, results_path=args.results)
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+    print(f"{report['captures']} captures: {report['recovered']}/{report['misses']} misses "
+          f"recovered ({report['recovery_rate']:.1%}), {report['lost']} hits lost, "
+          f"{report['changed']} payloads changed, {report['error']} unreadable")
+    print(f"Latency p50 {report['captured_p50_ms']:.0f} -> {report['replay_p50_ms']:.0f} ms, "
+          f"p95 {report['captured_p95_ms']:.0f} -> {report['replay_p95_ms']:.0f} ms "
+          f"(median change {report['delta_p50_ms']:+.0f} ms)")
+    for row in report['captures_detail']:
+        if row['outcome'] in ('recovered', 'lost', 'changed'):
+            print(f"  {row['outcome']:<10} {row['id']} ({row['reason']})")
+
+
+if __name__ == "__main__":
+    main()
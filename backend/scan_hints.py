@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""
+Client-supplied scan hints.
+
+Clients often know what the reader would otherwise rediscover: where the
+code is (from the device's preview detector), which symbology or payload
+format to expect, that a frame holds only a text label, or which way up it
+was taken. Hints let the pipeline skip or narrow stages:
+
+- roi: [x, y, w, h] of the code in the uploaded image; QR and barcode
+  decoding run on that region (padded, since preview boxes are
+  approximate), rescaled when the upload was decoded reduced
+- symbology: 'QRCODE' or barcode symbologies (e.g. 'EAN13'); the QR ladder
+  or the barcode stage is skipped, and barcodes are restricted to those named
+- payload_format: the payload parser to use (e.g. 'xml', 'json'); it is
+  used when the payload matches, otherwise the format is sniffed as usual
+- mode: 'auto', 'qr_only' (no OCR fallback, no barcodes) or 'ocr_only'
+  (no QR or barcode decoding)
+- rotation: 0, 90, 180 or 270, how far clockwise the label is turned in
+  the frame; the image is turned upright and OCR skips its rotated passes
+
+Every hinted scan gets a report of the hints used and ignored, the stages
+skipped, and the decode attempts and OCR passes made and saved.
+"""
+
+import json
+from typing import Dict, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from qr_decoders import BARCODE_SYMBOLOGIES, QRCODE
+
+MODE_AUTO = 'auto'
+MODE_QR_ONLY = 'qr_only'
+MODE_OCR_ONLY = 'ocr_only'
+MODES = (MODE_AUTO, MODE_QR_ONLY, MODE_OCR_ONLY)
+
+# Label rotation (clockwise, in the frame) -> cv2.rotate code that undoes it
+ROTATIONS = {
+    0: None,
+    90: cv2.ROTATE_90_COUNTERCLOCKWISE,
+    180: cv2.ROTATE_180,
+    270: cv2.ROTATE_90_CLOCKWISE,
+}
+
+HINT_FIELDS = ('roi', 'symbology', 'payload_format', 'mode', 'rotation')
+
+# Padding added on each side of a hinted region, as a fraction of its size
+ROI_PADDING = 0.15
+
+
+def parse_scan_hints(raw) -> Dict:
+    """
+    Validate hints from a request (a dict, a JSON string or None) into
+    {'roi', 'symbologies', 'payload_format', 'mode', 'rotation'}.
+    Raises ValueError describing the first invalid hint.
+    """
+    hints = {'roi': None, 'symbologies': None, 'payload_format': None,
+             'mode': MODE_AUTO, 'rotation': None}
+    if raw is None or raw == '':
+        return hints
+    if isinstance(raw, str):
+        try:
+            raw = json.loads(raw)
+        except ValueError:
+            raise ValueError("hints must be a JSON object")
+    if not isinstance(raw, dict):
+        raise ValueError("hints must be a JSON object")
+    unknown = sorted(set(raw) - set(HINT_FIELDS))
+    if unknown:
+        raise ValueError(f"Unknown hints: {', '.join(unknown)}")
+
+    roi = raw.get('roi')
+    if roi is not None:
+        if (not isinstance(roi, (list, tuple)) or len(roi) != 4
+                or not all(isinstance(value, (int, float)) for value in roi)):
+            raise ValueError("roi must be [x, y, width, height]")
+        x, y, w, h = (int(round(value)) for value in roi)
+        if x < 0 or y < 0 or w <= 0 or h <= 0:
+            raise ValueError("roi must have a non-negative origin and a positive size")
+        hints['roi'] = (x, y, w, h)
+
+    symbology = raw.get('symbology')
+    if symbology is not None:
+        names = [symbology] if isinstance(symbology, str) else symbology
+        if not isinstance(names, (list, tuple)) or not names:
+            raise ValueError("symbology must be a name or a list of names")
+        symbologies = tuple(str(name).upper() for name in names)
+        known = (QRCODE,) + BARCODE_SYMBOLOGIES
+        invalid = [name for name in symbologies if name not in known]
+        if invalid:
+            raise ValueError(f"Unknown symbology {invalid[0]}; expected one of {', '.join(known)}")
+        hints['symbologies'] = symbologies
+
+    payload_format = raw.get('payload_format')
+    if payload_format is not None:
+        if not isinstance(payload_format, str) or not payload_format:
+            raise ValueError("payload_format must be a format name")
+        hints['payload_format'] = payload_format
+
+    mode = raw.get('mode', MODE_AUTO)
+    if mode not in MODES:
+        raise ValueError(f"mode must be one of {', '.join(MODES)}")
+    hints['mode'] = mode
+
+    rotation = raw.get('rotation')
+    if rotation is not None:
+        if rotation not in ROTATIONS:
+            raise ValueError("rotation must be 0, 90, 180 or 270")
+        hints['rotation'] = int(rotation)
+    return hints
+
+
+def new_hint_report() -> Dict:
+    return {'used': [], 'ignored': [], 'skipped_stages': [],
+            'attempts': 0, 'attempts_saved': 0}
+
+
+def note_hint(report: Optional[Dict], name: str, used: bool = True) -> None:
+    if report is None:
+        return
+    entries = report['used' if used else 'ignored']
+    if name not in entries:
+        entries.append(name)
+
+
+def skip_stage(report: Optional[Dict], stage: str, planned_attempts: int) -> None:
+    """Record a stage the hints skipped and the attempts it would have planned"""
+    if report is None:
+        return
+    report['skipped_stages'].append(stage)
+    report['attempts_saved'] += planned_attempts
+
+
+def rotate_upright(image: np.ndarray, rotation: Optional[int]) -> np.ndarray:
+    code = ROTATIONS.get(rotation or 0)
+    return image if code is None else cv2.rotate(image, code)
+
+
+def scale_roi(roi: Tuple[int, int, int, int], scale: float) -> Tuple[int, int, int, int]:
+    """An roi in uploaded-image pixels, in pixels of the image decoded at scale"""
+    if scale == 1.0:
+        return roi
+    x, y, w, h = roi
+    return (int(x * scale), int(y * scale),
+            max(1, int(round(w * scale))), max(1, int(round(h * scale))))
+
+
+def roi_box(roi: Tuple[int, int, int, int],
+            shape: Tuple[int, ...]) -> Optional[Tuple[int, int, int, int]]:
+    """The padded region (x0, y0, x1, y1) clipped to the image, or None if outside it"""
+    height, width = shape[:2]
+    x, y, w, h = roi
+    pad_x, pad_y = int(w * ROI_PADDING), int(h * ROI_PADDING)
+    x0, y0 = max(0, x - pad_x), max(0, y - pad_y)
+    x1, y1 = min(width, x + w + pad_x), min(height, y + h + pad_y)
+    if x1 - x0 < 16 or y1 - y0 < 16:
+        return None
+    return x0, y0, x1, y1
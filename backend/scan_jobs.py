@@ -0,0 +1,318 @@
+#!/usr/bin/env python3
+"""
+Durable queue of asynchronous scan jobs.
+
+A scan that falls back to OCR can outlast client and proxy timeouts, and a
+worker that dies mid-scan used to lose the request. Instead the API can
+store the image as a job in a local SQLite database (WAL mode, so readers
+don't block the writer) and answer at once; worker processes on the same
+host claim jobs, scan them and store the result for clients to poll.
+
+- Claiming a job leases it for the visibility timeout. A worker that dies
+  or hangs lets the lease expire and another worker picks the job up.
+- Failed attempts are retried after a short delay until max_attempts is
+  reached, then the job is marked failed.
+- Finished jobs keep their result for the result TTL and are then purged.
+  The image itself is dropped as soon as the job finishes.
+
+Run workers with:
+
+    python scan_jobs.py worker --processes 4
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+from typing import Callable, Dict, Optional, Tuple
+
+DEFAULT_DATABASE = os.path.join(tempfile.gettempdir(), 'qr-scan-jobs.sqlite3')
+
+# A claimed job is handed to another worker if not finished within this many seconds
+VISIBILITY_TIMEOUT_SECONDS = float(os.environ.get('QR_SCAN_JOB_VISIBILITY_TIMEOUT', '120'))
+MAX_ATTEMPTS = int(os.environ.get('QR_SCAN_JOB_MAX_ATTEMPTS', '3'))
+# Finished jobs can be polled for this many seconds
+RESULT_TTL_SECONDS = float(os.environ.get('QR_SCAN_JOB_RESULT_TTL', '3600'))
+# A failed attempt is retried after this many seconds times the attempt number
+RETRY_DELAY_SECONDS = 2.0
+# Idle workers check for new jobs this often
+POLL_INTERVAL_SECONDS = 0.2
+# Workers purge expired jobs every this many seconds
+PURGE_INTERVAL_SECONDS = 60.0
+
+QUEUED, RUNNING, DONE, FAILED = 'queued', 'running', 'done', 'failed'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    image BLOB,
+    image_source TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    visible_at REAL NOT NULL,
+    lease TEXT,
+    finished_at REAL,
+    result TEXT,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_ready ON jobs (status, visible_at);
+CREATE INDEX IF NOT EXISTS jobs_finished ON jobs (finished_at);
+"""
+
+
+class JobQueue:
+    def __init__(self, path: Optional[str] = None,
+                 visibility_timeout: float = VISIBILITY_TIMEOUT_SECONDS,
+                 max_attempts: int = MAX_ATTEMPTS,
+                 result_ttl: float = RESULT_TTL_SECONDS):
+        self.path = path or os.environ.get('QR_SCAN_JOBS_DB', DEFAULT_DATABASE)
+        self.visibility_timeout = visibility_timeout
+        self.max_attempts = max_attempts
+        self.result_ttl = result_ttl
+        # sqlite3 connections can't be shared between threads
+        self._local = threading.local()
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            directory = os.path.dirname(os.path.abspath(self.path))
+            os.makedirs(directory, exist_ok=True)
+            # Autocommit; multi-statement updates take BEGIN IMMEDIATE
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            connection.row_factory = sqlite3.Row
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.executescript(SCHEMA)
+            self._local.connection = connection
+        return connection
+
+    def _transaction(self):
+        connection = self._connection()
+        connection.execute('BEGIN IMMEDIATE')
+        return connection
+
+    def submit(self, image: bytes, image_source: str,
+               job_id: Optional[str] = None) -> Tuple[str, bool]:
+        """
+        Queue an encoded image. Returns (job_id, created); submitting an
+        existing job_id again (an idempotent retry) doesn't queue it twice.
+        A job whose result has expired but not yet been purged is replaced.
+        """
+        job_id = job_id or uuid.uuid4().hex
+        now = time.time()
+        connection = self._transaction()
+        try:
+            connection.execute('DELETE FROM jobs WHERE id = ? AND finished_at < ?',
+                               (job_id, now - self.result_ttl))
+            cursor = connection.execute(
+                'INSERT OR IGNORE INTO jobs (id, status, image, image_source, max_attempts,'
+                ' created_at, visible_at) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (job_id, QUEUED, image, image_source, self.max_attempts, now, now))
+            connection.execute('COMMIT')
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        return job_id, cursor.rowcount == 1
+
+    def claim(self) -> Optional[Dict]:
+        """
+        Lease the oldest job that is ready to run: queued, or running on a
+        worker whose lease has expired. Jobs whose lease expired on their
+        last attempt are marked failed instead.
+        Returns {'id', 'lease', 'image', 'image_source', 'attempts'} or None.
+        """
+        now = time.time()
+        connection = self._transaction()
+        try:
+            while True:
+                row = connection.execute(
+                    'SELECT id, image, image_source, attempts, max_attempts FROM jobs'
+                    ' WHERE status IN (?, ?) AND visible_at <= ?'
+                    ' ORDER BY visible_at LIMIT 1', (QUEUED, RUNNING, now)).fetchone()
+                if row is None:
+                    connection.execute('COMMIT')
+                    return None
+                if row['attempts'] >= row['max_attempts']:
+                    self._finish(connection, row['id'], FAILED, None,
+                                 'Worker did not finish the scan', now)
+                    continue
+                lease = uuid.uuid4().hex
+                connection.execute(
+                    'UPDATE jobs SET status = ?, attempts = attempts + 1, lease = ?,'
+                    ' visible_at = ? WHERE id = ?',
+                    (RUNNING, lease, now + self.visibility_timeout, row['id']))
+                connection.execute('COMMIT')
+                return {'id': row['id'], 'lease': lease, 'image': row['image'],
+                        'image_source': row['image_source'],
+                        'attempts': row['attempts'] + 1}
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+
+    def _finish(self, connection, job_id, status, result, error, now):
+        connection.execute(
+            'UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ?,'
+            ' image = NULL, lease = NULL WHERE id = ?',
+            (status, result, error, now, job_id))
+
+    def complete(self, job_id: str, lease: str, result) -> bool:
+        """
+        Store a job's result. Returns False if the lease was lost (the job
+        timed out and went to another worker), in which case nothing changes.
+        """
+        cursor = self._connection().execute(
+            'UPDATE jobs SET status = ?, result = ?, finished_at = ?, image = NULL,'
+            ' lease = NULL WHERE id = ? AND lease = ? AND status = ?',
+            (DONE, json.dumps(result, default=str), time.time(), job_id, lease, RUNNING))
+        return cursor.rowcount == 1
+
+    def fail(self, job_id: str, lease: str, error: str) -> bool:
+        """Retry a failed attempt later, or mark the job failed after its last attempt"""
+        now = time.time()
+        connection = self._transaction()
+        try:
+            row = connection.execute(
+                'SELECT attempts, max_attempts FROM jobs WHERE id = ? AND lease = ? AND status = ?',
+                (job_id, lease, RUNNING)).fetchone()
+            if row is not None:
+                if row['attempts'] >= row['max_attempts']:
+                    self._finish(connection, job_id, FAILED, None, error, now)
+                else:
+                    connection.execute(
+                        'UPDATE jobs SET status = ?, lease = NULL, error = ?, visible_at = ?'
+                        ' WHERE id = ?',
+                        (QUEUED, error, now + RETRY_DELAY_SECONDS * row['attempts'], job_id))
+            connection.execute('COMMIT')
+            return row is not None
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        """A job's status (and result once done), or None if unknown or expired"""
+        row = self._connection().execute(
+            'SELECT id, status, image_source, attempts, created_at, finished_at, result, error'
+            ' FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        if row is None:
+            return None
+        if row['finished_at'] is not None and time.time() - row['finished_at'] > self.result_ttl:
+            return None
+        job = {
+            'job_id': row['id'],
+            'status': row['status'],
+            'image_source': row['image_source'],
+            'attempts': row['attempts'],
+            'created_at': row['created_at'],
+            'finished_at': row['finished_at'],
+        }
+        if row['result'] is not None:
+            job['result'] = json.loads(row['result'])
+        if row['error'] is not None and row['status'] != DONE:
+            job['error'] = row['error']
+        return job
+
+    def purge(self) -> int:
+        """Delete finished jobs older than the result TTL"""
+        cursor = self._connection().execute(
+            'DELETE FROM jobs WHERE finished_at IS NOT NULL AND finished_at < ?',
+            (time.time() - self.result_ttl,))
+        return cursor.rowcount
+
+    def metrics(self) -> Dict:
+        """Queue depth, jobs per status and the age of the oldest waiting job"""
+        now = time.time()
+        connection = self._connection()
+        counts = {status: 0 for status in (QUEUED, RUNNING, DONE, FAILED)}
+        for row in connection.execute('SELECT status, COUNT(*) AS n FROM jobs GROUP BY status'):
+            counts[row['status']] = row['n']
+        oldest = connection.execute(
+            'SELECT MIN(created_at) AS created_at FROM jobs WHERE status = ?',
+            (QUEUED,)).fetchone()['created_at']
+        expired = connection.execute(
+            'SELECT COUNT(*) AS n FROM jobs WHERE status = ? AND visible_at <= ?',
+            (RUNNING, now)).fetchone()['n']
+        return {
+            'queue_depth': counts[QUEUED] + expired,
+            'jobs': counts,
+            'expired_leases': expired,
+            'oldest_queued_age_seconds': round(now - oldest, 3) if oldest else 0.0,
+        }
+
+
+def run_worker(queue: JobQueue, handler: Callable[[bytes, str], object],
+               stop: Optional[threading.Event] = None,
+               max_jobs: Optional[int] = None,
+               poll_interval: float = POLL_INTERVAL_SECONDS) -> int:
+    """
+    Claim and run jobs until stop is set (or max_jobs have run). handler
+    receives the image bytes and source and returns a JSON-serializable
+    result; if it raises, the attempt is retried. Returns the jobs run.
+    """
+    stop = stop or threading.Event()
+    ran = 0
+    last_purge = 0.0
+    while not stop.is_set() and (max_jobs is None or ran < max_jobs):
+        if time.monotonic() - last_purge > PURGE_INTERVAL_SECONDS:
+            queue.purge()
+            last_purge = time.monotonic()
+
+        job = queue.claim()
+        if job is None:
+            stop.wait(poll_interval)
+            continue
+        ran += 1
+        try:
+            result = handler(job['image'], job['image_source'])
+        except Exception as e:
+            queue.fail(job['id'], job['lease'], f"{type(e).__name__}: {e}")
+        else:
+            queue.complete(job['id'], job['lease'], result)
+    return ran
+
+
+def _scan_handler(image: bytes, image_source: str):
+    # Imported here so the queue has no dependency on the API module
+    from prescription_api import decode_image_bytes, scan_image
+    body, status = scan_image(lambda: decode_image_bytes(image), image_source,
+                              encoded=lambda: image)
+    return {'body': body, 'status': status}
+
+
+def _worker_process(path: Optional[str]):
+    run_worker(JobQueue(path), _scan_handler)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Scan job queue')
+    commands = parser.add_subparsers(dest='command', required=True)
+    worker = commands.add_parser('worker', help='Run worker processes that drain the queue')
+    worker.add_argument('--processes', type=int, default=os.cpu_count() or 1)
+    worker.add_argument('--db', help='Queue database (default: QR_SCAN_JOBS_DB or a temp file)')
+    commands.add_parser('metrics', help='Print queue metrics as JSON').add_argument('--db')
+    args = parser.parse_args()
+
+    if args.command == 'metrics':
+        print(json.dumps(JobQueue(args.db).metrics(), indent=2))
+        return
+
+    processes = [multiprocessing.Process(target=_worker_process, args=(args.db,))
+                 for _ in range(max(1, args.processes))]
+    for process in processes:
+        process.start()
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        for process in processes:
+            process.terminate()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Per-scan memory accounting and budget.
+
+A high-resolution upload decodes to a BGR array of three bytes per pixel
+(a 48 MP photo is 144 MB), and every preprocessing variant, rescale and
+OCR rotation adds a buffer sized from it, so a few large scans at once can
+push a worker's RSS up by gigabytes. Each scan now carries a ScanMemory
+that the buffer arena charges for every image buffer it hands out, on top
+of the input image, and the pipeline checks it before allocating:
+
+1. Ingestion decodes uploads larger than their share of the budget at a
+   reduced size (JPEG decodes at 1/2, 1/4 or 1/8 scale directly).
+2. The decode image is downscaled further when its ladder would not fit,
+   while QR modules stay at least MIN_MODULE_PX wide.
+3. Preprocessed variants, rescaled copies and the OCR upscale and rotated
+   passes that don't fit in what is left are skipped.
+
+Each step taken is recorded in 'degraded', and the estimated peak is
+reported with every scan. The estimate counts NumPy buffers the pipeline
+allocates, not OpenCV's internal temporaries. With QR_TRACE_MEMORY=1,
+tracemalloc measures the peak as well; it traces the whole process, so
+concurrent scans inflate each other's figures.
+"""
+
+import os
+import tracemalloc
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+MB = 1024 * 1024
+
+# Image buffers one scan may hold; 0 disables the budget
+SCAN_MEMORY_BUDGET_BYTES = int(float(os.environ.get('QR_SCAN_MEMORY_BUDGET_MB', '256')) * MB)
+
+# Also measure each scan's peak with tracemalloc (slows allocation-heavy code)
+TRACE_MEMORY = os.environ.get('QR_TRACE_MEMORY', '0') == '1'
+
+# Share of the budget the decoded upload itself may take
+INPUT_BUDGET_SHARE = 0.5
+
+# Budget downscaling stops before QR modules get narrower than this
+MIN_MODULE_PX = 2.0
+
+
+def input_pixel_limit(budget_bytes: int = SCAN_MEMORY_BUDGET_BYTES) -> Optional[int]:
+    """Most pixels an upload may decode to at full size (BGR), or None without a budget"""
+    if budget_bytes <= 0:
+        return None
+    return int(budget_bytes * INPUT_BUDGET_SHARE) // 3
+
+
+class ScanMemory:
+    """Estimated bytes of image buffers one scan holds, and its peak, against a budget"""
+
+    def __init__(self, budget_bytes: int = SCAN_MEMORY_BUDGET_BYTES):
+        self.budget_bytes = budget_bytes
+        self.held = 0
+        self.peak = 0
+        self.traced_peak: Optional[int] = None
+        self.degraded: List[str] = []
+
+    def charge(self, nbytes: int) -> None:
+        self.held += nbytes
+        self.peak = max(self.peak, self.held)
+
+    def release(self, nbytes: int) -> None:
+        self.held = max(0, self.held - nbytes)
+
+    def fits(self, nbytes: int) -> bool:
+        """Whether nbytes more stays within the budget"""
+        return self.budget_bytes <= 0 or self.held + nbytes <= self.budget_bytes
+
+    def headroom(self) -> Optional[int]:
+        """Bytes left in the budget, or None without one"""
+        if self.budget_bytes <= 0:
+            return None
+        return max(0, self.budget_bytes - self.held)
+
+    def degrade(self, step: str) -> None:
+        """Record a step the budget forced (downscaling, skipped variants)"""
+        if step not in self.degraded:
+            self.degraded.append(step)
+
+    def summary(self) -> Dict:
+        summary = {
+            'peak_mb': round(self.peak / MB, 1),
+            'budget_mb': round(self.budget_bytes / MB, 1) if self.budget_bytes > 0 else None,
+            'degraded': list(self.degraded),
+        }
+        if self.traced_peak is not None:
+            summary['traced_peak_mb'] = round(self.traced_peak / MB, 1)
+        return summary
+
+
+@contextmanager
+def traced(memory: ScanMemory, enabled: bool = TRACE_MEMORY):
+    """Measure the tracemalloc peak over the block into memory.traced_peak"""
+    if not enabled:
+        yield memory
+        return
+    # Left running: stopping it would cut off other scans still being traced
+    if not tracemalloc.is_tracing():
+        tracemalloc.start()
+    tracemalloc.reset_peak()
+    baseline = tracemalloc.get_traced_memory()[0]
+    try:
+        yield memory
+    finally:
+        memory.traced_peak = max(0, tracemalloc.get_traced_memory()[1] - baseline)
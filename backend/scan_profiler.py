@@ -0,0 +1,321 @@
+#!/usr/bin/env python3
+"""
+On-demand profiling of API requests in a running worker.
+
+When scan latency regresses in production there was no way to see where
+the time goes inside PrescriptionQRReader short of redeploying with debug
+code. A ScanProfiler stays compiled into the API and is armed through
+/debug/profile for the next N requests or T seconds of this worker:
+
+- A sampling thread records the Python stack of each profiled request
+  every few milliseconds, together with the decode-race threads working
+  for it (see PrescriptionQRReader.race_attempts). Samples aggregate into
+  collapsed stacks ("frame;frame;frame count" lines, for flamegraph.pl or
+  speedscope) and into sampled cumulative and self time per function.
+- mode='cprofile' additionally runs cProfile in the request threads for
+  exact call counts and cumulative times; it slows the profiled requests
+  down, the sampler barely does. One request at a time is traced; requests
+  that overlap it are only sampled.
+
+While no session is armed, each request costs one attribute check.
+"""
+
+import cProfile
+import hmac
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+# Bearer token for /debug/profile; the endpoint is disabled without one
+PROFILE_TOKEN = os.environ.get('QR_PROFILE_TOKEN') or None
+
+MODE_SAMPLE = 'sample'
+MODE_CPROFILE = 'cprofile'
+MODES = (MODE_SAMPLE, MODE_CPROFILE)
+
+DEFAULT_REQUESTS = 20
+MAX_REQUESTS = 1000
+MAX_SECONDS = 300.0
+DEFAULT_INTERVAL_MS = 5.0
+MIN_INTERVAL_MS = 1.0
+TOP_FUNCTIONS = 25
+
+# Worker threads sampled alongside the profiled requests
+RACE_THREAD_PREFIX = 'qr-race'
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_MODULES = frozenset(name for name in os.listdir(BACKEND_DIR) if name.endswith('.py'))
+
+
+def frame_label(code) -> str:
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def label_module(label: str) -> str:
+    """The file name in a frame label"""
+    return label.rsplit('(', 1)[-1].split(':', 1)[0]
+
+
+def stack_labels(frame) -> Tuple[List[str], bool]:
+    """Frame labels from the outermost call in, and whether any frame is in this code base"""
+    labels = []
+    ours = False
+    while frame is not None:
+        labels.append(frame_label(frame.f_code))
+        ours = ours or frame.f_code.co_filename.startswith(BACKEND_DIR)
+        frame = frame.f_back
+    labels.reverse()
+    return labels, ours
+
+
+class ProfileSession:
+    """One armed profiling window and what it has collected"""
+
+    def __init__(self, requests: Optional[int], seconds: Optional[float],
+                 mode: str, interval_ms: float):
+        self.requests = requests
+        self.seconds = seconds
+        self.mode = mode
+        self.interval = interval_ms / 1000.0
+        self.started_at = time.time()
+        self.deadline = time.monotonic() + seconds if seconds else None
+        self.finished_at: Optional[float] = None
+        self.begun = 0
+        self.completed = 0
+        self.active = set()
+        self.stacks = Counter()
+        self.samples = 0
+        self.sample_seconds = 0.0
+        self.stats: Optional[pstats.Stats] = None
+
+    def accepting(self) -> bool:
+        if self.requests is not None and self.begun >= self.requests:
+            return False
+        return self.deadline is None or time.monotonic() < self.deadline
+
+    @property
+    def done(self) -> bool:
+        return self.finished_at is not None
+
+
+class ScanProfiler:
+    """
+    Profiles the requests that begin while armed. Call begin() as a request
+    starts and end() with its token when it finishes.
+    """
+
+    def __init__(self, token: Optional[str] = PROFILE_TOKEN):
+        self.token = token
+        self.armed = False
+        self.session: Optional[ProfileSession] = None
+        self._lock = threading.Lock()
+        self._sampler: Optional[threading.Thread] = None
+        self._cprofile_running = False
+
+    def arm(self, requests: Optional[int] = None, seconds: Optional[float] = None,
+            mode: str = MODE_SAMPLE, interval_ms: float = DEFAULT_INTERVAL_MS) -> Dict:
+        """
+        Profile the next requests requests, or those beginning in the next
+        seconds seconds (whichever ends first; DEFAULT_REQUESTS without
+        either). Replaces any earlier session. Raises ValueError.
+        """
+        if requests is None and seconds is None:
+            requests = DEFAULT_REQUESTS
+        if requests is not None and (not isinstance(requests, int) or isinstance(requests, bool)
+                                     or not 1 <= requests <= MAX_REQUESTS):
+            raise ValueError(f"requests must be an integer from 1 to {MAX_REQUESTS}")
+        if seconds is not None and (not isinstance(seconds, (int, float)) or isinstance(seconds, bool)
+                                    or not 0 < seconds <= MAX_SECONDS):
+            raise ValueError(f"seconds must be more than 0 and at most {MAX_SECONDS:g}")
+        if mode not in MODES:
+            raise ValueError(f"mode must be one of {', '.join(MODES)}")
+        if not isinstance(interval_ms, (int, float)) or interval_ms < MIN_INTERVAL_MS:
+            raise ValueError(f"interval_ms must be at least {MIN_INTERVAL_MS:g}")
+
+        self.disarm()
+        with self._lock:
+            self.session = ProfileSession(requests, seconds, mode, float(interval_ms))
+            self.armed = True
+            self._sampler = threading.Thread(target=self._sample, args=(self.session,),
+                                             name='scan-profiler', daemon=True)
+            self._sampler.start()
+        return self.status()
+
+    def disarm(self) -> None:
+        """Stop the current session, keeping what it collected"""
+        with self._lock:
+            self.armed = False
+            session = self.session
+            if session is not None and not session.done:
+                session.finished_at = time.time()
+            sampler = self._sampler
+        if sampler is not None and sampler is not threading.current_thread():
+            sampler.join()
+
+    def begin(self):
+        """Start profiling this request if a session wants it; returns a token for end()"""
+        if not self.armed:
+            return None
+        with self._lock:
+            session = self.session
+            if session is None or session.done:
+                return None
+            if not session.accepting():
+                self.armed = False
+                self._finish_if_idle(session)
+                return None
+            session.begun += 1
+            ident = threading.get_ident()
+            session.active.add(ident)
+            # From Python 3.12 a cProfile is process-wide and a second one
+            # can't be enabled; overlapping requests are only sampled
+            profile = None
+            if session.mode == MODE_CPROFILE and not self._cprofile_running:
+                profile = cProfile.Profile()
+                self._cprofile_running = True
+        if profile is not None:
+            try:
+                profile.enable()
+            except ValueError:
+                # Another profiling tool (a debugger, coverage) is active
+                profile = None
+                with self._lock:
+                    self._cprofile_running = False
+        return session, ident, profile
+
+    def end(self, token) -> None:
+        if token is None:
+            return
+        session, ident, profile = token
+        if profile is not None:
+            profile.disable()
+        with self._lock:
+            if profile is not None:
+                self._cprofile_running = False
+                if session.stats is None:
+                    session.stats = pstats.Stats(profile)
+                else:
+                    session.stats.add(profile)
+            session.active.discard(ident)
+            session.completed += 1
+            if not session.accepting():
+                if session is self.session:
+                    self.armed = False
+                self._finish_if_idle(session)
+
+    def _finish_if_idle(self, session: ProfileSession) -> None:
+        if not session.active and not session.done:
+            session.finished_at = time.time()
+
+    def _sample(self, session: ProfileSession) -> None:
+        """Sampling thread: record the stacks of profiled requests and their race threads"""
+        last = time.perf_counter()
+        while True:
+            time.sleep(session.interval)
+            now = time.perf_counter()
+            elapsed, last = now - last, now
+            with self._lock:
+                if session.done:
+                    return
+                if session.deadline is not None and time.monotonic() >= session.deadline \
+                        and not session.active:
+                    if session is self.session:
+                        self.armed = False
+                    self._finish_if_idle(session)
+                    return
+                active = set(session.active)
+            if not active:
+                continue
+
+            race_threads = {thread.ident for thread in threading.enumerate()
+                            if thread.name.startswith(RACE_THREAD_PREFIX)}
+            recorded = False
+            for ident, frame in sys._current_frames().items():
+                if ident in active:
+                    labels, _ = stack_labels(frame)
+                elif ident in race_threads:
+                    labels, ours = stack_labels(frame)
+                    if not ours:
+                        continue  # idle, waiting for an attempt
+                else:
+                    continue
+                with self._lock:
+                    session.stacks[';'.join(labels)] += 1
+                recorded = True
+            if recorded:
+                with self._lock:
+                    session.samples += 1
+                    session.sample_seconds += elapsed
+
+    def status(self) -> Dict:
+        with self._lock:
+            session = self.session
+            if session is None:
+                return {'status': 'idle'}
+            return {
+                'status': 'done' if session.done else ('armed' if self.armed else 'finishing'),
+                'mode': session.mode,
+                'requests': session.requests,
+                'seconds': session.seconds,
+                'interval_ms': session.interval * 1000,
+                'started_at': session.started_at,
+                'finished_at': session.finished_at,
+                'requests_profiled': session.completed,
+                'requests_in_flight': len(session.active),
+                'samples': session.samples,
+            }
+
+    def collapsed(self) -> str:
+        """Collapsed stacks, one 'outer;...;inner count' line each, heaviest first"""
+        with self._lock:
+            stacks = self.session.stacks.most_common() if self.session else []
+        return ''.join(f"{stack} {count}\n" for stack, count in stacks)
+
+    def top_functions(self, limit: int = TOP_FUNCTIONS) -> List[Dict]:
+        """
+        This code base's functions by cumulative time (thread plumbing and
+        library frames stay in the collapsed stacks): from cProfile in
+        cprofile mode, else estimated from the samples, where a function
+        counts once per sample it appears in, and as self time where it is
+        innermost. Sampled times add up across threads.
+        """
+        with self._lock:
+            session = self.session
+            if session is None:
+                return []
+            if session.stats is not None:
+                rows = sorted(((key, row) for key, row in session.stats.stats.items()
+                               if key[0].startswith(BACKEND_DIR)),
+                              key=lambda item: -item[1][3])[:limit]
+                return [{'function': f"{name} ({os.path.basename(filename)}:{line})",
+                         'calls': calls, 'cumulative_ms': round(cumulative * 1000, 2),
+                         'self_ms': round(own * 1000, 2)}
+                        for (filename, line, name), (_, calls, own, cumulative, _) in rows]
+            stacks = list(session.stacks.items())
+            per_sample = session.sample_seconds / session.samples if session.samples else 0.0
+
+        cumulative, own = Counter(), Counter()
+        for stack, count in stacks:
+            labels = stack.split(';')
+            for label in set(labels):
+                if label_module(label) in BACKEND_MODULES:
+                    cumulative[label] += count
+            own[labels[-1]] += count
+        return [{'function': label, 'samples': count,
+                 'cumulative_ms': round(count * per_sample * 1000, 2),
+                 'self_ms': round(own[label] * per_sample * 1000, 2)}
+                for label, count in cumulative.most_common(limit)]
+
+    def report(self, limit: int = TOP_FUNCTIONS) -> Dict:
+        return dict(self.status(), top_functions=self.top_functions(limit),
+                    collapsed=self.collapsed())
+
+    def authorized(self, supplied: Optional[str]) -> bool:
+        """Constant-time comparison against the token; always False without one"""
+        if not self.token or not supplied:
+            return False
+        return hmac.compare_digest(supplied.encode('utf-8'), self.token.encode('utf-8'))
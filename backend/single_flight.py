@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+"""
+Single-flight coalescing of identical work.
+
+When a client retries a slow scan, the retry should not start a second
+decode of the same image. SingleFlight.run(key, compute) runs compute()
+once per key: callers that arrive while it is running wait for it and get
+its result, as do callers arriving within a short TTL afterwards (a retry
+that lands just after the original finished).
+
+Threads in one process share an in-memory flight. Worker processes on the
+same host coordinate through a lock file per key (fcntl.flock) and a result
+file the leader writes before releasing the lock. Where fcntl is not
+available only threads of the same process are coalesced.
+
+Result files hold complete scan responses, prescription data included. They
+are kept in a directory only the service's user can read, and deleted once
+past their TTL: by every write, and by a timer while any are left.
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from typing import Any, Callable, Dict, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+DEFAULT_DIRECTORY = os.path.join(
+    tempfile.gettempdir(), f"qr-single-flight-{os.getuid() if hasattr(os, 'getuid') else 0}")
+
+# Set QR_SINGLE_FLIGHT=0 to run every request on its own
+SINGLE_FLIGHT_ENABLED = os.environ.get('QR_SINGLE_FLIGHT', '1') != '0'
+# Finished results are handed to identical requests for this many seconds
+RESULT_TTL_SECONDS = float(os.environ.get('QR_SINGLE_FLIGHT_TTL', '30'))
+# A caller waits this long for a running flight before computing itself
+WAIT_TIMEOUT_SECONDS = 120.0
+LOCK_POLL_SECONDS = 0.02
+
+
+def flight_key(*parts) -> str:
+    """Short file-safe key from bytes or strings (image content, idempotency keys)"""
+    digest = hashlib.blake2b(digest_size=16)
+    for part in parts:
+        digest.update(part if isinstance(part, bytes) else str(part).encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    def __init__(self, directory: Optional[str] = None,
+                 ttl: float = RESULT_TTL_SECONDS,
+                 wait_timeout: float = WAIT_TIMEOUT_SECONDS):
+        self.directory = directory or os.environ.get('QR_SINGLE_FLIGHT_DIR', DEFAULT_DIRECTORY)
+        self.ttl = ttl
+        self.wait_timeout = wait_timeout
+        self._lock = threading.Lock()
+        self._flights: Dict[str, _Flight] = {}
+        # Deletes results as they expire while any are left on disk
+        self._sweeper: Optional[threading.Timer] = None
+
+    def run(self, key: str, compute: Callable[[], Any]) -> Tuple[Any, bool]:
+        """
+        Return (result, shared): compute()'s result, and whether it came from
+        another caller's run. compute() must return something JSON
+        serializable for results to be shared across processes. If the
+        leader raises, waiting threads raise too; other processes compute
+        for themselves.
+        """
+        if not SINGLE_FLIGHT_ENABLED:
+            return compute(), False
+
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+
+        if not leader:
+            if flight.done.wait(self.wait_timeout):
+                if flight.error is not None:
+                    raise flight.error
+                return flight.result, True
+            return compute(), False
+
+        try:
+            flight.result, shared = self._run_across_processes(key, compute)
+            return flight.result, shared
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            flight.done.set()
+            with self._lock:
+                del self._flights[key]
+
+    def _paths(self, key: str) -> Tuple[str, str]:
+        base = os.path.join(self.directory, key)
+        return base + '.lock', base + '.json'
+
+    def _run_across_processes(self, key: str, compute: Callable[[], Any]) -> Tuple[Any, bool]:
+        if fcntl is None:
+            return compute(), False
+
+        lock_path, result_path = self._paths(key)
+        if not self._private_directory():
+            return compute(), False
+        try:
+            lock_file = open(lock_path, 'a')
+        except OSError:
+            return compute(), False
+        with lock_file:
+            self._acquire(lock_file)
+            try:
+                # Keeps prune() away from locks that are in use
+                os.utime(lock_path)
+                # Written by the process we waited for, or one that just finished
+                cached = self._read_result(result_path)
+                if cached is not None:
+                    return cached['result'], True
+                result = compute()
+                self._write_result(result_path, result)
+                return result, False
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _private_directory(self) -> bool:
+        """
+        Create the directory (again, if a temp cleaner removed it) readable
+        by this user only. Results aren't shared through a directory that
+        belongs to someone else or that others can read.
+        """
+        try:
+            os.makedirs(self.directory, mode=0o700, exist_ok=True)
+            stat = os.stat(self.directory)
+        except OSError:
+            return False
+        return stat.st_uid == os.getuid() and not stat.st_mode & 0o077
+
+    def _acquire(self, lock_file) -> None:
+        """Take the key's lock, polling so a stuck leader can't block forever"""
+        deadline = time.monotonic() + self.wait_timeout
+        while True:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return
+            except BlockingIOError:
+                if time.monotonic() > deadline:
+                    # Give up on the leader; our own run will do the work
+                    return
+                time.sleep(LOCK_POLL_SECONDS)
+
+    def _read_result(self, path: str) -> Optional[Dict]:
+        """The result within its TTL; an expired result file is deleted (called under the key's lock)"""
+        try:
+            if time.time() - os.stat(path).st_mtime > self.ttl:
+                # Scan results hold prescription data; don't wait for the sweep
+                os.remove(path)
+                return None
+            with open(path, encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write_result(self, path: str, result: Any) -> None:
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        except OSError:
+            return
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump({'result': result}, f, default=str)
+            os.replace(tmp_path, path)
+        except (OSError, TypeError, ValueError):
+            # Not shareable across processes; threads still got it in memory
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            return
+
+        self.prune()
+
+    def prune(self) -> int:
+        """
+        Remove results past their TTL and lock files well past it, and keep
+        a timer running until the results still on disk have expired.
+        Returns the number of files removed.
+        """
+        now = time.time()
+        lock_cutoff = now - 2 * max(self.ttl, self.wait_timeout)
+        removed = 0
+        next_expiry = None
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return 0
+        for name in names:
+            path = os.path.join(self.directory, name)
+            try:
+                mtime = os.stat(path).st_mtime
+                if name.endswith('.json'):
+                    expiry = mtime + self.ttl
+                    if expiry > now:
+                        next_expiry = min(expiry, next_expiry or expiry)
+                        continue
+                elif mtime >= lock_cutoff:
+                    continue
+                os.remove(path)
+                removed += 1
+            except OSError:
+                continue
+        if next_expiry is not None:
+            self._schedule_sweep(next_expiry - now)
+        return removed
+
+    def _schedule_sweep(self, delay: float) -> None:
+        with self._lock:
+            if self._sweeper is not None:
+                return
+            self._sweeper = threading.Timer(delay + 0.1, self._sweep)
+            self._sweeper.daemon = True
+            self._sweeper.start()
+
+    def _sweep(self) -> None:
+        with self._lock:
+            self._sweeper = None
+        self.prune()
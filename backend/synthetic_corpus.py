@@ -0,0 +1,344 @@
+#!/usr/bin/env python3
+"""
+Deterministic synthetic corpus of prescription label photos.
+
+Every sample is derived from (seed, index) alone, so a corpus can be
+regenerated bit for bit, or a single failing sample recreated, from the seed.
+Each sample varies payload format, QR version and error correction, module
+size, placement on a label with printed NDC/Rx text, rotation, perspective,
+blur, noise, gamma and JPEG quality. Ground truth goes to manifest.jsonl
+next to the images. The images can then be scanned with the CLI's batch mode
+and scored with `evaluate`.
+
+    python synthetic_corpus.py generate --count 2000 --seed 7 --out corpus/
+    python prescription_qr_reader.py --input-dir corpus/ -o results.jsonl
+    python synthetic_corpus.py evaluate corpus/manifest.jsonl results.jsonl
+"""
+
+import argparse
+import json
+import os
+from collections import defaultdict
+from typing import Dict, Iterator, List, Optional
+
+import cv2
+import numpy as np
+import qrcode
+
+PAYLOAD_FORMATS = ('json', 'key_value', 'xml', 'text')
+
+ERROR_CORRECTION = {
+    'L': qrcode.constants.ERROR_CORRECT_L,
+    'M': qrcode.constants.ERROR_CORRECT_M,
+    'Q': qrcode.constants.ERROR_CORRECT_Q,
+    'H': qrcode.constants.ERROR_CORRECT_H,
+}
+
+# Ranges each distortion is drawn from; 'clean' is for sanity checks
+PROFILES = {
+    'clean': {
+        'module_px': (6, 10), 'rotation': (0, 0), 'perspective': (0.0, 0.0),
+        'blur_sigma': (0.0, 0.0), 'noise_sigma': (0.0, 0.0),
+        'gamma': (1.0, 1.0), 'jpeg_quality': (95, 95), 'shading': (0.0, 0.0),
+    },
+    'mixed': {
+        'module_px': (2, 10), 'rotation': (-30, 30), 'perspective': (0.0, 0.08),
+        'blur_sigma': (0.0, 2.5), 'noise_sigma': (0.0, 12.0),
+        'gamma': (0.4, 2.2), 'jpeg_quality': (35, 95), 'shading': (0.0, 0.0),
+    },
+}
+# Mixed distortions under uneven light: a shadow falling across the label
+PROFILES['uneven'] = dict(PROFILES['mixed'], shading=(0.3, 0.85))
+# Labels photographed at a steep angle
+PROFILES['skewed'] = dict(PROFILES['mixed'], module_px=(4, 10), rotation=(-45, 45),
+                          perspective=(0.08, 0.2))
+
+FIRST_NAMES = ['Jane', 'John', 'Maria', 'Wei', 'Aisha', 'Carlos', 'Priya', 'Olga',
+               'Kwame', 'Sofia', 'Liam', 'Yuki']
+LAST_NAMES = ['Doe', 'Smith', 'Garcia', 'Chen', 'Khan', 'Okafor', 'Novak', 'Patel',
+              'Rossi', 'Kim', 'Silva', 'Nguyen']
+DRUGS = [('Lisinopril', '10mg'), ('Metformin', '500mg'), ('Atorvastatin', '20mg'),
+         ('Amoxicillin', '500mg'), ('Omeprazole', '20mg'), ('Sertraline', '50mg'),
+         ('Levothyroxine', '75mcg'), ('Amlodipine', '5mg')]
+PHARMACIES = ['Main Street Pharmacy', 'Westside Pharmacy', 'CareRx', 'City Drug']
+DIRECTIONS = ['Take one tablet by mouth once daily',
+              'Take one capsule twice daily with meals',
+              'Take one tablet at bedtime']
+NDC_LAYOUTS = ((4, 4, 2), (5, 3, 2), (5, 4, 1))
+
+
+def _sample_rng(seed: int, index: int) -> np.random.Generator:
+    return np.random.default_rng([seed, index])
+
+
+def _uniform(rng, bounds):
+    low, high = bounds
+    return float(low) if low == high else float(rng.uniform(low, high))
+
+
+def make_prescription(rng) -> Dict[str, str]:
+    """Random but plausible prescription fields"""
+    drug, strength = DRUGS[rng.integers(len(DRUGS))]
+    layout = NDC_LAYOUTS[rng.integers(len(NDC_LAYOUTS))]
+    ndc = '-'.join(''.join(str(d) for d in rng.integers(0, 10, size)) for size in layout)
+    return {
+        'patient_name': f"{FIRST_NAMES[rng.integers(len(FIRST_NAMES))]} "
+                        f"{LAST_NAMES[rng.integers(len(LAST_NAMES))]}",
+        'medication_name': f"{drug} {strength} Tablets",
+        'medication_strength': strength,
+        'ndc_number': ndc,
+        'prescriber_name': f"Dr. {LAST_NAMES[rng.integers(len(LAST_NAMES))]}",
+        'pharmacy_name': PHARMACIES[rng.integers(len(PHARMACIES))],
+        'rx_number': str(rng.integers(1000000, 9999999)),
+        'date_filled': f"2025-{rng.integers(1, 13):02d}-{rng.integers(1, 29):02d}",
+        'directions': DIRECTIONS[rng.integers(len(DIRECTIONS))],
+        'quantity': str(int(rng.choice([30, 60, 90]))),
+    }
+
+
+def encode_payload(fields: Dict[str, str], fmt: str) -> Dict:
+    """The QR payload for a format and the fields the parser should recover"""
+    if fmt == 'json':
+        return {'payload': json.dumps(fields), 'expected': dict(fields)}
+    if fmt == 'key_value':
+        keys = [('PATIENT', 'patient_name'), ('MEDICATION', 'medication_name'),
+                ('STRENGTH', 'medication_strength'), ('NDC', 'ndc_number'),
+                ('PRESCRIBER', 'prescriber_name'), ('PHARMACY', 'pharmacy_name'),
+                ('RX', 'rx_number'), ('FILLED', 'date_filled'),
+                ('DIRECTIONS', 'directions'), ('QTY', 'quantity')]
+        payload = '\n'.join(f"{key}: {fields[field]}" for key, field in keys)
+        return {'payload': payload, 'expected': dict(fields)}
+    if fmt == 'xml':
+        tags = [('n', 'patient_name'), ('dg', 'medication_name'), ('pm', 'prescriber_name'),
+                ('dt', 'date_filled'), ('in', 'directions'), ('id', 'rx_number')]
+        payload = '<p>' + ''.join(f"<{tag}>{fields[field]}</{tag}>" for tag, field in tags) + '</p>'
+        return {'payload': payload, 'expected': {field: fields[field] for _, field in tags}}
+    # Free text: only NDC and Rx numbers are recoverable
+    payload = (f"{fields['pharmacy_name']} Rx #{fields['rx_number']} "
+               f"{fields['medication_name']} NDC {fields['ndc_number']}")
+    return {'payload': payload, 'expected': {'ndc_number': fields['ndc_number'],
+                                             'rx_number': fields['rx_number']}}
+
+
+def render_qr(payload: str, version: int, error_correction: str, module_px: int):
+    """Grayscale QR with a 4-module quiet zone, and the symbol's corner points"""
+    qr = qrcode.QRCode(version=version, error_correction=ERROR_CORRECTION[error_correction],
+                       border=4)
+    qr.add_data(payload)
+    qr.make(fit=True)
+    modules = np.array(qr.get_matrix(), dtype=np.uint8)
+    image = np.kron(1 - modules, np.ones((module_px, module_px), np.uint8)) * 255
+    start = 4 * module_px
+    end = image.shape[0] - start
+    corners = np.float32([[start, start], [end, start], [end, end], [start, end]])
+    return image, corners, qr.version
+
+
+def render_label(rng, fields: Dict[str, str], qr_image: np.ndarray, qr_corners):
+    """Paste the QR onto a paper-coloured label with printed pharmacy text"""
+    qr_size = qr_image.shape[0]
+    width = max(int(qr_size * rng.uniform(1.8, 2.6)), 640)
+    height = max(int(qr_size * rng.uniform(1.3, 1.8)), 400)
+    paper = rng.integers(215, 250)
+    label = np.full((height, width), paper, np.uint8)
+
+    lines = [fields['pharmacy_name'], f"Rx# {fields['rx_number']}",
+             fields['patient_name'], fields['medication_name'],
+             f"NDC {fields['ndc_number']}", fields['directions']]
+    scale = width / 900
+    for row, line in enumerate(lines):
+        cv2.putText(label, line, (int(20 * scale), int((40 + row * 42) * scale)),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.8 * scale, 30, max(1, int(2 * scale)),
+                    cv2.LINE_AA)
+
+    # Text on the left, code somewhere in the right half
+    x = int(rng.integers(max(width // 2 - qr_size // 2, 0), width - qr_size + 1))
+    y = int(rng.integers(0, height - qr_size + 1))
+    label[y:y + qr_size, x:x + qr_size] = np.minimum(qr_image, paper)
+    return label, qr_corners + np.float32([x, y])
+
+
+def distort(rng, image: np.ndarray, corners, params: Dict):
+    """Apply rotation, perspective, shading, gamma, blur and noise; corners follow the geometry"""
+    height, width = image.shape[:2]
+    fill = int(image[0, 0])
+
+    if params['rotation']:
+        matrix = cv2.getRotationMatrix2D((width / 2, height / 2), params['rotation'], 1.0)
+        cos, sin = abs(matrix[0, 0]), abs(matrix[0, 1])
+        new_w, new_h = int(height * sin + width * cos), int(height * cos + width * sin)
+        matrix[0, 2] += new_w / 2 - width / 2
+        matrix[1, 2] += new_h / 2 - height / 2
+        image = cv2.warpAffine(image, matrix, (new_w, new_h), borderValue=fill)
+        corners = cv2.transform(corners[None], matrix)[0]
+        height, width = new_h, new_w
+
+    if params['perspective']:
+        jitter = params['perspective'] * min(width, height)
+        src = np.float32([[0, 0], [width, 0], [width, height], [0, height]])
+        dst = src + rng.uniform(-jitter, jitter, (4, 2)).astype(np.float32)
+        matrix = cv2.getPerspectiveTransform(src, dst)
+        image = cv2.warpPerspective(image, matrix, (width, height), borderValue=fill)
+        corners = cv2.perspectiveTransform(corners[None], matrix)[0]
+
+    if params['shading']:
+        # Light falls off linearly in a random direction, down to 1 - shading
+        angle = rng.uniform(0, 2 * np.pi)
+        ys, xs = np.mgrid[0:height, 0:width].astype(np.float32)
+        ramp = xs * np.cos(angle) + ys * np.sin(angle)
+        ramp = (ramp - ramp.min()) / max(float(ramp.max() - ramp.min()), 1.0)
+        image = (image * (1.0 - params['shading'] * ramp)).astype(np.uint8)
+    if params['gamma'] != 1.0:
+        table = (255 * (np.arange(256) / 255.0) ** params['gamma']).astype(np.uint8)
+        image = cv2.LUT(image, table)
+    if params['blur_sigma'] > 0:
+        image = cv2.GaussianBlur(image, (0, 0), params['blur_sigma'])
+    if params['noise_sigma'] > 0:
+        noise = rng.normal(0, params['noise_sigma'], image.shape)
+        image = np.clip(image + noise, 0, 255).astype(np.uint8)
+    return image, corners
+
+
+def generate_sample(seed: int, index: int, profile: str = 'mixed') -> Dict:
+    """One labeled sample: {'image': BGR array, 'jpeg': bytes, 'truth': dict}"""
+    rng = _sample_rng(seed, index)
+    ranges = PROFILES[profile]
+
+    fmt = PAYLOAD_FORMATS[rng.integers(len(PAYLOAD_FORMATS))]
+    fields = make_prescription(rng)
+    encoded = encode_payload(fields, fmt)
+    error_correction = 'LMQH'[rng.integers(4)]
+    module_px = int(rng.integers(ranges['module_px'][0], ranges['module_px'][1] + 1))
+    params = {
+        'rotation': round(_uniform(rng, ranges['rotation']), 2),
+        'perspective': round(_uniform(rng, ranges['perspective']), 4),
+        'blur_sigma': round(_uniform(rng, ranges['blur_sigma']), 2),
+        'noise_sigma': round(_uniform(rng, ranges['noise_sigma']), 2),
+        'gamma': round(_uniform(rng, ranges['gamma']), 2),
+        'jpeg_quality': int(round(_uniform(rng, ranges['jpeg_quality']))),
+        'shading': round(_uniform(rng, ranges['shading']), 2),
+    }
+
+    qr_image, corners, version = render_qr(encoded['payload'], int(rng.integers(1, 8)),
+                                           error_correction, module_px)
+    label, corners = render_label(rng, fields, qr_image, corners)
+    gray, corners = distort(rng, label, corners, params)
+
+    image = cv2.cvtColor(gray, cv2.COLOR_GRAY2BGR)
+    ok, jpeg = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, params['jpeg_quality']])
+    if not ok:
+        raise ValueError(f"Could not encode sample {seed}-{index} as JPEG")
+
+    truth = {
+        'id': f"{seed}-{index:06d}",
+        'file': f"sample_{index:06d}.jpg",
+        'seed': seed,
+        'index': index,
+        'profile': profile,
+        'format': fmt,
+        'payload': encoded['payload'],
+        'expected': encoded['expected'],
+        'qr_version': version,
+        'error_correction': error_correction,
+        'module_px': module_px,
+        'qr_corners': [[round(float(x), 1), round(float(y), 1)] for x, y in corners],
+        'width': int(image.shape[1]),
+        'height': int(image.shape[0]),
+        **params,
+    }
+    return {'image': image, 'jpeg': jpeg.tobytes(), 'truth': truth}
+
+
+def iter_samples(seed: int, count: int, profile: str = 'mixed',
+                 start: int = 0) -> Iterator[Dict]:
+    for index in range(start, start + count):
+        yield generate_sample(seed, index, profile)
+
+
+def generate_corpus(out_dir: str, seed: int, count: int, profile: str = 'mixed') -> str:
+    """Write count JPEGs and manifest.jsonl to out_dir; returns the manifest path"""
+    os.makedirs(out_dir, exist_ok=True)
+    manifest_path = os.path.join(out_dir, 'manifest.jsonl')
+    with open(manifest_path, 'w', encoding='utf-8') as manifest:
+        for sample in iter_samples(seed, count, profile):
+            with open(os.path.join(out_dir, sample['truth']['file']), 'wb') as f:
+                f.write(sample['jpeg'])
+            manifest.write(json.dumps(sample['truth']) + '\n')
+    return manifest_path
+
+
+def _percentile(values: List[float], fraction: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def evaluate(manifest_path: str, results_path: str) -> Dict:
+    """
+    Score batch scan results (--input-dir JSONL) against the manifest.
+    A hit decodes the exact payload; a misread decodes something else.
+    """
+    with open(manifest_path, encoding='utf-8') as f:
+        truths = {entry['file']: entry for entry in map(json.loads, f)}
+
+    by_format = defaultdict(lambda: {'samples': 0, 'hits': 0})
+    totals = {'samples': 0, 'hits': 0, 'misreads': 0, 'misses': 0}
+    latencies = []
+    with open(results_path, encoding='utf-8') as f:
+        for result in map(json.loads, f):
+            truth = truths.get(os.path.basename(result['path']))
+            if truth is None:
+                continue
+            totals['samples'] += 1
+            by_format[truth['format']]['samples'] += 1
+            latencies.append(result.get('decode_ms', 0.0))
+            if result.get('payload') == truth['payload']:
+                totals['hits'] += 1
+                by_format[truth['format']]['hits'] += 1
+            elif result.get('payload'):
+                totals['misreads'] += 1
+            else:
+                totals['misses'] += 1
+
+    samples = totals['samples']
+    return {
+        **totals,
+        'hit_rate': totals['hits'] / samples if samples else 0.0,
+        'by_format': {fmt: {**row, 'hit_rate': row['hits'] / row['samples']}
+                      for fmt, row in sorted(by_format.items())},
+        'p50_ms': _percentile(latencies, 0.5),
+        'p95_ms': _percentile(latencies, 0.95),
+    }
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description='Synthetic prescription label corpus')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    generate = commands.add_parser('generate', help='Write labeled sample images')
+    generate.add_argument('--out', required=True, help='Output directory')
+    generate.add_argument('--count', type=int, default=1000)
+    generate.add_argument('--seed', type=int, default=0)
+    generate.add_argument('--profile', choices=sorted(PROFILES), default='mixed')
+
+    score = commands.add_parser('evaluate', help='Score batch scan results against a manifest')
+    score.add_argument('manifest')
+    score.add_argument('results')
+
+    args = parser.parse_args(argv)
+    if args.command == 'generate':
+        path = generate_corpus(args.out, args.seed, args.count, args.profile)
+        print(f"Wrote {args.count} samples and {path}")
+        return
+
+    report = evaluate(args.manifest, args.results)
+    print(f"{report['hits']}/{report['samples']} decoded ({report['hit_rate']:.1%}), "
+          f"{report['misreads']} misread, {report['misses']} missed; "
+          f"decode p50 {report['p50_ms']:.0f} ms, p95 {report['p95_ms']:.0f} ms")
+    for fmt, row in report['by_format'].items():
+        print(f"  {fmt:<10} {row['hits']:>5}/{row['samples']:<5} {row['hit_rate']:.1%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Accuracy and latency of the old preprocessing fan-out (gamma 0.5/1.5/2.0,
+equalizeHist, global Otsu, morph close, Canny) against the illumination
+normalization ladder, on the sample photos and on synthetic labels with
+and without uneven lighting.
+"""
+
+import os
+import time
+
+import cv2
+
+from prescription_qr_reader import PrescriptionQRReader
+from synthetic_corpus import iter_samples
+
+SAMPLE_IMAGES = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                             'sample_images')
+SAMPLE_PHOTOS = ['prescription_photo_dark.jpg', 'prescription_photo_blurry.jpg',
+                 'prescription_photo_rotated.jpg', 'realistic_prescription_photo.jpg']
+SYNTHETIC_COUNT = 40
+BUILD_ITERATIONS = 20
+
+
+class FanOutReader(PrescriptionQRReader):
+    """The reader with the variant fan-out used before illumination normalization"""
+
+    def preprocess_image_for_qr(self, image, module_size=None):
+        arena = self.context.arena()
+        shape = image.shape[:2]
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY, dst=arena.acquire(shape))
+        variants = [image, gray, cv2.GaussianBlur(gray, (5, 5), 0, dst=arena.acquire(shape))]
+        variants.append(cv2.adaptiveThreshold(
+            gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 11, 2,
+            dst=arena.acquire(shape)))
+        variants.append(cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU,
+                                      dst=arena.acquire(shape))[1])
+        variants.append(cv2.equalizeHist(gray, dst=arena.acquire(shape)))
+        kernel = self.context.structuring_element(cv2.MORPH_RECT, (3, 3))
+        variants.append(cv2.morphologyEx(gray, cv2.MORPH_CLOSE, kernel,
+                                         dst=arena.acquire(shape)))
+        variants.append(cv2.Canny(gray, 50, 150, edges=arena.acquire(shape)))
+        for gamma in [0.5, 1.5, 2.0]:
+            variants.append(self.adjust_gamma(gray, gamma, dst=arena.acquire(shape)))
+        return variants
+
+
+def image_sets():
+    photos = [cv2.imread(os.path.join(SAMPLE_IMAGES, name)) for name in SAMPLE_PHOTOS]
+    return {
+        'sample photos': photos,
+        'synthetic mixed': [s['image'] for s in iter_samples(7, SYNTHETIC_COUNT, 'mixed')],
+        'synthetic uneven': [s['image'] for s in iter_samples(11, SYNTHETIC_COUNT, 'uneven')],
+    }
+
+
+def scan_all(reader, images):
+    start = time.perf_counter()
+    hits = sum(bool(reader.enhanced_qr_detection(image)) for image in images)
+    return hits, (time.perf_counter() - start) * 1000 / len(images)
+
+
+def build_ms(reader, image):
+    with reader.context.arena().scan():
+        start = time.perf_counter()
+        for _ in range(BUILD_ITERATIONS):
+            count = len(reader.preprocess_image_for_qr(image))
+    return count, (time.perf_counter() - start) * 1000 / BUILD_ITERATIONS
+
+
+def main():
+    readers = {'fan-out': FanOutReader(), 'normalized': PrescriptionQRReader()}
+
+    print("Variant build cost on prescription_photo_dark.jpg")
+    print("=" * 60)
+    dark = cv2.imread(os.path.join(SAMPLE_IMAGES, 'prescription_photo_dark.jpg'))
+    for name, reader in readers.items():
+        count, ms = build_ms(reader, dark)
+        print(f"{name:<12} {count:3d} variants {ms:8.1f} ms")
+
+    print()
+    print("Scans (hits, mean ms per image)")
+    print("=" * 60)
+    print(f"{'images':<18} " + " ".join(f"{name:>20}" for name in readers))
+    for set_name, images in image_sets().items():
+        row = []
+        for reader in readers.values():
+            hits, ms = scan_all(reader, images)
+            row.append(f"{hits:>4}/{len(images):<4} {ms:8.1f} ms")
+        print(f"{set_name:<18} " + " ".join(f"{cell:>20}" for cell in row))
+
+
+if __name__ == "__main__":
+    main()
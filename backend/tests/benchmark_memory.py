@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Peak and steady-state RSS of a worker running repeated QR scans, and the
+scan's own estimated peak (see scan_memory.py). Images are loaded and
+scanned as the API does. Each configuration runs in its own subprocess so
+the numbers don't mix:
+  - arena:     preprocessing buffers reused through the BufferArena
+  - no-arena:  QR_ARENA_MAX_MB=0, every buffer is freed after the scan
+  - no-budget: QR_SCAN_MEMORY_BUDGET_MB=0, full-size decode and every variant
+  - budget-64: QR_SCAN_MEMORY_BUDGET_MB=64
+
+Usage: python benchmark_memory.py [image_path] [scans]
+"""
+
+import os
+import resource
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+DEFAULT_IMAGE = BACKEND_DIR / "sample_images" / "12.jpg"
+
+
+def current_rss_mb():
+    with open("/proc/self/statm") as f:
+        resident_pages = int(f.read().split()[1])
+    return resident_pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_worker(image_path, scans):
+    """Runs inside the subprocess and prints one result line"""
+    sys.path.insert(0, str(BACKEND_DIR))
+    from image_ingest import load_image_file
+    from prescription_qr_reader import PrescriptionQRReader
+    from scan_memory import ScanMemory, input_pixel_limit
+
+    reader = PrescriptionQRReader()
+    baseline = current_rss_mb()
+
+    samples = []
+    scan_peak = 0
+    start = time.perf_counter()
+    for _ in range(scans):
+        image, metadata = load_image_file(image_path, input_pixel_limit())
+        memory = ScanMemory()
+        reader.scan_payload(image, orientation_known=metadata['orientation_known'],
+                            memory=memory)
+        scan_peak = max(scan_peak, memory.peak)
+        del image
+        samples.append(current_rss_mb())
+    elapsed = time.perf_counter() - start
+
+    print(f"{baseline:.1f} {peak_rss_mb():.1f} {samples[-1]:.1f} "
+          f"{scan_peak / (1024 * 1024):.1f} {elapsed / scans:.3f}")
+
+
+def measure(label, image_path, scans, env_overrides):
+    env = dict(os.environ, **env_overrides)
+    output = subprocess.run(
+        [sys.executable, __file__, "--worker", image_path, str(scans)],
+        env=env, capture_output=True, text=True, check=True
+    ).stdout.strip().splitlines()[-1]
+    baseline, peak, steady, scan_peak, seconds = (float(v) for v in output.split())
+    print(f"{label:<10} {baseline:>10.1f} {peak:>10.1f} {steady:>10.1f} "
+          f"{scan_peak:>10.1f} {seconds:>10.3f}")
+
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == "--worker":
+        run_worker(sys.argv[2], int(sys.argv[3]))
+        return
+
+    image_path = sys.argv[1] if len(sys.argv) > 1 else str(DEFAULT_IMAGE)
+    scans = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+
+    print(f"Image: {image_path}, {scans} scans per worker")
+    print(f"{'mode':<10} {'start MB':>10} {'peak MB':>10} {'steady MB':>10} "
+          f"{'scan MB':>10} {'s/scan':>10}")
+    measure("arena", image_path, scans, {})
+    measure("no-arena", image_path, scans, {"QR_ARENA_MAX_MB": "0"})
+    measure("no-budget", image_path, scans, {"QR_SCAN_MEMORY_BUDGET_MB": "0"})
+    measure("budget-64", image_path, scans, {"QR_SCAN_MEMORY_BUDGET_MB": "64"})
+
+
+if __name__ == "__main__":
+    main()
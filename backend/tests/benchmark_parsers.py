@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+"""
+Throughput benchmark for parse_prescription_data: parsed payloads per second
+for each payload format the reader hands to the parser.
+"""
+
+import time
+
+from gs1 import barcode_payload
+from prescription_parsers import sniff_format, text_info_payload
+from prescription_qr_reader import PrescriptionQRReader
+
+ITERATIONS = 20000
+
+PAYLOADS = {
+    'xml': "<p><n>Paul Smith</n><dg>Nexium Hp7 Pack 14+14+28</dg><in>utd</in>"
+           "<id>12345</id><pm>Dr Jones</pm><dt>16/03/2019</dt></p>",
+    'json': '{"patient_name": "Jane Doe", "medication_name": "Lisinopril", '
+            '"strength": "10mg", "ndc": "0093-1095-01", "doctor": "Dr Smith", '
+            '"pharmacy": "CVS", "rx": "RX123456", "qty": "30", "refills": "2"}',
+    'key_value': "PATIENT: Jane Doe\nDOB: 1980-01-15\nDRUG: Lisinopril\n"
+                 "STRENGTH: 10mg\nNDC: 0093-1095-01\nDOCTOR: Dr Smith\n"
+                 "PHARMACY: CVS\nRX: 123456\nFILLED: 2025-03-15\n"
+                 "SIG: Take one tablet daily\nQTY: 30\nREFILLS: 2",
+    'text_info': text_info_payload({'ndc': '0093-1095-01', 'rx_number': '123456'}),
+    'barcode': barcode_payload('DATAMATRIX', '(01)00300931095015(17)261231(10)ABC123'),
+}
+
+
+def main():
+    reader = PrescriptionQRReader()
+
+    print("Payload parsing throughput")
+    print("=" * 40)
+    for name, payload in PAYLOADS.items():
+        assert sniff_format(payload).name == name
+        start = time.perf_counter()
+        for _ in range(ITERATIONS):
+            reader.parse_prescription_data(payload)
+        elapsed = time.perf_counter() - start
+        print(f"{name:10s} {ITERATIONS / elapsed:10,.0f} payloads/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+Single-scan latency (p50/p99) and throughput with decode attempts raced on
+1, 2 and 4 threads. Racing only pays off with idle cores; on a loaded host
+the extra attempts compete with other requests.
+"""
+
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+from prescription_qr_reader import PrescriptionQRReader
+from synthetic_corpus import iter_samples
+
+SAMPLE_IMAGES = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                             'sample_images')
+SAMPLE_PHOTOS = ['prescription_photo_dark.jpg', 'prescription_photo_blurry.jpg',
+                 'prescription_photo_rotated.jpg', 'realistic_prescription_photo.jpg']
+SYNTHETIC_COUNT = 30
+RACE_WORKERS = [1, 2, 4]
+CLIENTS = 4
+
+
+def load_images():
+    images = [cv2.imread(os.path.join(SAMPLE_IMAGES, name)) for name in SAMPLE_PHOTOS]
+    images += [s['image'] for s in iter_samples(7, SYNTHETIC_COUNT, 'mixed')]
+    return images
+
+
+def scan_ms(reader, image):
+    start = time.perf_counter()
+    reader.enhanced_qr_detection(image)
+    return (time.perf_counter() - start) * 1000
+
+
+def main():
+    images = load_images()
+    print(f"{len(images)} images, {os.cpu_count()} CPUs")
+    print("=" * 60)
+    print(f"{'race workers':>12} {'p50 ms':>9} {'p99 ms':>9} "
+          f"{'hits':>6} {f'{CLIENTS} clients img/s':>18}")
+    for workers in RACE_WORKERS:
+        reader = PrescriptionQRReader(race_workers=workers)
+        reader.enhanced_qr_detection(images[0])  # warm up detectors and pools
+
+        # One interactive scan at a time
+        latencies = [scan_ms(reader, image) for image in images]
+        hits = sum(bool(reader.enhanced_qr_detection(image)) for image in images)
+
+        # Several requests at once share the same reader, as in the API
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=CLIENTS) as clients:
+            list(clients.map(reader.enhanced_qr_detection, images))
+        throughput = len(images) / (time.perf_counter() - start)
+
+        print(f"{workers:>12} {np.percentile(latencies, 50):9.1f} "
+              f"{np.percentile(latencies, 99):9.1f} {hits:>6} {throughput:18.1f}")
+        reader.close()
+
+
+if __name__ == "__main__":
+    main()
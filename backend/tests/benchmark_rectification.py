@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Hits, decode attempts and scan time with and without the rectified patch,
+on the sample photos and on synthetic labels photographed at an angle.
+"""
+
+import os
+import time
+
+import cv2
+
+from prescription_qr_reader import PrescriptionQRReader
+from qr_decoders import DecoderRouter
+from synthetic_corpus import iter_samples
+
+SAMPLE_IMAGES = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                             'sample_images')
+SAMPLE_PHOTOS = ['prescription_photo_dark.jpg', 'prescription_photo_blurry.jpg',
+                 'prescription_photo_rotated.jpg', 'realistic_prescription_photo.jpg']
+SYNTHETIC_COUNT = 40
+
+
+class UnrectifiedReader(PrescriptionQRReader):
+    """The reader without the rectification stage"""
+
+    def rectified_patch(self, image, geometry):
+        return None
+
+
+class CountingMixin:
+    attempts = 0
+
+    def _decode_attempt(self, *attempt):
+        self.attempts += 1
+        return super()._decode_attempt(*attempt)
+
+
+def image_sets():
+    photos = [cv2.imread(os.path.join(SAMPLE_IMAGES, name)) for name in SAMPLE_PHOTOS]
+    return {
+        'sample photos': photos,
+        'synthetic mixed': [s['image'] for s in iter_samples(7, SYNTHETIC_COUNT, 'mixed')],
+        'synthetic skewed': [s['image'] for s in iter_samples(5, SYNTHETIC_COUNT, 'skewed')],
+    }
+
+
+def scan_all(reader, images):
+    reader.attempts = 0
+    start = time.perf_counter()
+    hits = sum(bool(reader.decode_with_backends(image)) for image in images)
+    ms = (time.perf_counter() - start) * 1000 / len(images)
+    return hits, reader.attempts / len(images), ms
+
+
+def main():
+    for decoders in (None, ['opencv']):
+        router = DecoderRouter(names=decoders) if decoders else None
+        readers = {
+            'ladder': type('Counting', (CountingMixin, UnrectifiedReader), {})(
+                router=router, race_workers=1),
+            'rectified': type('Counting', (CountingMixin, PrescriptionQRReader), {})(
+                router=router, race_workers=1),
+        }
+        print(f"Decoders: {', '.join(decoders) if decoders else 'all available'}")
+        print("(hits, decode attempts per image, mean ms per image)")
+        print("=" * 72)
+        print(f"{'images':<18} " + " ".join(f"{name:>26}" for name in readers))
+        for set_name, images in image_sets().items():
+            row = []
+            for reader in readers.values():
+                hits, attempts, ms = scan_all(reader, images)
+                row.append(f"{hits:>3}/{len(images):<3} {attempts:5.1f} {ms:8.1f} ms")
+            print(f"{set_name:<18} " + " ".join(f"{cell:>26}" for cell in row))
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark for date validation: the strptime loop validate_prescription_data
+used to run, trying formats until one stops raising, against DateParser.
+"""
+
+import time
+from datetime import datetime
+
+from date_parsing import DateParser
+
+ITERATIONS = 20000
+
+LEGACY_FORMATS = ['%Y-%m-%d', '%m/%d/%Y', '%d/%m/%Y', '%Y/%m/%d',
+                  '%d-%m-%Y', '%m-%d-%Y', '%d.%m.%Y', '%m.%d.%Y']
+
+DATES = ['2025-03-15', '03/15/2025', '16/03/2019', '2025/03/15',
+         '15-03-2025', '15.03.2025', '03.15.2025', 'not a date']
+
+
+def legacy_valid(value):
+    for date_format in LEGACY_FORMATS:
+        try:
+            datetime.strptime(value, date_format)
+            return True
+        except ValueError:
+            continue
+    return False
+
+
+def time_it(func):
+    start = time.perf_counter()
+    for _ in range(ITERATIONS):
+        for value in DATES:
+            func(value)
+    return (time.perf_counter() - start) / (ITERATIONS * len(DATES)) * 1e6
+
+
+def main():
+    parser = DateParser()
+    for value in DATES:
+        assert legacy_valid(value) == (parser.parse(value) is not None)
+
+    legacy_us = time_it(legacy_valid)
+    parser_us = time_it(lambda value: parser.parse(value, 'benchmark'))
+
+    print("Date validation")
+    print("=" * 40)
+    print(f"strptime loop: {legacy_us:6.2f} us/date")
+    print(f"DateParser:    {parser_us:6.2f} us/date")
+    print(f"Speedup:       {legacy_us / parser_us:6.1f}x")
+
+
+if __name__ == "__main__":
+    main()
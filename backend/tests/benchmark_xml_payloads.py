@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark for short-tag XML payloads: the old two-path handling
+(ElementTree, then six regex scans when the markup is malformed) against
+the single-pass tag tokenizer.
+"""
+
+import re
+import time
+import xml.etree.ElementTree as ET
+from xml.etree.ElementTree import ParseError
+
+from prescription_parsers import apply_aliases, iter_tag_values, sniff_format
+
+ITERATIONS = 20000
+
+PAYLOADS = {
+    'well-formed': "<p><n>Paul Smith</n><dg>Nexium Hp7 Pack 14+14+28</dg><in>utd</in>"
+                   "<id>12345</id><pm>Dr Jones</pm><dt>16/03/2019</dt></p>",
+    'unclosed': "<p><n>Jane Smith</n><dg>Aspirin 100mg<in>Take daily</in>"
+                "<dt>20/03/2025</dt></p>",
+    'html-ish': "<P><N>Mary Major</N><br><DG>Salt &amp; Pepper</DG><PM>Dr Roe<DT>01/02/2025</P>",
+}
+
+LEGACY_XML_MAPPINGS = {
+    'patient_name': ['n', 'name', 'patient'],
+    'medication_name': ['dg', 'drug', 'medication', 'med'],
+    'prescriber_name': ['pm', 'prescriber', 'doctor'],
+    'date_filled': ['dt', 'date', 'dispensed'],
+    'directions': ['in', 'instructions', 'directions', 'sig'],
+    'rx_number': ['id', 'rx', 'prescription_id'],
+    'pharmacy_name': ['pharmacy', 'pharm'],
+}
+
+LEGACY_XML_PATTERNS = {
+    'patient_name': r'<n[^>]*>([^<]+)</n>',
+    'medication_name': r'<dg[^>]*>([^<]+)</dg>',
+    'prescriber_name': r'<pm[^>]*>([^<]+)</pm>',
+    'date_filled': r'<dt[^>]*>([^<]+)</dt>',
+    'directions': r'<in[^>]*>([^<]+)</in>',
+    'rx_number': r'<id[^>]*>([^<]+)</id>',
+}
+
+
+def legacy_parse(payload):
+    fields = {}
+    try:
+        root = ET.fromstring(payload)
+        for field, tags in LEGACY_XML_MAPPINGS.items():
+            for tag in tags:
+                element = root.find(tag)
+                if element is not None and element.text:
+                    fields[field] = element.text.strip()
+                    break
+    except ParseError:
+        for field, pattern in LEGACY_XML_PATTERNS.items():
+            match = re.search(pattern, payload, re.IGNORECASE)
+            if match:
+                fields[field] = match.group(1).strip()
+    return fields
+
+
+def tokenizer_parse(payload, aliases):
+    fields = {}
+    apply_aliases(iter_tag_values(payload), aliases, fields)
+    return fields
+
+
+def time_it(func, *args):
+    start = time.perf_counter()
+    for _ in range(ITERATIONS):
+        func(*args)
+    return (time.perf_counter() - start) / ITERATIONS * 1e6
+
+
+def main():
+    aliases = sniff_format(PAYLOADS['well-formed']).aliases
+
+    print("Short-tag XML payloads")
+    print("=" * 60)
+    print(f"{'payload':<12} {'two-path us':>12} {'fields':>7} {'tokenizer us':>13} {'fields':>7}")
+    for name, payload in PAYLOADS.items():
+        legacy_fields = legacy_parse(payload)
+        fields = tokenizer_parse(payload, aliases)
+        print(f"{name:<12} {time_it(legacy_parse, payload):12.1f} {len(legacy_fields):7d} "
+              f"{time_it(tokenizer_parse, payload, aliases):13.1f} {len(fields):7d}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,34 @@
+#!/usr/bin/env python3
+"""
+QR code test images shared by the test modules
+"""
+
+import io
+
+import cv2
+import numpy as np
+import qrcode
+from PIL import Image
+
+
+def make_qr_gray(data="RX: 1234567", box_size=6, border=4, version=None) -> np.ndarray:
+    """
+    Black-on-white code with box_size pixel modules and a border of
+    `border` modules. With a version, the code is at least that version.
+    """
+    qr = qrcode.QRCode(version=version, box_size=box_size, border=border)
+    qr.add_data(data)
+    qr.make(fit=True)
+    image = qr.make_image(fill_color="black", back_color="white").convert("L")
+    return np.array(image, dtype=np.uint8)
+
+
+def make_qr_bgr(data="RX: 1234567", box_size=6, border=4, version=None) -> np.ndarray:
+    return cv2.cvtColor(make_qr_gray(data, box_size, border, version), cv2.COLOR_GRAY2BGR)
+
+
+def qr_png(data="RX: 1234567", box_size=10) -> bytes:
+    """The code as an uploaded PNG"""
+    buffer = io.BytesIO()
+    Image.fromarray(make_qr_gray(data, box_size)).save(buffer, format='PNG')
+    return buffer.getvalue()
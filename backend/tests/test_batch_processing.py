@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+"""
+Tests for bulk re-parsing of stored QR payloads and batch image scans
+"""
+
+import csv
+import io
+import json
+import os
+import tempfile
+
+import cv2
+import numpy as np
+
+from batch_processing import (iter_image_paths, iter_payload_records,
+                              run_image_batch, run_reparse)
+from prescription_qr_reader import PrescriptionQRReader
+from qr_images import make_qr_bgr
+
+PAYLOADS = [
+    'PATIENT: Jane Doe\nDRUG: Lisinopril\nNDC: 0093-1095-01',
+    '{"patient_name": "John Smith", "drug_name": "Metformin"}',
+    '<p><n>Paul Smith</n></p>',
+]
+
+
+def write_jsonl(path):
+    with open(path, 'w') as f:
+        for index, payload in enumerate(PAYLOADS):
+            f.write(json.dumps({'id': f"scan-{index}", 'raw_qr_data': payload}) + '\n')
+        f.write('\n')
+        f.write('{not json\n')
+        f.write(json.dumps(PAYLOADS[0]) + '\n')
+
+
+def read_jsonl(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f]
+
+
+def test_iter_jsonl_and_csv():
+    stream = io.StringIO('{"raw_data": "A"}\n\n"B"\n{"other": 1}\n[1]\n')
+    records = list(iter_payload_records(stream))
+    assert [r['offset'] for r in records] == [0, 1, 2, 3]
+    assert [r['payload'] for r in records] == ['A', 'B', None, None]
+    assert 'error' in records[2] and 'error' in records[3]
+
+    stream = io.StringIO('id,payload\n7,"NDC: 0093-1095-01"\n8,RX 12\n')
+    records = list(iter_payload_records(stream, 'csv', field='payload', start=1))
+    assert records == [{'offset': 1, 'id': '8', 'payload': 'RX 12'}]
+
+
+def test_reparse_in_order_and_resume():
+    with tempfile.TemporaryDirectory() as tmp:
+        source = os.path.join(tmp, 'payloads.jsonl')
+        output = os.path.join(tmp, 'results.jsonl')
+        write_jsonl(source)
+
+        stats = run_reparse(PrescriptionQRReader, source, output, workers=2,
+                            chunk_size=2, progress=None)
+        results = read_jsonl(output)
+        assert [r['offset'] for r in results] == list(range(5))
+        assert results[0]['id'] == 'scan-0'
+        assert results[0]['parsed']['ndc']['canonical'] == '00093-1095-01'
+        assert results[0]['valid']
+        assert not results[2]['valid']
+        assert 'Missing medication name' in results[2]['issues']
+        assert 'error' in results[3]
+        assert stats['records'] == 5 and stats['errors'] == 1
+        assert stats['next_offset'] == 5
+
+        # Resuming appends the remaining records after the given offset
+        with open(output, 'w') as f:
+            f.writelines(json.dumps(r) + '\n' for r in results[:3])
+        stats = run_reparse(PrescriptionQRReader, source, output, workers=1,
+                            resume_from=3, progress=None)
+        assert stats['records'] == 2
+        assert [r['offset'] for r in read_jsonl(output)] == list(range(5))
+
+
+class ExplodingReader(PrescriptionQRReader):
+    def parse_prescription_data(self, qr_data, *args, **kwargs):
+        if 'BOOM' in qr_data:
+            raise RuntimeError("parser bug")
+        return super().parse_prescription_data(qr_data, *args, **kwargs)
+
+
+def test_reparse_keeps_going_past_bad_records():
+    with tempfile.TemporaryDirectory() as tmp:
+        source = os.path.join(tmp, 'payloads.jsonl')
+        output = os.path.join(tmp, 'results.jsonl')
+        with open(source, 'w') as f:
+            for payload in ['{"rx": 5, "patient_name": "B"}', 'BOOM', PAYLOADS[0]]:
+                f.write(json.dumps({'raw_qr_data': payload}) + '\n')
+
+        for workers in (1, 2):
+            stats = run_reparse(ExplodingReader, source, output, workers=workers,
+                                chunk_size=3, progress=None)
+            results = read_jsonl(output)
+            # A numeric Rx number is validated as text
+            assert results[0]['parsed']['rx_number'] == 5 and 'error' not in results[0]
+            assert results[1]['error'] == 'RuntimeError: parser bug'
+            assert results[2]['valid']
+            assert stats['records'] == 3 and stats['errors'] == 1
+
+
+def test_reparse_reports_unreadable_rows():
+    """A bad byte sequence or CSV row fails its own record, not the run"""
+    with tempfile.TemporaryDirectory() as tmp:
+        output = os.path.join(tmp, 'results.jsonl')
+        source = os.path.join(tmp, 'payloads.jsonl')
+        with open(source, 'wb') as f:
+            f.write(b'{"raw_qr_data": "RX: 1"}\n')
+            f.write(b'{"raw_qr_data": "RX: \xff\xfe"}\n')
+            f.write(json.dumps({'raw_qr_data': {'patient_name': 'Ann', 'rx': '9'}}).encode() + b'\n')
+        stats = run_reparse(PrescriptionQRReader, source, output, workers=1, progress=None)
+        results = read_jsonl(output)
+        assert [r['offset'] for r in results] == [0, 1, 2]
+        assert results[1]['error'] == 'Not valid UTF-8'
+        # An object payload is parsed as JSON, not as its Python repr
+        assert results[2]['parsed']['patient_name'] == 'Ann'
+        assert results[2]['parsed']['rx_number'] == '9'
+        assert stats['records'] == 3 and stats['errors'] == 1
+
+        source = os.path.join(tmp, 'payloads.csv')
+        with open(source, 'wb') as f:
+            f.write(b'id,payload\n1,RX 1\n2,RX \xff\n')
+            f.write(b'3,' + b'x' * (csv.field_size_limit() + 1) + b'\n4,RX 4\n')
+        stats = run_reparse(PrescriptionQRReader, source, output, field='payload',
+                            workers=1, progress=None)
+        results = read_jsonl(output)
+        assert [r['offset'] for r in results] == [0, 1, 2, 3]
+        assert results[1]['error'] == 'Not valid UTF-8'
+        assert results[2]['error'].startswith('Invalid CSV')
+        assert results[3]['parsed']['rx_number'] == '4'
+        assert stats['errors'] == 2
+
+
+def write_qr_image(path, data):
+    cv2.imwrite(path, make_qr_bgr(data, box_size=8))
+
+
+def test_image_paths():
+    with tempfile.TemporaryDirectory() as tmp:
+        os.makedirs(os.path.join(tmp, 'b'))
+        for name in ['b/2.jpg', 'a.PNG', 'notes.txt']:
+            open(os.path.join(tmp, name), 'w').close()
+        listing = os.path.join(tmp, 'list.txt')
+        with open(listing, 'w') as f:
+            f.write('x.jpg\n\ny.jpg\n')
+
+        assert list(iter_image_paths(input_dir=tmp)) == [
+            os.path.join(tmp, 'a.PNG'), os.path.join(tmp, 'b', '2.jpg')]
+        assert list(iter_image_paths(pattern=os.path.join(tmp, '**', '*.jpg'))) == [
+            os.path.join(tmp, 'b', '2.jpg')]
+        assert list(iter_image_paths(from_list=listing)) == ['x.jpg', 'y.jpg']
+
+
+def test_image_batch_hits_by_method():
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = []
+        for index in range(3):
+            path = os.path.join(tmp, f"qr_{index}.png")
+            write_qr_image(path, f"PATIENT: Patient {index}\nNDC: 0093-1095-0{index}")
+            paths.append(path)
+        blank = os.path.join(tmp, 'blank.png')
+        cv2.imwrite(blank, np.full((200, 200, 3), 255, np.uint8))
+        broken = os.path.join(tmp, 'broken.jpg')
+        with open(broken, 'w') as f:
+            f.write('not an image')
+        paths += [blank, broken, os.path.join(tmp, 'missing.jpg')]
+
+        output = os.path.join(tmp, 'results.jsonl')
+        stats = run_image_batch(PrescriptionQRReader, paths, output, workers=2,
+                                prefetch=2, progress=None)
+        results = read_jsonl(output)
+
+        assert [r['path'] for r in results] == paths
+        assert stats['images'] == 6
+        # The blank frame is turned away by the quality gate before decoding
+        assert stats['methods'] == {'qr': 3, 'rejected': 1, 'error': 2}
+        assert results[3]['quality'] == ['overexposed']
+        assert results[1]['parsed']['patient_name'] == 'Patient 1'
+        assert all(r['read_ms'] >= 0 and r['decode_ms'] >= 0 for r in results)
+        assert all(r['peak_mb'] > 0 for r in results if r['method'] == 'qr')
+        assert stats['peak_mb_max'] > 0 and stats['memory_degraded'] == 0
+        print(f"{stats['images_per_second']:.1f} images/s")
+
+
+if __name__ == "__main__":
+    test_iter_jsonl_and_csv()
+    test_reparse_in_order_and_resume()
+    test_reparse_keeps_going_past_bad_records()
+    test_reparse_reports_unreadable_rows()
+    test_image_paths()
+    test_image_batch_hits_by_method()
+    print("All batch processing tests passed")
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Tests for numeric date parsing and per-source day/month order inference
+"""
+
+from date_parsing import DateParser
+from prescription_qr_reader import PrescriptionQRReader
+
+
+def test_unambiguous_dates():
+    parser = DateParser()
+    cases = {
+        '2025-03-15': ('2025-03-15', 'YMD'),
+        '2025/3/5': ('2025-03-05', 'YMD'),
+        '15/03/2025': ('2025-03-15', 'DMY'),
+        '03/15/2025': ('2025-03-15', 'MDY'),
+        '15.03.2025': ('2025-03-15', 'DMY'),
+        '03-15-2025': ('2025-03-15', 'MDY'),
+        '04/04/2025': ('2025-04-04', 'MDY'),
+    }
+    for value, (iso, order) in cases.items():
+        date = parser.parse(value)
+        assert date['iso'] == iso, value
+        assert date['order'] == order, value
+        assert not date['ambiguous'], value
+
+
+def test_invalid_dates():
+    parser = DateParser()
+    for value in ['2025-02-29', '2024-13-01', '31/31/2025', '15/03/25',
+                  '2025-03-15T10:00', 'yesterday', '00/00/2025']:
+        assert parser.parse(value) is None, value
+    assert parser.parse('2024-02-29')['iso'] == '2024-02-29'
+
+
+def test_ambiguous_dates_are_flagged():
+    parser = DateParser()
+    date = parser.parse('03/04/2025')
+    assert date['ambiguous']
+    assert date['iso'] == '2025-03-04'
+    assert date['alternative'] == '2025-04-03'
+
+
+def test_order_learned_per_source():
+    parser = DateParser()
+    parser.parse('16/03/2019', source='uk-pharmacy')
+    assert parser.source_order('uk-pharmacy') == 'DMY'
+
+    date = parser.parse('03/04/2025', source='uk-pharmacy')
+    assert not date['ambiguous']
+    assert date['iso'] == '2025-04-03'
+    # Other sources are unaffected
+    assert parser.parse('03/04/2025', source='us-pharmacy')['ambiguous']
+
+    # A source using both orders can no longer settle ambiguous dates
+    parser.parse('03/16/2019', source='uk-pharmacy')
+    assert parser.source_order('uk-pharmacy') is None
+    assert parser.parse('03/04/2025', source='uk-pharmacy')['ambiguous']
+
+
+def test_validation_reports_ambiguous_dates():
+    reader = PrescriptionQRReader()
+    parsed = reader.parse_prescription_data(
+        'PATIENT: Jane Doe\nDRUG: Lisinopril\nPHARMACY: Boots\nFILLED: 03/04/2025')
+    is_valid, issues = reader.validate_prescription_data(parsed)
+    assert not is_valid
+    assert any(issue.startswith('Ambiguous date') for issue in issues)
+
+    # Once the pharmacy has shown day-first dates, the same date is accepted
+    reader.validate_prescription_data(reader.parse_prescription_data(
+        'PATIENT: Jane Doe\nDRUG: Lisinopril\nPHARMACY: Boots\nFILLED: 16/03/2025'))
+    assert reader.validate_prescription_data(parsed) == (True, [])
+
+
+def test_parsed_output_has_iso_date():
+    reader = PrescriptionQRReader()
+    parsed = reader.parse_prescription_data(
+        'PATIENT: Jane Doe\nDRUG: Lisinopril\nPHARMACY: Boots\nFILLED: 16/03/2025')
+    assert parsed['date_filled'] == '16/03/2025'
+    assert parsed['date_filled_iso'] == '2025-03-16'
+
+    # The pharmacy is now known to be day-first
+    parsed = reader.parse_prescription_data(
+        'PATIENT: Jane Doe\nDRUG: Lisinopril\nPHARMACY: Boots\nFILLED: 03/04/2025')
+    assert parsed['date_filled_iso'] == '2025-04-03'
+
+    # Ambiguous without a known order: no guess
+    parsed = reader.parse_prescription_data('PATIENT: Jane Doe\nFILLED: 03/04/2025')
+    assert parsed['date_filled_iso'] is None
+
+
+def test_payload_sniffed_once():
+    """Parsing and validating don't sniff the payload's format again for the date"""
+    import prescription_qr_reader
+
+    calls = []
+    original = prescription_qr_reader.sniff_format
+
+    def counting_sniff(payload):
+        calls.append(payload)
+        return original(payload)
+
+    reader = PrescriptionQRReader()
+    prescription_qr_reader.sniff_format = counting_sniff
+    try:
+        parsed = reader.parse_prescription_data(
+            'PATIENT: Jane Doe\nDRUG: Lisinopril\nPHARMACY: Boots\nFILLED: 16/03/2025')
+        reader.validate_prescription_data(parsed)
+    finally:
+        prescription_qr_reader.sniff_format = original
+    assert len(calls) == 1
+    assert parsed['payload_format'] == 'key_value'
+    assert list(reader.date_parser._orders) == [('Boots', 'key_value')]
+
+
+def test_no_learning_without_a_pharmacy():
+    reader = PrescriptionQRReader()
+    # Unrelated issuers without a pharmacy name don't teach each other
+    reader.parse_prescription_data('PATIENT: Jane Doe\nFILLED: 16/03/2025')
+    parsed = reader.parse_prescription_data('PATIENT: John Roe\nFILLED: 03/04/2025')
+    is_valid, issues = reader.validate_prescription_data(parsed)
+    assert any(issue.startswith('Ambiguous date') for issue in issues)
+    assert reader.date_parser._orders == {}
+
+
+if __name__ == "__main__":
+    test_unambiguous_dates()
+    test_invalid_dates()
+    test_ambiguous_dates_are_flagged()
+    test_order_learned_per_source()
+    test_validation_reports_ambiguous_dates()
+    test_parsed_output_has_iso_date()
+    test_payload_sniffed_once()
+    test_no_learning_without_a_pharmacy()
+    print("All date parsing tests passed")
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Tests for the shared detector context and its buffer arena
+"""
+
+import threading
+
+import cv2
+import numpy as np
+
+from detector_context import BufferArena, DetectorContext
+from prescription_qr_reader import PrescriptionQRReader
+
+
+def test_gamma_luts_match_per_call_tables():
+    """Cached tables must match the old list-comprehension tables"""
+    context = DetectorContext()
+    for gamma in [0.5, 1.5, 2.0, 0.8]:
+        inv_gamma = 1.0 / gamma
+        expected = np.array([((i / 255.0) ** inv_gamma) *
+                             255 for i in np.arange(0, 256)]).astype("uint8")
+        assert np.array_equal(context.gamma_lut(gamma), expected)
+        assert context.gamma_lut(gamma) is context.gamma_lut(gamma)
+
+
+def test_detectors_are_per_thread():
+    """Each thread gets its own detector, reused across calls"""
+    context = DetectorContext()
+    main_detector = context.qr_detector()
+    assert context.qr_detector() is main_detector
+
+    other = []
+    thread = threading.Thread(target=lambda: other.append(context.qr_detector()))
+    thread.start()
+    thread.join()
+    assert other[0] is not main_detector
+
+
+def test_arena_reuses_buffers_between_scans():
+    """Buffers released at the end of a scan are handed out again"""
+    arena = BufferArena()
+    with arena.scan():
+        first = arena.acquire((100, 100))
+        second = arena.acquire((100, 100))
+        assert first is not second
+    with arena.scan():
+        reused = arena.acquire((100, 100))
+    assert reused is first or reused is second
+    assert arena.allocations == 2
+    assert arena.reuses == 1
+
+
+def test_arena_respects_retention_limit():
+    """A zero limit frees every buffer once the scan ends"""
+    arena = BufferArena(max_retained_bytes=0)
+    with arena.scan():
+        arena.acquire((50, 50))
+    assert arena.retained_bytes == 0
+
+
+def test_preprocessing_writes_into_arena_buffers():
+    """OpenCV writes variants into the buffers passed as dst="""
+    reader = PrescriptionQRReader(DetectorContext())
+    image = np.full((120, 160, 3), 200, dtype=np.uint8)
+    cv2.rectangle(image, (40, 30), (100, 90), (0, 0, 0), -1)
+
+    arena = reader.context.arena()
+    with arena.scan():
+        first_pass = [id(v) for v in reader.preprocess_image_for_qr(image)[1:]]
+    with arena.scan():
+        second_pass = [id(v) for v in reader.preprocess_image_for_qr(image)[1:]]
+
+    assert sorted(first_pass) == sorted(second_pass)
+    print(f"Reused {arena.reuses} buffers, allocated {arena.allocations}")
+
+
+if __name__ == "__main__":
+    test_gamma_luts_match_per_call_tables()
+    test_detectors_are_per_thread()
+    test_arena_reuses_buffers_between_scans()
+    test_arena_respects_retention_limit()
+    test_preprocessing_writes_into_arena_buffers()
+    print("All detector context tests passed")
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Tests for GS1 barcode parsing and NDC extraction from package barcodes
+"""
+
+import numpy as np
+
+from gs1 import (barcode_payload, gs1_date_to_iso, gtin_check_digit_valid,
+                 ndc_from_gtin, parse_barcode, parse_element_string)
+from prescription_qr_reader import PrescriptionQRReader
+from qr_decoders import ZXING_AVAILABLE
+
+
+def test_check_digits():
+    assert gtin_check_digit_valid('00300931095015')
+    assert gtin_check_digit_valid('300931095015')
+    assert not gtin_check_digit_valid('00300931095016')
+
+
+def test_ndc_from_gtin():
+    # UPC-A, EAN-13 and GTIN-14 forms of NDC 0093-1095-01
+    for gtin in ['300931095015', '0300931095015', '00300931095015']:
+        assert ndc_from_gtin(gtin) == '0093109501'
+    # A non-drug GTIN carries no NDC
+    assert ndc_from_gtin('4006381333931') is None
+
+
+def test_parse_human_readable_element_string():
+    fields = parse_element_string('(01)00359762374417(21)325029840856(17)260831(10)LL6848')
+    assert fields == {
+        'gtin': '00359762374417',
+        'serial_number': '325029840856',
+        'expiration_date': '260831',
+        'lot_number': 'LL6848',
+    }
+
+
+def test_parse_raw_element_string():
+    """Raw DataMatrix text: symbology identifier, FNC1 as group separators"""
+    raw = ']d2' + '0100300931095015' + '17261200' + '10ABC123' + '\x1d' + '21XYZ'
+    barcode = parse_barcode('DATAMATRIX', raw)
+    assert barcode['ndc'] == '0093109501'
+    assert barcode['lot_number'] == 'ABC123'
+    assert barcode['serial_number'] == 'XYZ'
+    # Day 00 means the end of the month
+    assert barcode['expiration_date'] == '2026-12-31'
+
+
+def test_invalid_inputs():
+    assert gs1_date_to_iso('261340') is None
+    assert parse_barcode('CODE128', 'not a gs1 string')['ndc'] is None
+    assert parse_barcode('EAN13', '0300931095016')['gtin'] is None
+
+
+def test_barcode_payload_parsing():
+    reader = PrescriptionQRReader()
+    payload = barcode_payload('EAN13', '0300931095015')
+    parsed = reader.parse_prescription_data(payload)
+    assert parsed['detection_method'] == 'BARCODE'
+    assert parsed['ndc_number'] == '0093109501'
+    print(reader.format_prescription_output(parsed))
+
+
+def test_datamatrix_decoded_from_image():
+    """End to end with zxing-cpp, when it is installed"""
+    if not ZXING_AVAILABLE:
+        print("zxing-cpp not installed, skipping DataMatrix decode test")
+        return
+    import cv2
+    import zxingcpp
+
+    symbol = zxingcpp.create_barcode('(01)00300931095015(17)261231(10)ABC123',
+                                     zxingcpp.BarcodeFormat.DataMatrix, options='gs1')
+    gray = np.array(symbol.to_image(scale=8, add_quiet_zones=True))
+    image = cv2.cvtColor(cv2.copyMakeBorder(gray, 60, 60, 60, 60, cv2.BORDER_CONSTANT,
+                                            value=255), cv2.COLOR_GRAY2BGR)
+
+    reader = PrescriptionQRReader()
+    payload = reader.enhanced_qr_detection(image)
+    parsed = reader.parse_prescription_data(payload)
+    assert parsed['ndc_number'] == '0093109501'
+    assert parsed['expiration_date'] == '2026-12-31'
+    assert parsed['lot_number'] == 'ABC123'
+
+
+if __name__ == "__main__":
+    test_check_digits()
+    test_ndc_from_gtin()
+    test_parse_human_readable_element_string()
+    test_parse_raw_element_string()
+    test_invalid_inputs()
+    test_barcode_payload_parsing()
+    test_datamatrix_decoded_from_image()
+    print("All GS1 tests passed")
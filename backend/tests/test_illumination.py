@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Tests for illumination normalization under uneven lighting
+"""
+
+import cv2
+import numpy as np
+
+from detector_context import DetectorContext
+from illumination import background_kernel_size, normalize_illumination
+from prescription_qr_reader import PrescriptionQRReader
+from qr_images import make_qr_gray
+
+
+def make_label(box_size=6):
+    """White label with a QR code in one corner, and its ideal binarization"""
+    code = make_qr_gray("RX: 1234567\nNDC: 0378-1805-01", box_size)
+    label = np.full((480, 640), 235, dtype=np.uint8)
+    label[40:40 + code.shape[0], 360:360 + code.shape[1]] = np.where(code > 127, 235, 30)
+    return label
+
+
+def shade(gray, depth):
+    """Light falling off from left to right, down to 1 - depth"""
+    ramp = np.linspace(0.0, 1.0, gray.shape[1], dtype=np.float32)
+    return (gray * (1.0 - depth * ramp)).astype(np.uint8)
+
+
+def agreement(binary, reference):
+    return float(np.mean((binary > 127) == (reference > 127)))
+
+
+def test_normalization_flattens_shadows():
+    """Paper comes out evenly bright however the light falls"""
+    context = DetectorContext()
+    shaded = shade(np.full((480, 640), 230, dtype=np.uint8), 0.8)
+    assert int(shaded[:, -1].mean()) < 60
+    normalized, binary = normalize_illumination(shaded, context)
+    assert normalized.std() < 10
+    assert normalized.min() > 200
+
+
+def test_binarization_survives_uneven_light():
+    """One Otsu pass on the normalized image matches the evenly lit label"""
+    context = DetectorContext()
+    label = make_label()
+    _, reference = cv2.threshold(label, 127, 255, cv2.THRESH_BINARY)
+    shaded = shade(label, 0.85)
+
+    _, global_otsu = cv2.threshold(shaded, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    _, binary = normalize_illumination(shaded, context, module_size=6)
+    print(f"global Otsu {agreement(global_otsu, reference):.3f}, "
+          f"normalized {agreement(binary, reference):.3f}")
+    assert agreement(binary, reference) > 0.99
+    assert agreement(binary, reference) > agreement(global_otsu, reference)
+
+
+def test_shaded_label_decodes():
+    reader = PrescriptionQRReader(DetectorContext())
+    image = cv2.cvtColor(shade(make_label(), 0.85), cv2.COLOR_GRAY2BGR)
+    assert reader.enhanced_qr_detection(image) == "RX: 1234567\nNDC: 0378-1805-01"
+
+
+def test_background_kernel_size():
+    """Odd, at least 3, and spanning several modules of the shrunken image"""
+    assert background_kernel_size((480, 640), None) == 3
+    assert background_kernel_size((4000, 3000), None) % 2 == 1
+    assert background_kernel_size((4000, 3000), 24) == 25
+    assert background_kernel_size((480, 640), 1.0) == 3
+
+
+if __name__ == "__main__":
+    test_normalization_flattens_shadows()
+    test_binarization_survives_uneven_light()
+    test_shaded_label_decodes()
+    test_background_kernel_size()
+    print("All illumination tests passed")
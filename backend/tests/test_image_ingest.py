@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Tests for EXIF-orientation-aware image ingestion
+"""
+
+import base64
+import io
+import os
+import tempfile
+
+import numpy as np
+from PIL import Image, ImageOps
+
+from image_ingest import load_image_bytes, load_image_file, read_image_metadata
+from prescription_qr_reader import PrescriptionQRReader
+from qr_images import make_qr_bgr
+
+
+def encode(pixels, fmt='JPEG', orientation=None, exif_size=None):
+    """Encode RGB pixels, optionally tagged with an EXIF orientation and pixel size"""
+    exif = Image.Exif()
+    if orientation is not None:
+        exif[0x0112] = orientation
+    if exif_size is not None:
+        exif.get_ifd(0x8769).update({0xA002: exif_size[0], 0xA003: exif_size[1]})
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).save(buffer, fmt, exif=exif.tobytes(), quality=95)
+    return buffer.getvalue()
+
+
+def random_pixels(height=30, width=50):
+    return (np.random.default_rng(0).random((height, width, 3)) * 255).astype(np.uint8)
+
+
+def test_every_orientation_matches_pil_transpose():
+    """All eight EXIF orientations are applied losslessly, as PIL's exif_transpose does"""
+    pixels = random_pixels()
+    for orientation in range(1, 9):
+        data = encode(pixels, 'PNG', orientation)
+        expected = np.array(ImageOps.exif_transpose(Image.open(io.BytesIO(data))))[:, :, ::-1]
+        image, metadata = load_image_bytes(data)
+        assert metadata['orientation'] == orientation and metadata['orientation_known']
+        assert np.array_equal(image, expected)
+        assert (metadata['width'], metadata['height']) == (image.shape[1], image.shape[0])
+
+
+def test_jpeg_upright_from_bytes_and_file():
+    """The same sideways phone JPEG comes out upright from a file and from base64"""
+    pixels = np.full((40, 80, 3), 255, dtype=np.uint8)
+    pixels[:, :10] = 0  # dark strip on the stored left edge
+    data = encode(pixels, orientation=6)
+
+    image, metadata = load_image_bytes(data)
+    # Orientation 6: turn clockwise, so the strip ends up along the top
+    assert image.shape[:2] == (80, 40)
+    assert image[:5].mean() < 60 and image[-5:].mean() > 200
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'label.jpg')
+        with open(path, 'wb') as f:
+            f.write(data)
+        from_file, _ = load_image_file(path)
+    assert np.array_equal(from_file, image)
+
+    from prescription_api import decode_base64_image
+    from_base64, _ = decode_base64_image(
+        'data:image/jpeg;base64,' + base64.b64encode(data).decode('ascii'))
+    assert np.array_equal(from_base64, image)
+
+
+def test_metadata_without_exif():
+    metadata = read_image_metadata(encode(random_pixels(), 'PNG'))
+    assert metadata == {'orientation': 1, 'orientation_known': False, 'width': 50, 'height': 30}
+    # Capture size from the EXIF pixel dimensions, upright
+    metadata = read_image_metadata(encode(random_pixels(), orientation=8, exif_size=(4032, 3024)))
+    assert (metadata['width'], metadata['height']) == (3024, 4032)
+    assert read_image_metadata(b'not an image')['orientation_known'] is False
+    assert load_image_bytes(b'not an image') is None
+
+
+def test_known_orientation_skips_ocr_rotations():
+    reader = PrescriptionQRReader()
+    assert reader.text_rotations(orientation_known=True) == []
+    assert reader.text_rotations() == [90, 270]
+
+
+def test_sideways_qr_decodes():
+    qr = make_qr_bgr(box_size=10)[:, :, ::-1]
+    # Stored rotated a quarter turn, tagged so it displays upright
+    stored = np.ascontiguousarray(np.rot90(qr))
+    image, _ = load_image_bytes(encode(stored, 'PNG', orientation=6))
+    assert np.array_equal(image[:, :, ::-1], qr)
+    assert PrescriptionQRReader().enhanced_qr_detection(image) == "RX: 1234567"
+
+
+if __name__ == "__main__":
+    test_every_orientation_matches_pil_transpose()
+    test_jpeg_upright_from_bytes_and_file()
+    test_metadata_without_exif()
+    test_known_orientation_skips_ocr_rotations()
+    test_sideways_qr_decodes()
+    print("All image ingestion tests passed")
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Tests for the image quality gate run before decoding
+"""
+
+import os
+
+import cv2
+import numpy as np
+
+from image_quality import assess_image_quality
+from prescription_qr_reader import PrescriptionQRReader
+from qr_images import make_qr_gray
+from synthetic_corpus import iter_samples
+
+SAMPLE_IMAGES = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                             'sample_images')
+
+
+def load_sample(name):
+    return cv2.imread(os.path.join(SAMPLE_IMAGES, name))
+
+
+def test_sample_photos_pass():
+    """Every sample photo is worth decoding, including the dark and blurry ones"""
+    for name in sorted(os.listdir(SAMPLE_IMAGES)):
+        image = load_sample(name)
+        if image is None:
+            continue
+        quality = assess_image_quality(image)
+        print(f"{name}: {quality['issues']} {quality['metrics']}")
+        assert quality['ok'], name
+
+
+def test_synthetic_samples_pass():
+    """Rendered labels, distortions included, are never rejected"""
+    for sample in iter_samples(seed=3, count=12, profile='mixed'):
+        assert assess_image_quality(sample['image'])['ok'], sample['truth']['id']
+
+
+def test_hopeless_frames_rejected():
+    """Black, blank, very dark and heavily blurred frames are rejected with feedback"""
+    photo = load_sample('realistic_prescription_photo.jpg')
+    cases = {
+        'too_dark': [np.zeros_like(photo), (photo * 0.08).astype(np.uint8)],
+        'overexposed': [np.full_like(photo, 250)],
+        'no_contrast': [np.full_like(photo, 128)],
+        'too_blurry': [cv2.filter2D(photo, -1, np.ones((1, 41)) / 41),
+                       cv2.filter2D(photo, -1, np.ones((41, 1)) / 41),
+                       cv2.filter2D(photo, -1, np.eye(41) / 41),
+                       cv2.GaussianBlur(photo, (0, 0), 8)],
+    }
+    for issue, images in cases.items():
+        for image in images:
+            quality = assess_image_quality(image)
+            assert not quality['ok']
+            assert quality['issues'] == [issue], quality
+            assert quality['feedback']
+
+
+def test_finder_patterns_override_exposure():
+    """A visible QR code is never rejected, however dark the frame"""
+    code = make_qr_gray(box_size=8)
+    dim = cv2.cvtColor(code // 16, cv2.COLOR_GRAY2BGR)
+    quality = assess_image_quality(dim)
+    assert quality['metrics']['finder_patterns'] >= 3
+    assert quality['ok'] and 'dark' in quality['issues']
+
+
+def test_exposure_warnings():
+    """Dim and very bright frames are decoded, with a warning"""
+    dark = assess_image_quality(load_sample('prescription_photo_dark.jpg'))
+    assert dark['ok'] and 'dark' in dark['issues']
+
+    bright = assess_image_quality(load_sample('realistic_prescription_photo.jpg'))
+    assert bright['ok'] and 'bright' in bright['issues']
+
+
+def test_rejected_frames_skip_decoding():
+    """The reader returns straight away for rejected frames and still decodes dim ones"""
+    reader = PrescriptionQRReader()
+    assert reader.enhanced_qr_detection(np.zeros((480, 640, 3), np.uint8)) is None
+    assert reader.enhanced_qr_detection(load_sample('prescription_photo_dark.jpg'))
+
+
+if __name__ == "__main__":
+    test_sample_photos_pass()
+    test_synthetic_samples_pass()
+    test_hopeless_frames_rejected()
+    test_finder_patterns_override_exposure()
+    test_exposure_warnings()
+    test_rejected_frames_skip_decoding()
+    print("All image quality tests passed")
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Tests for the open-loop API load test harness
+"""
+
+import os
+import tempfile
+import threading
+
+import numpy as np
+from werkzeug.serving import make_server
+
+from load_test import (arrival_times, build_workload, ocr_only_label, parse_mix,
+                       run_load_test, saturation_point, unique_image, write_report)
+from prescription_qr_reader import PrescriptionQRReader
+from synthetic_corpus import generate_sample
+
+
+def stage(rate, throughput, p99, error_rate=0.0):
+    return {'offered_rps': rate, 'throughput_rps': throughput, 'p99_ms': p99,
+            'error_rate': error_rate}
+
+
+def test_parse_mix():
+    assert parse_mix('easy_qr=3,health=1') == {'easy_qr': 0.75, 'health': 0.25}
+    assert parse_mix('easy_qr=1,ocr_only=0') == {'easy_qr': 1.0}
+    for bad in ['easy=1', 'easy_qr=lots', 'easy_qr=0', 'hard_qr=-1,easy_qr=2']:
+        try:
+            parse_mix(bad)
+        except ValueError:
+            continue
+        raise AssertionError(f"{bad} should be rejected")
+
+
+def test_arrivals_are_scheduled_open_loop():
+    rng = np.random.default_rng(0)
+    times = arrival_times(50, 10, rng)
+    assert all(0 <= t < 10 for t in times) and times == sorted(times)
+    assert 400 < len(times) < 600
+    assert arrival_times(4, 2, rng, poisson=False) == [0, 0.25, 0.5, 0.75, 1.0, 1.25, 1.5, 1.75]
+
+
+def test_ocr_only_label_has_no_code():
+    sample = generate_sample(3, 0, 'clean')
+    reader = PrescriptionQRReader()
+    assert reader.enhanced_qr_detection(sample['image']) == sample['truth']['payload']
+
+    data = unique_image(ocr_only_label(sample))
+    from image_ingest import load_image_bytes
+    image, _ = load_image_bytes(data)
+    assert image.shape == sample['image'].shape
+    assert reader.enhanced_qr_detection(image) is None
+
+
+def test_saturation_point():
+    stages = [stage(1, 1.0, 300), stage(2, 2.0, 900), stage(4, 3.1, 2500), stage(8, 3.2, 9000)]
+    saturation = saturation_point(stages, slo_p99_ms=2000, max_error_rate=0.01)
+    assert saturation['max_sustained_rps'] == 2
+    assert saturation['saturated_at_rps'] == 4
+    assert len(saturation['reasons']) == 2  # fell behind and missed the p99 SLO
+
+    saturation = saturation_point([stage(1, 1.0, 300, error_rate=0.05)], 2000, 0.01)
+    assert saturation['max_sustained_rps'] is None
+    assert 'error rate' in saturation['reasons'][0]
+    assert saturation_point(stages[:2], 2000, 0.01)['saturated_at_rps'] is None
+
+
+def test_short_run_against_the_api():
+    """A few seconds of mixed load against the app in this process"""
+    import prescription_api
+
+    server = make_server('127.0.0.1', 0, prescription_api.app, threaded=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        workload = build_workload(synthetic_count=2)
+        workload['hard_qr'] = workload['hard_qr'][-2:]  # the small synthetic ones
+        report = run_load_test(f'http://127.0.0.1:{server.server_port}', workload,
+                               parse_mix('easy_qr=2,hard_qr=1,health=1'), [4], duration=1.5)
+    finally:
+        server.shutdown()
+
+    result = report['stages'][0]
+    assert result['requests'] > 0 and result['errors'] == 0
+    assert result['p50_ms'] <= result['p95_ms'] <= result['p99_ms']
+    assert sum(row['requests'] for row in result['by_kind'].values()) == result['requests']
+    if 'easy_qr' in result['by_kind']:
+        row = result['by_kind']['easy_qr']
+        assert row['decoded'] == row['requests']
+
+    with tempfile.TemporaryDirectory() as tmp:
+        json_path, html_path = write_report(report, os.path.join(tmp, 'report'))
+        with open(html_path, encoding='utf-8') as f:
+            html = f.read()
+        assert '<svg' in html and '4/s' in html
+        assert os.path.getsize(json_path) > 0
+
+
+if __name__ == "__main__":
+    test_parse_mix()
+    test_arrivals_are_scheduled_open_loop()
+    test_ocr_only_label_has_no_code()
+    test_saturation_point()
+    test_short_run_against_the_api()
+    print("All load test harness tests passed")
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Tests for NDC normalization to the canonical 11-digit 5-4-2 form
+"""
+
+from ndc import canonical_candidates, normalize_ndc
+from prescription_qr_reader import PrescriptionQRReader
+
+
+def test_hyphenated_layouts():
+    cases = {
+        '0378-1805-01': ('4-4-2', '00378-1805-01'),
+        '50090-347-0': None,
+        '12345-678-90': ('5-3-2', '12345-0678-90'),
+        '12345-6789-1': ('5-4-1', '12345-6789-01'),
+        '12345-6789-01': ('5-4-2', '12345-6789-01'),
+    }
+    for raw, expected in cases.items():
+        ndc = normalize_ndc(raw)
+        if expected is None:
+            assert ndc['canonical'] is None
+            continue
+        layout, canonical = expected
+        assert ndc['layout'] == layout, raw
+        assert ndc['canonical'] == canonical, raw
+        assert ndc['digits'] == canonical.replace('-', '')
+        assert ndc['raw'] == raw
+
+
+def test_parts():
+    ndc = normalize_ndc('0378-1805-01')
+    assert (ndc['labeler'], ndc['product'], ndc['package']) == ('00378', '1805', '01')
+
+
+def test_unhyphenated():
+    # 11 digits is already 5-4-2
+    assert normalize_ndc('00378180501')['canonical'] == '00378-1805-01'
+    assert normalize_ndc('00378 1805 01')['canonical'] == '00378-1805-01'
+    # 10 digits is ambiguous without the hyphens
+    ndc = normalize_ndc('0378180501')
+    assert ndc['canonical'] is None
+    assert ndc['candidates'] == canonical_candidates('0378180501')
+    assert ndc['candidates'][0] == '00378-1805-01'
+    assert len(set(ndc['candidates'])) == 3
+
+
+def test_invalid_inputs():
+    assert normalize_ndc(None) is None
+    assert normalize_ndc('  ') is None
+    for raw in ['123-45-6', 'not an ndc', '123456789']:
+        ndc = normalize_ndc(raw)
+        assert ndc['canonical'] is None and not ndc['candidates']
+
+
+def test_parser_emits_ndc_object():
+    reader = PrescriptionQRReader()
+    for payload in ['PATIENT: Jane Doe\nNDC: 0378-1805-01',
+                    '{"patient_name": "Jane Doe", "ndc": "0378-1805-01"}',
+                    'TEXT_INFO: {"ndc": "0378-1805-01"}']:
+        parsed = reader.parse_prescription_data(payload)
+        assert parsed['ndc_number'] == '0378-1805-01'
+        assert parsed['ndc']['canonical'] == '00378-1805-01'
+        assert parsed['ndc']['layout'] == '4-4-2'
+
+    parsed = reader.parse_prescription_data('PATIENT: Jane Doe')
+    assert parsed['ndc'] is None
+    print(reader.format_prescription_output(
+        reader.parse_prescription_data('PATIENT: Jane Doe\nNDC: 0378-1805-01')))
+
+
+if __name__ == "__main__":
+    test_hyphenated_layouts()
+    test_parts()
+    test_unhyphenated()
+    test_invalid_inputs()
+    test_parser_emits_ndc_object()
+    print("All NDC tests passed")
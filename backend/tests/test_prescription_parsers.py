@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""
+Tests for payload format sniffing, the per-format parsers and the mapping
+schema they are compiled from. Each schema format has a corpus of payloads
+and expected fields in tests/corpus/<format>.jsonl.
+"""
+
+import json
+import os
+import tempfile
+
+import prescription_parsers
+from gs1 import barcode_payload
+from prescription_parsers import (DEFAULT_MAPPINGS_PATH, PARSERS, PayloadParser,
+                                  compile_schema, iter_tag_values, load_mappings,
+                                  register_parser,
+                                  reload_mappings_if_changed, sniff_format,
+                                  text_info_payload)
+from prescription_qr_reader import PrescriptionQRReader
+
+CORPUS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'corpus')
+
+
+def default_schema():
+    with open(DEFAULT_MAPPINGS_PATH) as f:
+        return json.load(f)
+
+
+def test_sniff_format():
+    cases = {
+        barcode_payload('EAN13', '0300931095015'): 'barcode',
+        text_info_payload({'ndc': '0093-1095-01'}): 'text_info',
+        '  <p><n>Jane</n></p>\n': 'xml',
+        '{"name": "Jane"}': 'json',
+        'PATIENT: Jane': 'key_value',
+        'free text': 'key_value',
+    }
+    for payload, name in cases.items():
+        assert sniff_format(payload).name == name, payload
+
+
+def test_alias_priority_independent_of_order():
+    """The first alias in the table wins, wherever it appears in the payload"""
+    reader = PrescriptionQRReader()
+    parsed = reader.parse_prescription_data('<p><name>Other</name><n>Paul Smith</n></p>')
+    assert parsed['patient_name'] == 'Paul Smith'
+    parsed = reader.parse_prescription_data('{"name": "Other", "patient_name": "Jane"}')
+    assert parsed['patient_name'] == 'Jane'
+    # Key-value lines keep the last value for a field
+    parsed = reader.parse_prescription_data('PATIENT: Jane\nNAME: Override')
+    assert parsed['patient_name'] == 'Override'
+
+
+def test_json_keys_match_exactly():
+    """JSON keeps its own case-sensitive aliases, not the shared ones"""
+    reader = PrescriptionQRReader()
+    parsed = reader.parse_prescription_data(
+        '{"patient": "X", "pt": "Y", "date": "01/02/2025", "Patient_Name": "Z"}')
+    assert parsed['patient_name'] is None and parsed['date_filled'] is None
+    parsed = reader.parse_prescription_data('{"NDC": "0093-1095-01", "Ndc": "1"}')
+    assert parsed['ndc_number'] == '0093-1095-01'
+
+
+def test_text_info_round_trip():
+    reader = PrescriptionQRReader()
+    payload = text_info_payload({'ndc': '0093-1095-01', 'rx_number': '555'})
+    parsed = reader.parse_prescription_data(payload)
+    assert parsed['detection_method'] == 'TEXT_OCR'
+    assert parsed['ndc_number'] == '0093-1095-01'
+    assert parsed['rx_number'] == '555'
+
+    # Not JSON: no code is evaluated, NDCs in the text are still picked up
+    parsed = reader.parse_prescription_data("TEXT_INFO: __import__('os') 1234-5678-90")
+    assert parsed['ndc_number'] == '1234-5678-90'
+    assert parsed['detection_method'] == 'QR_CODE'
+
+
+def test_legacy_text_info_repr():
+    reader = PrescriptionQRReader()
+    # OCR results archived before the hand-off became JSON
+    parsed = reader.parse_prescription_data(
+        "TEXT_INFO: {'ndc': '0378-1805-1', 'rx_number': '123456'}")
+    assert parsed['detection_method'] == 'TEXT_OCR'
+    assert parsed['ndc_number'] == '0378-1805-1'
+    assert parsed['rx_number'] == '123456'
+
+    # Only a dict of strings is accepted from the old format
+    for payload in ["TEXT_INFO: {'ndc': ['0378-1805-1']}", "TEXT_INFO: [1, 2]",
+                    "TEXT_INFO: {'ndc': (1).__class__}"]:
+        assert reader.parse_prescription_data(payload)['detection_method'] == 'QR_CODE'
+
+
+def test_registered_parser_is_sniffed_before_fallback():
+    class PipeParser(PayloadParser):
+        name = 'pipe'
+
+        def sniff(self, payload):
+            return payload.startswith('RX|')
+
+        def parse(self, payload, parsed_data):
+            parsed_data['rx_number'] = payload.split('|')[1]
+            return parsed_data
+
+    parser = register_parser(PipeParser())
+    try:
+        names = [p.name for p in PARSERS]
+        assert names.index('pipe') < names.index('xml')
+        parsed = PrescriptionQRReader().parse_prescription_data('RX|777')
+        assert parsed['rx_number'] == '777'
+    finally:
+        PARSERS.remove(parser)
+
+
+def test_tag_tokenizer_tolerates_broken_markup():
+    payload = ('<p><n>Jane</n><dg>Aspirin<in> Take daily </p></in>'
+               '<br/>stray<x:pm a="1">Dr &amp; Co</x:pm><empty></empty></p>')
+    assert list(iter_tag_values(payload)) == [
+        ('n', 'Jane', 1), ('dg', 'Aspirin', 1), ('in', 'Take daily', 2),
+        ('pm', 'Dr & Co', 0)]
+    assert list(iter_tag_values('<<<>>>< n>x')) == []
+    # Void HTML elements don't nest what follows them
+    assert list(iter_tag_values('<p><br><n>Jane</n></p>')) == [('n', 'Jane', 1)]
+
+
+def test_nested_tags_rank_below_top_level():
+    """A field comes from the shallowest matching tag, whatever the alias order"""
+    reader = PrescriptionQRReader()
+    parsed = reader.parse_prescription_data(
+        '<rx><prescriber><name>Dr Who</name></prescriber><name>Pat</name></rx>')
+    assert parsed['patient_name'] == 'Pat'
+    parsed = reader.parse_prescription_data(
+        '<rx><info><patient_name>Nested</patient_name></info><n>Top</n></rx>')
+    assert parsed['patient_name'] == 'Top'
+
+
+def test_corpus_per_format():
+    reader = PrescriptionQRReader()
+    for spec in default_schema()['formats']:
+        path = os.path.join(CORPUS_DIR, f"{spec['name']}.jsonl")
+        assert os.path.exists(path), f"No corpus for format {spec['name']}"
+        with open(path) as f:
+            cases = [json.loads(line) for line in f if line.strip()]
+        assert cases
+        for case in cases:
+            assert sniff_format(case['payload']).name == spec['name']
+            parsed = reader.parse_prescription_data(case['payload'])
+            for field, value in case['expected'].items():
+                assert parsed[field] == value, (spec['name'], field, parsed[field])
+
+
+def test_schema_errors():
+    for bad_format, message in [
+            ({'name': 'x', 'syntax': 'yaml'}, 'unknown syntax'),
+            ({'name': 'x', 'syntax': 'json', 'fields': {'colour': ['c']}}, 'unknown field'),
+            ({'name': 'x', 'syntax': 'json', 'match': '('}, 'bad match pattern')]:
+        schema = default_schema()
+        schema['formats'].insert(0, bad_format)
+        try:
+            compile_schema(schema)
+            assert False, message
+        except ValueError as e:
+            assert message in str(e)
+
+
+def test_pharmacy_format_from_schema_and_hot_reload():
+    """A new pipe-delimited layout added by editing the mapping file"""
+    reader = PrescriptionQRReader()
+    payload = 'ACME|PATIENT: Jane Doe|DRUG: Lisinopril'
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'mappings.json')
+        schema = default_schema()
+        with open(path, 'w') as f:
+            json.dump(schema, f)
+        try:
+            load_mappings(path)
+            assert reader.parse_prescription_data(payload)['patient_name'] is None
+
+            schema['formats'].insert(0, {
+                'name': 'acme', 'syntax': 'key_value', 'match': '^ACME[|]',
+                'patterns': {'patient_name': 'PATIENT: ([^|]+)',
+                             'medication_name': 'DRUG: ([^|]+)'}})
+            with open(path, 'w') as f:
+                json.dump(schema, f)
+            os.utime(path, (1, 1))
+            prescription_parsers._schema_state['checked'] = 0.0
+
+            parsed = reader.parse_prescription_data(payload)
+            assert sniff_format(payload).name == 'acme'
+            assert parsed['patient_name'] == 'Jane Doe'
+            assert parsed['medication_name'] == 'Lisinopril'
+
+            # A broken edit keeps the last good mappings
+            with open(path, 'w') as f:
+                f.write('{"formats": [')
+            os.utime(path, (2, 2))
+            prescription_parsers._schema_state['checked'] = 0.0
+            assert not reload_mappings_if_changed()
+            assert sniff_format(payload).name == 'acme'
+        finally:
+            load_mappings(DEFAULT_MAPPINGS_PATH)
+
+if __name__ == "__main__":
+    test_sniff_format()
+    test_alias_priority_independent_of_order()
+    test_json_keys_match_exactly()
+    test_text_info_round_trip()
+    test_legacy_text_info_repr()
+    test_registered_parser_is_sniffed_before_fallback()
+    test_tag_tokenizer_tolerates_broken_markup()
+    test_nested_tags_rank_below_top_level()
+    test_corpus_per_format()
+    test_schema_errors()
+    test_pharmacy_format_from_schema_and_hot_reload()
+    print("All parser tests passed")
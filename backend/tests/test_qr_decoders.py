@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+"""
+Tests for the decoder backend registry and router
+"""
+
+import os
+import tempfile
+import threading
+import time
+
+import cv2
+
+from prescription_qr_reader import PrescriptionQRReader
+import qr_decoders
+from qr_decoders import (BACKENDS, BARCODE_SYMBOLOGIES, TRAIT_NO_FINDERS, DecoderBackend,
+                         DecoderRouter, bench_backends, make_result)
+from qr_images import make_qr_bgr
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class FakeBackend(DecoderBackend):
+    def __init__(self, name, cost, strengths=(), answer=None):
+        self.name = name
+        self.cost = cost
+        self.strengths = strengths
+        self.answer = answer
+        self.calls = 0
+
+    def decode(self, image, context, symbologies=('QRCODE',)):
+        self.calls += 1
+        return [make_result(self.answer, self.name)] if self.answer else []
+
+
+class SlowBackend(FakeBackend):
+    """Answers on its nth call; every call takes delay seconds"""
+
+    def __init__(self, name, answer_on_call, delay=0.02):
+        super().__init__(name, 1.0, answer='RX: 7')
+        self.answer_on_call = answer_on_call
+        self.delay = delay
+        self.lock = threading.Lock()
+        self.running = 0
+        self.max_running = 0
+
+    def decode(self, image, context, symbologies=('QRCODE',)):
+        with self.lock:
+            self.calls += 1
+            call = self.calls
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        time.sleep(self.delay)
+        with self.lock:
+            self.running -= 1
+        return [make_result(self.answer, self.name)] if call == self.answer_on_call else []
+
+
+def test_registry_contains_known_backends():
+    for name in ['pyzbar', 'opencv', 'opencv_aruco', 'wechat', 'zxing']:
+        assert name in BACKENDS
+    # OpenCV's detector is always available
+    assert BACKENDS['opencv'].is_available()
+
+
+def test_router_orders_by_cost_and_strengths():
+    router = DecoderRouter(names=[])
+    cheap = FakeBackend('cheap', 1.0)
+    costly = FakeBackend('costly', 3.0, strengths=(TRAIT_NO_FINDERS,))
+    router.backends = [costly, cheap]
+
+    assert router.plan() == [cheap, costly]
+    # 3.0 / (1 + 1) is still more than 1.0
+    assert router.plan([TRAIT_NO_FINDERS]) == [cheap, costly]
+    costly.cost = 1.5
+    assert router.plan([TRAIT_NO_FINDERS]) == [costly, cheap]
+
+
+def test_router_restricted_by_name():
+    router = DecoderRouter(names=['opencv'])
+    assert [backend.name for backend in router.backends] == ['opencv']
+
+
+def test_escalates_to_next_backend():
+    """The second backend only runs once the first has exhausted its ladder"""
+    reader = PrescriptionQRReader(race_workers=1)
+    failing = FakeBackend('failing', 1.0)
+    working = FakeBackend('working', 2.0, answer='RX: 42')
+    image = make_qr_bgr('ignored')
+
+    result = reader.decode_with_backends(image, backends=[failing, working])
+    assert result['data'] == 'RX: 42'
+    assert result['backend'] == 'working'
+    assert failing.calls > 1
+    assert working.calls == 1
+
+
+def test_racing_matches_sequential():
+    image = make_qr_bgr('PATIENT: Jane Doe\nNDC: 0378-1805-01')
+    sequential = PrescriptionQRReader(race_workers=1).decode_with_backends(image)
+    raced = PrescriptionQRReader(race_workers=4).decode_with_backends(image)
+    assert raced['data'] == sequential['data'] == 'PATIENT: Jane Doe\nNDC: 0378-1805-01'
+
+
+def test_racing_cancels_remaining_attempts():
+    """Attempts run K at a time; nothing runs or starts once a result is returned"""
+    backend = SlowBackend('slow', answer_on_call=5)
+    reader = PrescriptionQRReader(race_workers=3)
+    result = reader.decode_with_backends(make_qr_bgr('ignored'), backends=[backend])
+
+    assert result['data'] == 'RX: 7'
+    assert backend.max_running == 3
+    assert backend.running == 0
+    calls = backend.calls
+    # The winner plus at most the two attempts running beside it
+    assert 5 <= calls <= 7
+    time.sleep(0.1)
+    assert backend.calls == calls
+
+
+def test_racing_exhausts_ladder_on_miss():
+    backend = SlowBackend('never', answer_on_call=0, delay=0)
+    sequential = SlowBackend('never', answer_on_call=0, delay=0)
+    image = make_qr_bgr('ignored')
+    assert PrescriptionQRReader(race_workers=3).decode_with_backends(image, backends=[backend]) is None
+    PrescriptionQRReader(race_workers=1).decode_with_backends(image, backends=[sequential])
+    assert backend.calls == sequential.calls
+
+
+def test_race_pool_shared_and_closed():
+    """Concurrent first scans share one pool, and close() shuts it down"""
+    reader = PrescriptionQRReader(race_workers=2)
+    image = make_qr_bgr('RX: 1234567')
+    scans = [threading.Thread(target=reader.decode_with_backends, args=(image,))
+             for _ in range(4)]
+    for scan in scans:
+        scan.start()
+    for scan in scans:
+        scan.join()
+    pool = reader._race_pool
+    assert pool is not None
+    assert 0 < len(pool._threads) <= 2
+
+    reader.close()
+    assert reader._race_pool is None and pool._shutdown
+    assert not any(thread.is_alive() for thread in pool._threads)
+    # A later scan starts a new pool
+    assert reader.decode_with_backends(image)['data'] == 'RX: 1234567'
+    reader.close()
+
+
+def test_default_router_created_once():
+    """Concurrent first requests share one router and its stats"""
+    original = qr_decoders._default_router
+    qr_decoders._default_router = None
+    routers = []
+    start = threading.Barrier(4)
+
+    def first_request():
+        start.wait()
+        routers.append(qr_decoders.get_default_router())
+
+    try:
+        threads = [threading.Thread(target=first_request) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        qr_decoders._default_router = original
+    assert len(routers) == 4 and all(router is routers[0] for router in routers)
+
+
+def test_bench_decodes_upright_images():
+    """The bench loads images the way scans do, EXIF orientation applied"""
+    from PIL import Image
+
+    image = Image.fromarray(cv2.cvtColor(make_qr_bgr('RX: 1234567'), cv2.COLOR_BGR2RGB))
+    image = image.crop((0, 0, image.width, image.height // 2))
+    exif = Image.Exif()
+    exif[0x0112] = 6  # stored rotated; displayed 90 degrees clockwise
+    shapes = []
+
+    class RecordingReader(PrescriptionQRReader):
+        def decode_with_backends(self, image, backends=None, **kwargs):
+            shapes.append(image.shape[:2])
+            return None
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'rotated.jpg')
+        image.save(path, exif=exif)
+        report = bench_backends(RecordingReader(), [path])
+    assert report and report[0]['images'] == 1
+    assert shapes[0] == (image.width, image.height)
+
+
+def test_polygon_is_in_input_coordinates():
+    """Polygons are mapped back through the initial downscale"""
+    qr = make_qr_bgr('PATIENT: Jane Doe', box_size=40)
+    image = cv2.copyMakeBorder(qr, 100, 100, 300, 300,
+                               cv2.BORDER_CONSTANT, value=(255, 255, 255))
+    reader = PrescriptionQRReader(router=DecoderRouter(names=['opencv']))
+    result = reader.decode_with_backends(image)
+
+    assert result['data'] == 'PATIENT: Jane Doe'
+    xs = [point[0] for point in result['polygon']]
+    ys = [point[1] for point in result['polygon']]
+    print(f"Polygon x {min(xs):.0f}-{max(xs):.0f}, y {min(ys):.0f}-{max(ys):.0f}")
+    # The code (inside its quiet zone) starts at x=300+4*40, y=100+4*40
+    assert abs(min(xs) - 460) < 30
+    assert abs(min(ys) - 260) < 30
+
+
+def test_barcodes_tried_on_the_first_rung():
+    """A barcode-only package decodes before the QR variant ladder runs"""
+    reader = PrescriptionQRReader(race_workers=1)
+    barcode_backends = reader.router.plan(symbologies=BARCODE_SYMBOLOGIES)
+    if not barcode_backends:
+        return
+    failing = FakeBackend('failing', 1.0)
+    image = make_qr_bgr('ignored')
+    with reader.context.arena().scan():
+        prepared, geometry = reader.prepare_decode_image(image)
+        attempts = list(reader.ladder_attempts(prepared, geometry, [failing], barcodes=True))
+    first_rung = attempts[1:1 + len(barcode_backends)]
+    assert [attempt[0] for attempt in first_rung] == barcode_backends
+    assert all(attempt[1] is prepared and attempt[3] == BARCODE_SYMBOLOGIES
+               for attempt in first_rung)
+    # The original is not tried again after the QR ladder
+    assert sum(1 for attempt in attempts
+               if attempt[1] is prepared and attempt[3] == BARCODE_SYMBOLOGIES) \
+        == len(barcode_backends)
+
+    stats = {}
+    package = cv2.imread(os.path.join(BACKEND_DIR, 'sample_images', '12.jpg'))
+    result = reader.decode_with_backends(package, barcodes=True, stats=stats)
+    assert result['symbology'] == 'DATAMATRIX'
+    assert stats['attempts'] <= 1 + len(barcode_backends)
+
+
+if __name__ == "__main__":
+    test_registry_contains_known_backends()
+    test_router_orders_by_cost_and_strengths()
+    test_router_restricted_by_name()
+    test_escalates_to_next_backend()
+    test_racing_matches_sequential()
+    test_racing_cancels_remaining_attempts()
+    test_racing_exhausts_ladder_on_miss()
+    test_race_pool_shared_and_closed()
+    test_default_router_created_once()
+    test_bench_decodes_upright_images()
+    test_polygon_is_in_input_coordinates()
+    test_barcodes_tried_on_the_first_rung()
+    print("All decoder tests passed")
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Tests for QR module size estimation and resolution-aware scale planning
+"""
+
+import cv2
+import numpy as np
+
+import prescription_qr_reader
+from prescription_qr_reader import PrescriptionQRReader
+from qr_geometry import (MAX_DECODE_DIMENSION, analyze_geometry,
+                         find_finder_patterns, initial_scale, plan_decode_scales)
+from qr_images import make_qr_gray
+
+
+def test_module_size_from_finder_patterns():
+    """Estimated module size should be close to the generated box size"""
+    for box_size in [3, 6, 12]:
+        gray = make_qr_gray(box_size=box_size, version=2)
+        assert len(find_finder_patterns(gray)) >= 3
+        module_size = analyze_geometry(gray)['module_size']
+        print(f"box_size={box_size} estimated={module_size:.2f}")
+        assert abs(module_size - box_size) / box_size < 0.2
+
+
+def test_no_module_size_without_finders():
+    """A blank frame has no finder patterns, so no module size or region"""
+    blank = np.full((300, 300), 255, dtype=np.uint8)
+    geometry = analyze_geometry(blank)
+    assert geometry['module_size'] is None and geometry['region'] is None
+
+
+def test_large_inputs_are_downscaled_first():
+    """Huge modules and oversized photos are downscaled before decoding"""
+    assert initial_scale((4000, 3000), module_size=40.0) == 5.0 / 40.0
+    assert initial_scale((4000, 3000), module_size=None) == MAX_DECODE_DIMENSION / 4000
+    assert initial_scale((800, 800), module_size=4.0) == 1.0
+
+
+def test_planned_scales_stay_within_limits():
+    """No planned scale upsamples past the decode dimension limit"""
+    for shape, module_size in [((4000, 3000), None), ((150, 150), 1.0),
+                               ((1600, 1200), 2.6), ((870, 870), 9.9)]:
+        scales = plan_decode_scales(shape, module_size)
+        limit = MAX_DECODE_DIMENSION * (2 if module_size else 1)
+        for scale in scales:
+            assert max(shape) * scale <= max(limit, max(shape))
+        print(f"shape={shape} module={module_size} scales={scales}")
+
+    # Small modules get upscaled beyond the old fixed 2x
+    assert max(plan_decode_scales((150, 150), 1.0)) > 2.0
+
+
+def test_wrong_estimate_still_decodes_at_native_resolution():
+    """A module estimate that downscales a code past reading isn't the last word"""
+    gray = cv2.copyMakeBorder(make_qr_gray(box_size=3, version=2), 200, 200, 200, 200,
+                              cv2.BORDER_CONSTANT, value=255)
+    image = cv2.cvtColor(gray, cv2.COLOR_GRAY2BGR)
+    original = prescription_qr_reader.analyze_geometry
+    prescription_qr_reader.analyze_geometry = lambda gray: dict(
+        original(gray), module_size=40.0)
+    try:
+        reader = PrescriptionQRReader(race_workers=1)
+        with reader.context.arena().scan():
+            prepared, geometry = reader.prepare_decode_image(image)
+        assert geometry['input_scale'] == 5.0 / 40.0 and geometry['native'] is image
+        result = reader.decode_with_backends(image)
+    finally:
+        prescription_qr_reader.analyze_geometry = original
+    assert result and result['data'] == "RX: 1234567"
+
+
+def test_downscaled_code_still_has_finders():
+    """Finder search on a thumbnail reports coordinates in the source image"""
+    gray = make_qr_gray(box_size=20, version=2)
+    big = cv2.copyMakeBorder(gray, 500, 500, 500, 500,
+                             cv2.BORDER_CONSTANT, value=255)
+    patterns = find_finder_patterns(big)
+    assert len(patterns) >= 3
+    for x, y, _ in patterns[:3]:
+        assert 500 <= x <= 500 + gray.shape[1]
+        assert 500 <= y <= 500 + gray.shape[0]
+
+
+if __name__ == "__main__":
+    test_module_size_from_finder_patterns()
+    test_no_module_size_without_finders()
+    test_large_inputs_are_downscaled_first()
+    test_planned_scales_stay_within_limits()
+    test_wrong_estimate_still_decodes_at_native_resolution()
+    test_downscaled_code_still_has_finders()
+    print("All QR geometry tests passed")
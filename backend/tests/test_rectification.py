@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Tests for perspective rectification of located QR codes
+"""
+
+import cv2
+import numpy as np
+
+from detector_context import DetectorContext
+from prescription_qr_reader import PrescriptionQRReader
+from qr_decoders import DecoderRouter
+from qr_geometry import TARGET_MODULE_PX, find_finder_patterns
+from qr_images import make_qr_gray
+from rectification import (QUIET_ZONE_MODULES, order_finder_patterns, qr_module_count,
+                           rectify_code)
+
+PAYLOAD = "RX: 1234567\nNDC: 0378-1805-01"
+
+
+def make_code(box_size=6, version=3):
+    return make_qr_gray(PAYLOAD, box_size, version=version)
+
+
+def skew(gray, corners_out, size=(640, 480)):
+    """Warp the code onto a white frame so its corners land at corners_out"""
+    height, width = gray.shape
+    source = np.float32([[0, 0], [width, 0], [width, height], [0, height]])
+    matrix = cv2.getPerspectiveTransform(source, np.float32(corners_out))
+    return cv2.warpPerspective(gray, matrix, size, borderValue=255), matrix
+
+
+def test_module_count_snaps_to_qr_sizes():
+    assert qr_module_count(21.4) == 21
+    assert qr_module_count(28.7) == 29
+    assert qr_module_count(5) == 21
+    assert qr_module_count(500) == 177
+
+
+def test_finder_patterns_ordered_in_code_orientation():
+    """Top-left, top-right and bottom-left survive a rotation"""
+    code = make_code()
+    size = code.shape[0]
+    # Quarter turn clockwise: the code's top-left ends up top-right
+    rotated = cv2.rotate(code, cv2.ROTATE_90_CLOCKWISE)
+    top_left, top_right, bottom_left, module_size = order_finder_patterns(
+        find_finder_patterns(rotated))
+    assert top_left[0] > size / 2 and top_left[1] < size / 2
+    assert top_right[0] > size / 2 and top_right[1] > size / 2
+    assert bottom_left[0] < size / 2 and bottom_left[1] < size / 2
+    assert abs(module_size - 6) < 1
+    # Stray shapes that don't meet at a right angle are not a code
+    assert order_finder_patterns([(0, 0, 42), (100, 0, 42), (200, 0, 42)]) is None
+
+
+def test_patch_is_fronto_parallel():
+    """A steeply skewed code comes out square, at the target module size"""
+    context = DetectorContext()
+    skewed, matrix = skew(make_code(), [[150, 60], [520, 110], [470, 430], [120, 380]])
+    patterns = find_finder_patterns(skewed)
+    patch, homography = rectify_code(skewed, context, patterns)
+
+    modules = 29  # version 3
+    quiet = QUIET_ZONE_MODULES * TARGET_MODULE_PX
+    assert patch.shape == (int((modules + 2 * QUIET_ZONE_MODULES) * TARGET_MODULE_PX),) * 2
+    # Quiet zone stays light, and the top-left finder starts where the code does
+    assert patch[:int(quiet) - 2].min() > 200
+    start, module = int(quiet), int(TARGET_MODULE_PX)
+    finder_edge = patch[start + 1:start + module - 1, start + 1:start + 7 * module - 1]
+    assert finder_edge.mean() < 80
+
+    data, _, _ = cv2.QRCodeDetector().detectAndDecode(cv2.cvtColor(patch, cv2.COLOR_GRAY2BGR))
+    assert data == PAYLOAD
+    # The homography maps the patch's code corner back onto the skewed one
+    # (the generated code has a 4 module border of 6 px modules)
+    point = cv2.perspectiveTransform(np.float32([[[quiet, quiet]]]), homography)[0, 0]
+    expected = cv2.perspectiveTransform(np.float32([[[24, 24]]]), matrix)[0, 0]
+    assert np.hypot(*(point - expected)) < 6
+
+
+def test_no_finders_no_patch():
+    blank = np.full((300, 300), 255, dtype=np.uint8)
+    assert rectify_code(blank, DetectorContext(), []) is None
+
+
+def test_patch_follows_direct_attempt():
+    """Each backend tries the patch once, right after the direct attempt"""
+    skewed, _ = skew(make_code(box_size=4), [[200, 40], [600, 120], [560, 470], [160, 400]])
+    image = cv2.cvtColor(skewed, cv2.COLOR_GRAY2BGR)
+    reader = PrescriptionQRReader(race_workers=1)
+    image, geometry = reader.prepare_decode_image(image)
+    backends = ['first', 'second']
+    attempts = list(reader.ladder_attempts(image, geometry, backends))
+
+    for backend in backends:
+        transforms = [transform for name, _, transform, _ in attempts if name == backend]
+        assert isinstance(transforms[0], tuple)
+        assert isinstance(transforms[1], np.ndarray)
+        assert sum(isinstance(transform, np.ndarray) for transform in transforms) == 1
+
+
+def test_patch_polygon_in_input_coordinates():
+    """Polygons decoded from the patch are mapped back onto the skewed code"""
+    skewed, matrix = skew(make_code(box_size=4), [[200, 40], [600, 120], [560, 470], [160, 400]])
+    reader = PrescriptionQRReader(router=DecoderRouter(names=['opencv']))
+    image, geometry = reader.prepare_decode_image(cv2.cvtColor(skewed, cv2.COLOR_GRAY2BGR))
+    patch, homography = reader.rectified_patch(image, geometry)
+
+    result = reader._decode_attempt(reader.router.get('opencv'), patch, homography)
+    assert result['data'] == PAYLOAD
+    # The code spans 16..132 px of the generated image (4 px modules, 4 module border)
+    code_outline = cv2.perspectiveTransform(
+        np.float32([[[16, 16], [132, 16], [132, 132], [16, 132]]]), matrix)[0]
+    for x, y in result['polygon']:
+        assert np.min(np.hypot(*(code_outline - (x, y)).T)) < 12
+
+
+if __name__ == "__main__":
+    test_module_count_snaps_to_qr_sizes()
+    test_finder_patterns_ordered_in_code_orientation()
+    test_patch_is_fronto_parallel()
+    test_no_finders_no_patch()
+    test_patch_follows_direct_attempt()
+    test_patch_polygon_in_input_coordinates()
+    print("All rectification tests passed")
@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""
+Tests for capturing missed and slow scans and replaying them
+"""
+
+import base64
+import io
+import json
+import os
+import tempfile
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from image_ingest import load_image_bytes, read_image_metadata
+from load_test import ocr_only_label, unique_image
+from qr_images import qr_png
+import scan_capture
+from scan_capture import MB, CaptureStore, load_records, payload_digest, replay
+from synthetic_corpus import generate_sample
+
+HIT = {'success': True, 'qr_detected': True, 'raw_qr_data': "RX: 1234567",
+       'prescription_data': {'detection_method': 'QR_CODE'}}
+MISS = {'success': False, 'qr_detected': False, 'quality': {'ok': True, 'issues': []}}
+REJECTED = {'success': False, 'qr_detected': False, 'quality': {'ok': False, 'issues': ['blank']}}
+TIMINGS = {'decode_ms': 5.0, 'scan_ms': 95.0, 'total_ms': 100.0}
+
+
+def write_capture(store, reason, encoded, body):
+    image, metadata = load_image_bytes(encoded)
+    return store.write(reason, encoded, image, metadata, body, TIMINGS, 'file_upload')
+
+
+def test_capture_reasons():
+    with tempfile.TemporaryDirectory() as directory:
+        store = CaptureStore(directory, slow_ms=1000, capture_rejected=False)
+        assert store.reason(MISS, 10) == 'miss'
+        assert store.reason(REJECTED, 10) is None
+        assert store.reason(HIT, 10) is None
+        assert store.reason(HIT, 1500) == 'slow'
+        assert CaptureStore(directory, capture_rejected=True).reason(REJECTED, 10) == 'rejected'
+        assert CaptureStore(directory, slow_ms=0).reason(HIT, 10 ** 6) is None
+    assert CaptureStore(None).reason(MISS, 10) is None
+
+
+def test_write_and_evict():
+    encoded = qr_png()
+    with tempfile.TemporaryDirectory() as directory:
+        store = CaptureStore(directory, max_files=2)
+        first = write_capture(store, 'miss', encoded, MISS)
+        write_capture(store, 'slow', encoded, HIT)
+        third = write_capture(store, 'slow', encoded, HIT)
+
+        records = load_records(directory)
+        assert [record['id'] for record in records][-1] == third['id']
+        assert len(records) == 2 and first['id'] not in {record['id'] for record in records}
+        assert len(os.listdir(directory)) == 4
+        assert third['image'].endswith('.png') and third['result']['payload'] == "RX: 1234567"
+        assert third['timings'] == TIMINGS and not third['redacted']
+        with open(os.path.join(directory, third['image']), 'rb') as f:
+            assert f.read() == encoded
+
+        # The byte limit keeps only what fits
+        store.max_bytes = len(encoded) + 1
+        assert store.evict() == 1 and len(load_records(directory)) == 1
+
+
+def test_queue_holds_encoded_bytes_only():
+    encoded = qr_png()
+    image, metadata = load_image_bytes(encoded)
+    with tempfile.TemporaryDirectory() as directory:
+        store = CaptureStore(directory)
+        store._start_writer = lambda: None  # keep the captures queued
+        assert store.submit('miss', encoded, image, metadata, MISS, TIMINGS, 'file_upload')
+        size, item = store._queue.get_nowait()
+        # The decoded pixels aren't kept unless they are needed for redaction
+        assert size == len(encoded)
+        assert item[2] is None and item[3] == image.shape
+
+        redacting = CaptureStore(directory, redact=True)
+        redacting._start_writer = lambda: None
+        large = np.zeros((5000, 5000, 3), np.uint8)
+        assert redacting.submit('miss', encoded, large, metadata, MISS, TIMINGS, 'base64')
+        # Over the queue's byte bound while the first capture waits
+        original = scan_capture.QUEUE_BYTES
+        scan_capture.QUEUE_BYTES = 100 * MB
+        try:
+            assert not redacting.submit('miss', encoded, large, metadata, MISS, TIMINGS, 'base64')
+        finally:
+            scan_capture.QUEUE_BYTES = original
+        assert redacting.status()['dropped'] == 1
+
+
+def test_redaction():
+    # A JPEG with an EXIF orientation and GPS position
+    exif = Image.Exif()
+    exif[0x0112] = 6
+    exif[0x8825] = {1: 'N', 2: (40.0, 26.0, 46.0)}
+    upload = io.BytesIO()
+    Image.open(io.BytesIO(qr_png())).convert('RGB').save(upload, format='JPEG', exif=exif)
+
+    with tempfile.TemporaryDirectory() as directory:
+        record = write_capture(CaptureStore(directory, redact=True), 'slow',
+                               upload.getvalue(), HIT)
+        assert record['redacted'] and record['image'].endswith('.png')
+        assert 'payload' not in record['result']
+        assert record['result']['payload_sha256'] == payload_digest("RX: 1234567")
+
+        with open(os.path.join(directory, record['image']), 'rb') as f:
+            stored = f.read()
+        with Image.open(io.BytesIO(stored)) as image:
+            assert 0x8825 not in image.getexif()
+        # Stored upright, and still marked as such
+        assert read_image_metadata(stored)['orientation'] == 1
+        assert read_image_metadata(stored)['orientation_known']
+
+
+def test_api_captures_misses():
+    import prescription_api
+
+    client = prescription_api.app.test_client()
+    original = prescription_api.captures
+    with tempfile.TemporaryDirectory() as directory:
+        try:
+            prescription_api.captures = CaptureStore(directory, slow_ms=0)
+            # Unique bytes, so no other test's result is shared by single-flight
+            label = unique_image(ocr_only_label(generate_sample(11, 0, 'clean')))
+            slow_upload = unique_image(qr_png("RX: 7654321"))
+            body = client.post('/api/scan-qr', data={
+                'image': (io.BytesIO(label), 'label.jpg')}).get_json()
+            assert body['qr_detected'] is False
+            client.post('/api/scan-qr', data={'image': (io.BytesIO(qr_png()), 'label.png')})
+
+            # Any hit is slow with a 1 ms threshold; base64 uploads are stored decoded
+            prescription_api.captures.slow_ms = 0.001
+            client.post('/api/scan-qr', json={
+                'image': base64.b64encode(slow_upload).decode('ascii')})
+            prescription_api.captures.flush()
+        finally:
+            prescription_api.captures = original
+
+        records = load_records(directory)
+        assert [record['reason'] for record in records] == ['miss', 'slow']
+        miss, slow = records
+        assert miss['image'].endswith('.jpg') and miss['image_source'] == 'file_upload'
+        assert miss['timings']['total_ms'] >= miss['timings']['decode_ms'] > 0
+        assert miss['memory']['peak_mb'] > 0
+        assert slow['image_source'] == 'base64' and slow['result']['payload'] == "RX: 7654321"
+        with open(os.path.join(directory, slow['image']), 'rb') as f:
+            assert f.read() == slow_upload
+
+
+def test_replay_reports_changes():
+    label = ocr_only_label(generate_sample(11, 0, 'clean'))
+    with tempfile.TemporaryDirectory() as directory:
+        store = CaptureStore(directory)
+        write_capture(store, 'miss', qr_png(), MISS)  # missed before, decodes now
+        write_capture(store, 'miss', label, MISS)
+        write_capture(store, 'slow', qr_png(), HIT)
+        write_capture(store, 'slow', qr_png("RX: 9999999"), HIT)
+        ok, black = cv2.imencode('.png', np.zeros((200, 200, 3), np.uint8))
+        write_capture(store, 'miss', black.tobytes(), MISS)
+        # An image that no longer reads
+        broken = write_capture(store, 'miss', qr_png(), MISS)
+        with open(os.path.join(directory, broken['image']), 'wb') as f:
+            f.write(b'not an image')
+
+        results_path = os.path.join(directory, 'replay.jsonl')
+        report = replay(directory, workers=1, results_path=results_path, progress=None)
+        outcomes = [row['outcome'] for row in report['captures_detail']]
+        assert outcomes == ['recovered', 'still_missed', 'same', 'changed',
+                            'still_missed', 'error']
+        assert report['captures'] == 6 and report['misses'] == 4
+        assert report['recovered'] == 1 and report['recovery_rate'] == 0.25
+        assert all('delta_ms' in row for row in report['captures_detail'][:5])
+        assert report['captured_p50_ms'] == 100.0 and report['replay_p50_ms'] > 0
+        with open(results_path, encoding='utf-8') as f:
+            assert len([json.loads(line) for line in f]) == 6
+
+
+if __name__ == "__main__":
+    test_capture_reasons()
+    test_write_and_evict()
+    test_queue_holds_encoded_bytes_only()
+    test_redaction()
+    test_api_captures_misses()
+    test_replay_reports_changes()
+    print("All scan capture tests passed")
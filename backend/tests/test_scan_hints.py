@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+Tests for client-supplied scan hints
+"""
+
+import base64
+import io
+
+import cv2
+import numpy as np
+
+from prescription_qr_reader import PrescriptionQRReader
+from qr_images import make_qr_bgr
+from scan_hints import parse_scan_hints
+
+
+def two_code_frame():
+    """Two different codes side by side; the second starts at x=400"""
+    frame = np.full((300, 700, 3), 255, dtype=np.uint8)
+    first, second = make_qr_bgr("RX: 1111111"), make_qr_bgr("RX: 2222222")
+    frame[20:20 + first.shape[0], 20:20 + first.shape[1]] = first
+    frame[20:20 + second.shape[0], 400:400 + second.shape[1]] = second
+    return frame, (400, 20, second.shape[1], second.shape[0])
+
+
+def test_parse_hints():
+    hints = parse_scan_hints('{"roi": [10, 20, 300.4, 200], "symbology": "ean13", '
+                             '"mode": "qr_only", "rotation": 90, "payload_format": "xml"}')
+    assert hints == {'roi': (10, 20, 300, 200), 'symbologies': ('EAN13',),
+                     'payload_format': 'xml', 'mode': 'qr_only', 'rotation': 90}
+    assert parse_scan_hints(None)['mode'] == 'auto'
+
+    for bad in ['[1, 2]', '{"colour": "red"}', '{"roi": [0, 0, -5, 10]}',
+                '{"symbology": "PDF417"}', '{"mode": "fast"}', '{"rotation": 45}', 'not json']:
+        try:
+            parse_scan_hints(bad)
+        except ValueError:
+            continue
+        raise AssertionError(f"{bad} should be rejected")
+
+
+def test_roi_narrows_decoding_to_one_code():
+    reader = PrescriptionQRReader(race_workers=1)
+    frame, roi = two_code_frame()
+    hints = parse_scan_hints({'roi': list(roi), 'symbology': 'QRCODE'})
+    payload, report = reader.scan_payload(frame, hints=hints)
+    assert payload == "RX: 2222222"
+    assert report['used'] == ['symbology', 'roi']
+    assert report['attempts'] >= 1
+
+    # A region outside the frame is ignored rather than failing the scan
+    payload, report = reader.scan_payload(frame, hints=parse_scan_hints({'roi': [5000, 0, 50, 50]}))
+    assert payload == "RX: 1111111"
+    assert report['ignored'] == ['roi']
+
+
+def test_roi_is_rescaled_with_a_reduced_decode():
+    reader = PrescriptionQRReader(race_workers=1)
+    frame, roi = two_code_frame()
+    # The client's box is in the pixels of an upload twice this size,
+    # which ingestion decoded at half size
+    upload_roi = [2 * value for value in roi]
+    hints = parse_scan_hints({'roi': upload_roi, 'symbology': 'QRCODE'})
+    payload, report = reader.scan_payload(frame, hints=hints, decode_scale=0.5)
+    assert payload == "RX: 2222222"
+    assert report['used'] == ['symbology', 'roi']
+
+
+def test_ocr_only_skips_decoding():
+    reader = PrescriptionQRReader()
+    payload, report = reader.scan_payload(make_qr_bgr("RX: 1234567"),
+                                          hints=parse_scan_hints({'mode': 'ocr_only'}))
+    # The code is never decoded (and tesseract may not be installed)
+    assert payload is None or not payload.startswith("RX: 1234567")
+    assert report['skipped_stages'] == ['decode']
+    assert report['used'] == ['mode']
+    assert report['attempts_saved'] > 0
+
+
+def test_qr_only_skips_barcodes_and_ocr():
+    reader = PrescriptionQRReader(race_workers=1)
+    blank = np.full((240, 320, 3), 200, dtype=np.uint8)
+    blank[100:140, 100:220] = 40
+    payload, report = reader.scan_payload(blank, hints=parse_scan_hints({'mode': 'qr_only'}))
+    assert payload is None
+    assert report['skipped_stages'] == ['barcode', 'ocr']
+    assert report['attempts_saved'] >= reader.planned_ocr_passes(blank)
+
+    # Without hints the same frame also runs the barcode stage
+    _, unhinted = reader.scan_payload(blank)
+    assert unhinted['attempts'] > report['attempts']
+
+
+def test_barcode_symbology_skips_qr_ladder():
+    reader = PrescriptionQRReader()
+    _, report = reader.scan_payload(make_qr_bgr("RX: 1234567"),
+                                    hints=parse_scan_hints({'symbology': ['EAN13', 'UPCA'],
+                                                            'mode': 'qr_only'}))
+    assert report['skipped_stages'][0] == 'qr'
+
+
+def test_rotation_hint_skips_rotated_ocr_passes():
+    reader = PrescriptionQRReader()
+    blank = np.full((240, 320, 3), 200, dtype=np.uint8)
+    _, report = reader.scan_payload(blank, hints=parse_scan_hints({'rotation': 90}))
+    assert 'rotation' in report['used']
+    assert report['attempts_saved'] >= len(reader.text_rotations())
+
+
+def test_payload_format_hint():
+    reader = PrescriptionQRReader()
+    xml = "<prescription><patient>Jane Doe</patient><rx>1234567</rx></prescription>"
+    report = {'used': [], 'ignored': []}
+    parsed = reader.parse_prescription_data(xml, 'xml', report)
+    assert parsed['patient_name'] == 'Jane Doe'
+    assert report['used'] == ['payload_format']
+
+    # A payload that isn't in the hinted format is sniffed as usual
+    report = {'used': [], 'ignored': []}
+    parsed = reader.parse_prescription_data("PATIENT: John Roe\nRX: 7654321", 'xml', report)
+    assert parsed['patient_name'] == 'John Roe'
+    assert report['ignored'] == ['payload_format']
+
+
+def test_scan_api_reports_hints():
+    import prescription_api
+
+    client = prescription_api.app.test_client()
+    frame, roi = two_code_frame()
+    _, png = cv2.imencode('.png', frame)
+    image = 'data:image/png;base64,' + base64.b64encode(png.tobytes()).decode('ascii')
+
+    body = client.post('/api/scan-qr', json={
+        'image': image, 'hints': {'roi': list(roi), 'mode': 'qr_only'}}).get_json()
+    assert body['raw_qr_data'] == "RX: 2222222"
+    assert set(body['hints']['used']) == {'roi', 'mode'}
+
+    # Multipart uploads send hints as a JSON form field
+    response = client.post('/api/scan-qr', data={
+        'image': (io.BytesIO(png.tobytes()), 'frame.png'),
+        'hints': '{"mode": "sideways"}'})
+    assert response.status_code == 400
+    assert 'mode' in response.get_json()['message']
+
+    plain = client.post('/api/scan-qr', json={'image': image}).get_json()
+    assert plain['raw_qr_data'] == "RX: 1111111" and 'hints' not in plain
+
+
+if __name__ == "__main__":
+    test_parse_hints()
+    test_roi_narrows_decoding_to_one_code()
+    test_roi_is_rescaled_with_a_reduced_decode()
+    test_ocr_only_skips_decoding()
+    test_qr_only_skips_barcodes_and_ocr()
+    test_barcode_symbology_skips_qr_ladder()
+    test_rotation_hint_skips_rotated_ocr_passes()
+    test_payload_format_hint()
+    test_scan_api_reports_hints()
+    print("All scan hint tests passed")
@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+"""
+Tests for the durable scan job queue and the asynchronous scan API
+"""
+
+import io
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+
+
+from qr_images import qr_png
+from scan_jobs import DONE, FAILED, QUEUED, RUNNING, JobQueue, run_worker
+
+
+def make_queue(tmp, **kwargs):
+    return JobQueue(os.path.join(tmp, 'jobs.sqlite3'), **kwargs)
+
+
+def test_submit_claim_complete():
+    with tempfile.TemporaryDirectory() as tmp:
+        queue = make_queue(tmp)
+        job_id, created = queue.submit(b'image bytes', 'file_upload')
+        assert created
+        assert queue.get(job_id)['status'] == QUEUED
+
+        job = queue.claim()
+        assert job['id'] == job_id and job['image'] == b'image bytes'
+        assert job['attempts'] == 1
+        assert queue.get(job_id)['status'] == RUNNING
+        # Leased jobs are not handed out twice
+        assert queue.claim() is None
+
+        assert queue.complete(job_id, job['lease'], {'body': {'success': True}, 'status': 200})
+        done = queue.get(job_id)
+        assert done['status'] == DONE
+        assert done['result'] == {'body': {'success': True}, 'status': 200}
+
+
+def test_resubmitting_a_job_id_is_idempotent():
+    with tempfile.TemporaryDirectory() as tmp:
+        queue = make_queue(tmp)
+        assert queue.submit(b'a', 'base64', 'retry-1') == ('retry-1', True)
+        assert queue.submit(b'a', 'base64', 'retry-1') == ('retry-1', False)
+        assert queue.metrics()['queue_depth'] == 1
+
+
+def test_expired_lease_is_reclaimed_until_max_attempts():
+    """A worker that dies mid-scan loses its lease; the last lost attempt fails the job"""
+    with tempfile.TemporaryDirectory() as tmp:
+        queue = make_queue(tmp, visibility_timeout=0.05, max_attempts=2)
+        job_id, _ = queue.submit(b'image', 'file_upload')
+        first = queue.claim()
+        time.sleep(0.1)
+        assert queue.metrics()['expired_leases'] == 1
+
+        second = queue.claim()
+        assert second['id'] == job_id and second['attempts'] == 2
+        # The first worker's late result is ignored
+        assert not queue.complete(job_id, first['lease'], {'late': True})
+
+        time.sleep(0.1)
+        assert queue.claim() is None
+        assert queue.get(job_id)['status'] == FAILED
+
+
+def test_failed_attempts_are_retried():
+    with tempfile.TemporaryDirectory() as tmp:
+        queue = make_queue(tmp, max_attempts=2)
+        job_id, _ = queue.submit(b'image', 'file_upload')
+        job = queue.claim()
+        assert queue.fail(job_id, job['lease'], 'ValueError: decoder crashed')
+        retried = queue.get(job_id)
+        assert retried['status'] == QUEUED and retried['error'] == 'ValueError: decoder crashed'
+        # Retries wait a little before they become visible again
+        assert queue.claim() is None
+
+        with queue._connection() as connection:
+            connection.execute('UPDATE jobs SET visible_at = 0')
+        job = queue.claim()
+        assert job['attempts'] == 2
+        queue.fail(job_id, job['lease'], 'ValueError: decoder crashed')
+        assert queue.get(job_id)['status'] == FAILED
+
+
+def test_results_expire_after_ttl():
+    with tempfile.TemporaryDirectory() as tmp:
+        queue = make_queue(tmp, result_ttl=0.05)
+        job_id, _ = queue.submit(b'image', 'file_upload')
+        job = queue.claim()
+        queue.complete(job_id, job['lease'], {'status': 200})
+        assert queue.get(job_id) is not None
+        time.sleep(0.1)
+        assert queue.get(job_id) is None
+        assert queue.purge() == 1
+        assert queue.metrics()['jobs'][DONE] == 0
+
+
+def test_resubmitting_an_expired_job_queues_it_again():
+    with tempfile.TemporaryDirectory() as tmp:
+        queue = make_queue(tmp, result_ttl=0.05)
+        queue.submit(b'image', 'file_upload', 'retry-1')
+        job = queue.claim()
+        queue.complete('retry-1', job['lease'], {'status': 200})
+        time.sleep(0.1)
+        # Expired but not purged yet: replaced rather than ignored
+        assert queue.submit(b'image', 'file_upload', 'retry-1') == ('retry-1', True)
+        assert queue.get('retry-1')['status'] == QUEUED
+        assert queue.claim()['id'] == 'retry-1'
+
+
+def test_metrics_report_depth_and_age():
+    with tempfile.TemporaryDirectory() as tmp:
+        queue = make_queue(tmp)
+        assert queue.metrics()['oldest_queued_age_seconds'] == 0.0
+        for index in range(3):
+            queue.submit(b'image', 'file_upload', f'job-{index}')
+        time.sleep(0.05)
+        queue.claim()
+        metrics = queue.metrics()
+        assert metrics['queue_depth'] == 2
+        assert metrics['jobs'][RUNNING] == 1
+        assert metrics['oldest_queued_age_seconds'] >= 0.05
+
+
+def _drain(path, counts):
+    ran = run_worker(JobQueue(path), lambda image, source: {'length': len(image)},
+                     stop=_StopWhenEmpty(JobQueue(path)))
+    counts.put(ran)
+
+
+class _StopWhenEmpty(threading.Event):
+    """Stops a worker once nothing is left to claim"""
+
+    def __init__(self, queue):
+        super().__init__()
+        self.queue = queue
+
+    def is_set(self):
+        return self.queue.metrics()['queue_depth'] == 0
+
+
+def test_worker_processes_drain_the_queue():
+    """Each job runs exactly once across several worker processes"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'jobs.sqlite3')
+        queue = JobQueue(path)
+        ids = [queue.submit(b'x' * index, 'file_upload')[0] for index in range(1, 41)]
+
+        counts = multiprocessing.Queue()
+        workers = [multiprocessing.Process(target=_drain, args=(path, counts)) for _ in range(3)]
+        for worker in workers:
+            worker.start()
+        ran = sum(counts.get(timeout=60) for _ in workers)
+        for worker in workers:
+            worker.join()
+
+        assert ran == 40
+        for index, job_id in enumerate(ids, start=1):
+            job = queue.get(job_id)
+            assert job['status'] == DONE and job['attempts'] == 1
+            assert job['result'] == {'length': index}
+
+
+def test_scan_job_api():
+    """Submit, run one worker pass, then poll for the /api/scan-qr response"""
+    import prescription_api
+
+    with tempfile.TemporaryDirectory() as tmp:
+        prescription_api.scan_jobs = make_queue(tmp)
+        client = prescription_api.app.test_client()
+
+        upload = qr_png("RX: 1234567\nPATIENT: Jane Doe")
+        response = client.post('/api/scan-jobs', headers={'Idempotency-Key': 'label-1'},
+                               data={'image': (io.BytesIO(upload), 'label.png')})
+        assert response.status_code == 202
+        job_id = response.get_json()['job_id']
+        assert response.headers['Location'] == f'/api/scan-jobs/{job_id}'
+        assert client.get(f'/api/scan-jobs/{job_id}').get_json()['status'] == QUEUED
+
+        # The same key doesn't queue the image twice
+        again = client.post('/api/scan-jobs', headers={'Idempotency-Key': 'label-1'},
+                            data={'image': (io.BytesIO(upload), 'label.png')})
+        assert again.get_json()['job_id'] == job_id and not again.get_json()['created']
+        assert client.get('/api/scan-jobs/metrics').get_json()['queue_depth'] == 1
+
+        # The key is bound to the image: another image under it is another job
+        different = client.post('/api/scan-jobs', headers={'Idempotency-Key': 'label-1'},
+                                data={'image': (io.BytesIO(qr_png("RX: 7654321")), 'label.png')})
+        assert different.get_json()['job_id'] != job_id and different.get_json()['created']
+
+        from scan_jobs import _scan_handler
+        assert run_worker(prescription_api.scan_jobs, _scan_handler, max_jobs=2) == 2
+        job = client.get(f'/api/scan-jobs/{job_id}').get_json()
+        assert job['status'] == DONE
+        assert job['result_status'] == 200
+        assert job['result']['raw_qr_data'] == "RX: 1234567\nPATIENT: Jane Doe"
+
+        assert client.get('/api/scan-jobs/unknown').status_code == 404
+        assert client.post('/api/scan-jobs', json={'image': 'not base64!'}).status_code == 400
+
+
+if __name__ == "__main__":
+    test_submit_claim_complete()
+    test_resubmitting_a_job_id_is_idempotent()
+    test_expired_lease_is_reclaimed_until_max_attempts()
+    test_failed_attempts_are_retried()
+    test_results_expire_after_ttl()
+    test_resubmitting_an_expired_job_queues_it_again()
+    test_metrics_report_depth_and_age()
+    test_worker_processes_drain_the_queue()
+    test_scan_job_api()
+    print("All scan job tests passed")
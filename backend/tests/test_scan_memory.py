@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+Tests for per-scan memory accounting and the memory budget
+"""
+
+import io
+
+import cv2
+import numpy as np
+
+from detector_context import BufferArena
+from image_ingest import load_image_bytes
+from prescription_qr_reader import PrescriptionQRReader
+from qr_images import make_qr_bgr, qr_png
+from scan_hints import parse_scan_hints
+from scan_memory import MB, ScanMemory, input_pixel_limit, traced
+
+
+def large_qr_frame(data="RX: 1234567", size=2400):
+    """A code with wide modules in the middle of a large white frame"""
+    qr = make_qr_bgr(data, box_size=24)
+    frame = np.full((size, size, 3), 255, dtype=np.uint8)
+    offset = (size - qr.shape[0]) // 2
+    frame[offset:offset + qr.shape[0], offset:offset + qr.shape[1]] = qr
+    return frame
+
+
+def test_accounting():
+    memory = ScanMemory(10 * MB)
+    memory.charge(6 * MB)
+    assert memory.fits(4 * MB) and not memory.fits(5 * MB)
+    assert memory.headroom() == 4 * MB
+    memory.release(6 * MB)
+    memory.charge(2 * MB)
+    assert memory.peak == 6 * MB and memory.held == 2 * MB
+
+    memory.degrade('downscaled')
+    memory.degrade('downscaled')
+    assert memory.summary() == {'peak_mb': 6.0, 'budget_mb': 10.0, 'degraded': ['downscaled']}
+
+    unlimited = ScanMemory(0)
+    assert unlimited.fits(10 ** 12) and unlimited.headroom() is None
+    assert input_pixel_limit(0) is None
+    assert input_pixel_limit(300 * MB) == 50 * MB
+
+
+def test_arena_charges_its_meter():
+    arena = BufferArena()
+    memory = ScanMemory(0)
+    with arena.metered(memory):
+        with arena.scan():
+            arena.acquire((1000, 1000))
+            arena.acquire((1000, 1000))
+            assert memory.held == 2000000
+        assert memory.held == 0
+        # Reused buffers are charged again by the next scan
+        with arena.scan():
+            arena.acquire((1000, 1000))
+            assert memory.held == 1000000
+    assert memory.peak == 2000000
+    assert arena.meter is None
+
+
+def test_reduced_decode_on_ingestion():
+    pixels = large_qr_frame(size=1600)
+    for fmt in ('.jpg', '.png'):
+        ok, encoded = cv2.imencode(fmt, pixels)
+        image, metadata = load_image_bytes(encoded.tobytes(), max_pixels=1600 * 1600 // 4)
+        assert image.shape == (800, 800, 3) and metadata['decode_scale'] == 0.5
+
+        image, metadata = load_image_bytes(encoded.tobytes(), max_pixels=1600 * 1600)
+        assert image.shape == (1600, 1600, 3) and metadata['decode_scale'] == 1.0
+
+    # Beyond 1/8 the decoded image is resized down to the limit
+    ok, encoded = cv2.imencode('.jpg', pixels)
+    image, metadata = load_image_bytes(encoded.tobytes(), max_pixels=10000)
+    assert image.shape[0] * image.shape[1] <= 10000
+    assert metadata['decode_scale'] < 0.125
+
+
+def test_budget_skips_variants():
+    reader = PrescriptionQRReader()
+    image = large_qr_frame(size=1000)
+    arena = reader.context.arena()
+
+    memory = ScanMemory(0)
+    with arena.metered(memory), arena.scan():
+        assert len(reader.preprocess_image_for_qr(image)) == 6
+    assert memory.degraded == []
+
+    # Room for the gray copy and one more variant only
+    memory = ScanMemory(int(2.5 * image.shape[0] * image.shape[1]))
+    with arena.metered(memory), arena.scan():
+        variants = reader.preprocess_image_for_qr(image)
+    assert len(variants) == 2
+    assert memory.degraded == ['skipped_variants']
+
+
+def test_budget_downscales_and_still_decodes():
+    reader = PrescriptionQRReader(race_workers=1)
+    image = large_qr_frame()
+
+    unlimited = ScanMemory(0)
+    assert reader.scan_payload(image, memory=unlimited)[0] == "RX: 1234567"
+
+    # The input alone takes 16.5 MB; leave half a megabyte for the ladder
+    memory = ScanMemory(image.nbytes + MB // 2)
+    assert reader.scan_payload(image, memory=memory)[0] == "RX: 1234567"
+    assert 'downscaled' in memory.degraded
+    assert memory.peak <= memory.budget_bytes < unlimited.peak
+
+
+def test_rotated_copy_is_released():
+    reader = PrescriptionQRReader(race_workers=1)
+    blank = np.full((240, 320, 3), 200, dtype=np.uint8)
+    memory = ScanMemory(0)
+    reader.scan_payload(blank, hints=parse_scan_hints({'rotation': 90}), memory=memory)
+    assert memory.held == 0
+    assert memory.peak >= 2 * blank.nbytes
+
+
+def test_traced_peak():
+    memory = ScanMemory()
+    with traced(memory, enabled=True):
+        buffer = np.ones((1000, 1000), dtype=np.uint8)
+        del buffer
+    assert memory.traced_peak >= 1000000
+    assert 'traced_peak_mb' in memory.summary()
+
+
+def test_scan_api_reports_memory():
+    import prescription_api
+
+    body = prescription_api.app.test_client().post(
+        '/api/scan-qr', data={'image': (io.BytesIO(qr_png("RX: 7654321")), 'label.png')}).get_json()
+    assert body['raw_qr_data'] == "RX: 7654321"
+    assert body['memory']['peak_mb'] > 0
+    assert body['memory']['degraded'] == []
+
+
+if __name__ == "__main__":
+    test_accounting()
+    test_arena_charges_its_meter()
+    test_reduced_decode_on_ingestion()
+    test_budget_skips_variants()
+    test_budget_downscales_and_still_decodes()
+    test_rotated_copy_is_released()
+    test_traced_peak()
+    test_scan_api_reports_memory()
+    print("All scan memory tests passed")
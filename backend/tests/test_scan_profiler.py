@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+Tests for the on-demand request profiler and /debug/profile
+"""
+
+import io
+import threading
+import time
+
+from prescription_qr_reader import PrescriptionQRReader
+from qr_images import qr_png
+from scan_profiler import ScanProfiler
+from synthetic_corpus import generate_sample
+
+
+def profiled_scans(profiler, images, reader):
+    """Scan each image as one request on its own thread, as the API does"""
+    def request(image):
+        token = profiler.begin()
+        try:
+            reader.scan_payload(image)
+        finally:
+            profiler.end(token)
+
+    for image in images:
+        thread = threading.Thread(target=request, args=(image,))
+        thread.start()
+        thread.join()
+
+
+def test_disabled_until_armed():
+    profiler = ScanProfiler()
+    assert profiler.begin() is None
+    profiler.end(None)
+    assert profiler.status() == {'status': 'idle'}
+    assert profiler.report()['collapsed'] == ''
+
+    for options in [{'requests': 0}, {'requests': 1.5}, {'seconds': -1}, {'seconds': 3600},
+                    {'mode': 'perf'}, {'interval_ms': 0.1}]:
+        try:
+            profiler.arm(**options)
+        except ValueError:
+            continue
+        raise AssertionError(f"{options} should be rejected")
+
+
+def test_sampling_next_requests():
+    profiler = ScanProfiler()
+    reader = PrescriptionQRReader(race_workers=2)
+    images = [generate_sample(11, index, 'mixed')['image'] for index in range(3)]
+
+    profiler.arm(requests=2, interval_ms=1)
+    profiled_scans(profiler, images, reader)
+    status = profiler.status()
+    assert status['status'] == 'done' and status['requests_profiled'] == 2
+    assert status['samples'] > 0 and not profiler.armed
+
+    lines = profiler.collapsed().splitlines()
+    stack, count = lines[0].rsplit(' ', 1)
+    assert int(count) >= 1 and ';' in stack
+    # Attempts decoding on the race threads are sampled too
+    assert any('_worker (thread.py' in line and 'decode' in line for line in lines)
+
+    top = {row['function'].split(' ')[0]: row for row in profiler.top_functions()}
+    assert 'scan_payload' in top
+    assert top['scan_payload']['cumulative_ms'] >= top['scan_payload']['self_ms']
+
+
+def test_cprofile_mode():
+    profiler = ScanProfiler()
+    reader = PrescriptionQRReader(race_workers=1)
+    image = generate_sample(11, 0, 'clean')['image']
+
+    profiler.arm(requests=1, mode='cprofile')
+    profiled_scans(profiler, [image, image], reader)
+    top = {row['function'].split(' ')[0]: row for row in profiler.top_functions(100)}
+    assert top['enhanced_qr_detection']['calls'] == 1
+    assert top['scan_payload']['cumulative_ms'] > 0
+
+
+def test_cprofile_one_request_at_a_time():
+    profiler = ScanProfiler()
+    profiler.arm(requests=3, mode='cprofile')
+    first = profiler.begin()
+    # Overlapping requests are sampled, not traced
+    second = profiler.begin()
+    assert first[2] is not None and second[2] is None
+    profiler.end(second)
+    profiler.end(first)
+    third = profiler.begin()
+    assert third[2] is not None
+    profiler.end(third)
+    assert profiler.status()['status'] == 'done'
+    assert profiler.status()['requests_in_flight'] == 0
+
+
+def test_cprofile_falls_back_when_another_profiler_runs():
+    import cProfile
+
+    other = cProfile.Profile()
+    other.enable()
+    try:
+        profiler = ScanProfiler()
+        profiler.arm(requests=1, mode='cprofile')
+        token = profiler.begin()
+    finally:
+        other.disable()
+    # Before Python 3.12 a second cProfile replaces the first; from 3.12 it
+    # can't start and the request is only sampled
+    profiler.end(token)
+    assert profiler.status()['status'] == 'done'
+    assert not profiler._cprofile_running
+
+
+def test_time_window_expires():
+    profiler = ScanProfiler()
+    profiler.arm(seconds=0.05)
+    time.sleep(0.1)
+    assert profiler.begin() is None
+    assert profiler.status()['status'] == 'done'
+
+
+def test_debug_profile_endpoint():
+    import prescription_api
+
+    client = prescription_api.app.test_client()
+    original = prescription_api.profiler
+    try:
+        # Without a configured token the endpoint doesn't exist
+        prescription_api.profiler = ScanProfiler(token=None)
+        assert client.post('/debug/profile', json={'requests': 1}).status_code == 404
+
+        prescription_api.profiler = ScanProfiler(token='s3cret')
+        assert client.post('/debug/profile', json={'requests': 1}).status_code == 401
+        headers = {'Authorization': 'Bearer s3cret'}
+        assert client.post('/debug/profile', json={'requests': 1, 'colour': 1},
+                           headers=headers).status_code == 400
+
+        armed = client.post('/debug/profile', json={'requests': 1, 'interval_ms': 1},
+                            headers=headers)
+        assert armed.status_code == 202 and armed.get_json()['status'] == 'armed'
+
+        client.post('/api/scan-qr', data={'image': (io.BytesIO(qr_png()), 'label.png')})
+        client.get('/health')  # after the quota, not profiled
+
+        report = client.get('/debug/profile', headers=headers).get_json()
+        assert report['status'] == 'done' and report['requests_profiled'] == 1
+        assert isinstance(report['top_functions'], list)
+        collapsed = client.get('/debug/profile?format=collapsed', headers=headers)
+        assert collapsed.mimetype == 'text/plain'
+        assert client.delete('/debug/profile', headers=headers).status_code == 200
+    finally:
+        prescription_api.profiler = original
+
+
+if __name__ == "__main__":
+    test_disabled_until_armed()
+    test_sampling_next_requests()
+    test_cprofile_mode()
+    test_cprofile_one_request_at_a_time()
+    test_cprofile_falls_back_when_another_profiler_runs()
+    test_time_window_expires()
+    test_debug_profile_endpoint()
+    print("All profiler tests passed")
@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+"""
+Tests for single-flight coalescing of identical scan requests
+"""
+
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+
+from single_flight import SingleFlight, fcntl, flight_key
+
+
+def slow_compute(calls, result, delay=0.3):
+    def compute():
+        calls.append(1)
+        time.sleep(delay)
+        return result
+    return compute
+
+
+def run_in_threads(flights, key, compute, count):
+    results = []
+
+    def call():
+        results.append(flights.run(key, compute))
+
+    threads = [threading.Thread(target=call) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+        time.sleep(0.01)
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def test_concurrent_threads_share_one_run():
+    with tempfile.TemporaryDirectory() as tmp:
+        flights = SingleFlight(tmp)
+        calls = []
+        results = run_in_threads(flights, 'scan', slow_compute(calls, {'data': 'RX: 1'}), 4)
+        assert len(calls) == 1
+        assert [result for result, _ in results] == [{'data': 'RX: 1'}] * 4
+        assert sorted(shared for _, shared in results) == [False, True, True, True]
+
+
+def test_late_retry_gets_result_within_ttl():
+    with tempfile.TemporaryDirectory() as tmp:
+        calls = []
+        compute = slow_compute(calls, ['body', 200], delay=0)
+        assert SingleFlight(tmp).run('scan', compute) == (['body', 200], False)
+        if fcntl is not None:
+            # A retry, even in another process, is answered from the result file
+            assert SingleFlight(tmp).run('scan', compute) == (['body', 200], True)
+            assert len(calls) == 1
+        # Past the TTL the image is scanned again
+        assert SingleFlight(tmp, ttl=0).run('scan', compute) == (['body', 200], False)
+        assert SingleFlight(tmp).run('other', compute)[1] is False
+
+
+def test_leader_error_reaches_waiting_threads():
+    with tempfile.TemporaryDirectory() as tmp:
+        flights = SingleFlight(tmp)
+
+        def failing():
+            time.sleep(0.2)
+            raise ValueError("decoder crashed")
+
+        errors = []
+
+        def call():
+            try:
+                flights.run('scan', failing)
+            except ValueError as e:
+                errors.append(str(e))
+
+        threads = [threading.Thread(target=call) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert errors == ["decoder crashed"] * 3
+        # Nothing cached: the next request runs again
+        assert flights.run('scan', lambda: 'ok') == ('ok', False)
+
+
+def _process_scan(directory, counter_path, results):
+    def compute():
+        with open(counter_path, 'a') as f:
+            f.write('x')
+        time.sleep(0.5)
+        return {'data': 'RX: 2'}
+    results.put(SingleFlight(directory).run('scan', compute))
+
+
+def test_worker_processes_share_one_run():
+    if fcntl is None:
+        return
+    with tempfile.TemporaryDirectory() as tmp:
+        counter = os.path.join(tmp, 'calls.txt')
+        results = multiprocessing.Queue()
+        processes = [multiprocessing.Process(target=_process_scan, args=(tmp, counter, results))
+                     for _ in range(3)]
+        for process in processes:
+            process.start()
+        outcomes = [results.get(timeout=30) for _ in processes]
+        for process in processes:
+            process.join()
+
+        with open(counter) as f:
+            assert f.read() == 'x'
+        assert all(result == {'data': 'RX: 2'} for result, _ in outcomes)
+        assert sorted(shared for _, shared in outcomes) == [False, True, True]
+
+
+def test_flight_keys():
+    image = b'\xff\xd8 jpeg bytes'
+    assert flight_key('file_upload', image) == flight_key('file_upload', image)
+    assert flight_key('file_upload', image) != flight_key('base64', image)
+    assert flight_key('idempotency', 'retry-1') != flight_key('idempotency', 'retry-2')
+    assert len(flight_key('idempotency', '../../etc/passwd')) == 32
+
+
+def test_expired_results_are_deleted():
+    if fcntl is None:
+        return
+    with tempfile.TemporaryDirectory() as tmp:
+        compute = slow_compute([], {'data': 'RX: 1'}, delay=0)
+        SingleFlight(tmp).run('scan', compute)
+        lock_path, result_path = SingleFlight(tmp)._paths('scan')
+        assert os.path.exists(result_path)
+        past = time.time() - 60
+        os.utime(result_path, (past, past))
+        assert SingleFlight(tmp, ttl=30)._read_result(result_path) is None
+        assert not os.path.exists(result_path)
+
+
+def test_results_are_swept_after_ttl():
+    """No later request is needed for an expired result to be deleted"""
+    if fcntl is None:
+        return
+    with tempfile.TemporaryDirectory() as tmp:
+        flights = SingleFlight(tmp, ttl=0.2)
+        flights.run('scan', slow_compute([], {'data': 'RX: 1'}, delay=0))
+        _, result_path = flights._paths('scan')
+        assert os.path.exists(result_path)
+        time.sleep(0.6)
+        assert not os.path.exists(result_path)
+        assert flights._sweeper is None
+
+
+def test_readable_directory_is_not_used():
+    """Results aren't written where other users could read them"""
+    if fcntl is None:
+        return
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chmod(tmp, 0o755)
+        calls = []
+        compute = slow_compute(calls, {'data': 'RX: 1'}, delay=0)
+        assert SingleFlight(tmp).run('scan', compute) == ({'data': 'RX: 1'}, False)
+        assert SingleFlight(tmp).run('scan', compute) == ({'data': 'RX: 1'}, False)
+        assert len(calls) == 2 and os.listdir(tmp) == []
+
+        private = os.path.join(tmp, 'flights')
+        SingleFlight(private).run('scan', compute)
+        assert os.stat(private).st_mode & 0o777 == 0o700
+
+
+def test_idempotency_key_is_bound_to_the_image():
+    import io
+
+    import prescription_api
+    from qr_images import qr_png
+
+    def upload(data):
+        return {'image': (io.BytesIO(qr_png(data)), 'label.png')}
+
+    client = prescription_api.app.test_client()
+    original = prescription_api.scan_flights
+    headers = {'Idempotency-Key': 'label-1'}
+    with tempfile.TemporaryDirectory() as tmp:
+        try:
+            prescription_api.scan_flights = SingleFlight(tmp)
+            first = client.post('/api/scan-qr', data=upload("RX: 1111111"), headers=headers)
+            assert first.get_json()['shared_result'] is False
+            # The same key with another image is a separate scan
+            other = client.post('/api/scan-qr', data=upload("RX: 2222222"), headers=headers)
+            assert other.get_json()['raw_qr_data'] == "RX: 2222222"
+            assert other.get_json()['shared_result'] is False
+            retry = client.post('/api/scan-qr', data=upload("RX: 1111111"), headers=headers)
+            assert retry.get_json()['raw_qr_data'] == "RX: 1111111"
+            assert retry.get_json()['shared_result'] is True
+        finally:
+            prescription_api.scan_flights = original
+
+
+if __name__ == "__main__":
+    test_concurrent_threads_share_one_run()
+    test_late_retry_gets_result_within_ttl()
+    test_leader_error_reaches_waiting_threads()
+    test_worker_processes_share_one_run()
+    test_flight_keys()
+    test_expired_results_are_deleted()
+    test_results_are_swept_after_ttl()
+    test_readable_directory_is_not_used()
+    test_idempotency_key_is_bound_to_the_image()
+    print("All single-flight tests passed")
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Tests for the deterministic synthetic label corpus
+"""
+
+import json
+import os
+import tempfile
+
+import numpy as np
+
+from prescription_qr_reader import PrescriptionQRReader
+from synthetic_corpus import (PAYLOAD_FORMATS, encode_payload, evaluate,
+                              generate_corpus, generate_sample, make_prescription)
+
+
+def test_same_seed_same_samples():
+    for index in range(3):
+        first = generate_sample(11, index)
+        second = generate_sample(11, index)
+        assert first['jpeg'] == second['jpeg']
+        assert first['truth'] == second['truth']
+    assert generate_sample(12, 0)['jpeg'] != generate_sample(11, 0)['jpeg']
+
+
+def test_uneven_profile_shades_the_same_labels():
+    """Shading is drawn last, so it doesn't shift the mixed profile's other parameters"""
+    mixed = generate_sample(11, 0, profile='mixed')['truth']
+    uneven = generate_sample(11, 0, profile='uneven')['truth']
+    assert mixed['shading'] == 0.0 and 0.3 <= uneven['shading'] <= 0.85
+    for key in ['payload', 'rotation', 'blur_sigma', 'gamma', 'module_px']:
+        assert mixed[key] == uneven[key]
+
+
+def test_ground_truth_matches_parser():
+    reader = PrescriptionQRReader()
+    fields = make_prescription(np.random.default_rng(3))
+    for fmt in PAYLOAD_FORMATS:
+        encoded = encode_payload(fields, fmt)
+        parsed = reader.parse_prescription_data(encoded['payload'])
+        for field, value in encoded['expected'].items():
+            assert parsed[field] == value, (fmt, field)
+
+
+def test_clean_samples_decode():
+    reader = PrescriptionQRReader()
+    for index in range(4):
+        sample = generate_sample(5, index, profile='clean')
+        assert reader.enhanced_qr_detection(sample['image']) == sample['truth']['payload']
+
+
+def test_generate_and_evaluate():
+    with tempfile.TemporaryDirectory() as tmp:
+        manifest = generate_corpus(tmp, seed=1, count=3, profile='clean')
+        with open(manifest) as f:
+            truths = [json.loads(line) for line in f]
+        assert [t['file'] for t in truths] == sorted(n for n in os.listdir(tmp) if n.endswith('.jpg'))
+
+        results = os.path.join(tmp, 'results.jsonl')
+        with open(results, 'w') as f:
+            for truth, payload in zip(truths, [truths[0]['payload'], 'wrong', None]):
+                f.write(json.dumps({'path': os.path.join(tmp, truth['file']),
+                                    'payload': payload, 'decode_ms': 10.0}) + '\n')
+        report = evaluate(manifest, results)
+        assert (report['hits'], report['misreads'], report['misses']) == (1, 1, 1)
+        assert report['p50_ms'] == 10.0
+
+
+if __name__ == "__main__":
+    test_same_seed_same_samples()
+    test_uneven_profile_shades_the_same_labels()
+    test_ground_truth_matches_parser()
+    test_clean_samples_decode()
+    test_generate_and_evaluate()
+    print("All synthetic corpus tests passed")